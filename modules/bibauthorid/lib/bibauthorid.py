@@ -25,6 +25,7 @@ bibauthorid
 """
 import Queue
 import glob
+import os
 
 import time
 import bibauthorid_structs as dat
@@ -34,6 +35,8 @@ import gc
 from bibauthorid_realauthor_utils import process_updated_virtualauthors
 from bibauthorid_realauthor_utils import find_and_process_orphans
 from bibauthorid_virtualauthor_utils import add_minimum_virtualauthor
+from bibauthorid_file_utils import dump_mem_cache
+from bibauthorid_file_utils import load_mem_cache
 
 if not bconfig.STANDALONE:
     from bibauthorid_tables_utils import populate_doclist_for_author_surname
@@ -344,6 +347,200 @@ def computation_process_starter(i, mp_termination_queue, job_mp_queue,
                 gc.collect()
 
 
+def estimate_last_name_cluster_cost():
+    '''
+    Estimates the cost of the disambiguation of the last name cluster loaded
+    in AUTHOR_NAMES as its number of documents (approximated by the number
+    of bibrefs of its names) times its number of name variants.
+
+    @return: the estimated cost
+    @rtype: int
+    '''
+    docs = 0
+
+    for bibrefs in dat.AUTHOR_NAMES.lookup_values('bibrefs', processed=False):
+        docs += len(bibrefs.split(','))
+
+    return docs * len(dat.AUTHOR_NAMES)
+
+
+def create_last_name_clusters(job_last_names):
+    '''
+    Groups the last names into the clusters processed together (a last name
+    and its variations, e.g. 't hooft and t'hooft) and estimates the cost of
+    each cluster.
+
+    @param job_last_names: the last names to process
+    @type job_last_names: list of string
+
+    @return: the clusters, as (estimated cost, sorted last names) tuples
+    @rtype: list of tuples
+    '''
+    variations_set = set()
+    clusters = []
+
+    for lname in job_last_names:
+        if lname in variations_set:
+            continue
+
+        dat.reset_mem_cache(True)
+        init_authornames(lname)
+        nameset = set([row['name'].split(",")[0] for row in dat.AUTHOR_NAMES])
+        nameset.add(lname)
+        clusters.append((estimate_last_name_cluster_cost(), sorted(nameset)))
+        variations_set.update(nameset)
+
+    dat.reset_mem_cache(True)
+
+    return clusters
+
+
+def disambiguate_last_name_cluster(job):
+    '''
+    Worker of the local process pool: disambiguates a last name cluster in
+    memory and returns the results as a compact blob, leaving the writing
+    to the database to the parent process.
+
+    @param job: the last names of the cluster and whether to process orphans
+    @type job: tuple of (list of string, boolean)
+
+    @return: the last names, whether the computation succeeded and the blob
+        of the resulting memory cache (None if there is nothing to write)
+    @rtype: tuple of (list of string, boolean, string)
+    '''
+    last_names, process_orphans = job
+    dat.reset_mem_cache(True)
+    gc.collect()
+    blob = None
+
+    try:
+        populate_doclist_for_author_surname(last_names[0], last_names)
+        start_computation(process_orphans=process_orphans, print_stats=False)
+
+        if dat.ID_TRACKER:
+            blob = dump_mem_cache()
+    except Exception, emsg:
+        bconfig.LOGGER.exception("Disambiguation of %s failed: %s"
+                                 % (last_names[0], emsg))
+        dat.reset_mem_cache(True)
+        return (last_names, False, None)
+
+    dat.reset_mem_cache(True)
+
+    return (last_names, True, blob)
+
+
+def start_local_disambiguation(last_names="all",
+                               process_orphans=True,
+                               processes=None,
+                               checkpoint_file=None):
+    '''
+    Disambiguates the last name clusters on this machine using a pool of
+    worker processes. The clusters are handed out by decreasing estimated
+    cost (see estimate_last_name_cluster_cost), so that the biggest ones do
+    not end up last on a single core. The workers stream their results back
+    to this process, the only one writing to the database.
+
+    The last names of each cluster written to the database are appended to
+    the checkpoint file: running the function again with the same file
+    skips them, so that an interrupted run can be resumed.
+
+    @param last_names: "all" to process all authors or a list of last names
+    @type last_names: string or list of string
+    @param process_orphans: process the orphans left after the first process?
+    @type process_orphans: boolean
+    @param processes: the number of worker processes; defaults to
+        BIBAUTHORID_MAX_PROCESSES
+    @type processes: int
+    @param checkpoint_file: path of the checkpoint file
+    @type checkpoint_file: string
+
+    @return: True if every cluster was written to the database
+    @rtype: boolean
+    '''
+    if bconfig.STANDALONE:
+        bconfig.LOGGER.critical("This method is not available in "
+                                "standalone mode.")
+        return False
+
+    if last_names == "all":
+        job_last_names = find_all_last_names()
+    elif isinstance(last_names, list):
+        job_last_names = last_names
+    else:
+        job_last_names = [last_names]
+
+    done_last_names = set()
+
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        checkpoint = open(checkpoint_file)
+        done_last_names = set([line.rstrip('\n').decode('utf-8')
+                               for line in checkpoint])
+        checkpoint.close()
+        bconfig.LOGGER.log(25, "Resuming: %s last names already processed."
+                           % (len(done_last_names)))
+
+    job_last_names = [lname for lname in job_last_names
+                      if not lname in done_last_names]
+    clusters = create_last_name_clusters(job_last_names)
+    clusters.sort(reverse=True)
+    jobs = [(cluster_names, process_orphans)
+            for dummy_cost, cluster_names in clusters]
+    bconfig.LOGGER.log(25, "Processing %s last name clusters."
+                       % (len(jobs)))
+
+    if not processes:
+        processes = bconfig.BIBAUTHORID_MAX_PROCESSES
+
+    pool = None
+
+    if MP_ENABLED and processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(disambiguate_last_name_cluster, jobs)
+    else:
+        results = (disambiguate_last_name_cluster(job) for job in jobs)
+
+    success = True
+    status = 0
+
+    for cluster_names, computed, blob in results:
+        status += 1
+        bconfig.LOGGER.log(25, "Writing cluster %s of %s: %s"
+                           % (status, len(jobs), cluster_names[0]))
+
+        if not computed:
+            success = False
+            continue
+
+        if blob:
+            load_mem_cache(blob)
+
+            try:
+                written = write_mem_cache_to_tables()
+            except Exception, emsg:
+                bconfig.LOGGER.error("An error occurred while writing "
+                                     "to the db: %s" % emsg)
+                written = False
+
+            dat.reset_mem_cache(True)
+
+            if not written:
+                success = False
+                continue
+
+        if checkpoint_file:
+            checkpoint = open(checkpoint_file, 'a')
+            checkpoint.write(''.join(["%s\n" % lname.encode('utf-8')
+                                      for lname in cluster_names]))
+            checkpoint.close()
+
+    if pool:
+        pool.close()
+        pool.join()
+
+    return success
+
+
 def start_computation(process_doclist=True,
                       process_orphans=False,
                       print_stats=True):
@@ -392,8 +589,7 @@ def create_vas_from_doclist():
 
     for docs in [row for row in dat.DOC_LIST]:
         for author_id in docs['authornameids']:
-            author_name = [an['name'] for an in dat.AUTHOR_NAMES
-                           if an['id'] == author_id]
+            author_name = dat.AUTHOR_NAMES.lookup_values('name', id=author_id)
             refrecs = [ref[1] for ref in docs['authornameid_bibrefrec']
                        if ref[0] == author_id]
             refrec = -1
@@ -44,11 +44,10 @@ def get_bibrefs_by_authornames_id(authornames_id):
     '''
 
     bibrefs = ''
-    bibref_str = [row['bibrefs'] for row in dat.AUTHOR_NAMES
-                  if row['id'] == authornames_id]
+    bibref_str = dat.AUTHOR_NAMES.lookup_values('bibrefs', id=authornames_id)
 
     if len(bibref_str) > 0:
-        bibrefs = bibref_str.split(",")
+        bibrefs = bibref_str[0].split(",")
 
     b100 = set()
     b700 = set()
@@ -162,8 +161,7 @@ def get_name_id(name_string):
         Returns -1 if the string is not found.
     @return: int
     """
-    name = [row['id'] for row in dat.AUTHOR_NAMES
-               if row['name'] == name_string]
+    name = dat.AUTHOR_NAMES.lookup_values('id', name=name_string)
     try:
         name_id = name[0]
     except (IndexError, ValueError):
@@ -181,8 +179,7 @@ def get_name_string(authorname_id):
     @rtype: string
     '''
     name_string = ""
-    name = [row['name'] for row in dat.AUTHOR_NAMES
-            if row['id'] == authorname_id]
+    name = dat.AUTHOR_NAMES.lookup_values('name', id=authorname_id)
 
     if len(name) > 0:
         name_string = name[0]
@@ -199,8 +196,7 @@ def get_db_name_string(authorname_id):
     @rtype: string
     '''
     name_string = ""
-    name = [row['db_name'] for row in dat.AUTHOR_NAMES
-            if row['id'] == authorname_id]
+    name = dat.AUTHOR_NAMES.lookup_values('db_name', id=authorname_id)
 
     if len(name) > 0:
         name_string = name[0]
@@ -218,8 +214,7 @@ def get_name_and_db_name_strings(authorname_id):
     '''
     names_dict = {"name": "",
                   "db_name" : ""}
-    name = [row for row in dat.AUTHOR_NAMES
-            if row['id'] == authorname_id]
+    name = dat.AUTHOR_NAMES.lookup(id=authorname_id)
 
     if len(name) > 0:
         names_dict["name"] = name[0]['name']
@@ -242,8 +237,7 @@ def get_name_bibrefs(authorname_id):
     @rtype: string
     """
     bibref_string = ""
-    bibrefs = [row['bibrefs'] for row in dat.AUTHOR_NAMES
-               if row['id'] == authorname_id]
+    bibrefs = dat.AUTHOR_NAMES.lookup_values('bibrefs', id=authorname_id)
     if len(bibrefs) > 0:
         bibref_string = bibrefs[0]
 
@@ -259,8 +253,7 @@ def update_doclist(bibrec_id, authorname_id="", bibref=""):
         bibrecord was previously processed
     @rtype: boolean
     """
-    records = [row for row in dat.DOC_LIST
-               if row['bibrecid'] == bibrec_id]
+    records = dat.DOC_LIST.lookup(bibrecid=bibrec_id)
 
     if len(records) > 0:
 #            @note maybe it's better to have a comma-separated list in the
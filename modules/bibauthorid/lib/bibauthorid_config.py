@@ -150,6 +150,16 @@ PERSONID_CNP_FLAG_MINUS1 = 0.5
 # minimum flag
 PERSONID_UPFA_PPLMF = -1
 
+# Size of the character n-grams of the surnames in the person name index
+PERSONID_NAME_INDEX_NGRAM_SIZE = 3
+
+# Minimum fraction of the n-grams of a searched surname the names of a person
+# must share for the person to be a fuzzy match candidate
+PERSONID_NAME_INDEX_FUZZY_RATIO = 0.6
+
+# Maximum number of persons returned by a person name index lookup
+PERSONID_NAME_INDEX_MAX_CANDIDATES = 1000
+
 
 #Tables Utils debug output
 TABLES_UTILS_DEBUG = False
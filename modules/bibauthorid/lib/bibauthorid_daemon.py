@@ -54,6 +54,7 @@ from bibauthorid_file_utils import write_mem_cache_to_files
 from bibauthorid_file_utils import populate_structs_from_files
 from bibauthorid_file_utils import tail
 from bibauthorid import start_full_disambiguation
+from bibauthorid import start_local_disambiguation
 from bibauthorid import start_computation
 from bibauthorid_utils import get_field_values_on_condition
 from bibauthorid_utils import split_name_parts
@@ -62,6 +63,8 @@ from bibauthorid_personid_tables_utils import get_user_log
 from bibauthorid_personid_tables_utils import insert_user_log
 from bibauthorid_personid_tables_utils import update_personID_table_from_paper
 from bibauthorid_personid_tables_utils import update_personID_from_algorithm
+from bibauthorid_personid_tables_utils import update_personID_name_index
+from bibauthorid_personid_tables_utils import personID_name_index_complete_p
 
 import bibtask
 
@@ -83,14 +86,22 @@ Examples:
       $ bibauthorid -u admin --lastname 'Ellis'
   - Process all records and regard all authors:
       $ bibauthorid -u admin --process-all
+  - Process all records on all the cores of this machine, resuming the
+    previous run if it was interrupted:
+      $ bibauthorid -u admin --local-pool -d pooldata
   - Prepare job packages in folder 'gridfiles' with the sub directories
     prefixed with 'task' and a maximum number of 2000 records per package:
       $ bibauthorid -u admin --prepare-grid -d gridfiles -p task -m 2000
 """,
         help_specific_usage="""
-  NOTE: Options -n, -a, -U, -G and -R are mutually exclusive (XOR)!
+  NOTE: Options -n, -a, -L, -U, -G and -R are mutually exclusive (XOR)!
   -n, --lastname=STRING     Process only authors with this last name.
   -a, --process-all         The option for cleaning all authors.
+  -L, --local-pool          Process all authors with a pool of worker
+                            processes on this machine, starting with the
+                            biggest last name clusters. The progress is
+                            checkpointed in the -d directory (optional),
+                            from where an interrupted run is resumed.
   -U, --update-universe     Update bibauthorid universe. Find modified and
                             newly entered records and process all the authors
                             on these records.
@@ -105,7 +116,7 @@ Examples:
                             options -d (required).
   -d, --data-dir=DIRNAME    Specifies the data directory, in which the data for
                             the grid preparation will be stored to or loaded
-                            from. It requires the -G or -R switch.
+                            from. It requires the -G, -R or -L switch.
   -p, --prefix=STRING       Specifies the prefix of the directories created
                             under the --data-dir directory. Optional.
                             Defaults to 'job'. It requires the -G switch.
@@ -119,20 +130,25 @@ Examples:
                             the frontend (and the backend).
       --clean-cache         Clean the cache from out of date contents
                             (deleted documents).
+      --rebuild-name-index  Rebuild the person name index used by the person
+                            search. It is also built by -a, -L and -U when
+                            it is not complete yet.
 """,
         version="Invenio Bibauthorid v%s" % bconfig.VERSION,
-        specific_params=("d:n:p:m:GRa",
+        specific_params=("d:n:p:m:GRaL",
             [
              "data-dir=",
              "lastname=",
              "prefix=",
              "max-records=",
              "process-all",
+             "local-pool",
              "prepare-grid",
              "load-grid-results",
              "update-universe",
              "update-cache",
-             "clean-cache"
+             "clean-cache",
+             "rebuild-name-index"
             ]),
         task_submit_elaborate_specific_parameter_fnc=
             _task_submit_elaborate_specific_parameter,
@@ -159,6 +175,9 @@ def _task_submit_elaborate_specific_parameter(key, value, opts, args):
     elif key in ("-a", "--process-all"):
         bibtask.task_set_option("process_all", True)
 
+    elif key in ("-L", "--local-pool"):
+        bibtask.task_set_option("local_pool", True)
+
     elif key in ("-U", "--update-universe"):
         bibtask.task_set_option("update", True)
 
@@ -183,6 +202,9 @@ def _task_submit_elaborate_specific_parameter(key, value, opts, args):
     elif key in ("--clean-cache",):
         bibtask.task_set_option("clean_cache", True)
 
+    elif key in ("--rebuild-name-index",):
+        bibtask.task_set_option("rebuild_name_index", True)
+
     else:
         return False
 
@@ -196,6 +218,7 @@ def _task_run_core():
 
     lastname = bibtask.task_get_option('lastname')
     process_all = bibtask.task_get_option('process_all')
+    local_pool = bibtask.task_get_option('local_pool')
     prepare_grid = bibtask.task_get_option('prepare_grid')
     load_grid = bibtask.task_get_option('load_grid_results')
     data_dir = bibtask.task_get_option('data_dir')
@@ -204,6 +227,7 @@ def _task_run_core():
     update = bibtask.task_get_option('update')
     clean_cache = bibtask.task_get_option('clean_cache')
     update_cache = bibtask.task_get_option('update_cache')
+    rebuild_name_index = bibtask.task_get_option('rebuild_name_index')
 
 #    automated_daemon_mode_p = True
 
@@ -211,7 +235,7 @@ def _task_run_core():
         bibtask.write_message("Processing last name %s" % (lastname),
                               stream=sys.stdout, verbose=0)
 
-    if process_all:
+    if process_all or local_pool:
         if bconfig.STANDALONE:
             bibtask.write_message("Processing not possible in standalone!",
                                   stream=sys.stdout, verbose=0)
@@ -244,11 +268,21 @@ def _task_run_core():
             populate_authornames_bibrefs_from_authornames()
 
         bibtask.task_update_progress('Processing all authors.')
-        start_full_disambiguation(last_names="all",
-                                 process_orphans=True,
-                                 db_exists=False,
-                                 populate_doclist=True,
-                                 write_to_db=True)
+
+        if local_pool:
+            if not _run_local_disambiguation(data_dir):
+                bibtask.write_message("Some last name clusters could not be "
+                                      "processed. Run the task again to "
+                                      "retry them.",
+                                      stream=sys.stdout, verbose=0)
+                return 0
+        else:
+            start_full_disambiguation(last_names="all",
+                                     process_orphans=True,
+                                     db_exists=False,
+                                     populate_doclist=True,
+                                     write_to_db=True)
+
         update_personID_from_algorithm()
         insert_user_log('daemon', '-1', 'update_aid', 'bibsched', 'status',
                     comment='bibauthorid_daemon, update_authorid_universe')
@@ -312,6 +346,16 @@ def _task_run_core():
                               " table", stream=sys.stdout, verbose=0)
         bibtask.task_update_progress('clean-cache: DONE')
 
+    if (rebuild_name_index or ((process_all or local_pool or update)
+                               and not personID_name_index_complete_p())):
+        bibtask.write_message("Rebuilding the person name index",
+                              stream=sys.stdout, verbose=0)
+        bibtask.task_update_progress('Rebuilding the person name index')
+        update_personID_name_index()
+        bibtask.write_message("Done rebuilding the person name index",
+                              stream=sys.stdout, verbose=0)
+        bibtask.task_update_progress('Rebuilding the person name index: DONE')
+
     return 1
 
 
@@ -321,6 +365,7 @@ def _task_submit_check_options():
     """
     lastname = bibtask.task_get_option('lastname')
     process_all = bibtask.task_get_option('process_all')
+    local_pool = bibtask.task_get_option('local_pool')
     prepare_grid = bibtask.task_get_option('prepare_grid')
     load_grid = bibtask.task_get_option('load_grid_results')
     data_dir = bibtask.task_get_option('data_dir')
@@ -329,28 +374,36 @@ def _task_submit_check_options():
     update = bibtask.task_get_option('update')
     clean_cache = bibtask.task_get_option('clean_cache')
     update_cache = bibtask.task_get_option('update_cache')
+    rebuild_name_index = bibtask.task_get_option('rebuild_name_index')
 
     if (lastname == "None," or lastname == "None"):
         lastname = False
 
-    if (not lastname and not process_all and not update
+    if (not lastname and not process_all and not local_pool and not update
         and not prepare_grid and not load_grid and not clean_cache
-        and not update_cache):
-        bibtask.write_message("ERROR: One of the options -a, -n, -U, -G, -R, "
-                              "--clean-cache, --update-cache is"
+        and not update_cache and not rebuild_name_index):
+        bibtask.write_message("ERROR: One of the options -a, -n, -L, -U, -G, "
+                              "-R, --clean-cache, --update-cache, "
+                              "--rebuild-name-index is"
                               " required!", stream=sys.stdout, verbose=0)
         return False
-    elif not (bool(lastname) ^ bool(process_all) ^ bool(update)
-              ^ bool(prepare_grid) ^ bool(load_grid) ^ bool(clean_cache)
-              ^ bool(update_cache)):
-        bibtask.write_message("ERROR: Options -a -n -U -R -G --clean-cache "
-                              "--update-cache are mutually"
+    elif not (bool(lastname) ^ bool(process_all) ^ bool(local_pool)
+              ^ bool(update) ^ bool(prepare_grid) ^ bool(load_grid)
+              ^ bool(clean_cache) ^ bool(update_cache)
+              ^ bool(rebuild_name_index)):
+        bibtask.write_message("ERROR: Options -a -n -L -U -R -G --clean-cache "
+                              "--update-cache --rebuild-name-index are mutually"
                               " exclusive!", stream=sys.stdout, verbose=0)
         return False
     elif ((not prepare_grid and (data_dir or prefix or max_records)) and
-          (not load_grid and (data_dir))):
-        bibtask.write_message("ERROR: The options -d, -m and -p require -G or "
-                              "-R to run!", stream=sys.stdout, verbose=0)
+          (not load_grid and not local_pool and (data_dir))):
+        bibtask.write_message("ERROR: The options -d, -m and -p require -G, "
+                              "-R or -L to run!", stream=sys.stdout,
+                              verbose=0)
+        return False
+    elif local_pool and (prefix or max_records):
+        bibtask.write_message("ERROR: The options -m and -p require -G "
+                              "to run!", stream=sys.stdout, verbose=0)
         return False
     elif load_grid and not bool(data_dir):
         bibtask.write_message("ERROR: The option -R requires the option -d "
@@ -360,6 +413,44 @@ def _task_submit_check_options():
     return True
 
 
+def _run_local_disambiguation(data_dir_name=None):
+    '''
+    Disambiguates all the authors with a pool of worker processes on this
+    machine. The progress is checkpointed in the data directory, so that an
+    interrupted run is resumed where it stopped; the checkpoint is removed
+    once all last names have been processed.
+
+    @param data_dir_name: the directory holding the checkpoint file;
+        defaults to the 'local_pool' directory in the module's path
+    @type data_dir_name: string
+
+    @return: True if all the last name clusters were processed
+    @rtype: boolean
+    '''
+    if not data_dir_name:
+        data_dir_name = "local_pool"
+
+    if data_dir_name.startswith("/"):
+        data_dir = data_dir_name
+    else:
+        data_dir = "%s/%s" % (bconfig.FILE_PATH, data_dir_name)
+
+    if not osp.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    checkpoint_file = "%s/checkpoint.txt" % (data_dir,)
+
+    if not start_local_disambiguation(last_names="all",
+                                      process_orphans=True,
+                                      checkpoint_file=checkpoint_file):
+        return False
+
+    if osp.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return True
+
+
 def _write_data_files_to_db(data_dir_name):
     '''
     Reads all the files of a specified directory and writes the content
@@ -639,8 +730,8 @@ def _update_authorid_universe():
         for docs in [row for row in dat.DOC_LIST
                      if row['bibrecid'] in bibrec_ids]:
             for author_id in docs['authornameids']:
-                author_name = [an['name'] for an in dat.AUTHOR_NAMES
-                               if an['id'] == author_id]
+                author_name = dat.AUTHOR_NAMES.lookup_values('name',
+                                                             id=author_id)
                 refrecs = [ref[1] for ref in docs['authornameid_bibrefrec']
                            if ref[0] == author_id]
                 refrec = -1
@@ -744,8 +835,8 @@ def _update_authorid_universe():
 
         for current_author in current_authors:
             load_records_to_mem_cache(current_author['records'])
-            authornamesid = [row['id'] for row in dat.AUTHOR_NAMES
-                             if row['db_name'] == current_author['db_name']]
+            authornamesid = dat.AUTHOR_NAMES.lookup_values('id',
+                                        db_name=current_author['db_name'])
 
             if not authornamesid:
                 bconfig.LOGGER.error("The author '%s' rec '%s' is not in authornames "
@@ -782,8 +873,8 @@ def _update_authorid_universe():
                         va_anames_id = get_virtualauthor_records(va_id,
                                                         "orig_authorname_id")
 
-                        for an_list in [row['authornameids'] for row in
-                                    dat.DOC_LIST if row['bibrecid'] == rec]:
+                        for an_list in dat.DOC_LIST.lookup_values(
+                                            'authornameids', bibrecid=rec):
                             try:
                                 an_list.remove(va_anames_id)
                             except (ValueError):
@@ -72,19 +72,19 @@ def populate_structs_from_files(work_dir, results=False):
     try:
 
         dfile = open("%s/authornames.dat" % (work_dir), "r")
-        dat.AUTHOR_NAMES = loads(decompress(dfile.read()))
+        dat.AUTHOR_NAMES.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/virtual_authors.dat" % (work_dir), "r")
-        dat.VIRTUALAUTHORS = loads(decompress(dfile.read()))
+        dat.VIRTUALAUTHORS.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/virtual_author_data.dat" % (work_dir), "r")
-        dat.VIRTUALAUTHOR_DATA = loads(decompress(dfile.read()))
+        dat.VIRTUALAUTHOR_DATA.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/virtual_author_clusters.dat" % (work_dir), "r")
-        dat.VIRTUALAUTHOR_CLUSTERS = loads(decompress(dfile.read()))
+        dat.VIRTUALAUTHOR_CLUSTERS.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/virtual_author_cluster_cache.dat" % (work_dir), "r")
@@ -92,15 +92,15 @@ def populate_structs_from_files(work_dir, results=False):
         dfile.close()
 
         dfile = open("%s/realauthors.dat" % (work_dir), "r")
-        dat.REALAUTHORS = loads(decompress(dfile.read()))
+        dat.REALAUTHORS.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/realauthor_data.dat" % (work_dir), "r")
-        dat.REALAUTHOR_DATA = loads(decompress(dfile.read()))
+        dat.REALAUTHOR_DATA.load(loads(decompress(dfile.read())))
         dfile.close()
 
         dfile = open("%s/doclist.dat" % (work_dir), "r")
-        dat.DOC_LIST = loads(decompress(dfile.read()))
+        dat.DOC_LIST.load(loads(decompress(dfile.read())))
         dfile.close()
 
         if not results:
@@ -163,19 +163,19 @@ def write_mem_cache_to_files(destination_dir, lnames=None, is_result=False):
 
     try:
         dfile = open("%s/authornames.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.AUTHOR_NAMES)))
+        dfile.write(compress(dumps(dat.AUTHOR_NAMES.dump())))
         dfile.close()
 
         dfile = open("%s/virtual_authors.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.VIRTUALAUTHORS)))
+        dfile.write(compress(dumps(dat.VIRTUALAUTHORS.dump())))
         dfile.close()
 
         dfile = open("%s/virtual_author_data.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.VIRTUALAUTHOR_DATA)))
+        dfile.write(compress(dumps(dat.VIRTUALAUTHOR_DATA.dump())))
         dfile.close()
 
         dfile = open("%s/virtual_author_clusters.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.VIRTUALAUTHOR_CLUSTERS)))
+        dfile.write(compress(dumps(dat.VIRTUALAUTHOR_CLUSTERS.dump())))
         dfile.close()
 
         dfile = open("%s/virtual_author_cluster_cache.dat"
@@ -184,15 +184,15 @@ def write_mem_cache_to_files(destination_dir, lnames=None, is_result=False):
         dfile.close()
 
         dfile = open("%s/realauthors.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.REALAUTHORS)))
+        dfile.write(compress(dumps(dat.REALAUTHORS.dump())))
         dfile.close()
 
         dfile = open("%s/realauthor_data.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.REALAUTHOR_DATA)))
+        dfile.write(compress(dumps(dat.REALAUTHOR_DATA.dump())))
         dfile.close()
 
         dfile = open("%s/doclist.dat" % (destination_dir), "w")
-        dfile.write(compress(dumps(dat.DOC_LIST)))
+        dfile.write(compress(dumps(dat.DOC_LIST.dump())))
         dfile.close()
 
         if not is_result:
@@ -216,6 +216,45 @@ def write_mem_cache_to_files(destination_dir, lnames=None, is_result=False):
         sys.exit(1)
 
 
+def dump_mem_cache():
+    '''
+    Serializes the memory cache holding the results of a computation, i.e.
+    the content of the files written in the results directory of a job,
+    into a compressed blob that can be passed between processes.
+
+    @return: the compressed marshal-dumped memory cache
+    @rtype: string
+    '''
+    return compress(dumps({'authornames': dat.AUTHOR_NAMES.dump(),
+                  'virtual_authors': dat.VIRTUALAUTHORS.dump(),
+                  'virtual_author_data': dat.VIRTUALAUTHOR_DATA.dump(),
+                  'virtual_author_clusters': dat.VIRTUALAUTHOR_CLUSTERS.dump(),
+                  'realauthors': dat.REALAUTHORS.dump(),
+                  'realauthor_data': dat.REALAUTHOR_DATA.dump(),
+                  'doclist': dat.DOC_LIST.dump(),
+                  'ids': dat.ID_TRACKER}))
+
+
+def load_mem_cache(blob):
+    '''
+    Replaces the content of the memory cache by a blob created by
+    dump_mem_cache().
+
+    @param blob: the compressed marshal-dumped memory cache
+    @type blob: string
+    '''
+    mem_cache = loads(decompress(blob))
+    dat.reset_mem_cache(True)
+    dat.AUTHOR_NAMES.load(mem_cache['authornames'])
+    dat.VIRTUALAUTHORS.load(mem_cache['virtual_authors'])
+    dat.VIRTUALAUTHOR_DATA.load(mem_cache['virtual_author_data'])
+    dat.VIRTUALAUTHOR_CLUSTERS.load(mem_cache['virtual_author_clusters'])
+    dat.REALAUTHORS.load(mem_cache['realauthors'])
+    dat.REALAUTHOR_DATA.load(mem_cache['realauthor_data'])
+    dat.DOC_LIST.load(mem_cache['doclist'])
+    dat.ID_TRACKER.update(mem_cache['ids'])
+
+
 def make_directory(path, force=False):
     '''
     Checks if a specified directory exists. If not, it will create one.
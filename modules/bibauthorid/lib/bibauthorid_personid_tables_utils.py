@@ -28,6 +28,8 @@ import bibauthorid_config as bconfig
 
 from bibauthorid_utils import split_name_parts, create_normalized_name, create_canonical_name
 from bibauthorid_utils import clean_name_string, get_field_values_on_condition
+from bibauthorid_utils import get_name_index_terms, get_name_index_ngrams
+from bibauthorid_utils import normalize_name_index_string
 from bibauthorid_authorname_utils import soft_compare_names
 from bibauthorid_tables_utils import get_bibrefs_from_name_string
 
@@ -334,6 +336,11 @@ def update_personID_canonical_names(persons_list=[], overwrite=False, suggested=
                 canonical_name = canonical_name + '.' + str(max_idx + 1)
                 run_sql("insert into aidPERSONID (personid,tag,data) values (%s,%s,%s) ", (pid[0], 'canonical_name', canonical_name))
 
+                try:
+                    update_personID_name_index((pid,))
+                except (OperationalError, ProgrammingError):
+                    pass
+
 
 def update_personID_table_from_paper(papers_list=[], personid=None):
     '''
@@ -861,25 +868,152 @@ def get_person_names_set(pid):
     return list(authornames)
 
 
-def find_personIDs_by_name_string(namestring, strict=False):
+def _canonical_name_to_name_string(canonical_name):
     '''
-    Search engine to find persons matching the given string
-    @param: string name, 'surname, names I.'
-    @type: string
-    @return: pid list of lists [pid,[[name string, occur count, compatibility]]]
+    Turns a canonical name into a name string, e.g. 'J.R.Ellis.1' into
+    'Ellis, J. R.'
+    '''
+    parts = canonical_name.split('.')
 
-    The matching is done on the surname first, and names if present.
-    An ordered list (per compatibility) of pids and found names is returned.
+    if len(parts) < 2:
+        return canonical_name
+
+    return "%s, %s" % (parts[-2], " ".join(["%s." % initial
+                                            for initial in parts[:-2]]))
+
+
+# Term of the row marking the person name index as complete. It is written
+# once the whole index has been built and is never matched by a name lookup.
+_NAME_INDEX_COMPLETE_TERM = "x:complete"
+_NAME_INDEX_COMPLETE_PID = -1
+
+
+def update_personID_name_index(PIDlist=[]):
     '''
-    canonical = []
-    use_index = True
+    Updates the person name index (aidPERSONIDNAMEINDEX), which maps the
+    terms computed by get_name_index_terms from the gathered and canonical
+    names of the persons to their person ids.
+    The index is only used for searches once it has been fully rebuilt, which
+    is marked by a dedicated row written at the end of the rebuild.
+    @param PIDlist: persons to reindex ((pid,),); if omitted, the whole index
+        is rebuilt
+    @type PIDlist: tuple of tuples
+    '''
+    if PIDlist:
+        pids = [pid[0] for pid in PIDlist]
+    else:
+        run_sql("TRUNCATE aidPERSONIDNAMEINDEX")
+        pids = [None]
 
+    for pid in pids:
+        if pid is None:
+            names = run_sql("select personid, tag, data from aidPERSONID "
+                            "where tag in ('gathered_name', 'canonical_name')")
+        else:
+            run_sql("delete from aidPERSONIDNAMEINDEX where personid=%s",
+                    (pid,))
+            names = run_sql("select personid, tag, data from aidPERSONID "
+                            "where personid=%s and tag in "
+                            "('gathered_name', 'canonical_name')", (pid,))
+
+        entries = set()
+
+        for personid, tag, name in names:
+            if tag == 'canonical_name':
+                name = _canonical_name_to_name_string(name)
+
+            for term in get_name_index_terms(name):
+                entries.add((term[:100], personid))
+
+        entries = list(entries)
+
+        for i in range(0, len(entries), bconfig.TABLE_POPULATION_BUNCH_SIZE):
+            bunch = entries[i:i + bconfig.TABLE_POPULATION_BUNCH_SIZE]
+            params = []
+
+            for entry in bunch:
+                params += entry
+
+            run_sql("insert ignore into aidPERSONIDNAMEINDEX (term, personid) "
+                    "values " + ",".join(["(%s,%s)"] * len(bunch)),
+                    tuple(params))
+
+    if not PIDlist:
+        run_sql("insert ignore into aidPERSONIDNAMEINDEX (term, personid) "
+                "values (%s,%s)", (_NAME_INDEX_COMPLETE_TERM,
+                                   _NAME_INDEX_COMPLETE_PID))
+
+
+def personID_name_index_complete_p():
+    '''
+    Tells whether the person name index has been fully built, i.e. whether it
+    can be used in place of the LIKE searches on aidPERSONID.
+    @return: True if the index is complete
+    @rtype: boolean
+    '''
     try:
-        canonical = run_sql("select personid,data from aidPERSONID use index (`tdf-b`) where data like %s and tag=%s", (namestring+'%','canonical_name'))
+        return bool(run_sql("select personid from aidPERSONIDNAMEINDEX "
+                            "where term=%s and personid=%s",
+                            (_NAME_INDEX_COMPLETE_TERM,
+                             _NAME_INDEX_COMPLETE_PID)))
     except (ProgrammingError, OperationalError):
-        canonical = run_sql("select personid,data from aidPERSONID where data like %s and tag=%s", (namestring+'%','canonical_name'))
-        use_index = False
+        return False
+
+def find_personIDs_in_name_index(namestring):
+    '''
+    Finds the persons whose names match the surname of namestring in the
+    person name index: first the persons with exactly this surname, then the
+    persons with a surname holding all its n-grams (e.g. a longer surname it
+    is a part of), and finally the persons with a surname sharing most of its
+    n-grams (see bconfig.PERSONID_NAME_INDEX_FUZZY_RATIO).
+    @param namestring: string name, 'surname, names I.'
+    @type namestring: string
+    @return: list of pids, or None if the name index is not complete
+    '''
+    if not personID_name_index_complete_p():
+        return None
 
+    surname = normalize_name_index_string(split_name_parts(namestring)[0])
+
+    if not surname:
+        return []
+
+    pids = run_sql("select personid from aidPERSONIDNAMEINDEX where term=%s",
+                   ((u"s:%s" % surname).encode('utf-8')[:100],))
+
+    if pids:
+        return [pid[0] for pid in pids]
+
+    ngrams = [(u"g:%s" % ngram).encode('utf-8')
+              for ngram in get_name_index_ngrams(surname)]
+    ngrams_sql = ",".join(["%s"] * len(ngrams))
+    fuzzy_min = max(1, int(len(ngrams)
+                           * bconfig.PERSONID_NAME_INDEX_FUZZY_RATIO + 0.5))
+
+    for min_count in (len(ngrams), fuzzy_min):
+        pids = run_sql("select personid from aidPERSONIDNAMEINDEX "
+                       "where term in (" + ngrams_sql + ") group by personid "
+                       "having count(*) >= %s order by count(*) desc limit %s",
+                       tuple(ngrams) + (min_count,
+                       bconfig.PERSONID_NAME_INDEX_MAX_CANDIDATES))
+
+        if pids:
+            return [pid[0] for pid in pids]
+
+    return []
+
+
+def _find_personIDs_names_by_surname_like(namestring, use_index=True):
+    '''
+    Finds the gathered names of the persons whose surname matches the one of
+    namestring with progressively looser LIKE patterns. Used when the person
+    name index is not available.
+    @param namestring: string name, 'surname, names I.'
+    @type namestring: string
+    @param use_index: whether the aidPERSONID indexes can be forced
+    @type use_index: boolean
+    @return: tuple of (personid, gathered name, flag) tuples
+    '''
     namestring_parts = split_name_parts(namestring)
 
 #   The following lines create the regexp used in the query.
@@ -928,6 +1062,46 @@ def find_personIDs_by_name_string(namestring, strict=False):
                                             "(select distinct i.personid as ipid from aidPERSONID i where i.tag='gathered_name' and i.data like %s)"
                                             " as dummy where  o.tag='gathered_name' and o.personid = dummy.ipid",(surname,))
 
+    return matching_pids_names_tuple
+
+
+def find_personIDs_by_name_string(namestring, strict=False):
+    '''
+    Search engine to find persons matching the given string
+    @param: string name, 'surname, names I.'
+    @type: string
+    @return: pid list of lists [pid,[[name string, occur count, compatibility]]]
+
+    The matching is done on the surname first, and names if present.
+    An ordered list (per compatibility) of pids and found names is returned.
+    '''
+    canonical = []
+    use_index = True
+
+    try:
+        canonical = run_sql("select personid,data from aidPERSONID use index (`tdf-b`) where data like %s and tag=%s", (namestring+'%','canonical_name'))
+    except (ProgrammingError, OperationalError):
+        canonical = run_sql("select personid,data from aidPERSONID where data like %s and tag=%s", (namestring+'%','canonical_name'))
+        use_index = False
+
+    matching_pids_names_tuple = []
+    index_pids = find_personIDs_in_name_index(namestring)
+
+    if index_pids is None:
+        matching_pids_names_tuple = _find_personIDs_names_by_surname_like(
+                                                    namestring, use_index)
+    elif index_pids:
+        pids_sql = ",".join(["%s"] * len(index_pids))
+
+        if use_index:
+            matching_pids_names_tuple = run_sql("select personid, data, flag from aidPERSONID use index (`ptf-b`) "
+                                                "where tag='gathered_name' and personid in (%s)" % pids_sql,
+                                                tuple(index_pids))
+        else:
+            matching_pids_names_tuple = run_sql("select personid, data, flag from aidPERSONID "
+                                                "where tag='gathered_name' and personid in (%s)" % pids_sql,
+                                                tuple(index_pids))
+
     matching_pids = []
 #    print matching_pids_names_tuple
     for name in matching_pids_names_tuple:
@@ -1031,6 +1205,11 @@ def update_personID_names_string_set(PIDlist=[]):
                             + str(self.pid[0]) + ',\'gathered_name\',\"' + str(name)
                             + '\",\"' + str(self.namesdict[name]) + '\")')
 
+                try:
+                    update_personID_name_index((self.pid,))
+                except (OperationalError, ProgrammingError):
+                    pass
+
             close_connection()
 #                else:
 #                    sys.stdout.write(str(self.pid) + ' not updating!')
@@ -82,9 +82,8 @@ def update_realauthor_va_confidence(ra_id, va_id, probability):
     @param probability: the new probability for the virtual author
     @type probability: float
     '''
-    for line in [row for row in dat.REALAUTHORS
-              if ((row['realauthorid'] == ra_id)
-                  and (row['virtualauthorid'] == va_id))]:
+    for line in dat.REALAUTHORS.lookup(realauthorid=ra_id,
+                                       virtualauthorid=va_id):
         line['p'] = probability
 
 
@@ -119,8 +118,7 @@ def get_realauthor_va_count_p_sum(ra_id):
     va_count = 0
     p_sum = 0
 
-    for line in [row for row in dat.REALAUTHORS
-              if row['realauthorid'] == ra_id]:
+    for line in dat.REALAUTHORS.lookup(realauthorid=ra_id):
         va_count += 1
         p_sum += line['p']
 
@@ -137,9 +135,7 @@ def get_realauthor_va_p(ra_id):
     @return: the requested va, p information
     @rtype: list of dictionaries
     '''
-    retval = [row for row in dat.REALAUTHORS if row['realauthorid'] == ra_id]
-
-    return retval
+    return dat.REALAUTHORS.lookup(realauthorid=ra_id)
 
 
 def remove_va_from_ra(ra_id, va_id):
@@ -151,9 +147,8 @@ def remove_va_from_ra(ra_id, va_id):
     @param va_id: if of the virtual author to be removed from ra attachment
     @type va_id: int
     '''
-    for remove in [row for row in dat.REALAUTHORS
-               if ((row['realauthorid'] == ra_id) and
-                   (row['virtualauthorid'] == va_id))]:
+    for remove in dat.REALAUTHORS.lookup(realauthorid=ra_id,
+                                         virtualauthorid=va_id):
         dat.REALAUTHORS.remove(remove)
 
     bibauthorid_virtualauthor_utils.delete_virtualauthor_record(va_id,
@@ -170,10 +165,8 @@ def get_realauthor_names_from_set(ra_id):
     @return: the complete list of realauthor names, ordered by confidence
     @rtype: list
     '''
-    names = [row['value'] for row in dat.REALAUTHOR_DATA
-                if ((row['realauthorid'] == ra_id)
-                and (row['tag'] == "orig_name_string"))]
-    return names
+    return dat.REALAUTHOR_DATA.lookup_values('value', realauthorid=ra_id,
+                                             tag="orig_name_string")
 
 
 def get_realauthors_by_virtuala_id(va_id):
@@ -184,8 +177,7 @@ def get_realauthors_by_virtuala_id(va_id):
     @return: a list of realauthors ids which are connected to a given
         virtual author
     '''
-    return [row['realauthorid'] for row in dat.REALAUTHORS
-            if row['virtualauthorid'] == va_id]
+    return dat.REALAUTHORS.lookup_values('realauthorid', virtualauthorid=va_id)
 
 
 def update_ralist_cache(va_list, va_list_hash):
@@ -448,35 +440,28 @@ def update_realauthor_data_by_vid(ra_id, va_id):
     @type va_id: int
     '''
     va_names_p = 0
-    for row in dat.VIRTUALAUTHORS:
-        if row['virtualauthorid'] == va_id:
-            va_names_p = row['p']
-            break
+    for row in dat.VIRTUALAUTHORS.lookup(virtualauthorid=va_id):
+        va_names_p = row['p']
+        break
 
     va_p = 0
-    for row in dat.REALAUTHORS:
-        if ((row['realauthorid'] == ra_id)
-            and (row['virtualauthorid'] == va_id)):
-            va_p = row['p']
-            break
+    for row in dat.REALAUTHORS.lookup(realauthorid=ra_id,
+                                      virtualauthorid=va_id):
+        va_p = row['p']
+        break
 
-    va_data = [row for row in dat.VIRTUALAUTHOR_DATA
-               if row['virtualauthorid'] == va_id]
+    va_data = dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id)
 
     for i in va_data:
         if ((i['tag'] != "updated") and (i['tag'] != "connected")
             and (i['tag'] != "authorIndex")
             and (i['tag'] != "bibrefrecpair")):
-            existant_data = [row for row in dat.REALAUTHOR_DATA
-                             if ((row['realauthorid'] == ra_id)
-                                 and (row['tag'] == i['tag'])
-                                 and (row['value'] == i['value']))]
+            existant_data = dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id,
+                                                       tag=i['tag'],
+                                                       value=i['value'])
 
             if len(existant_data) > 0:
-                for updated in [row for row in dat.REALAUTHOR_DATA
-                                if ((row['realauthorid'] == ra_id)
-                                    and (row['tag'] == i['tag'])
-                                    and (row['value'] == i['value']))]:
+                for updated in existant_data:
                     updated['va_count'] += 1
                     updated['va_np'] += va_names_p
                     updated['va_p'] += va_p
@@ -556,17 +541,10 @@ def get_realauthor_data(ra_id, tag_name=""):
     @return: the data associated with a real author
     @rtype: list of dictionaries
     '''
-    ra_data = []
-
     if not tag_name:
-        ra_data = [row for row in dat.REALAUTHOR_DATA
-                   if row['realauthorid'] == ra_id]
-    else:
-        ra_data = [row for row in dat.REALAUTHOR_DATA
-                   if ((row['realauthorid'] == ra_id) and
-                       (row['tag'] == tag_name))]
+        return dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id)
 
-    return ra_data
+    return dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id, tag=tag_name)
 
 
 def set_realauthor_data(ra_id, tag_name, value):
@@ -580,16 +558,11 @@ def set_realauthor_data(ra_id, tag_name, value):
     @param value: value of the entry (e.g. '12114')
     @type value: string
     '''
-    existant_data = [row for row in dat.REALAUTHOR_DATA
-                     if ((row['realauthorid'] == ra_id)
-                         and (row['tag'] == tag_name)
-                         and (row['value'] == value))]
+    existant_data = dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id,
+                                               tag=tag_name, value=value)
 
     if len(existant_data) > 0:
-        for updated in [row for row in dat.REALAUTHOR_DATA
-                        if ((row['realauthorid'] == ra_id)
-                            and (row['tag'] == tag_name)
-                            and (row['value'] == value))]:
+        for updated in existant_data:
             updated['va_count'] += 1
 
     else:
@@ -610,32 +583,26 @@ def del_ra_data_by_vaid(ra_id, va_id):
     @param va_id: Virtualauthor ID
     @type va_id: int
     '''
-    va_data = [row for row in dat.VIRTUALAUTHOR_DATA
-               if row['virtualauthorid'] == va_id]
+    va_data = dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id)
 
     bconfig.LOGGER.info("Processing RA data. %s " % (va_data))
 
     for i in va_data:
         if ((i['tag'] != "updated") and (i['tag'] != "connected")
             and (i['tag'] != "authorindex") and (i['tag'] != "bibrec_id")):
-            existant_data = [row for row in dat.REALAUTHOR_DATA
-                             if ((row['realauthorid'] == ra_id)
-                                 and (row['tag'] == i['tag'])
-                                 and (row['value'] == i['value']))]
+            existant_data = dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id,
+                                                       tag=i['tag'],
+                                                       value=i['value'])
             if existant_data[0]['va_count'] > 1:
                 bconfig.LOGGER.info("|--> Updating RA Data")
 
-                for updated in [row for row in dat.REALAUTHOR_DATA
-                                if ((row['realauthorid'] == ra_id)
-                                    and (row['tag'] == i['tag']))]:
+                for updated in dat.REALAUTHOR_DATA.lookup(realauthorid=ra_id,
+                                                          tag=i['tag']):
                     updated['va_count'] -= 1
             else:
                 bconfig.LOGGER.info("|--> Deleting RA Data")
 
-                for deletion_candidate in [row for row in dat.REALAUTHOR_DATA
-                            if ((row['realauthorid'] == ra_id)
-                                and (row['tag'] == i['tag'])
-                                and (row['value'] == i['value']))]:
+                for deletion_candidate in existant_data:
                     dat.REALAUTHOR_DATA.remove(deletion_candidate)
 
 
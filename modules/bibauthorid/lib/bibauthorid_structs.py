@@ -23,14 +23,373 @@ bibauthorid_structs
     bibauthorid's memory storage facility.
 '''
 import Queue
+from bisect import insort
+
+## marks the cells of rows that do not define a column
+_MISSING = object()
+
+
+class TableRow(object):
+    '''
+    Dictionary-like view of a row of an IndexedTable. Reading a column
+    returns the value stored in the table, assigning a column updates the
+    table and its indexes.
+    '''
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table, position):
+        self.table = table
+        self.position = position
+
+    def __getitem__(self, column):
+        value = self.table.columns[column][self.position]
+
+        if value is _MISSING:
+            raise KeyError(column)
+
+        return value
+
+    def __setitem__(self, column, value):
+        self.table.set_value(self.position, column, value)
+
+    def get(self, column, default=None):
+        try:
+            return self[column]
+        except KeyError:
+            return default
+
+    def has_key(self, column):
+        return column in self.table.columns and \
+            self.table.columns[column][self.position] is not _MISSING
+
+    __contains__ = has_key
+
+    def keys(self):
+        return [column for column in self.table.columns if self.has_key(column)]
+
+    def items(self):
+        return [(column, self[column]) for column in self.keys()]
+
+    def values(self):
+        return [self[column] for column in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, TableRow):
+            other = other.copy()
+        return self.copy() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class IndexedTable(object):
+    '''
+    In-memory table storing its rows column-wise and keeping hash indexes
+    on some of its columns, so that the rows holding a given value can be
+    found without scanning the whole table.
+
+    The table behaves like the list of dictionaries it replaces: rows are
+    appended as dictionaries, while iterating over the table or looking
+    rows up yields TableRow views.
+
+    @param indexes: the indexed columns, which must hold hashable values;
+        a tuple of columns defines a composite index on the values of these
+        columns.
+    @type indexes: sequence of strings or tuples of strings
+    '''
+
+    def __init__(self, indexes=()):
+        self.columns = {}
+        self.size = 0
+        self.deleted = set()
+        self.indexes = {}
+
+        for index in indexes:
+            if not isinstance(index, tuple):
+                index = (index,)
+            self.indexes[index] = {}
+
+    def _index_key(self, index, position):
+        '''
+        Returns the key of the row at position in index or _MISSING if the
+        row does not define all the indexed columns.
+        '''
+        key = []
+
+        for column in index:
+            if not column in self.columns:
+                return _MISSING
+
+            value = self.columns[column][position]
+
+            if value is _MISSING:
+                return _MISSING
+
+            key.append(value)
+
+        if len(key) == 1:
+            return key[0]
+
+        return tuple(key)
+
+    def _index_row(self, position):
+        for index, entries in self.indexes.iteritems():
+            key = self._index_key(index, position)
+
+            if key is not _MISSING:
+                entries.setdefault(key, []).append(position)
+
+    def _unindex_row(self, position, columns=None):
+        for index, entries in self.indexes.iteritems():
+            if columns and not [col for col in index if col in columns]:
+                continue
+
+            key = self._index_key(index, position)
+
+            if key is not _MISSING:
+                positions = entries[key]
+                positions.remove(position)
+
+                if not positions:
+                    del entries[key]
+
+    def append(self, row):
+        '''
+        Adds a row to the table.
+
+        @param row: the values of the row
+        @type row: dict
+        '''
+        position = self.size
+
+        for column in row:
+            if not column in self.columns:
+                self.columns[column] = [_MISSING] * position
+
+        for column, values in self.columns.iteritems():
+            values.append(row.get(column, _MISSING))
+
+        self.size += 1
+        self._index_row(position)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def set_value(self, position, column, value):
+        '''
+        Changes the value of a column of the row at position and updates
+        the indexes on this column.
+        '''
+        if not column in self.columns:
+            self.columns[column] = [_MISSING] * self.size
+
+        self._unindex_row(position, (column,))
+        self.columns[column][position] = value
+
+        for index, entries in self.indexes.iteritems():
+            if column in index:
+                key = self._index_key(index, position)
+
+                if key is not _MISSING:
+                    insort(entries.setdefault(key, []), position)
+
+    def remove(self, row):
+        '''
+        Removes a row, given as a view or by its values, from the table.
+        '''
+        if isinstance(row, TableRow):
+            if row.table is not self or row.position in self.deleted:
+                raise ValueError("IndexedTable.remove(x): x not in table")
+            position = row.position
+        else:
+            for candidate in self.lookup(**dict([(str(column), value)
+                                                 for column, value
+                                                 in row.iteritems()])):
+                if candidate == row:
+                    position = candidate.position
+                    break
+            else:
+                raise ValueError("IndexedTable.remove(x): x not in table")
+
+        self._unindex_row(position)
+        self.deleted.add(position)
+
+        for values in self.columns.itervalues():
+            values[position] = _MISSING
+
+    def lookup(self, **conditions):
+        '''
+        Returns the rows holding the given column values, e.g.
+        table.lookup(virtualauthorid=12, tag='bibrec_id'). Among the indexes
+        covering some of the conditions, the one yielding the fewest
+        candidate rows is used; these are then filtered by the other
+        conditions.
+
+        @return: the matching rows, in insertion order
+        @rtype: list of TableRow
+        '''
+        best_index = None
+        positions = None
+
+        for index, entries in self.indexes.iteritems():
+            if [col for col in index if not col in conditions]:
+                continue
+
+            if len(index) == 1:
+                key = conditions[index[0]]
+            else:
+                key = tuple([conditions[col] for col in index])
+
+            try:
+                candidates = entries.get(key, [])
+            except TypeError:
+                candidates = []
+
+            if positions is None or len(candidates) < len(positions):
+                best_index = index
+                positions = candidates
+
+        if best_index is None:
+            positions = [row.position for row in self]
+            remaining = conditions
+        else:
+            remaining = dict([(col, value) for col, value
+                              in conditions.iteritems()
+                              if not col in best_index])
+
+        for column in remaining:
+            if not column in self.columns:
+                return []
+
+        return [TableRow(self, position) for position in positions
+                if not [col for col, value in remaining.iteritems()
+                        if self.columns[col][position] != value]]
+
+    def lookup_values(self, column, **conditions):
+        '''
+        Returns the values of column in the rows holding the given column
+        values. Rows not defining column are skipped.
+        '''
+        values = []
+
+        for row in self.lookup(**conditions):
+            value = self.columns[column][row.position]
+
+            if value is not _MISSING:
+                values.append(value)
+
+        return values
+
+    def compact(self):
+        '''
+        Releases the space of the removed rows. Any TableRow view obtained
+        before is invalidated.
+        '''
+        if not self.deleted:
+            return
+
+        live = [position for position in xrange(self.size)
+                if not position in self.deleted]
+
+        for column in self.columns.keys():
+            values = self.columns[column]
+            self.columns[column] = [values[position] for position in live]
+
+        self.size = len(live)
+        self.deleted = set()
+
+        for index in self.indexes:
+            self.indexes[index] = {}
+
+        for position in xrange(self.size):
+            self._index_row(position)
+
+    def clear(self):
+        self.columns = {}
+        self.size = 0
+        self.deleted = set()
+
+        for index in self.indexes:
+            self.indexes[index] = {}
+
+    def dump(self):
+        '''
+        Returns the content of the table in a marshallable form: the
+        column arrays, with None in the cells of the rows not defining a
+        column, and the positions of these cells.
+        '''
+        self.compact()
+        columns = {}
+        missing = {}
+
+        for column, values in self.columns.iteritems():
+            missing[column] = [position for position in xrange(self.size)
+                               if values[position] is _MISSING]
+            columns[column] = [(value is not _MISSING and [value] or [None])[0]
+                               for value in values]
+
+        return {'size': self.size, 'columns': columns, 'missing': missing}
+
+    def load(self, data):
+        '''
+        Replaces the content of the table by data, as returned by dump() or
+        as a list of dictionaries.
+        '''
+        self.clear()
+
+        if isinstance(data, dict):
+            for column, values in data['columns'].iteritems():
+                values = list(values)
+
+                for position in data['missing'][column]:
+                    values[position] = _MISSING
+
+                self.columns[column] = values
+
+            self.size = data['size']
+
+            for position in xrange(self.size):
+                self._index_row(position)
+        else:
+            self.extend(data)
+
+    def __len__(self):
+        return self.size - len(self.deleted)
+
+    def __iter__(self):
+        position = 0
+
+        while position < self.size:
+            if not position in self.deleted:
+                yield TableRow(self, position)
+            position += 1
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 # pylint: disable=W0105
-AUTHOR_NAMES = []
+AUTHOR_NAMES = IndexedTable(('id', 'name', 'db_name'))
 '''
 AUTHOR_NAMES
     Holds data from the aidAUTHORNAMES table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'id': '1',
     'name': 'Groom, Donald E.',
@@ -43,12 +402,12 @@ Example:
     ]
 '''
 
-DOC_LIST = []
+DOC_LIST = IndexedTable(('bibrecid',))
 '''
 DOC_LIST
     Holds data from the aidDOCLIST table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'bibrecid': 680600L,
       'authornameids': [305005L, 44341L],
@@ -58,12 +417,12 @@ Example:
       'authornameid_bibrefrec' : [(305005L, "100:133,681822")]}]
 '''
 
-REALAUTHORS = []
+REALAUTHORS = IndexedTable(('realauthorid', 'virtualauthorid'))
 '''
 REALAUTHORS
     Holds data from the aidREALAUTHORS table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'realauthorid': '1',
         'virtualauthorid': '1020',
@@ -71,12 +430,12 @@ Example:
     ]
 '''
 
-REALAUTHOR_DATA = []
+REALAUTHOR_DATA = IndexedTable(('realauthorid', ('tag', 'value')))
 '''
 REALAUTHOR_DATA
     Holds data from the aidREALAUTHORDATA table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'realauthorid: '1',
         'tag': 'affiliation',
@@ -99,12 +458,13 @@ Example:
     ]
 '''
 
-VIRTUALAUTHORS = []
+VIRTUALAUTHORS = IndexedTable(('virtualauthorid', 'authornamesid',
+                               'clusterid'))
 '''
 VIRTUALAUTHORS
     Holds data from the aidVIRTUALAUTHORS table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'virtualauthorid': '3',
         'authornamesid': '42555',
@@ -113,12 +473,12 @@ Example:
     ]
 '''
 
-VIRTUALAUTHOR_DATA = []
+VIRTUALAUTHOR_DATA = IndexedTable(('virtualauthorid', ('tag', 'value')))
 '''
 VIRTUALAUTHOR_DATA
     Holds data from the aidVIRTUALAUTHORSDATA table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'virtualauthorid' : '1'
         'tag': 'authorIndex'
@@ -138,12 +498,12 @@ Example:
     ]
 '''
 
-VIRTUALAUTHOR_CLUSTERS = []
+VIRTUALAUTHOR_CLUSTERS = IndexedTable(('clusterid', 'clustername'))
 '''
 VIRTUALAUTHOR_CLUSTERS
     Holds data from the aidVIRTUALAUTHORS_clusters table.
 Structure:
-    [{tag: value}*]
+    IndexedTable of [{tag: value}*]
 Example:
     [{'clusterid': '1',
         'clustername': 'Chen, A.'},
@@ -313,13 +673,13 @@ def reset_mem_cache(doit=False):
     '''
 
     if doit:
-        AUTHOR_NAMES[:] = []
-        DOC_LIST[:] = []
-        REALAUTHORS[:] = []
-        REALAUTHOR_DATA[:] = []
-        VIRTUALAUTHORS[:] = []
-        VIRTUALAUTHOR_DATA[:] = []
-        VIRTUALAUTHOR_CLUSTERS[:] = []
+        AUTHOR_NAMES.clear()
+        DOC_LIST.clear()
+        REALAUTHORS.clear()
+        REALAUTHOR_DATA.clear()
+        VIRTUALAUTHORS.clear()
+        VIRTUALAUTHOR_DATA.clear()
+        VIRTUALAUTHOR_CLUSTERS.clear()
         VIRTUALAUTHOR_CLUSTER_CACHE.clear()
         VIRTUALAUTHOR_PROCESS_QUEUE.queue.clear()
         ID_TRACKER.clear()
@@ -832,9 +832,9 @@ def write_mem_cache_to_tables(sanity_checks=False):
     if max_va_id <= 1:
         max_va_id = 2
     random_va_id = random.randint(1, max_va_id - 1)
-    va_mem_data = [row['value'] for row in dat.VIRTUALAUTHOR_DATA
-                   if (row["virtualauthorid"] == random_va_id
-                       and row['tag'] == "orig_authorname_id")][0]
+    va_mem_data = dat.VIRTUALAUTHOR_DATA.lookup_values('value',
+                                            virtualauthorid=random_va_id,
+                                            tag="orig_authorname_id")[0]
 
     if sanity_checks:
         if va_mem_data:
@@ -1246,12 +1246,10 @@ def load_mem_cache_from_tables():
 #    print "Storing doclist entries"
 
     for db_doc in db_doclist:
-        existing_item = [row for row in dat.DOC_LIST
-                         if row['bibrecid'] == db_doc[0]]
+        existing_item = dat.DOC_LIST.lookup(bibrecid=db_doc[0])
 
         if existing_item:
-            for update in [row for row in dat.DOC_LIST
-                           if row['bibrecid'] == db_doc[0]]:
+            for update in existing_item:
                 if not db_doc[1] in update['authornameids']:
                     update['authornameids'].append(db_doc[1])
         else:
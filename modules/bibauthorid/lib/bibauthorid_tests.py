@@ -21,6 +21,8 @@ import unittest
 import bibauthorid_tables_utils as baidtu
 import bibauthorid_utils as baidu
 import bibauthorid_authorname_utils as bau
+import bibauthorid_structs as dat
+import bibauthorid_file_utils as baidfu
 from invenio.testutils import make_test_suite, run_test_suite
 
 class TestSplitNameParts(unittest.TestCase):
@@ -99,6 +101,27 @@ class TestCleanNameString(unittest.TestCase):
         self.assertEqual('',
             baidu.clean_name_string(''))
 
+class TestNameIndexTerms(unittest.TestCase):
+    """Test for the functionality of the person name index terms"""
+
+    def test_get_name_index_terms(self):
+        """bibauthorid - test terms of the person name index"""
+
+        self.assertEqual(['g:ell', 'g:lis', 'g:lli', 'i:ellis,j',
+                          's:ellis', 't:ellis'],
+            sorted(baidu.get_name_index_terms('Ellis, John R.')))
+
+        self.assertEqual(['g:li', 's:li', 't:li'],
+            sorted(baidu.get_name_index_terms('Li')))
+
+        self.assertEqual([], sorted(baidu.get_name_index_terms('')))
+
+    def test_get_name_index_ngrams(self):
+        """bibauthorid - test n-grams of the person name index"""
+
+        self.assertEqual(set([u'des', u'esa', u'sac']),
+            baidu.get_name_index_ngrams(u'de sac'))
+
 class TestCompareNames(unittest.TestCase):
     """Test for the functionality of comparison of names strings"""
 
@@ -127,11 +150,98 @@ class TestCompareNames(unittest.TestCase):
             bau.compare_names('', ''))
 
 
+class TestIndexedTable(unittest.TestCase):
+    """Test for the indexed in-memory tables"""
+
+    def setUp(self):
+        """Fill a virtual author data table"""
+        self.table = dat.IndexedTable(('virtualauthorid', ('tag', 'value')))
+        self.table.append({'virtualauthorid': 1, 'tag': 'bibrec_id',
+                           'value': '10'})
+        self.table.append({'virtualauthorid': 2, 'tag': 'bibrec_id',
+                           'value': '10'})
+        self.table.append({'virtualauthorid': 1, 'tag': 'connected',
+                           'value': 'False'})
+
+    def test_lookup(self):
+        """bibauthorid - test indexed table lookups"""
+
+        self.assertEqual([1, 2], self.table.lookup_values('virtualauthorid',
+                                                          tag='bibrec_id',
+                                                          value='10'))
+
+        self.assertEqual([{'virtualauthorid': 1, 'tag': 'connected',
+                           'value': 'False'}],
+                         self.table.lookup(virtualauthorid=1, tag='connected'))
+
+        self.assertEqual([], self.table.lookup(virtualauthorid=3))
+
+    def test_update_and_remove(self):
+        """bibauthorid - test indexed table updates and removals"""
+
+        self.table.lookup(virtualauthorid=1, tag='connected')[0]['value'] = \
+            'True'
+        self.assertEqual([], self.table.lookup(tag='connected', value='False'))
+        self.assertEqual([1], self.table.lookup_values('virtualauthorid',
+                                                       tag='connected',
+                                                       value='True'))
+
+        self.table.remove({'virtualauthorid': 2, 'tag': 'bibrec_id',
+                           'value': '10'})
+        self.assertEqual(2, len(self.table))
+        self.assertEqual([1], self.table.lookup_values('virtualauthorid',
+                                                       tag='bibrec_id',
+                                                       value='10'))
+
+    def test_dump_and_load(self):
+        """bibauthorid - test indexed table dump and load"""
+
+        self.table.append({'virtualauthorid': 3, 'tag': 'updated',
+                           'value': 'True', 'p': 0})
+        loaded = dat.IndexedTable(('virtualauthorid', ('tag', 'value')))
+        loaded.load(self.table.dump())
+
+        self.assertEqual(list(self.table), list(loaded))
+        self.assertEqual([0], loaded.lookup_values('p', virtualauthorid=3))
+        self.assertEqual([], loaded.lookup_values('p', virtualauthorid=1))
+
+
+class TestMemCacheBlob(unittest.TestCase):
+    """Test for the serialization of the memory cache between processes"""
+
+    def tearDown(self):
+        """Empty the memory cache"""
+        dat.reset_mem_cache(True)
+
+    def test_dump_and_load_mem_cache(self):
+        """bibauthorid - test memory cache blob round trip"""
+
+        dat.reset_mem_cache(True)
+        dat.VIRTUALAUTHORS.append({'virtualauthorid': 1, 'authornamesid': 7,
+                                   'p': 1, 'clusterid': 2})
+        dat.DOC_LIST.append({'bibrecid': 10, 'authornameids': [7]})
+        dat.increment_tracker("va_id_counter")
+        blob = baidfu.dump_mem_cache()
+
+        dat.reset_mem_cache(True)
+        self.assertEqual(0, len(dat.VIRTUALAUTHORS))
+
+        baidfu.load_mem_cache(blob)
+        self.assertEqual([7], dat.VIRTUALAUTHORS.lookup_values('authornamesid',
+                                                               clusterid=2))
+        self.assertEqual([[7]], dat.DOC_LIST.lookup_values('authornameids',
+                                                           bibrecid=10))
+        self.assertEqual(1, dat.ID_TRACKER["va_id_counter"])
+
+
 TEST_SUITE = make_test_suite(TestSplitNameParts,
                              TestCreateUnifiedNames,
                              TestCreateNormalizedName,
                              TestCleanNameString,
-                             TestCompareNames,)
+                             TestNameIndexTerms,
+                             TestCompareNames,
+                             TestIndexedTable,
+                             TestMemCacheBlob,)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -32,6 +32,12 @@ try:
 except ImportError:
     pass
 
+try:
+    import unidecode
+    UNIDECODE_ENABLED = True
+except ImportError:
+    UNIDECODE_ENABLED = False
+
 
 def string_partition(s, sep, dir='l'):
     '''
@@ -459,6 +465,83 @@ def str_to_int(string_value):
     return int(''.join([c for c in string_value if c.isdigit()]))
 
 
+def normalize_name_index_string(string):
+    '''
+    Normalizes a (part of a) name for the person name index: transliterates
+    it to ASCII if unidecode is available, lowercases it and removes every
+    character that is neither alphanumeric nor whitespace.
+
+    @param string: the string to normalize
+    @type string: string
+
+    @return: the normalized string
+    @rtype: unicode
+    '''
+    if not isinstance(string, unicode):
+        string = string.decode('utf-8', 'ignore')
+
+    if UNIDECODE_ENABLED:
+        string = unidecode.unidecode(string)
+
+    string = re.compile(r"[^\w\s]|_", re.UNICODE).sub("", string.lower())
+
+    return u" ".join(string.split())
+
+
+def get_name_index_ngrams(surname):
+    '''
+    Returns the character n-grams of a normalized surname, the whitespace
+    excluded. Surnames shorter than an n-gram are their own only n-gram.
+
+    @param surname: the normalized surname
+    @type surname: unicode
+
+    @return: the set of n-grams
+    @rtype: set of unicode strings
+    '''
+    size = bconfig.PERSONID_NAME_INDEX_NGRAM_SIZE
+    surname = surname.replace(u" ", u"")
+
+    if len(surname) <= size:
+        return set([surname])
+
+    return set([surname[i:i + size] for i in range(len(surname) - size + 1)])
+
+
+def get_name_index_terms(name_string):
+    '''
+    Returns the terms under which a name is stored in the person name index:
+    the normalized surname, its tokens, the surname with the first initial
+    and the character n-grams of the surname.
+
+    @param name_string: the name, e.g. 'Ellis, John R.'
+    @type name_string: string
+
+    @return: the utf-8 encoded index terms, e.g. set(['s:ellis', 't:ellis',
+        'i:ellis,j', 'g:ell', 'g:lli', 'g:lis'])
+    @rtype: set of strings
+    '''
+    surname, initials = split_name_parts(name_string)[0:2]
+    surname = normalize_name_index_string(surname)
+
+    if not surname:
+        return set()
+
+    terms = set([u"s:%s" % surname])
+
+    for token in surname.split():
+        terms.add(u"t:%s" % token)
+
+    if initials:
+        terms.add(u"i:%s,%s" % (surname,
+                                normalize_name_index_string(initials[0])))
+
+    for ngram in get_name_index_ngrams(surname):
+        terms.add(u"g:%s" % ngram)
+
+    return set([term.encode('utf-8') for term in terms])
+
+
 def clean_name_string(namestring, replacement=" ", keep_whitespace=True,
                       trim_whitespaces=False):
     '''
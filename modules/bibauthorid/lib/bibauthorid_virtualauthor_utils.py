@@ -122,8 +122,7 @@ def update_virtualauthor_cluster(va_id):
     ori_name = clean_name_string(ori_name)
     current_cluster_ids = get_clusterids_from_name(ori_name, True)
 
-    for va_item in [row for row in dat.VIRTUALAUTHORS
-               if row['virtualauthorid'] == va_id]:
+    for va_item in dat.VIRTUALAUTHORS.lookup(virtualauthorid=va_id):
         va_item['clusterid'] = current_cluster_ids[1]
 
     bconfig.LOGGER.debug("| Found %s cluster for %s. Now set to %s." %
@@ -163,17 +162,10 @@ def get_virtualauthor_records(va_id, tag=False):
     @param tag: the tag to read. Optional. Default: False
     @type tag: string
     '''
-    rows = []
-
     if tag:
-        rows = [row for row in dat.VIRTUALAUTHOR_DATA
-                if ((row['virtualauthorid'] == va_id)
-                    and (row['tag'] == tag))]
-    else:
-        rows = [row for row in dat.VIRTUALAUTHOR_DATA
-                if row['virtualauthorid'] == va_id]
+        return dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id, tag=tag)
 
-    return rows
+    return dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id)
 
 
 def get_virtualauthor_record_tags():
@@ -202,15 +194,11 @@ def update_virtualauthor_record(va_id, tag, value):
     @param value: value to be written for the tag
     @type value: string
     '''
-    current_tag_value = [row for row in dat.VIRTUALAUTHOR_DATA
-                         if ((row['virtualauthorid'] == va_id)
-                             and (row['tag'] == tag))]
+    current_tag_value = dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id,
+                                                      tag=tag)
 
     if len(current_tag_value) > 0:
-        for tagupdate in [row for row in dat.VIRTUALAUTHOR_DATA
-                          if ((row['virtualauthorid'] == va_id)
-                              and (row['tag'] == tag))]:
-            tagupdate['tag'] = tag
+        for tagupdate in current_tag_value:
             tagupdate['value'] = value
 
         dat.update_log("touched_vas", va_id)
@@ -227,9 +215,8 @@ def delete_virtualauthor_record(va_id, tag):
     @param tag: tag of the record to be deleted
     @type tag: string
     '''
-    for tagupdate in list([row for row in dat.VIRTUALAUTHOR_DATA
-                      if ((row['virtualauthorid'] == va_id)
-                          and (row['tag'] == tag))]):
+    for tagupdate in dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=va_id,
+                                                   tag=tag):
         dat.VIRTUALAUTHOR_DATA.remove(tagupdate)
 
     dat.update_log("touched_vas", va_id)
@@ -246,7 +233,7 @@ def get_whole_va_cluster(cluster_id):
         author that belongs to a certain cluster.
     @rtype: a list of dictionaries
     '''
-    return [row for row in dat.VIRTUALAUTHORS if row['clusterid'] == cluster_id]
+    return dat.VIRTUALAUTHORS.lookup(clusterid=cluster_id)
 
 
 def get_cluster_va_ids(cluster_id):
@@ -260,17 +247,8 @@ def get_cluster_va_ids(cluster_id):
     @return: A list of virtual author IDs
     @rtype: list of int
     '''
-    matches = set()
-
-    for row in sorted(dat.VIRTUALAUTHORS, key=itemgetter('clusterid')):
-        if row['clusterid'] == cluster_id:
-            matches.add(row['virtualauthorid'])
-        elif row['clusterid'] > cluster_id:
-            break
-        else:
-            continue
-
-    return list(matches)
+    return list(set(dat.VIRTUALAUTHORS.lookup_values('virtualauthorid',
+                                                     clusterid=cluster_id)))
 
 
 def get_cluster_va_ids_from_va_id(va_id):
@@ -395,10 +373,9 @@ def _get_clusterids_from_name(search_string, return_matching=False):
     newly_created_cluster_id = -1
     existing_initial_cluster_id = -1
 
-    for row in dat.VIRTUALAUTHOR_CLUSTERS:
-        if row['clustername'] == search_string:
-            existing_initial_cluster_id = row['clusterid']
-            break
+    for row in dat.VIRTUALAUTHOR_CLUSTERS.lookup(clustername=search_string):
+        existing_initial_cluster_id = row['clusterid']
+        break
 
     if existing_initial_cluster_id > -1:
         clusterids.add(existing_initial_cluster_id)
@@ -482,10 +459,9 @@ def get_orphan_virtualauthors():
     @return: a list of all the virtual author IDs tagged as orphans.
     @rtype: list of int
     '''
-    valist = [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-              if ((row['tag'] == 'connected')
-                  and (row['value'] == 'False'))]
-    return valist
+    return dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                tag='connected',
+                                                value='False')
 
 
 def get_next_updated_virtualauthor():
@@ -498,9 +474,9 @@ def get_next_updated_virtualauthor():
     @rtype: int
     """
     while(True):
-        valist = [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                  if ((row['tag'] == 'updated')
-                      and (row['value'] == 'True'))]
+        valist = dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                      tag='updated',
+                                                      value='True')
 
         if len(valist) > 0:
             last_valist_str = ''
@@ -528,16 +504,12 @@ def init_va_process_queue(mode="updated"):
     va_nosort = {}
 
     if mode == "updated":
-        for va_entry in [row['virtualauthorid'] for row in
-                         dat.VIRTUALAUTHOR_DATA
-                         if ((row['tag'] == 'updated')
-                             and (row['value'] == 'True'))]:
+        for va_entry in dat.VIRTUALAUTHOR_DATA.lookup_values(
+                                'virtualauthorid', tag='updated', value='True'):
             va_nosort[va_entry] = 0
     elif mode == "orphaned":
-        for va_entry in [row['virtualauthorid'] for row in
-                         dat.VIRTUALAUTHOR_DATA
-                         if ((row['tag'] == 'connected')
-                             and (row['value'] == 'False'))]:
+        for va_entry in dat.VIRTUALAUTHOR_DATA.lookup_values(
+                        'virtualauthorid', tag='connected', value='False'):
             va_nosort[va_entry] = 0
 
     for va_id in va_nosort:
@@ -580,9 +552,8 @@ def get_updated_virtualauthors():
     @return: list of updated virtual authors
     @rtype: list of int
     """
-    return [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                  if ((row['tag'] == 'updated')
-                      and (row['value'] == 'True'))]
+    return dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                tag='updated', value='True')
 
 
 def get_va_id_from_recid_and_nameid(bibrec, authornamesid):
@@ -599,12 +570,12 @@ def get_va_id_from_recid_and_nameid(bibrec, authornamesid):
     '''
     va_ids = set()
 
-    for possible_va_id in [row['virtualauthorid'] for row in dat.VIRTUALAUTHORS
-                              if row['authornamesid'] == authornamesid]:
-        for va_id in [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                      if ((row['virtualauthorid'] == possible_va_id) and
-                          (row['tag'] == 'bibrec_id') and
-                          (row['value'] == bibrec))]:
+    for possible_va_id in dat.VIRTUALAUTHORS.lookup_values('virtualauthorid',
+                                                authornamesid=authornamesid):
+        for va_id in dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                virtualauthorid=possible_va_id,
+                                                tag='bibrec_id',
+                                                value=bibrec):
             va_ids.add(va_id)
 
     return list(va_ids)
@@ -622,9 +593,9 @@ def get_va_ids_from_recid(bibrec):
     '''
     va_ids = set()
 
-    for va_id in [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                  if ((row['tag'] == 'bibrec_id') and
-                      (row['value'] == str(bibrec)))]:
+    for va_id in dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                      tag='bibrec_id',
+                                                      value=str(bibrec)):
         va_ids.add(va_id)
 
     return list(va_ids)
@@ -644,14 +615,14 @@ def get_va_ids_by_recid_lname(bibrec, lastname):
     @rtype: list of int
     '''
     va_ids = set()
-    pot_va_ids = [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                  if ((row['tag'] == 'bibrec_id') and
-                      (row['value'] == str(bibrec)))]
-    for va_id in [row['virtualauthorid'] for row in dat.VIRTUALAUTHOR_DATA
-                      if ((row['virtualauthorid'] in pot_va_ids) and
-                          (row['tag'] == 'orig_name_string') and
-                          (split_name_parts(row['value'])[0] == lastname))]:
-        va_ids.add(va_id)
+    pot_va_ids = dat.VIRTUALAUTHOR_DATA.lookup_values('virtualauthorid',
+                                                      tag='bibrec_id',
+                                                      value=str(bibrec))
+    for pot_va_id in pot_va_ids:
+        for row in dat.VIRTUALAUTHOR_DATA.lookup(virtualauthorid=pot_va_id,
+                                                 tag='orig_name_string'):
+            if split_name_parts(row['value'])[0] == lastname:
+                va_ids.add(pot_va_id)
 
     return list(va_ids)
 
@@ -673,13 +644,12 @@ def delete_virtual_author(va_id):
         except (ValueError, TypeError):
             raise ValueError("Expecting the va id to be an int.")
 
-    tags = get_virtualauthor_record_tags()
+    tags = set([row['tag'] for row in get_virtualauthor_records(va_id)])
 
     for tag in tags:
         delete_virtualauthor_record(va_id, tag)
 
-    for deletion_candidate in list([row for row in dat.VIRTUALAUTHORS
-                               if row['virtualauthorid'] == va_id]):
+    for deletion_candidate in dat.VIRTUALAUTHORS.lookup(virtualauthorid=va_id):
         dat.VIRTUALAUTHORS.remove(deletion_candidate)
 
     dat.update_log("deleted_vas", va_id)
@@ -30,12 +30,14 @@ import sys
 STANDALONE = False
 
 try:
-    from invenio.bibclassify_engine import output_keywords_for_sources
+    from invenio.bibclassify_engine import output_keywords_for_sources, \
+        benchmark_keywords_for_sources
     from invenio.bibclassify_utils import write_message, set_verbose_level
     from invenio.bibclassify_daemon import bibclassify_daemon
     from invenio.bibclassify_ontology_reader import check_taxonomy
 except ImportError, err:
-    from bibclassify_engine import output_keywords_for_sources
+    from bibclassify_engine import output_keywords_for_sources, \
+        benchmark_keywords_for_sources
     from bibclassify_utils import write_message, set_verbose_level
     from bibclassify_ontology_reader import check_taxonomy
     write_message("WARNING: Running in standalone mode.", stream=sys.stderr,
@@ -107,6 +109,13 @@ def main():
         if options['check_taxonomy']:
             check_taxonomy(options['taxonomy'])
 
+        if options['benchmark']:
+            benchmark_keywords_for_sources(options["text_files"],
+                options["taxonomy"],
+                rebuild_cache=options["rebuild_cache"],
+                no_cache=options["no_cache"])
+            return
+
         output_keywords_for_sources(options["text_files"],
             options["taxonomy"],
             rebuild_cache=options["rebuild_cache"],
@@ -150,6 +159,10 @@ Standalone file mode options:
                             the document.
    --acronyms-file=FILE     if specified, the acronyms will be added to the
                             content of that file
+  --benchmark               times the matching of the single keywords in the
+                            files against running all their regular
+                            expressions over the text, and checks that both
+                            find the same keywords
 Daemon mode options:
   -i, --recid=RECID         extract keywords for a record and store into DB
                             (=all necessary ones for pre-defined taxonomies)
@@ -169,6 +182,7 @@ Examples (standalone file mode):
     $ bibclassify -k HEP.rdf http://arxiv.org/pdf/0808.1825
     $ bibclassify -k HEP.rdf article.pdf
     $ bibclassify -k HEP.rdf directory/
+    $ bibclassify -k HEP.rdf --benchmark directory/
 
 Examples (daemon mode):
     $ bibclassify -u admin -s 24h -L 23:00-05:00
@@ -204,6 +218,7 @@ def _read_options(options_string):
         "extract_acronyms": False,
         "acronyms_file": "",
         "only_core_tags": False,
+        "benchmark": False,
     }
 
     try:
@@ -212,7 +227,8 @@ def _read_options(options_string):
             "keywords-number=", "matching-mode=", "help", "version", "file",
             "rebuild-cache", "no-limit", "no-cache", "check-taxonomy",
             "detect-author-keywords", "id:", "collection:", "modified:",
-            "extract-acronyms", "acronyms-file=", "only-core-tags"]
+            "extract-acronyms", "acronyms-file=", "only-core-tags",
+            "benchmark"]
         opts, args = getopt.gnu_getopt(options_string, short_flags, long_flags)
     except getopt.GetoptError, err1:
         print >> sys.stderr, "Options problem: %s" % err1
@@ -242,6 +258,7 @@ def _read_options(options_string):
         "--detect-author-keywords": "with_author_keywords",
         "--extract-acronyms": "acronyms",
         "--only-core-tags": "only_core_tags",
+        "--benchmark": "benchmark",
     }
 
     for option, argument in opts:
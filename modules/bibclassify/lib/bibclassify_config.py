@@ -39,6 +39,16 @@ CFG_BIBCLASSIFY_USER_AGENT = ""
 # Number of keywords that are output per default.
 CFG_BIBCLASSIFY_DEFAULT_OUTPUT_NUMBER = 20
 
+# DAEMON
+
+# Number of processes extracting the text of the documents and analyzing
+# their keywords in parallel. 0 means one per CPU.
+CFG_BIBCLASSIFY_DAEMON_PROCESSES = 0
+
+# Number of records whose keywords are uploaded together by one BibUpload
+# task.
+CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE = 1000
+
 # PARTIAL_TEXT
 # Marks the part of the fulltext to keep when running a partial match.
 # Each tuple contains the start and end percentages of a section.
@@ -179,3 +189,8 @@ CFG_BIBCLASSIFY_AUTHOR_KW_END = (
 
 CFG_BIBCLASSIFY_AUTHOR_KW_SEPARATION = re.compile(" ?; ?| ?, ?| ?- ")
 
+# ONTOLOGY CACHE
+
+# Version of the format of the cached ontologies. Cached ontologies
+# written with another version are rebuilt.
+CFG_BIBCLASSIFY_ONTOLOGY_CACHE_VERSION = 3
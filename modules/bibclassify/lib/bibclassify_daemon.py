@@ -28,12 +28,24 @@ This is not clean and should be fixed.
 import sys
 import time
 import os
+import tempfile
+from itertools import imap
+
+try:
+    import multiprocessing
+    _MULTIPROCESSING_ENABLED = True
+except ImportError:
+    # Python < 2.6: analyze the documents in the task process.
+    _MULTIPROCESSING_ENABLED = False
 
 from invenio.dbquery import run_sql
 from invenio.bibtask import task_init, write_message, task_update_progress, \
     task_set_option, task_get_option, task_sleep_now_if_required, \
     task_get_task_param
-from invenio.bibclassify_engine import output_keywords_for_local_file
+from invenio.bibclassify_engine import output_keywords_for_local_file, \
+    load_taxonomy
+from invenio.bibclassify_config import CFG_BIBCLASSIFY_DAEMON_PROCESSES, \
+    CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE
 from invenio.config import CFG_BINDIR, CFG_TMPDIR
 from invenio.intbitset import intbitset
 from invenio.search_engine import get_collection_reclist
@@ -45,6 +57,9 @@ from invenio.config import CFG_VERSION
 _INDEX = 0
 _RECIDS_NUMBER = 0
 
+# MARCXML of the analyzed records waiting to be uploaded.
+_RECORDS_TO_UPLOAD = []
+
 
 ## INTERFACE
 
@@ -252,10 +267,6 @@ def _task_run_core():
             _update_date_of_last_run(task_get_task_param('task_starting_time'))
         return 1
 
-    changes = []
-    changes.append('<?xml version="1.0" encoding="UTF-8"?>')
-    changes.append('<collection xmlns="http://www.loc.gov/MARC21/slim">')
-
     # Count the total number of records in order to update the progression.
     global _RECIDS_NUMBER
     for onto_rec in onto_recids:
@@ -275,37 +286,13 @@ def _task_run_core():
                 stream=sys.stderr, verbose=3)
 
         if onto_rec['recIDs']:
-            changes.append(_analyze_documents(onto_rec['recIDs'],
-                onto_rec['ontology'], onto_rec['collection']))
-
-    changes.append('</collection>')
+            if not _analyze_documents(onto_rec['recIDs'],
+                onto_rec['ontology'], onto_rec['collection']):
+                return 0
 
-    # Write the changes to a temporary file.
-    tmp_directory = "%s/bibclassify" % CFG_TMPDIR
-    filename = "bibclassifyd_%s.xml" % time.strftime("%Y%m%d%H%M%S",
-        time.localtime())
-    abs_path = os.path.join(tmp_directory, filename)
-
-    if not os.path.isdir(tmp_directory):
-        os.mkdir(tmp_directory)
-
-    file_desc = open(abs_path, "w")
-    file_desc.write('\n'.join(changes))
-    file_desc.close()
-
-    # Apply the changes.
-    if changes:
-        cmd = "%s/bibupload -n -c '%s' " % (CFG_BINDIR, abs_path)
-        errcode = 0
-        try:
-            errcode = os.system(cmd)
-        except OSError, exc:
-            write_message('ERROR: Command %s failed [%s].' % (cmd, exc),
-                stream=sys.stderr, verbose=0)
-        if errcode != 0:
-            write_message("ERROR: %s failed, error code is %d." %
-                (cmd, errcode), stream=sys.stderr, verbose=0)
-            return 0
+    # Apply the remaining changes.
+    if not _upload_records():
+        return 0
 
     # Update the date of last run in the clsMETHOD table, but only if
     # we were running in an automated mode.
@@ -315,42 +302,129 @@ def _task_run_core():
 
 def _analyze_documents(records, ontology, collection):
     """For each collection, parse the documents attached to the records
-    in collection with the corresponding ontology."""
+    in collection with the corresponding ontology. The documents are
+    analyzed by a pool of worker processes and their keywords are
+    uploaded by chunks of CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE records.
+    Returns False if an upload failed, True otherwise."""
     global _INDEX
 
     if not records:
         # No records could be found.
         write_message("WARNING: No record were found in collection %s." %
             collection, stream=sys.stderr, verbose=2)
-        return False
+        return True
+
+    # Load the taxonomy before forking the workers so that they all
+    # share it.
+    load_taxonomy(ontology)
+
+    pool = None
+    if _MULTIPROCESSING_ENABLED and CFG_BIBCLASSIFY_DAEMON_PROCESSES != 1:
+        pool = multiprocessing.Pool(CFG_BIBCLASSIFY_DAEMON_PROCESSES or None)
+
+    records = list(records)
+    try:
+        for index in range(0, len(records), CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE):
+            # The documents are listed by the task process as the workers
+            # cannot use its database connection.
+            jobs = []
+            for record in records[index:index +
+                CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE]:
+                jobs.append((record, [doc.get_full_path() for doc in
+                    BibRecDocs(record).list_latest_files()], ontology,
+                    task_get_option('verbose')))
+
+            # While some workers wait for pdftotext, the others analyze
+            # the text they already extracted.
+            if pool is None:
+                outputs = imap(_analyze_record, jobs)
+            else:
+                outputs = pool.imap_unordered(_analyze_record, jobs)
+
+            for output in outputs:
+                _RECORDS_TO_UPLOAD.append(output)
+                if len(_RECORDS_TO_UPLOAD) >= CFG_BIBCLASSIFY_DAEMON_CHUNK_SIZE:
+                    if not _upload_records():
+                        return False
+
+                _INDEX += 1
+
+                task_update_progress('Done %d out of %d.' % (_INDEX,
+                    _RECIDS_NUMBER))
+                task_sleep_now_if_required(can_stop_too=False)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    return True
+
+def _analyze_record(job):
+    """Returns the MARCXML of the keywords of the PDF documents of a
+    record. Runs in the worker processes: job is a tuple (recid, paths
+    of the documents, ontology, verbose level)."""
+    record, paths, ontology, verbose = job
 
-    # Process records:
     output = []
-    for record in records:
-        bibdocfiles = BibRecDocs(record).list_latest_files()
-        output.append('<record>')
-        output.append('<controlfield tag="001">%s</controlfield>' % record)
-        for doc in bibdocfiles:
-            # Get the keywords for each PDF document contained in the record.
-            if is_pdf(doc.get_full_path()):
-                write_message('INFO: Generating keywords for record %d.' %
-                    record, stream=sys.stderr, verbose=3)
-                fulltext = doc.get_full_path()
-
-                output.append(output_keywords_for_local_file(fulltext,
-                    taxonomy=ontology, output_mode="marcxml", output_limit=3,
-                    match_mode="partial", with_author_keywords=True,
-                    verbose=task_get_option('verbose')))
-
-        _INDEX += 1
-
-        output.append('</record>')
-
-        task_update_progress('Done %d out of %d.' % (_INDEX, _RECIDS_NUMBER))
-        task_sleep_now_if_required(can_stop_too=False)
+    output.append('<record>')
+    output.append('<controlfield tag="001">%s</controlfield>' % record)
+    for path in paths:
+        # Get the keywords for each PDF document contained in the record.
+        if is_pdf(path):
+            write_message('INFO: Generating keywords for record %d.' %
+                record, stream=sys.stderr, verbose=3)
+
+            output.append(output_keywords_for_local_file(path,
+                taxonomy=ontology, output_mode="marcxml", output_limit=3,
+                match_mode="partial", with_author_keywords=True,
+                verbose=verbose))
+    output.append('</record>')
 
     return '\n'.join(output)
 
+def _upload_records():
+    """Writes the MARCXML of the analyzed records waiting to be uploaded
+    to a temporary file and uploads it with BibUpload. Returns False if
+    the upload failed, True otherwise."""
+    global _RECORDS_TO_UPLOAD
+
+    if not _RECORDS_TO_UPLOAD:
+        return True
+
+    changes = []
+    changes.append('<?xml version="1.0" encoding="UTF-8"?>')
+    changes.append('<collection xmlns="http://www.loc.gov/MARC21/slim">')
+    changes.extend(_RECORDS_TO_UPLOAD)
+    changes.append('</collection>')
+    _RECORDS_TO_UPLOAD = []
+
+    # Write the changes to a temporary file.
+    tmp_directory = "%s/bibclassify" % CFG_TMPDIR
+
+    if not os.path.isdir(tmp_directory):
+        os.mkdir(tmp_directory)
+
+    file_desc, abs_path = tempfile.mkstemp(prefix="bibclassifyd_%s_" %
+        time.strftime("%Y%m%d%H%M%S", time.localtime()), suffix=".xml",
+        dir=tmp_directory)
+    file_desc = os.fdopen(file_desc, "w")
+    file_desc.write('\n'.join(changes))
+    file_desc.close()
+
+    # Apply the changes.
+    cmd = "%s/bibupload -n -c '%s' " % (CFG_BINDIR, abs_path)
+    errcode = 0
+    try:
+        errcode = os.system(cmd)
+    except OSError, exc:
+        write_message('ERROR: Command %s failed [%s].' % (cmd, exc),
+            stream=sys.stderr, verbose=0)
+    if errcode != 0:
+        write_message("ERROR: %s failed, error code is %d." %
+            (cmd, errcode), stream=sys.stderr, verbose=0)
+        return False
+
+    return True
+
 def _task_submit_check_options():
     """Required by bibtask. Checks the options."""
     recids = task_get_option('recids')
@@ -367,7 +441,3 @@ def _task_submit_check_options():
         return False
 
     return True
-
-# FIXME: outfiledesc can be multiple files, e.g. when processing
-#    100000 records it is good to store results by 1000 records
-#    (see oaiharvest)
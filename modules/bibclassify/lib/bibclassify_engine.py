@@ -38,7 +38,8 @@ try:
         text_lines_from_url
     from bibclassify_text_normalizer import normalize_fulltext, cut_references
     from bibclassify_keyword_analyzer import get_single_keywords, \
-        get_composite_keywords, get_author_keywords
+        get_composite_keywords, get_author_keywords, get_keyword_matcher, \
+        benchmark_single_keywords
     from bibclassify_config import CFG_BIBCLASSIFY_DEFAULT_OUTPUT_NUMBER, \
         CFG_BIBCLASSIFY_PARTIAL_TEXT, CFG_BIBCLASSIFY_USER_AGENT
     from bibclassify_utils import write_message, set_verbose_level
@@ -123,6 +124,42 @@ def output_keywords_for_sources(input_sources, taxonomy, rebuild_cache=False,
             else:
                 print keywords
 
+def benchmark_keywords_for_sources(input_sources, taxonomy,
+    rebuild_cache=False, no_cache=False):
+    """Benchmarks the matching of the single keywords of the taxonomy in the
+    local files and directories of input_sources (see
+    benchmark_single_keywords)."""
+    skws = get_regular_expressions(taxonomy, rebuild=rebuild_cache,
+        no_cache=no_cache)[0]
+
+    local_files = []
+    for entry in input_sources:
+        if os.path.isdir(entry):
+            for filename in sorted(os.listdir(entry)):
+                if os.path.isfile(os.path.join(entry, filename)):
+                    local_files.append(os.path.join(entry, filename))
+        elif os.path.isfile(entry):
+            local_files.append(entry)
+
+    fulltexts = []
+    for local_file in local_files:
+        text_lines = text_lines_from_local_file(local_file)
+        if text_lines:
+            text_lines = cut_references(text_lines)
+            fulltexts.append(normalize_fulltext("\n".join(text_lines)))
+
+    benchmark_single_keywords(skws, fulltexts)
+
+def load_taxonomy(taxonomy, rebuild_cache=False, no_cache=False):
+    """Loads the taxonomy used by the next keyword extractions, e.g. before
+    forking worker processes that will share it."""
+    global _SKWS
+    global _CKWS
+    _SKWS, _CKWS = get_regular_expressions(taxonomy, rebuild=rebuild_cache,
+        no_cache=no_cache)
+    # Make sure the keyword matcher is compiled as well.
+    get_keyword_matcher(_SKWS)
+
 def output_keywords_for_local_file(local_file, taxonomy, rebuild_cache=False,
     output_mode="text", output_limit=CFG_BIBCLASSIFY_DEFAULT_OUTPUT_NUMBER,
     match_mode="full", no_cache=False, with_author_keywords=False,
@@ -26,6 +26,8 @@ keywords and author keywords.
 """
 
 import re
+import sre_constants
+import sre_parse
 import sys
 import time
 
@@ -39,6 +41,13 @@ except ImportError, err:
     print >> sys.stderr, "Error: %s" % err
     sys.exit(1)
 
+try:
+    from aho_corasick import AhoCorasickAutomaton
+except ImportError:
+    # Standalone BibClassify without the Aho-Corasick automaton: the
+    # keyword matcher runs every regular expression over the text.
+    AhoCorasickAutomaton = None
+
 # Retrieve the custom configuration if it exists.
 try:
     from bibclassify_config_local import *
@@ -49,15 +58,74 @@ except ImportError:
 _MAXIMUM_SEPARATOR_LENGTH = max([len(_separator)
     for _separator in CFG_BIBCLASSIFY_VALID_SEPARATORS])
 
+# (single keywords, keyword matcher) of the taxonomy used last. Only
+# this matcher is kept, so that loading other taxonomies does not pile
+# up their keywords in memory.
+_KEYWORD_MATCHER = (None, None)
+
+# Beyond this number of possible starts of a match before its anchor,
+# the regular expression is run over the whole text.
+_MAXIMUM_ANCHOR_OFFSET_RANGE = 16
+
 def get_single_keywords(skw_db, fulltext, verbose=True):
     """Returns a dictionary of single keywords bound with the positions
     of the matches in the fulltext.
     Format of the output dictionary is (single keyword: positions)."""
     timer_start = time.clock()
 
-    # Matched span -> single keyword
-    records = []
+    records = get_keyword_matcher(skw_db).get_spans(fulltext)
+
+    # List of single_keywords: {spans: single keyword}
+    single_keywords = {}
+    for span, single_keyword in records:
+        single_keywords.setdefault(single_keyword, []).append(span)
+
+    if verbose:
+        write_message("INFO: Matching single keywords... %d keywords found "
+            "in %.1f sec." % (len(single_keywords), time.clock() - timer_start),
+            stream=sys.stderr, verbose=3)
+
+    return single_keywords
 
+def benchmark_single_keywords(skw_db, fulltexts):
+    """Benchmarks the keyword matcher against the previous matching of the
+    single keywords, which ran every regular expression over the whole
+    text. Prints the time spent by both on each fulltext and checks that
+    they find the same keywords."""
+    timer_start = time.time()
+    get_keyword_matcher(skw_db)
+    print "Keyword matcher: %d keywords compiled in %.2f sec." % \
+        (len(skw_db), time.time() - timer_start)
+
+    total_matcher = total_regexes = 0.0
+    for fulltext in fulltexts:
+        timer_start = time.time()
+        found_by_matcher = get_single_keywords(skw_db, fulltext,
+            verbose=False)
+        time_matcher = time.time() - timer_start
+
+        timer_start = time.time()
+        found_by_regexes = _get_single_keywords_by_regexes(skw_db, fulltext)
+        time_regexes = time.time() - timer_start
+
+        for single_keywords in (found_by_matcher, found_by_regexes):
+            for spans in single_keywords.itervalues():
+                spans.sort()
+        print "%d characters, %d keywords: %.3f sec. (regular expressions: " \
+            "%.3f sec.)%s" % (len(fulltext), len(found_by_matcher),
+            time_matcher, time_regexes,
+            found_by_matcher != found_by_regexes and " DIFFERENT" or "")
+        total_matcher += time_matcher
+        total_regexes += time_regexes
+
+    print "%d fulltexts: %.2f sec. (regular expressions: %.2f sec.)" % \
+        (len(fulltexts), total_matcher, total_regexes)
+
+def _get_single_keywords_by_regexes(skw_db, fulltext):
+    """Returns the single keywords found by running all their regular
+    expressions over the fulltext, as get_single_keywords did before the
+    keyword matcher. Only used by benchmark_single_keywords."""
+    records = []
     for single_keyword in skw_db:
         for regex in single_keyword.regex:
             for match in regex.finditer(fulltext):
@@ -80,18 +148,186 @@ def get_single_keywords(skw_db, fulltext, verbose=True):
                 if add:
                     records.append((span, single_keyword))
 
-    # List of single_keywords: {spans: single keyword}
     single_keywords = {}
     for span, single_keyword in records:
         single_keywords.setdefault(single_keyword, []).append(span)
 
-    if verbose:
-        write_message("INFO: Matching single keywords... %d keywords found "
-            "in %.1f sec." % (len(single_keywords), time.clock() - timer_start),
-            stream=sys.stderr, verbose=3)
-
     return single_keywords
 
+def get_keyword_matcher(skw_db):
+    """Returns the keyword matcher of the single keywords skw_db. The
+    matcher is compiled on the first call and then kept as long as the
+    same list of single keywords is used."""
+    registered_skw_db, matcher = _KEYWORD_MATCHER
+    if registered_skw_db is skw_db:
+        return matcher
+
+    timer_start = time.clock()
+    matcher = KeywordMatcher(skw_db)
+    register_keyword_matcher(skw_db, matcher)
+    write_message("INFO: Compiling the keyword matcher... %d anchors "
+        "built in %.1f sec." % (len(matcher.anchored),
+        time.clock() - timer_start), stream=sys.stderr, verbose=3)
+    return matcher
+
+def register_keyword_matcher(skw_db, matcher):
+    """Registers the matcher compiled for the single keywords skw_db,
+    e.g. when it was read from the cached ontology. It replaces the
+    matcher registered before."""
+    global _KEYWORD_MATCHER
+    _KEYWORD_MATCHER = (skw_db, matcher)
+
+class KeywordMatcher:
+    """A matcher of all the single keywords of a taxonomy.
+
+    Every regular expression of the keywords is bound to the longest
+    literal string any of its matches has to contain (its anchor). All
+    the anchors are compiled in an Aho-Corasick automaton that finds the
+    occurrences of the anchors in a text in a single pass. The regular
+    expressions are then only tried at the few positions where the
+    occurrences of their anchor allow a match to start, and the ones
+    without anchor are run over the whole text.
+
+    Without the aho_corasick module, all the regular expressions are
+    run over the whole text."""
+
+    def __init__(self, skw_db):
+        # Anchor -> [(regex, single keyword, minimum and maximum
+        # distance between the start of a match and its anchor), ...]
+        self.anchored = {}
+        # [(regex, single keyword), ...]
+        self.unanchored = []
+
+        for single_keyword in skw_db:
+            for regex in single_keyword.regex:
+                if AhoCorasickAutomaton is None:
+                    anchor = ""
+                else:
+                    anchor, min_offset, max_offset = _get_regex_anchor(regex)
+                if anchor:
+                    self.anchored.setdefault(anchor, []).append((regex,
+                        single_keyword, min_offset, max_offset))
+                else:
+                    self.unanchored.append((regex, single_keyword))
+
+        if AhoCorasickAutomaton is None:
+            self.automaton = None
+        else:
+            self.automaton = AhoCorasickAutomaton(self.anchored.keys())
+
+    def get_spans(self, fulltext):
+        """Returns the list of (span, single keyword) matched in the
+        fulltext that are not contained by another match."""
+        records = []
+        for regex, single_keyword in self.unanchored:
+            for match in regex.finditer(fulltext):
+                records.append((match.span(), single_keyword))
+
+        if self.automaton is None:
+            occurrences = {}
+        else:
+            occurrences = self.automaton.find(fulltext.lower())
+        for anchor, positions in occurrences.iteritems():
+            for regex, single_keyword, min_offset, max_offset in \
+                self.anchored[anchor]:
+                if max_offset is None:
+                    # The anchor can be anywhere in the match.
+                    for match in regex.finditer(fulltext):
+                        records.append((match.span(), single_keyword))
+                    continue
+
+                # Emulate finditer: the leftmost match starting after
+                # the previous match is the first one found among the
+                # possible starts, taken in increasing order.
+                end = 0
+                for position in positions:
+                    start = max(end, position - max_offset)
+                    while start <= position - min_offset:
+                        match = regex.match(fulltext, start)
+                        if match is not None:
+                            records.append((match.span(), single_keyword))
+                            end = match.end()
+                            break
+                        start += 1
+
+        # Modify the right index to put it on the last letter of the
+        # word.
+        records = [((start, end - 1), single_keyword)
+                   for (start, end), single_keyword in records]
+
+        return _remove_contained_spans(records)
+
+def _get_regex_anchor(regex):
+    """Returns the longest lowercased ASCII literal string that every
+    match of the compiled regex contains, together with the minimum and
+    maximum distance between the start of the match and the string (None
+    if unbounded). Returns an empty anchor if none could be found."""
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except (sre_constants.error, TypeError):
+        return "", 0, None
+
+    items = list(parsed)
+    anchor, anchor_index = "", 0
+    run, run_index = [], 0
+    for index, (opcode, argument) in enumerate(items + [(None, None)]):
+        char = None
+        if opcode == sre_constants.LITERAL:
+            char = argument
+        elif opcode == sre_constants.IN:
+            # Accept character sets like [mM] that only vary by case.
+            chars = set([])
+            for set_opcode, set_argument in argument:
+                if set_opcode != sre_constants.LITERAL or set_argument > 127:
+                    chars = None
+                    break
+                chars.add(chr(set_argument).lower())
+            if chars and len(chars) == 1:
+                char = ord(chars.pop())
+
+        if char is not None and char < 128:
+            if not run:
+                run_index = index
+            run.append(chr(char).lower())
+        else:
+            if len(run) > len(anchor):
+                anchor, anchor_index = "".join(run), run_index
+            run = []
+
+    if not anchor:
+        return "", 0, None
+
+    min_offset, max_offset = sre_parse.SubPattern(parsed.pattern,
+        items[:anchor_index]).getwidth()
+    if max_offset - min_offset > _MAXIMUM_ANCHOR_OFFSET_RANGE:
+        max_offset = None
+
+    return anchor, min_offset, max_offset
+
+def _remove_contained_spans(records):
+    """Returns the (span, keyword) records whose span is not strictly
+    contained by the span of another record. Identical records are only
+    returned once."""
+    # Sort by increasing start and decreasing end so that every span
+    # comes after the spans containing it.
+    records = list(set(records))
+    records.sort(key=lambda record: (record[0][0], -record[0][1]))
+
+    out = []
+    max_end = -1
+    index = 0
+    while index < len(records):
+        span = records[index][0]
+        group_end = index
+        while group_end < len(records) and records[group_end][0] == span:
+            group_end += 1
+        if span[1] > max_end:
+            out.extend(records[index:group_end])
+            max_end = span[1]
+        index = group_end
+
+    return out
+
 def get_composite_keywords(ckw_db, fulltext, skw_spans, verbose=True):
     """Returns a list of composite keywords bound with the number of
     occurrences found in the text string.
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the BibClassify keyword analyzer."""
+
+import re
+import unittest
+
+from invenio import bibclassify_keyword_analyzer
+from invenio.bibclassify_keyword_analyzer import get_single_keywords, \
+    get_keyword_matcher, _get_regex_anchor, _remove_contained_spans
+from invenio.bibclassify_ontology_reader import SingleKeyword
+from invenio.testutils import make_test_suite, run_test_suite
+
+class BibClassifyKeywordMatcherTest(unittest.TestCase):
+    """Test the single pass matching of the single keywords."""
+
+    def test_regex_anchor(self):
+        """bibclassify - anchor of the regular expression of a keyword"""
+        self.assertEqual(("muon", 1, 1),
+            _get_regex_anchor(re.compile(r"[^\w-][mM]uons?[^\w-]")))
+        self.assertEqual(("", 0, None),
+            _get_regex_anchor(re.compile(r"[^\w-](a|b)+[^\w-]")))
+
+    def test_remove_contained_spans(self):
+        """bibclassify - removal of the matches contained by others"""
+        self.assertEqual([((0, 10), 'a'), ((0, 10), 'b'), ((12, 15), 'd')],
+            sorted(_remove_contained_spans([((0, 10), 'a'), ((2, 5), 'c'),
+                ((0, 10), 'b'), ((0, 10), 'a'), ((12, 15), 'd'),
+                ((0, 4), 'e')])))
+
+    def test_get_single_keywords(self):
+        """bibclassify - matching of the single keywords of a text"""
+        muon = SingleKeyword("muon")
+        dark_matter = SingleKeyword("dark matter")
+        matter = SingleKeyword("matter")
+        self.assertEqual({muon: [(0, 6), (12, 17)], dark_matter: [(21, 33)]},
+            get_single_keywords([muon, dark_matter, matter],
+                " Muons, then muon and dark matter. ", verbose=False))
+
+    def test_keyword_matcher_cache(self):
+        """bibclassify - only the last keyword matcher is kept"""
+        skw_db1 = [SingleKeyword("muon")]
+        skw_db2 = [SingleKeyword("muon")]
+        matcher1 = get_keyword_matcher(skw_db1)
+        self.assert_(matcher1 is get_keyword_matcher(skw_db1))
+        matcher2 = get_keyword_matcher(skw_db2)
+        self.assert_(matcher2 is not matcher1)
+        self.assertEqual((skw_db2, matcher2),
+            bibclassify_keyword_analyzer._KEYWORD_MATCHER)
+
+TEST_SUITE = make_test_suite(BibClassifyKeywordMatcherTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -53,8 +53,11 @@ try:
         CFG_BIBCLASSIFY_INVARIABLE_WORDS, CFG_BIBCLASSIFY_EXCEPTIONS, \
         CFG_BIBCLASSIFY_UNCHANGE_REGULAR_EXPRESSIONS, \
         CFG_BIBCLASSIFY_GENERAL_REGULAR_EXPRESSIONS, \
-        CFG_BIBCLASSIFY_SEPARATORS, CFG_BIBCLASSIFY_SYMBOLS
+        CFG_BIBCLASSIFY_SEPARATORS, CFG_BIBCLASSIFY_SYMBOLS, \
+        CFG_BIBCLASSIFY_ONTOLOGY_CACHE_VERSION
     from bibclassify_utils import write_message
+    from bibclassify_keyword_analyzer import KeywordMatcher, \
+        register_keyword_matcher
 except ImportError, err:
     print >> sys.stderr, "Import error: %s" % err
     sys.exit(0)
@@ -371,9 +374,16 @@ def _build_cache(source_file, no_cache=False):
 
         store.close()
 
+    # Compile the keyword matcher once for all, it is stored in the cache
+    # with the keywords.
+    matcher = KeywordMatcher(single_keywords)
+    register_keyword_matcher(single_keywords, matcher)
+
     cached_data = {}
+    cached_data["version"] = CFG_BIBCLASSIFY_ONTOLOGY_CACHE_VERSION
     cached_data["single"] = single_keywords
     cached_data["composite"] = composite_keywords
+    cached_data["matcher"] = matcher
     cached_data["creation_time"] = time.gmtime()
 
     write_message("INFO: Building taxonomy... %d terms built in %.1f sec." %
@@ -383,7 +393,7 @@ def _build_cache(source_file, no_cache=False):
     if not no_cache:
         # Serialize.
         try:
-            filestream = open(_get_cache_path(source_file), "w")
+            filestream = open(_get_cache_path(source_file), "wb")
         except IOError:
             # Impossible to write the cache.
             write_message("ERROR: Impossible to write cache to %s." %
@@ -392,7 +402,7 @@ def _build_cache(source_file, no_cache=False):
         else:
             write_message("INFO: Writing cache to file %s." %
                 _get_cache_path(source_file), stream=sys.stderr, verbose=3)
-            cPickle.dump(cached_data, filestream, 1)
+            cPickle.dump(cached_data, filestream, cPickle.HIGHEST_PROTOCOL)
             filestream.close()
 
     return (single_keywords, composite_keywords)
@@ -468,10 +478,11 @@ def _get_cache(source_file):
     timer_start = time.clock()
 
     cache_file = _get_cache_path(source_file)
-    filestream = open(cache_file, "r")
+    filestream = open(cache_file, "rb")
     try:
         cached_data = cPickle.load(filestream)
-    except (cPickle.UnpicklingError, AttributeError, DeprecationWarning):
+    except (cPickle.UnpicklingError, AttributeError, DeprecationWarning,
+        EOFError, ImportError):
         write_message("WARNING: The existing cache in %s is not readable. "
             "Rebuilding it." %
             cache_file, stream=sys.stderr, verbose=3)
@@ -480,8 +491,16 @@ def _get_cache(source_file):
         return _build_cache(source_file)
     filestream.close()
 
+    if cached_data.get("version") != CFG_BIBCLASSIFY_ONTOLOGY_CACHE_VERSION:
+        write_message("WARNING: The existing cache in %s was written by "
+            "another version of BibClassify. Rebuilding it." % cache_file,
+            stream=sys.stderr, verbose=2)
+        os.remove(cache_file)
+        return _build_cache(source_file)
+
     single_keywords = cached_data["single"]
     composite_keywords = cached_data["composite"]
+    register_keyword_matcher(single_keywords, cached_data["matcher"])
 
     write_message("INFO: Found ontology cache created on %s." %
         time.asctime(cached_data["creation_time"]), stream=sys.stderr,
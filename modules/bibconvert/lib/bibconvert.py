@@ -24,6 +24,7 @@ import string
 import os
 import re
 import sys
+from bisect import bisect_right
 from time import strftime, localtime
 
 from invenio.config import CFG_OAI_ID_PREFIX, CFG_ETCDIR
@@ -730,88 +731,181 @@ def crawl_KB(filename, value, mode):
 
     # FIXME: Remove \n from returned value?
     if (os.path.isfile(filename)):
-
-        file_to_read = open(filename,"r")
-
-        file_read = file_to_read.readlines()
-        for line in file_read:
-            code = string.split(line, "---")
-
-            if (mode == "2"):
-                value_to_cmp   = string.lower(value)
-                code[0]        = string.lower(code[0])
-
-                if ((len(string.split(value_to_cmp, code[0])) > 1) \
-                    or (code[0]=="_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif ((mode == "3") or (mode == "0")):
-                if ((len(string.split(value, code[0])) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "4"):
-                value_to_cmp   = string.lower(value)
-                code[0]        = string.lower(code[0])
-                if ((code[0] == value_to_cmp) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "5"):
-                if ((len(string.split(code[0], value)) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "6"):
-                value_to_cmp   = string.lower(value)
-                code[0]        = string.lower(code[0])
-                if ((len(string.split(code[0], value_to_cmp)) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "7"):
-                if ((len(string.split(code[0], value)) > 1) or \
-                    (len(string.split(value,code[0])) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "8"):
-                value_to_cmp   = string.lower(value)
-                code[0]        = string.lower(code[0])
-                if ((len(string.split(code[0], value_to_cmp)) > 1) or \
-                    (len(string.split(value_to_cmp, code[0])) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = code[1]
-                    return value
-
-            elif (mode == "9"):
-                if (code[0]=="_DEFAULT_"):
-                    value = code[1]
-                    return value
-
-            elif (mode == "R"):
-                value_to_cmp   = string.lower(value)
-                code[0]        = string.lower(code[0])
-                if ((len(string.split(code[0], value_to_cmp)) > 1) or \
-                    (len(string.split(value_to_cmp, code[0])) > 1) or \
-                    (code[0] == "_DEFAULT_")):
-                    value = value.replace(code[0], code[1])
-
-            else:
-                if ((code[0] == value) or (code[0]=="_DEFAULT_")):
-                    value = code[1]
-                    return value
+        return get_parsed_KB(filename).lookup(value, mode)
     else:
         sys.stderr.write("Warning: given KB could not be found. \n")
 
     return value
 
+## Parsed knowledge bases, keyed by file name: (modification time, size,
+## ParsedKB)
+_PARSED_KBS = {}
+
+def get_parsed_KB(filename):
+    """
+    Return the ParsedKB of the KB file FILENAME, parsing the file only
+    if it was not parsed yet or has changed since.
+    """
+    stat = os.stat(filename)
+    try:
+        mtime, size, kb = _PARSED_KBS[filename]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return kb
+    except KeyError:
+        pass
+    file_to_read = open(filename, "r")
+    kb = ParsedKB(file_to_read.readlines())
+    file_to_read.close()
+    _PARSED_KBS[filename] = (stat.st_mtime, stat.st_size, kb)
+    return kb
+
+class ParsedKB:
+    """
+    A KB file parsed into the look-up structures of the modes of crawl_KB:
+    exact dictionaries for the match modes, dictionaries by key length for
+    searching the keys in the value, and the keys joined in one string for
+    searching the value in the keys.  The lines are still looked up in the
+    order of the file: the first matching line wins.
+    """
+
+    def __init__(self, lines):
+        """Parse the LINES of a KB file."""
+        self.codes = [string.split(line, "---") for line in lines]
+        self.keys = [code[0] for code in self.codes]
+        self.lower_keys = [string.lower(key) for key in self.keys]
+
+        # Position of the first _DEFAULT_ line, which only matches in the
+        # case sensitive modes (the lowered keys are never _DEFAULT_).
+        self.default_index = None
+        if "_DEFAULT_" in self.keys:
+            self.default_index = self.keys.index("_DEFAULT_")
+
+        # Position of the first empty key, on which searching the key in
+        # the value fails.
+        self.empty_key_index = None
+        if "" in self.keys:
+            self.empty_key_index = self.keys.index("")
+
+        self.exact = self._index_exact(self.keys)
+        self.lower_exact = self._index_exact(self.lower_keys)
+        self.by_length = self._index_by_length(self.keys)
+        self.lower_by_length = self._index_by_length(self.lower_keys)
+
+        # The keys joined by a character that cannot be searched for, and
+        # the position of each key in the joined string.
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self.joined = "\0".join(self.keys)
+        self.lower_joined = "\0".join(self.lower_keys)
+        self.keys_have_separator = self.joined.count("\0") != \
+                                   max(len(self.keys) - 1, 0)
+
+    def _index_exact(self, keys):
+        """Return the dictionary key -> position of its first line."""
+        index = {}
+        for position in range(len(keys) - 1, -1, -1):
+            index[keys[position]] = position
+        return index
+
+    def _index_by_length(self, keys):
+        """Return the dictionary length -> {key: position of its first
+        line} of the non empty keys."""
+        index = {}
+        for position in range(len(keys) - 1, -1, -1):
+            key = keys[position]
+            if key:
+                index.setdefault(len(key), {})[key] = position
+        return index
+
+    def _find_key_in_value(self, value, by_length):
+        """Return the position of the first line whose key is contained
+        in VALUE, or None."""
+        found = None
+        for length, keys in by_length.iteritems():
+            for start in range(len(value) - length + 1):
+                position = keys.get(value[start:start + length])
+                if position is not None and (found is None or
+                                             position < found):
+                    found = position
+        return found
+
+    def _find_value_in_key(self, value, keys, joined):
+        """Return the position of the first line whose key contains
+        VALUE, or None."""
+        if "\0" in value or self.keys_have_separator:
+            for position in range(len(keys)):
+                if value in keys[position]:
+                    return position
+            return None
+        offset = joined.find(value)
+        if offset == -1:
+            return None
+        return bisect_right(self.offsets, offset) - 1
+
+    def lookup(self, value, mode):
+        """Look VALUE up in MODE, as described in crawl_KB."""
+        if mode == "R":
+            # The replacements are chained, line by line.
+            for position in range(len(self.codes)):
+                key = self.lower_keys[position]
+                value_to_cmp = string.lower(value)
+                if ((len(string.split(key, value_to_cmp)) > 1) or \
+                    (len(string.split(value_to_cmp, key)) > 1)):
+                    value = value.replace(key, self.codes[position][1])
+            return value
+
+        if mode in ("2", "4", "6", "8"):
+            value_to_cmp = string.lower(value)
+            keys = self.lower_keys
+            exact = self.lower_exact
+            by_length = self.lower_by_length
+            joined = self.lower_joined
+            default_index = None
+        else:
+            value_to_cmp = value
+            keys = self.keys
+            exact = self.exact
+            by_length = self.by_length
+            joined = self.joined
+            default_index = self.default_index
+
+        # Look for the first matching line, and for the first line on
+        # which the comparison fails with an empty separator.
+        found = None
+        error_index = None
+        if mode == "9":
+            found = default_index
+        elif mode in ("1", "4") or mode not in ("0", "2", "3", "5", "6", "7",
+                                                 "8"):
+            found = exact.get(value_to_cmp)
+        else:
+            if mode in ("0", "2", "3", "7", "8"):
+                found = self._find_key_in_value(value_to_cmp, by_length)
+                error_index = self.empty_key_index
+            if mode in ("5", "6", "7", "8") and keys:
+                if value_to_cmp:
+                    position = self._find_value_in_key(value_to_cmp, keys,
+                                                       joined)
+                    if position is not None and (found is None or
+                                                 position < found):
+                        found = position
+                else:
+                    error_index = 0
+
+        if default_index is not None and (found is None or
+                                          default_index < found):
+            found = default_index
+        if error_index is not None and (found is None or
+                                        error_index <= found):
+            raise ValueError("empty separator")
+
+        if found is None:
+            return value
+        return self.codes[found][1]
+
 
 def FormatField(value, fn):
     """
@@ -22,9 +22,14 @@
 
 __revision__ = "$Id$"
 
+import os
+import tempfile
 import unittest
 
+from cStringIO import StringIO
+
 from invenio import bibconvert
+from invenio import bibconvert_xslt_engine
 from invenio.testutils import make_test_suite, run_test_suite
 
 class TestFormattingFunctions(unittest.TestCase):
@@ -221,11 +226,83 @@ class TestBCCL(unittest.TestCase):
 class TestKnowledgeBase(unittest.TestCase):
     """Test bibconvert knowledge base"""
 
-    def xtest_enc(self):
-        """bibconvert - knowledge base"""
-
-        # FIXME: put proper tests here
-        self.assertEqual(1, 1)
+    def setUp(self):
+        """Write a temporary KB file"""
+        fd, self.kb_file = tempfile.mkstemp(suffix=".kb")
+        os.write(fd, "Foo---first\nfoo bar---second\nBar---third\n" \
+                 "_DEFAULT_---default\n")
+        os.close(fd)
+
+    def tearDown(self):
+        """Remove the temporary KB file"""
+        os.remove(self.kb_file)
+
+    def test_kb_match(self):
+        """bibconvert - knowledge base match modes"""
+        self.assertEqual("first\n", bibconvert.crawl_KB(self.kb_file, "Foo", "1"))
+        self.assertEqual("default\n", bibconvert.crawl_KB(self.kb_file, "foo", "1"))
+        self.assertEqual("first\n", bibconvert.crawl_KB(self.kb_file, "FOO", "4"))
+        self.assertEqual("baz", bibconvert.crawl_KB(self.kb_file, "baz", "4"))
+        self.assertEqual("default\n", bibconvert.crawl_KB(self.kb_file, "baz", "9"))
+
+    def test_kb_search(self):
+        """bibconvert - knowledge base search modes"""
+        self.assertEqual("third\n", bibconvert.crawl_KB(self.kb_file, "a Bar b", "3"))
+        self.assertEqual("first\n", bibconvert.crawl_KB(self.kb_file, "foo bar", "2"))
+        self.assertEqual("second\n", bibconvert.crawl_KB(self.kb_file, "o b", "5"))
+        self.assertEqual("first\n", bibconvert.crawl_KB(self.kb_file, "OO", "6"))
+        self.assertEqual("default\n", bibconvert.crawl_KB(self.kb_file, "OO", "7"))
+        self.assertEqual("FOO third\n", bibconvert.crawl_KB(self.kb_file, "FOO bar", "R"))
+
+    def test_kb_modified(self):
+        """bibconvert - knowledge base file modified after a look-up"""
+        self.assertEqual("first\n", bibconvert.crawl_KB(self.kb_file, "Foo", "1"))
+        kb = open(self.kb_file, "w")
+        kb.write("Foo---changed\n")
+        kb.close()
+        self.assertEqual("changed\n", bibconvert.crawl_KB(self.kb_file, "Foo", "1"))
+
+class TestSplitOAIRecords(unittest.TestCase):
+    """Test splitting of OAI-PMH responses for the XSLT engine"""
+
+    opening = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+              '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">' \
+              '<responseDate>2011-01-01T00:00:00Z</responseDate>' \
+              '<ListRecords>'
+    closing = '</ListRecords></OAI-PMH>'
+    records = ['<record><header><identifier>oai:1</identifier></header>' \
+               '<metadata><record xmlns="http://www.loc.gov/MARC21/slim">' \
+               '</record></metadata></record>',
+               '<record><header status="deleted"><identifier>oai:2' \
+               '</identifier></header></record>',
+               '<record/>']
+
+    def test_split_records(self):
+        """bibconvert - splitting OAI-PMH records in chunks"""
+        response = self.opening + '\n'.join(self.records) + \
+                   '<resumptionToken>token</resumptionToken>' + self.closing
+        for block_size in (1, 7, 65536):
+            chunks = list(bibconvert_xslt_engine.split_oai_records( \
+                StringIO(response), 2, block_size))
+            self.assertEqual([self.opening + ''.join(self.records[:2]) +
+                              self.closing,
+                              self.opening + self.records[2] + self.closing],
+                             chunks)
+
+    def test_split_no_records(self):
+        """bibconvert - splitting XML without OAI-PMH records"""
+        response = self.opening + self.closing
+        self.assertEqual([response],
+                         list(bibconvert_xslt_engine.split_oai_records( \
+            StringIO(response), 2, 5)))
+
+    def test_split_other_xml(self):
+        """bibconvert - splitting XML that is not an OAI-PMH response"""
+        response = '<?xml version="1.0" encoding="UTF-8"?>\n<collection>' + \
+                   ''.join(self.records) + '</collection>'
+        self.assertEqual([response],
+                         list(bibconvert_xslt_engine.split_oai_records( \
+            StringIO(response), 2, 5)))
 
 class TestErrorCodes(unittest.TestCase):
     """Test bibconvert error codes"""
@@ -256,6 +333,7 @@ TEST_SUITE = make_test_suite(TestFormattingFunctions,
                              TestWords,
                              TestBCCL,
                              TestKnowledgeBase,
+                             TestSplitOAIRecords,
                              TestErrorCodes,
                              TestEncodings,)
 
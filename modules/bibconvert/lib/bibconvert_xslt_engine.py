@@ -41,6 +41,12 @@ __revision__ = "$Id$"
 
 import sys
 import os
+import re
+import threading
+if sys.hexversion < 0x2060000:
+    from md5 import md5
+else:
+    from hashlib import md5
 
 from invenio.config import \
      CFG_ETCDIR, \
@@ -50,6 +56,9 @@ from invenio.bibconvert import FormatField
 # The namespace used for BibConvert functions
 CFG_BIBCONVERT_FUNCTION_NS = "http://cdsweb.cern.ch/bibconvert/fn"
 
+# The number of records converted at a time by convert_file
+CFG_BIBCONVERT_XSLT_CHUNK_SIZE = 1000
+
 # Import one XSLT processor
 #
 # processor_type:
@@ -77,6 +86,20 @@ if processor_type == -1:
 
 CFG_BIBCONVERT_XSL_PATH = "%s%sbibconvert%sconfig" % (CFG_ETCDIR, os.sep, os.sep)
 
+# Compiled stylesheets, keyed by path (or by MD5 digest of the source):
+# ((modification time, size) or None, compiled stylesheet)
+_compiled_stylesheets = {}
+# Guards _compiled_stylesheets, shared by the threads of the process
+_compiled_stylesheets_lock = threading.Lock()
+
+# Opening and closing tags of OAI-PMH records
+_OAI_RECORD_TAG_RE = re.compile(r'<(/?)record(?=[\s/>])')
+# Any opening, closing or empty element tag
+_XML_TAG_RE = re.compile(r'<(/?)([^\s/>!?]+)[^>]*?(/?)>')
+# A conversion result: XML declaration, <collection> tag and content
+_COLLECTION_RE = re.compile(r'\s*(<\?xml[^>]*\?>\s*)?(<collection[^>]*?)' \
+                            r'(/>|>(.*)</collection>)\s*$', re.DOTALL)
+
 def bibconvert_function_libxslt(ctx, value, func):
     """
     libxslt extension function:
@@ -140,51 +163,74 @@ def bibconvert_function_4suite(ctx, value, func):
 
     return ''
 
-def convert(xmltext, template_filename=None, template_source=None):
+def get_compiled_stylesheet(template_filename=None, template_source=None):
     """
-    Processes an XML text according to a template, and returns the result.
-
-    The template can be given either by name (or by path) or by source.
-    If source is given, name is ignored.
-
-    bibconvert_xslt_engine will look for template_filename in standard directories
-    for templates. If not found, template_filename will be assumed to be a path to
-    a template. If none can be found, return None.
-
-    Raises an exception if cannot find an appropriate XSLT processor.
-
-
-    @param xmltext: The string representation of the XML to process
-    @param template_filename: The name of the template to use for the processing
-    @param template_source: The configuration describing the processing.
-    @return: the transformed XML text, or None if an error occured
+    Returns the compiled stylesheet of a template, compiling it only if
+    it was not compiled yet by this process, or if its file changed
+    since.
+
+    The template can be given either by name (or by path) or by source,
+    as in L{convert}.  Compiled stylesheets of files are cached by path,
+    and checked against the modification time and size of the file;
+    compiled stylesheets of sources are cached by the MD5 digest of the
+    source.
+
+    @param template_filename: The name of the template to compile
+    @param template_source: The source of the template to compile
+    @return: the compiled stylesheet, or None if an error occured
     """
     if processor_type == -1:
         # No XSLT processor found
         raise "No XSLT processor could be found"
 
-    # Retrieve template and read it
+    _compiled_stylesheets_lock.acquire()
+    try:
+        return _get_compiled_stylesheet(template_filename, template_source)
+    finally:
+        _compiled_stylesheets_lock.release()
+
+def _get_compiled_stylesheet(template_filename, template_source):
+    """
+    Does the job of L{get_compiled_stylesheet}, the caller holding
+    _compiled_stylesheets_lock.
+    """
+    # Retrieve template and check whether it is cached
     if template_source:
+        key = md5(template_source).hexdigest()
+        stamp = None
+        if key in _compiled_stylesheets:
+            return _compiled_stylesheets[key][1]
         template = template_source
     elif template_filename:
         try:
             path_to_templates = (CFG_BIBCONVERT_XSL_PATH + os.sep +
                                  template_filename)
             if os.path.exists(path_to_templates):
-                template = file(path_to_templates).read()
+                key = path_to_templates
             elif os.path.exists(template_filename):
-                template = file(template_filename).read()
+                key = template_filename
             else:
                 sys.stderr.write(template_filename +' does not exist.')
                 return None
-        except IOError:
+            stat = os.stat(key)
+            stamp = (stat.st_mtime, stat.st_size)
+            if key in _compiled_stylesheets and \
+                   _compiled_stylesheets[key][0] == stamp:
+                return _compiled_stylesheets[key][1]
+            if key in _compiled_stylesheets:
+                # The file changed: drop the outdated stylesheet.  It is
+                # not freed explicitly, as another thread may still be
+                # applying it.
+                del _compiled_stylesheets[key]
+            template = file(key).read()
+        except (IOError, OSError):
             sys.stderr.write(template_filename +' could not be read.')
             return None
     else:
         sys.stderr.write(template_filename +' was not given.')
         return None
 
-    result = ""
+    processor = None
     if processor_type == 0:
         # libxml2 & libxslt
 
@@ -193,7 +239,7 @@ def convert(xmltext, template_filename=None, template_source=None):
                                           CFG_BIBCONVERT_FUNCTION_NS,
                                           bibconvert_function_libxslt)
 
-        # Load template and source
+        # Load template
         try:
             template_xml = libxml2.parseDoc(template)
         except libxml2.parserError, e:
@@ -201,21 +247,6 @@ def convert(xmltext, template_filename=None, template_source=None):
                              str(e) + '\n')
             return None
         processor = libxslt.parseStylesheetDoc(template_xml)
-        try:
-            source = libxml2.parseDoc(xmltext)
-        except libxml2.parserError, e:
-            sys.stderr.write('Parsing XML source failed:\n ' + \
-                             str(e) + '\n')
-            return None
-
-        # Transform
-        result_object = processor.applyStylesheet(source, None)
-        result = processor.saveResultToString(result_object)
-
-        # Deallocate
-        processor.freeStylesheet()
-        source.freeDoc()
-        result_object.freeDoc()
 
     elif processor_type == 1:
         # 4suite
@@ -228,16 +259,56 @@ def convert(xmltext, template_filename=None, template_source=None):
                                             "format",
                                             bibconvert_function_4suite)
 
-        # Load template and source
+        # Load template
         transform = InputSource.DefaultFactory.fromString(template,
                                                           uri=CFG_SITE_URL)
-        source = InputSource.DefaultFactory.fromString(xmltext,
-                                                       uri=CFG_SITE_URL)
         try:
             processor.appendStylesheet(transform)
         except XsltException, e:
             sys.stderr.write('Parsing XSL template failed:\n' + str(e))
             return None
+    else:
+        sys.stderr.write("No XSLT processor could be found")
+        return None
+
+    _compiled_stylesheets[key] = (stamp, processor)
+    return processor
+
+def apply_stylesheet(processor, xmltext):
+    """
+    Processes an XML text with a stylesheet compiled by
+    L{get_compiled_stylesheet}, and returns the result.
+
+    @param processor: The compiled stylesheet
+    @param xmltext: The string representation of the XML to process
+    @return: the transformed XML text, or None if an error occured
+    """
+    result = ""
+    if processor_type == 0:
+        # libxml2 & libxslt
+
+        # Load source
+        try:
+            source = libxml2.parseDoc(xmltext)
+        except libxml2.parserError, e:
+            sys.stderr.write('Parsing XML source failed:\n ' + \
+                             str(e) + '\n')
+            return None
+
+        # Transform
+        result_object = processor.applyStylesheet(source, None)
+        result = processor.saveResultToString(result_object)
+
+        # Deallocate (the stylesheet is kept in cache)
+        source.freeDoc()
+        result_object.freeDoc()
+
+    elif processor_type == 1:
+        # 4suite
+
+        # Load source
+        source = InputSource.DefaultFactory.fromString(xmltext,
+                                                       uri=CFG_SITE_URL)
 
         # Transform
         try:
@@ -250,6 +321,218 @@ def convert(xmltext, template_filename=None, template_source=None):
 
     return result
 
+def convert(xmltext, template_filename=None, template_source=None):
+    """
+    Processes an XML text according to a template, and returns the result.
+
+    The template can be given either by name (or by path) or by source.
+    If source is given, name is ignored.
+
+    bibconvert_xslt_engine will look for template_filename in standard directories
+    for templates. If not found, template_filename will be assumed to be a path to
+    a template. If none can be found, return None.
+
+    The template is compiled only once per process (see
+    L{get_compiled_stylesheet}).
+
+    Raises an exception if cannot find an appropriate XSLT processor.
+
+
+    @param xmltext: The string representation of the XML to process
+    @param template_filename: The name of the template to use for the processing
+    @param template_source: The configuration describing the processing.
+    @return: the transformed XML text, or None if an error occured
+    """
+    processor = get_compiled_stylesheet(template_filename, template_source)
+    if processor is None:
+        return None
+    return apply_stylesheet(processor, xmltext)
+
+def convert_records(xmltexts, template_filename=None, template_source=None):
+    """
+    Processes a sequence of XML texts according to a template, and
+    yields the results one by one, so that the sequence can be a
+    generator (e.g. L{split_oai_records}) and does not need to be held
+    in memory.  The template is given as in L{convert}, and compiled
+    only once.
+
+    @param xmltexts: The XML texts to process
+    @param template_filename: The name of the template to use for the processing
+    @param template_source: The configuration describing the processing.
+    @return: iterator over the transformed XML texts (None for the texts
+        that could not be processed, or for all of them if the template
+        could not be compiled)
+    """
+    processor = get_compiled_stylesheet(template_filename, template_source)
+    for xmltext in xmltexts:
+        if processor is None:
+            yield None
+        else:
+            yield apply_stylesheet(processor, xmltext)
+
+def split_oai_records(input_file, chunk_size=CFG_BIBCONVERT_XSLT_CHUNK_SIZE,
+                      block_size=65536):
+    """
+    Reads an OAI-PMH response (e.g. a harvested file) from INPUT_FILE
+    block by block, and yields standalone OAI-PMH responses of at most
+    CHUNK_SIZE records each: every record is wrapped into the envelope
+    of the response, i.e. what precedes its first record, and the
+    corresponding closing tags.  What follows its last record
+    (e.g. the resumption token) is dropped.
+
+    An input that is not an OAI-PMH response, or without records, is
+    yielded unchanged, as a whole.
+
+    @param input_file: file object of the OAI-PMH response
+    @param chunk_size: maximum number of records of the yielded responses
+    @param block_size: number of bytes read at once from INPUT_FILE
+    @return: iterator over the OAI-PMH responses
+    """
+    buf = ''
+    position = 0 # where to look for the next record tag in buf
+    depth = 0 # of nested record tags
+    record_start = 0
+    envelope = None # (opening, closing)
+    records = []
+    end_of_file = False
+    while not end_of_file:
+        block = input_file.read(block_size)
+        end_of_file = not block
+        buf += block
+        while True:
+            match = _OAI_RECORD_TAG_RE.search(buf, position)
+            if match is None:
+                # Look again at the end of buf, once more is read
+                position = max(position, len(buf) - len('</record'))
+                break
+            tag_end = buf.find('>', match.end())
+            if tag_end == -1:
+                position = match.start()
+                break
+            position = tag_end + 1
+            if not match.group(1):
+                if depth == 0:
+                    if envelope is None:
+                        if not _is_oai_pmh(buf[:match.start()]):
+                            yield buf + input_file.read()
+                            return
+                        envelope = (buf[:match.start()],
+                                    _get_closing_tags(buf[:match.start()]))
+                    record_start = match.start()
+                if buf[tag_end - 1] != '/':
+                    depth += 1
+                    continue
+                elif depth > 0:
+                    continue
+            else:
+                if depth == 0:
+                    # Closing tag without opening tag
+                    continue
+                depth -= 1
+                if depth > 0:
+                    continue
+            records.append(buf[record_start:position])
+            buf = buf[position:]
+            position = 0
+            if len(records) == chunk_size:
+                yield envelope[0] + ''.join(records) + envelope[1]
+                records = []
+    if envelope is None:
+        if buf:
+            yield buf
+        return
+    if depth > 0:
+        # Truncated record: let the parser report it
+        records.append(buf[record_start:])
+    if records:
+        yield envelope[0] + ''.join(records) + envelope[1]
+
+def _is_oai_pmh(opening):
+    """
+    Tells whether the XML text OPENING starts an OAI-PMH response,
+    i.e. whether its root element is OAI-PMH.
+    """
+    for match in _XML_TAG_RE.finditer(opening):
+        return match.group(2).split(':')[-1] == 'OAI-PMH'
+    return False
+
+def _get_closing_tags(opening):
+    """
+    Returns the closing tags of the elements left open at the end of
+    the XML text OPENING.
+    """
+    open_elements = []
+    for match in _XML_TAG_RE.finditer(opening):
+        closing, name, empty = match.groups()
+        if empty:
+            continue
+        if closing:
+            if open_elements and open_elements[-1] == name:
+                open_elements.pop()
+        else:
+            open_elements.append(name)
+    open_elements.reverse()
+    return ''.join(['</%s>' % name for name in open_elements])
+
+def convert_file(input_file, output_file, template_filename=None,
+                 template_source=None,
+                 chunk_size=CFG_BIBCONVERT_XSLT_CHUNK_SIZE):
+    """
+    Processes an OAI-PMH response read from INPUT_FILE according to a
+    template, and writes the result to OUTPUT_FILE, converting
+    CHUNK_SIZE records at a time so that large harvested files are
+    converted in bounded memory.  The template is given as in
+    L{convert}, and compiled only once.
+
+    The results of the chunks are merged into one collection: the
+    template must output a <collection> element (as the standard
+    templates do), and must convert each record on its own (i.e. not
+    use e.g. count(), position() or xsl:key across records).  An input
+    of one chunk, or that is not an OAI-PMH response, is written
+    exactly as L{convert} would return it.
+
+    @param input_file: file object of the OAI-PMH response
+    @param output_file: file object where to write the result
+    @param template_filename: The name of the template to use for the processing
+    @param template_source: The configuration describing the processing.
+    @param chunk_size: number of records to convert at a time
+    @return: True if the conversion succeeded, False otherwise
+    """
+    first_result = None
+    chunk_count = 0
+    for result in convert_records(split_oai_records(input_file, chunk_size),
+                                  template_filename, template_source):
+        if result is None:
+            return False
+        chunk_count += 1
+        if chunk_count == 1:
+            first_result = result
+            continue
+        if chunk_count == 2:
+            match = _COLLECTION_RE.match(first_result)
+            if match is None:
+                sys.stderr.write('Conversion result is not a collection.')
+                return False
+            output_file.write((match.group(1) or '') + match.group(2) + '>')
+            output_file.write(match.group(4) or '')
+            first_result = None
+        match = _COLLECTION_RE.match(result)
+        if match is None:
+            sys.stderr.write('Conversion result is not a collection.')
+            return False
+        output_file.write(match.group(4) or '')
+    if chunk_count == 0:
+        # Empty input: let the processor report it
+        result = convert('', template_filename, template_source)
+        if result is None:
+            return False
+        output_file.write(result)
+    elif chunk_count == 1:
+        output_file.write(first_result)
+    else:
+        output_file.write('</collection>\n')
+    return True
+
 ## def bc_profile():
 ##     """
 ##     Runs a benchmark
@@ -25,7 +25,15 @@ __revision__ = "$Id$"
 
 import sys, re
 import os, getopt
-from time import mktime, localtime, ctime
+from time import mktime, localtime, ctime, time
+from itertools import imap
+
+try:
+    import multiprocessing
+    MULTIPROCESSING_ENABLED = True
+except ImportError:
+    ## Python < 2.6: documents can only be processed one after another
+    MULTIPROCESSING_ENABLED = False
 
 # make refextract runnable without having to have done the full Invenio installation:
 try:
@@ -119,6 +127,12 @@ except ImportError:
         s = string.replace(s, '<', '&lt;')
         return s
 
+# make refextract runnable without having to have done the full Invenio installation:
+try:
+    from invenio.aho_corasick import AhoCorasickAutomaton
+except ImportError:
+    from aho_corasick import AhoCorasickAutomaton
+
 cli_opts = {}
 
 ## The minimum length of a reference's misc text to be deemed insignificant.
@@ -1895,6 +1909,9 @@ def build_titles_knowledge_base(fpath):
         sys.stderr.flush()
         sys.exit(1)
 
+    ## Build the matcher of the titles once for all:
+    get_periodical_title_matcher(seek_phrases)
+
     ## return the raw knowledge base:
     return (kb, standardised_titles, seek_phrases)
 
@@ -2388,8 +2405,11 @@ def identify_periodical_titles(line,
     titles_count = {}             ## sum totals of each 'bad title found in
                                   ## line.
 
-    ## Begin searching:
-    for title in periodical_title_search_keys:
+    ## Begin searching, only with the titles whose text is contained by
+    ## the line (matched titles are replaced by underscores, which
+    ## cannot make new titles appear):
+    title_matcher = get_periodical_title_matcher(periodical_title_search_keys)
+    for title in title_matcher.get_candidate_titles(line):
         ## search for all instances of the current periodical title
         ## in the line:
         title_matches_iter = periodical_title_search_kb[title].finditer(line)
@@ -2422,6 +2442,58 @@ def identify_periodical_titles(line,
     return (title_matches_matchlen, title_matches_matchtext, line, titles_count)
 
 
+## (title search keys, periodical title matcher) of the titles used
+## last.  Only this matcher is kept, so that loading other titles
+## knowledge bases does not pile up their matchers in memory:
+_PERIODICAL_TITLE_MATCHER = (None, None)
+
+def get_periodical_title_matcher(periodical_title_search_keys):
+    """Return the PeriodicalTitleMatcher of a list of non-standard
+       periodical titles.  The matcher is built on the first call and
+       then kept as long as the same list of titles is used.
+       @param periodical_title_search_keys: (list) - contains the non-
+        standard periodical TITLEs to be searched for, in the order in
+        which they must be searched for.
+       @return: (PeriodicalTitleMatcher) - the matcher of the titles.
+    """
+    global _PERIODICAL_TITLE_MATCHER
+    registered_search_keys, matcher = _PERIODICAL_TITLE_MATCHER
+    if registered_search_keys is periodical_title_search_keys:
+        return matcher
+    matcher = PeriodicalTitleMatcher(periodical_title_search_keys)
+    _PERIODICAL_TITLE_MATCHER = (periodical_title_search_keys, matcher)
+    return matcher
+
+class PeriodicalTitleMatcher:
+    """An index of the non-standard periodical titles of the titles
+       knowledge base.
+       The titles are compiled into an Aho-Corasick automaton that finds,
+       in a single pass over a reference line, the titles whose text is
+       contained by the line: only the search patterns of these titles
+       can match in the line.
+    """
+    def __init__(self, titles):
+        """Build the automaton of the titles.
+           @param titles: (list) - the non-standard periodical titles, in
+            the order in which they must be searched for.
+        """
+        ## title -> position in the search order:
+        self.ranks = {}
+        for rank in xrange(len(titles)):
+            if not self.ranks.has_key(titles[rank]):
+                self.ranks[titles[rank]] = rank
+        self.automaton = AhoCorasickAutomaton(self.ranks.keys())
+
+    def get_candidate_titles(self, line):
+        """Find the titles whose text is contained by a line.
+           @param line: (string) - the working reference line.
+           @return: (list) - the titles contained by the line, in the
+            order in which they must be searched for.
+        """
+        titles = self.automaton.find_strings(line)
+        titles.sort(key=self.ranks.get)
+        return titles
+
 def identify_ibids(line):
     """Find IBIDs within the line, record their position and length,
        and replace them with underscores.
@@ -5665,8 +5737,20 @@ def usage(wmsg="", err_code=0):
    -n, --kb-report-number
                   manually specify the location of a report number knowledge-
                   base file.
+   -b, --batchfile
+                  read the recid:file arguments from a file, one per line,
+                  in addition to the ones given on the command line.
+   -p, --processes
+                  number of processes extracting the references of the
+                  documents in parallel (default 1). The knowledge bases are
+                  loaded once and shared by all the processes; the records
+                  are output in the order of the arguments.
+   -t, --timingfile
+                  write the time spent on each document (conversion to text
+                  and whole extraction, in seconds) to a file.
 
   Example: refextract -x /home/chayward/refs.xml 499:/home/chayward/thesis.pdf
+  Batch example: refextract -p 8 -b /home/chayward/jobs.txt -x refs.xml
 """
     sys.stderr.write(wmsg + msg)
     sys.exit(err_code)
@@ -5688,10 +5772,13 @@ def get_cli_options():
                  'inspire'                    : 0,
                  'kb-journal'                 : 0,
                  'kb-report-number'           : 0,
+                 'batchfile'                  : 0,
+                 'processes'                  : 1,
+                 'timingfile'                 : 0,
                }
 
     try:
-        myoptions, myargs = getopt.getopt(sys.argv[1:], "hVv:zrx:d:sj:n:", \
+        myoptions, myargs = getopt.getopt(sys.argv[1:], "hVv:zrx:d:sj:n:b:p:t:", \
                                           ["help",
                                            "version",
                                            "verbose=",
@@ -5701,7 +5788,10 @@ def get_cli_options():
                                            "dictfile=",
                                            "inspire",
                                            "kb-journal=",
-                                           "kb-report-number="])
+                                           "kb-report-number=",
+                                           "batchfile=",
+                                           "processes=",
+                                           "timingfile="])
     except getopt.GetoptError, err:
         ## Invalid option provided - usage message
         usage(wmsg="Error: %(msg)s." % { 'msg' : str(err) })
@@ -5747,6 +5837,18 @@ def get_cli_options():
             ## The location of the report number kb requested to override
             ## a 'configuration file'-specified kb
             cli_opts['kb-report-number'] = o[1]
+        elif o[0] in ("-b", "--batchfile"):
+            ## Read further recid:file arguments from a file
+            cli_opts['batchfile'] = o[1]
+        elif o[0] in ("-p", "--processes"):
+            ## The number of documents processed in parallel
+            if not o[1].isdigit() or int(o[1]) < 1:
+                usage(wmsg="Error: invalid number of processes '%s'." % o[1])
+            cli_opts['processes'] = int(o[1])
+        elif o[0] in ("-t", "--timingfile"):
+            ## Write out the time spent on each document to the
+            ## specified file
+            cli_opts['timingfile'] = o[1]
 
     # What journal title format are we using?
     if cli_opts['verbosity'] > 0 and cli_opts['inspire']:
@@ -5754,6 +5856,17 @@ def get_cli_options():
     elif cli_opts['verbosity'] > 0:
         sys.stdout.write("--- Using invenio journal title form\n")
 
+    if cli_opts['batchfile']:
+        ## add the recid:file arguments of the batch file:
+        try:
+            bfilehdl = open(cli_opts['batchfile'], "r")
+            myargs = myargs + [line.strip() for line in bfilehdl \
+                               if line.strip()]
+            bfilehdl.close()
+        except IOError, (errno, err_string):
+            usage(wmsg="Error: Unable to read batch file %s (%s)." \
+                       % (cli_opts['batchfile'], err_string))
+
     if len(myargs) == 0:
         ## no arguments: error message
         usage(wmsg="Error: no full-text.")
@@ -5861,10 +5974,155 @@ def sum_2_dictionaries(dicta, dictb):
             dict_out[key] = dictb[key]
     return dict_out
 
+## The knowledge bases used by extract_references_from_document, set by
+## main before the documents are processed:
+_knowledge_bases = None
+
+def extract_references_from_document(curitem):
+    """Extract the references of a document and mark them up in a MARC XML
+       record. Used by main, possibly in the processes of a pool, with the
+       knowledge bases it loaded.
+       @param curitem: (tuple) - the record-id of the document and the path
+        to its full-text.
+       @return: (tuple) of 5 elements:
+                        + (tuple)      - curitem.
+                        + (integer)    - the extraction error code: 1 if the
+                                         full-text could not be read, in
+                                         which case no record is returned.
+                        + (unicode)    - the MARC XML record.
+                        + (dictionary) - the totals for each bad-title found
+                                         in the document.
+                        + (tuple)      - the time spent converting the
+                                         document to text and processing it
+                                         as a whole, in seconds.
+    """
+    (preprint_reportnum_sre, \
+     standardised_preprint_reportnum_categs, \
+     title_search_kb, \
+     title_search_standardised_titles, \
+     title_search_keys) = _knowledge_bases
+
+    start_time = time()
+    how_found_start = -1  ## flag to indicate how the reference start section was found (or not)
+    extract_error = 0  ## extraction was OK unless determined otherwise
+    ## reset the stats counters:
+    count_misc = count_title = count_reportnum = count_url = count_doi = count_auth_group = 0
+    record_titles_count = {}
+    recid = curitem[0]
+    if cli_opts['verbosity'] >= 1:
+        sys.stdout.write("--- processing RecID: %s pdffile: %s; %s\n" \
+                         % (str(curitem[0]), curitem[1], ctime()))
+
+    ## 1. Get this document body as plaintext:
+    (docbody, extract_error) = get_plaintext_document_body(curitem[1])
+    conversion_time = time() - start_time
+    if extract_error == 1:
+        ## Non-existent or unreadable pdf/text directory.
+        return (curitem, extract_error, None, record_titles_count, \
+                (conversion_time, conversion_time))
+    if extract_error == 0 and len(docbody) == 0:
+        extract_error = 3
+    if cli_opts['verbosity'] >= 1:
+        sys.stdout.write("-----get_plaintext_document_body gave: " \
+                         "%s lines, overall error: %s\n" \
+                         % (str(len(docbody)), str(extract_error)))
+
+    if len(docbody) > 0:
+        ## the document body is not empty:
+        ## 2. If necessary, locate the reference section:
+        if cli_opts['treat_as_reference_section']:
+            ## don't search for citations in the document body:
+            ## treat it as a reference section:
+            reflines = docbody
+        else:
+            ## launch search for the reference section in the document body:
+            (reflines, extract_error, how_found_start) = \
+                       extract_references_from_fulltext(docbody)
+            if len(reflines) == 0 and extract_error == 0:
+                extract_error = 6
+            if cli_opts['verbosity'] >= 1:
+                sys.stdout.write("-----extract_references_from_fulltext " \
+                                 "gave len(reflines): %s overall error: " \
+                                 "%s\n" \
+                                 % (str(len(reflines)), str(extract_error)))
+
+        ## 3. Standardise the reference lines:
+        (processed_references, count_misc, \
+         count_title, count_reportnum, \
+         count_url, count_doi, count_auth_group, \
+         record_titles_count) = \
+          create_marc_xml_reference_section(reflines,
+                                            preprint_repnum_search_kb=\
+                                              preprint_reportnum_sre,
+                                            preprint_repnum_standardised_categs=\
+                                              standardised_preprint_reportnum_categs,
+                                            periodical_title_search_kb=\
+                                              title_search_kb,
+                                            standardised_periodical_titles=\
+                                              title_search_standardised_titles,
+                                            periodical_title_search_keys=\
+                                              title_search_keys)
+    else:
+        ## document body is empty, therefore the reference section is empty:
+        reflines = []
+        processed_references = []
+
+    ## 4. Display the extracted references, status codes, etc:
+    if cli_opts['output_raw']:
+        ## now write the raw references to the stream:
+        raw_file = str(recid) + '.rawrefs'
+        try:
+            rawfilehdl = open(raw_file, 'w')
+            write_raw_references_to_stream(recid, reflines, rawfilehdl)
+            rawfilehdl.close()
+        except:
+            raise IOError("Cannot open raw ref file: %s to write" \
+                          % raw_file)
+    ## If found ref section by a weaker method and only found misc/urls then junk it
+    ## studies show that such cases are ~ 100% rubbish. Also allowing only
+    ## urls found greatly increases the level of rubbish accepted..
+    if count_reportnum + count_title == 0 and how_found_start > 2:
+        count_misc = count_url = count_doi = count_auth_group = 0
+        processed_references = []
+        if cli_opts['verbosity'] >= 1:
+            sys.stdout.write("-----Found ONLY miscellaneous/Urls so removed it how_found_start=  %d\n" % (how_found_start))
+    elif  count_reportnum + count_title  > 0 and how_found_start > 2:
+        if cli_opts['verbosity'] >= 1:
+            sys.stdout.write("-----Found journals/reports with how_found_start=  %d\n" % (how_found_start))
+
+    ## Display the processed reference lines:
+    out = display_xml_record(extract_error, \
+                             count_reportnum, \
+                             count_title, \
+                             count_url, \
+                             count_doi, \
+                             count_misc, \
+                             count_auth_group, \
+                             recid, \
+                             processed_references)
+
+    ## Filter the processed reference lines to remove junk
+    out = filter_processed_references(out)  ## Be sure to call this BEFORE compress_subfields
+                                            ## since filter_processed_references expects the
+                                            ## original xml format.
+    ## Compress mulitple 'm' subfields in a datafield
+    out = compress_subfields(out,CFG_REFEXTRACT_SUBFIELD_MISC)
+    ## Compress multiple 'h' subfields in a datafield
+    out = compress_subfields(out,CFG_REFEXTRACT_SUBFIELD_AUTH)
+
+    if cli_opts['verbosity'] >= 1:
+        lines = out.split('\n')
+        sys.stdout.write("-----display_xml_record gave: %s significant " \
+                         "lines of xml, overall error: %s\n" \
+                         % (str(len(lines) - 7), extract_error))
+
+    return (curitem, extract_error, out, record_titles_count, \
+            (conversion_time, time() - start_time))
+
 def main():
     """Main function.
     """
-    global cli_opts
+    global cli_opts, _knowledge_bases
     (cli_opts, cli_args) =  get_cli_options()
 
     ## A dictionary to contain the counts of all 'bad titles' found during
@@ -5900,32 +6158,57 @@ def main():
          standardised_preprint_reportnum_categs) = \
                    build_reportnum_knowledge_base(CFG_REFEXTRACT_KB_REPORT_NUMBERS)
 
+    ## The knowledge bases are shared with the processes of the pool by
+    ## forking them once the knowledge bases are loaded:
+    _knowledge_bases = (preprint_reportnum_sre,
+                        standardised_preprint_reportnum_categs,
+                        title_search_kb,
+                        title_search_standardised_titles,
+                        title_search_keys)
+
+    pool = None
+    if cli_opts['processes'] > 1 and len(extract_jobs) > 1:
+        if MULTIPROCESSING_ENABLED:
+            pool = multiprocessing.Pool(cli_opts['processes'])
+        else:
+            sys.stderr.write("W: The multiprocessing module is not " \
+                             "available. Processing the documents one " \
+                             "after another.\n")
+
+    if pool is None:
+        results = imap(extract_references_from_document, extract_jobs)
+    else:
+        ## while some processes wait for pdftotext, the others
+        ## process the references of the documents they already
+        ## converted:
+        results = pool.imap(extract_references_from_document, extract_jobs)
+
+    if cli_opts['timingfile']:
+        try:
+            tfilehdl = open(cli_opts['timingfile'], "w")
+        except IOError, (errno, err_string):
+            sys.stderr.write("Error: Unable to open timing file %s. " \
+                             "Error Number %d (%s).\n" \
+                             % (cli_opts['timingfile'], errno, err_string))
+            sys.exit(1)
+
     done_coltags = 0 ## flag to signal that the starting XML collection
                      ## tags have been output to either an xml file or stdout
 
-    for curitem in extract_jobs:
-        how_found_start = -1  ## flag to indicate how the reference start section was found (or not)
-        extract_error = 0  ## extraction was OK unless determined otherwise
-        ## reset the stats counters:
-        count_misc = count_title = count_reportnum = count_url = count_doi = count_auth_group = 0
-        recid = curitem[0]
-        if cli_opts['verbosity'] >= 1:
-            sys.stdout.write("--- processing RecID: %s pdffile: %s; %s\n" \
-                             % (str(curitem[0]), curitem[1], ctime()))
-
-        ## 1. Get this document body as plaintext:
-        (docbody, extract_error) = get_plaintext_document_body(curitem[1])
+    for (curitem, extract_error, out, record_titles_count, timing) in results:
         if extract_error == 1:
             ## Non-existent or unreadable pdf/text directory.
             sys.stderr.write("Error: could not open %s for extraction.\n" \
                              % curitem[1])
+            if pool is not None:
+                pool.terminate()
             sys.exit(1)
-        if extract_error == 0 and len(docbody) == 0:
-            extract_error = 3
-        if cli_opts['verbosity'] >= 1:
-            sys.stdout.write("-----get_plaintext_document_body gave: " \
-                             "%s lines, overall error: %s\n" \
-                             % (str(len(docbody)), str(extract_error)))
+
+        ## Add the count of 'bad titles' found in this document to the
+        ## total for the extraction job:
+        all_found_titles_count = \
+                               sum_2_dictionaries(all_found_titles_count, \
+                                                  record_titles_count)
 
         if not done_coltags:
             ## Output opening XML collection tags:
@@ -5950,103 +6233,6 @@ def main():
                           % CFG_REFEXTRACT_XML_COLLECTION_OPEN.encode("utf-8"))
             done_coltags = 1
 
-        if len(docbody) > 0:
-            ## the document body is not empty:
-            ## 2. If necessary, locate the reference section:
-            if cli_opts['treat_as_reference_section']:
-                ## don't search for citations in the document body:
-                ## treat it as a reference section:
-                reflines = docbody
-            else:
-                ## launch search for the reference section in the document body:
-                (reflines, extract_error, how_found_start) = \
-                           extract_references_from_fulltext(docbody)
-                if len(reflines) == 0 and extract_error == 0:
-                    extract_error = 6
-                if cli_opts['verbosity'] >= 1:
-                    sys.stdout.write("-----extract_references_from_fulltext " \
-                                     "gave len(reflines): %s overall error: " \
-                                     "%s\n" \
-                                     % (str(len(reflines)), str(extract_error)))
-
-            ## 3. Standardise the reference lines:
-            #reflines = test_get_reference_lines()
-            (processed_references, count_misc, \
-             count_title, count_reportnum, \
-             count_url, count_doi, count_auth_group, \
-             record_titles_count) = \
-              create_marc_xml_reference_section(reflines,
-                                                preprint_repnum_search_kb=\
-                                                  preprint_reportnum_sre,
-                                                preprint_repnum_standardised_categs=\
-                                                  standardised_preprint_reportnum_categs,
-                                                periodical_title_search_kb=\
-                                                  title_search_kb,
-                                                standardised_periodical_titles=\
-                                                  title_search_standardised_titles,
-                                                periodical_title_search_keys=\
-                                                  title_search_keys)
-
-            ## Add the count of 'bad titles' found in this line to the total
-            ## for the reference section:
-            all_found_titles_count = \
-                                   sum_2_dictionaries(all_found_titles_count, \
-                                                      record_titles_count)
-
-
-        else:
-            ## document body is empty, therefore the reference section is empty:
-            reflines = []
-            processed_references = []
-
-        ## 4. Display the extracted references, status codes, etc:
-        if cli_opts['output_raw']:
-            ## now write the raw references to the stream:
-            raw_file = str(recid) + '.rawrefs'
-            try:
-                rawfilehdl = open(raw_file, 'w')
-                write_raw_references_to_stream(recid, reflines, rawfilehdl)
-                rawfilehdl.close()
-            except:
-                raise IOError("Cannot open raw ref file: %s to write" \
-                              % raw_file)
-        ## If found ref section by a weaker method and only found misc/urls then junk it
-        ## studies show that such cases are ~ 100% rubbish. Also allowing only
-        ## urls found greatly increases the level of rubbish accepted..
-        if count_reportnum + count_title == 0 and how_found_start > 2:
-            count_misc = count_url = count_doi = count_auth_group = 0
-            processed_references = []
-            if cli_opts['verbosity'] >= 1:
-                sys.stdout.write("-----Found ONLY miscellaneous/Urls so removed it how_found_start=  %d\n" % (how_found_start))
-        elif  count_reportnum + count_title  > 0 and how_found_start > 2:
-            if cli_opts['verbosity'] >= 1:
-                sys.stdout.write("-----Found journals/reports with how_found_start=  %d\n" % (how_found_start))
-
-        ## Display the processed reference lines:
-        out = display_xml_record(extract_error, \
-                                 count_reportnum, \
-                                 count_title, \
-                                 count_url, \
-                                 count_doi, \
-                                 count_misc, \
-                                 count_auth_group, \
-                                 recid, \
-                                 processed_references)
-
-        ## Filter the processed reference lines to remove junk
-        out = filter_processed_references(out)  ## Be sure to call this BEFORE compress_subfields
-                                                ## since filter_processed_references expects the
-                                                ## original xml format.
-        ## Compress mulitple 'm' subfields in a datafield
-        out = compress_subfields(out,CFG_REFEXTRACT_SUBFIELD_MISC)
-        ## Compress multiple 'h' subfields in a datafield
-        out = compress_subfields(out,CFG_REFEXTRACT_SUBFIELD_AUTH)
-
-        if cli_opts['verbosity'] >= 1:
-            lines = out.split('\n')
-            sys.stdout.write("-----display_xml_record gave: %s significant " \
-                             "lines of xml, overall error: %s\n" \
-                             % (str(len(lines) - 7), extract_error))
         if cli_opts['xmlfile']:
             ofilehdl.write("%s" % (out.encode("utf-8"),))
             ofilehdl.flush()
@@ -6055,6 +6241,18 @@ def main():
             sys.stdout.write("%s" % out.encode("utf-8"))
             sys.stdout.flush()
 
+        if cli_opts['timingfile']:
+            tfilehdl.write("%s:%s %.3f %.3f\n" \
+                           % (curitem[0], curitem[1], timing[0], timing[1]))
+            tfilehdl.flush()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if cli_opts['timingfile']:
+        tfilehdl.close()
+
     ## If an XML collection was opened, display closing tag
     if done_coltags:
         if (cli_opts['xmlfile']):
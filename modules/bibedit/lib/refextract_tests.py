@@ -19,10 +19,20 @@
 
 """
 The Refextract test suite.
+
+Run with --benchmark to time the search of the periodical titles in the
+test reference lines of refextract.
 """
 
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 from invenio.testutils import make_test_suite, run_test_suite
+from invenio import refextract
 ## Import the minimal necessary methods and variables needed to run Refextract
 from invenio.refextract import CFG_REFEXTRACT_KB_JOURNAL_TITLES, \
                                CFG_REFEXTRACT_KB_REPORT_NUMBERS, \
@@ -32,6 +42,8 @@ from invenio.refextract import CFG_REFEXTRACT_KB_JOURNAL_TITLES, \
                                display_xml_record, \
                                compress_subfields, \
                                restrict_m_subfields, \
+                               identify_periodical_titles, \
+                               PeriodicalTitleMatcher, \
                                cli_opts
 
 # Initially, build the titles knowledge base
@@ -575,7 +587,145 @@ class RefextractTest(unittest.TestCase):
         #Compare the recieved output with the expected references
         self.assertEqual(out, references_expected)
 
-TEST_SUITE = make_test_suite(RefextractTest)
+class PeriodicalTitleMatcherTest(unittest.TestCase):
+    """ refextract - testing the matching of periodical titles """
+
+    def test_candidate_titles(self):
+        """ refextract - test the titles contained by a line """
+        matcher = PeriodicalTitleMatcher([u"PHYS REV LETT", u"PHYS REV",
+                                          u"REV", u"NUCL PHYS"])
+        self.assertEqual(matcher.get_candidate_titles(u"[1] PHYS REV LETT 44"),
+                         [u"PHYS REV LETT", u"PHYS REV", u"REV"])
+        self.assertEqual(matcher.get_candidate_titles(u"[1] NUCL PHYS B342"),
+                         [u"NUCL PHYS"])
+        self.assertEqual(matcher.get_candidate_titles(u"[1] SOME TEXT"), [])
+
+    def test_longest_title_first(self):
+        """ refextract - test that the longest titles are matched first """
+        (title_matches_matchlen, title_matches_matchtext, line, dummy) = \
+            identify_periodical_titles(u"[1] PHYS REV LETT 44 (1980) 912 ",
+                                       title_search_kb, title_search_keys)
+        self.assertEqual(title_matches_matchtext, {4: u"PHYS REV LETT"})
+        self.assertEqual(line, u"[1] _____________ 44 (1980) 912 ")
+
+class RefextractCliTest(unittest.TestCase):
+    """ refextract - testing the batch options of the command line """
+
+    def setUp(self):
+        """Write 3 documents of test reference lines, and a batch file
+           listing the last 2 of them"""
+        self.argv = sys.argv
+        self.cli_opts = refextract.cli_opts
+        self.knowledge_bases = refextract._knowledge_bases
+        self.tmpdir = tempfile.mkdtemp()
+        reference_lines = refextract.test_get_reference_lines()
+        self.jobs = []
+        for i in range(3):
+            document = os.path.join(self.tmpdir, "doc%d.txt" % i)
+            docfile = open(document, "w")
+            docfile.write("\n".join(reference_lines[i::3]) + "\n")
+            docfile.close()
+            self.jobs.append("%d:%s" % (i + 1, document))
+        self.batchfile = os.path.join(self.tmpdir, "jobs.txt")
+        bfile = open(self.batchfile, "w")
+        bfile.write("%s\n\n  %s  \n" % (self.jobs[1], self.jobs[2]))
+        bfile.close()
+
+    def tearDown(self):
+        """Restore the options of refextract, and remove the documents"""
+        sys.argv = self.argv
+        refextract.cli_opts = self.cli_opts
+        refextract._knowledge_bases = self.knowledge_bases
+        shutil.rmtree(self.tmpdir)
+
+    def run_refextract(self, *options):
+        """Run refextract on the documents with the given options, and
+           return the MARC XML it wrote, without the statistics datafields
+           (which hold the time of the extraction)"""
+        xmlfile = os.path.join(self.tmpdir, "refs.xml")
+        sys.argv = ["refextract", "-z", "-x", xmlfile, "-b", self.batchfile] \
+                   + list(options) + [self.jobs[0]]
+        refextract.main()
+        return re.sub(r'(?s)<datafield tag="999" ind1="C" ind2="6">.*?'
+                      r'</datafield>', '', open(xmlfile).read())
+
+    def test_batch_file_arguments(self):
+        """ refextract - test the arguments read from a batch file """
+        sys.argv = ["refextract", "-b", self.batchfile, self.jobs[0]]
+        (options, args) = refextract.get_cli_options()
+        self.assertEqual(args, self.jobs)
+
+    def test_parallel_extraction(self):
+        """ refextract - test that -p gives the same output as one process """
+        out = self.run_refextract()
+        self.assertEqual(out.count("<record>"), 3)
+        self.assertEqual(self.run_refextract("-p", "2"), out)
+
+    def test_timing_file(self):
+        """ refextract - test the format of the timing file """
+        timingfile = os.path.join(self.tmpdir, "timing.txt")
+        self.run_refextract("-t", timingfile)
+        timing_lines = open(timingfile).read().splitlines()
+        self.assertEqual([line.split(" ")[0] for line in timing_lines],
+                         self.jobs)
+        for line in timing_lines:
+            self.assert_(re.match(r"^\d+:\S+ \d+\.\d{3} \d+\.\d{3}$", line))
+            (conversion_time, total_time) = map(float, line.split(" ")[1:])
+            self.assert_(conversion_time <= total_time)
+
+TEST_SUITE = make_test_suite(RefextractTest,
+                             PeriodicalTitleMatcherTest,
+                             RefextractCliTest)
+
+class _AllPeriodicalTitles:
+    """The previous search of the periodical titles: the pattern of every
+       title of the knowledge base is tried on every line.
+    """
+    def __init__(self, titles):
+        self.titles = titles
+
+    def get_candidate_titles(self, line):
+        return self.titles
+
+def refextract_benchmark(repeat=10):
+    """Time the extraction of the test reference lines of refextract, with
+       the index of the periodical titles (PeriodicalTitleMatcher) and with
+       the previous search, and check that both give the same output.
+    """
+    reference_lines = [unicode(line, 'utf-8') for line in
+                       refextract.test_get_reference_lines()]
+    cli_opts['inspire'] = 0
+
+    def extract(get_periodical_title_matcher):
+        refextract.get_periodical_title_matcher = get_periodical_title_matcher
+        start = time.time()
+        for dummy in xrange(repeat):
+            out = create_marc_xml_reference_section(reference_lines,
+                                         preprint_reportnum_sre,
+                                         standardised_preprint_reportnum_categs,
+                                         title_search_kb,
+                                         title_search_standardised_titles,
+                                         title_search_keys)
+        return (time.time() - start, out)
+
+    get_periodical_title_matcher = refextract.get_periodical_title_matcher
+    try:
+        ## build the index before timing the extraction:
+        get_periodical_title_matcher(title_search_keys)
+        (time_index, out_index) = extract(get_periodical_title_matcher)
+        (time_all, out_all) = extract(_AllPeriodicalTitles)
+    finally:
+        refextract.get_periodical_title_matcher = get_periodical_title_matcher
+
+    print "%d reference lines x %d, %d periodical titles:" % \
+          (len(reference_lines), repeat, len(title_search_keys))
+    print "with the index of the titles: %.3fs" % time_index
+    print "trying every title: %.3fs" % time_all
+    if out_index != out_all:
+        print "ERROR: the outputs differ"
 
 if __name__ == '__main__':
-    run_test_suite(TEST_SUITE)
+    if '--benchmark' in sys.argv[1:]:
+        refextract_benchmark()
+    else:
+        run_test_suite(TEST_SUITE)
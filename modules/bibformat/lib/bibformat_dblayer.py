@@ -430,6 +430,29 @@ def get_preformatted_record(recID, of, decompress=zlib.decompress):
     else:
         return None
 
+def get_preformatted_records(recIDs, of, decompress=zlib.decompress):
+    """
+    Returns the preformatted records with ids 'recIDs' and format 'of',
+    fetched with a single query.
+
+    Records that are not preformatted in given output format are not
+    part of the result.
+
+    @param recIDs: the list of ids of the records to fetch
+    @param of: the output format code
+    @param decompress: the method used to decompress the preformatted record in database
+    @return: dictionary {recID: formatted record as String}
+    """
+    out = {}
+    if not recIDs:
+        return out
+    query = "SELECT id_bibrec, value FROM bibfmt WHERE id_bibrec IN (%s) AND format=%%s" % \
+            ("%s,"*len(recIDs))[:-1]
+    params = tuple(recIDs) + (of,)
+    for recID, value in run_sql(query, params):
+        out[recID] = "%s" % decompress(value)
+    return out
+
 def get_preformatted_record_date(recID, of):
     """
     Returns the date of the last update of the cache for the considered
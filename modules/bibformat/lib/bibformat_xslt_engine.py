@@ -35,6 +35,11 @@ __revision__ = "$Id$"
 
 import sys
 import os
+import threading
+if sys.hexversion < 0x2060000:
+    from md5 import md5
+else:
+    from hashlib import md5
 
 from invenio.config import \
      CFG_SITE_URL
@@ -78,6 +83,12 @@ if processor_type == -1:
                      'No output produced.\n')
     #sys.exit(1)
 
+# Compiled libxslt stylesheets, keyed by path (or by MD5 digest of the
+# source): ((modification time, size) or None, compiled stylesheet)
+_compiled_stylesheets = {}
+# Guards _compiled_stylesheets, shared by the threads of the process
+_compiled_stylesheets_lock = threading.Lock()
+
 ##################################################################
 # Support for 'creation_date' and 'modification_date' functions  #
 
@@ -299,49 +310,74 @@ def eval_bibformat_4suite(ctx, recID, template_code):
 # End of date-related functions                                  #
 ##################################################################
 
-def format(xmltext, template_filename=None, template_source=None):
+def get_compiled_stylesheet(template_filename=None, template_source=None):
     """
-    Processes an XML text according to a template, and returns the result.
-
-    The template can be given either by name (or by path) or by source.
-    If source is given, name is ignored.
-
-    bibformat_xslt_engine will look for template_filename in standard directories
-    for templates. If not found, template_filename will be assumed to be a path to
-    a template. If none can be found, return None.
-
-    @param xmltext: The string representation of the XML to process
-    @param template_filename: The name of the template to use for the processing
-    @param template_source: The configuration describing the processing.
-    @return: the transformed XML text.
+    Returns the compiled stylesheet of a template, compiling it only if
+    it was not compiled yet by this process, or if its file changed
+    since.
+
+    The template can be given either by name (or by path) or by source,
+    as in L{format}.  Compiled stylesheets of files are cached by path,
+    and checked against the modification time and size of the file;
+    compiled stylesheets of sources are cached by the MD5 digest of the
+    source.
+
+    Only libxslt stylesheets are cached: a 4suite processor keeps the
+    state of the transformation it runs, hence can not be shared by
+    threads, and a new one is returned at each call.
+
+    @param template_filename: The name of the template to compile
+    @param template_source: The source of the template to compile
+    @return: the compiled stylesheet, or None if an error occured
     """
-    if processor_type == -1:
-        # No XSLT processor found
-        sys.stderr.write('No XSLT processor could be found.')
-        #sys.exit(1)
+    _compiled_stylesheets_lock.acquire()
+    try:
+        return _get_compiled_stylesheet(template_filename, template_source)
+    finally:
+        _compiled_stylesheets_lock.release()
 
-    # Retrieve template and read it
+def _get_compiled_stylesheet(template_filename, template_source):
+    """
+    Does the job of L{get_compiled_stylesheet}, the caller holding
+    _compiled_stylesheets_lock.
+    """
+    # Retrieve template and check whether it is cached
     if template_source:
+        key = md5(template_source).hexdigest()
+        stamp = None
+        if key in _compiled_stylesheets:
+            return _compiled_stylesheets[key][1]
         template = template_source
     elif template_filename:
         try:
             path_to_templates = (CFG_BIBFORMAT_TEMPLATES_PATH + os.sep +
                                  template_filename)
             if os.path.exists(path_to_templates):
-                template = file(path_to_templates).read()
+                key = path_to_templates
             elif os.path.exists(template_filename):
-                template = file(template_filename).read()
+                key = template_filename
             else:
                 sys.stderr.write(template_filename +' does not exist.')
                 return None
-        except IOError:
+            stat = os.stat(key)
+            stamp = (stat.st_mtime, stat.st_size)
+            if key in _compiled_stylesheets and \
+                   _compiled_stylesheets[key][0] == stamp:
+                return _compiled_stylesheets[key][1]
+            if key in _compiled_stylesheets:
+                # The file changed: drop the outdated stylesheet.  It is
+                # not freed explicitly, as another thread may still be
+                # applying it.
+                del _compiled_stylesheets[key]
+            template = file(key).read()
+        except (IOError, OSError):
             sys.stderr.write(template_filename +' could not be read.')
             return None
     else:
         sys.stderr.write(template_filename +' was not given.')
         return None
 
-    result = ""
+    processor = None
     if processor_type == 0:
         # libxml2 & libxslt
 
@@ -355,24 +391,10 @@ def format(xmltext, template_filename=None, template_source=None):
         libxslt.registerExtModuleFunction("eval_bibformat",
                                           CFG_BIBFORMAT_FUNCTION_NS,
                                           eval_bibformat_libxslt)
-        # Load template and source
+        # Load template
         template_xml = libxml2.parseDoc(template)
         processor = libxslt.parseStylesheetDoc(template_xml)
-        source = libxml2.parseDoc(xmltext)
-
-        # Transform
-        result_object = processor.applyStylesheet(source, None)
-        try:
-            result = processor.saveResultToString(result_object)
-        except SystemError :
-            # Catch an exception thrown when result is empty,
-            # due to a bug in libxslt
-            result = ''
-
-        # Deallocate
-        processor.freeStylesheet()
-        source.freeDoc()
-        result_object.freeDoc()
+        _compiled_stylesheets[key] = (stamp, processor)
 
     elif processor_type == 1:
         # 4suite
@@ -390,17 +412,73 @@ def format(xmltext, template_filename=None, template_source=None):
         processor.registerExtensionFunction(CFG_BIBFORMAT_FUNCTION_NS,
                                             "eval_bibformat",
                                             eval_bibformat_4suite)
-        # Load template and source
+        # Load template
         transform = InputSource.DefaultFactory.fromString(template,
                                                        uri=CFG_SITE_URL)
+        processor.appendStylesheet(transform)
+    else:
+        sys.stderr.write("No XSLT processor could be found")
+
+    return processor
+
+def format(xmltext, template_filename=None, template_source=None):
+    """
+    Processes an XML text according to a template, and returns the result.
+
+    The template can be given either by name (or by path) or by source.
+    If source is given, name is ignored.
+
+    bibformat_xslt_engine will look for template_filename in standard directories
+    for templates. If not found, template_filename will be assumed to be a path to
+    a template. If none can be found, return None.
+
+    The template is compiled only once per process (see
+    L{get_compiled_stylesheet}).
+
+    @param xmltext: The string representation of the XML to process
+    @param template_filename: The name of the template to use for the processing
+    @param template_source: The configuration describing the processing.
+    @return: the transformed XML text.
+    """
+    if processor_type == -1:
+        # No XSLT processor found
+        sys.stderr.write('No XSLT processor could be found.')
+        #sys.exit(1)
+        return ""
+
+    processor = get_compiled_stylesheet(template_filename, template_source)
+    if processor is None:
+        return None
+
+    result = ""
+    if processor_type == 0:
+        # libxml2 & libxslt
+
+        # Load source
+        source = libxml2.parseDoc(xmltext)
+
+        # Transform
+        result_object = processor.applyStylesheet(source, None)
+        try:
+            result = processor.saveResultToString(result_object)
+        except SystemError :
+            # Catch an exception thrown when result is empty,
+            # due to a bug in libxslt
+            result = ''
+
+        # Deallocate (the stylesheet is kept in cache)
+        source.freeDoc()
+        result_object.freeDoc()
+
+    elif processor_type == 1:
+        # 4suite
+
+        # Load source
         source = InputSource.DefaultFactory.fromString(xmltext,
                                                        uri=CFG_SITE_URL)
-        processor.appendStylesheet(transform)
 
         # Transform
         result = processor.run(source)
-    else:
-        sys.stderr.write("No XSLT processor could be found")
 
     return result
 
@@ -28,3 +28,13 @@ CFG_OAI_POSSIBLE_POSTMODES = [\
          ["t", "attach full-text (t)"], \
          ["f", "filter (f)"], \
          ["u", "upload (u)"]]
+
+## CFG_OAI_HARVEST_CONCURRENT_SOURCES -- number of OAI sources that the
+## periodical harvesting task harvests at the same time
+CFG_OAI_HARVEST_CONCURRENT_SOURCES = 4
+
+## CFG_OAI_HARVEST_QUEUE_SIZE -- number of harvested files that may be
+## waiting for each post-processing step (conversion, extraction,
+## filtering, upload); harvesting pauses while the queue of the first
+## step is full
+CFG_OAI_HARVEST_QUEUE_SIZE = 4
@@ -37,6 +37,8 @@ import calendar
 import shutil
 import tempfile
 import urlparse
+import threading
+import Queue
 
 from invenio.config import \
      CFG_BINDIR, \
@@ -50,6 +52,7 @@ from invenio.bibtask import \
      task_set_option, \
      write_message, \
      task_init, \
+     task_read_status, \
      task_sleep_now_if_required, \
      task_update_progress, \
      task_low_level_submission
@@ -58,6 +61,9 @@ from invenio import oai_harvest_getter
 from invenio.plotextractor_getter import harvest_single, make_single_directory
 from invenio.plotextractor import process_single
 from invenio.shellutils import run_shell_command
+from invenio.errorlib import register_exception
+from invenio.oai_harvest_config import CFG_OAI_HARVEST_CONCURRENT_SOURCES, \
+     CFG_OAI_HARVEST_QUEUE_SIZE
 
 ## precompile some often-used regexp for speed reasons:
 REGEXP_OAI_ID = re.compile("<identifier.*?>(.*?)<\/identifier>", re.DOTALL)
@@ -81,6 +87,11 @@ def task_run_core():
     """Run the harvesting task.  The row argument is the oaiharvest task
     queue row, containing if, arguments, etc.
     Return 1 in case of success and 0 in case of failure.
+
+    The repositories are harvested CFG_OAI_HARVEST_CONCURRENT_SOURCES at
+    a time, and each harvested file goes through the post-processing
+    steps of its repository (see L{HarvestPipeline}) while the next
+    files are being harvested.
     """
     reposlist = []
     datelist = []
@@ -110,60 +121,30 @@ def task_run_core():
         for element in task_get_option("dates"):
             datelist.append(element)
 
-    error_happened_p = False
+    ### go ahead: find out which repositories to harvest, and from when
+    harvest_jobs = []
     j = 0
     for repos in reposlist:
         j += 1
-        task_sleep_now_if_required()
         reponame = str(repos[0][6])
-        setspecs = str(repos[0][10])
-        postmode = repos[0][9]
-        write_message("running in postmode %s" % (postmode,))
-        downloaded_material_dict = {}
-        harvested_files_list = []
-        # Harvest phase
         harvestpath = "%s_%d_%s_" % (filepath_prefix, j, time.strftime("%Y%m%d%H%M%S"))
         if dateflag == 1:
-            task_update_progress("Harvesting %s from %s to %s (%i/%i)" % \
-                                 (reponame, \
-                                  str(datelist[0]),
-                                  str(datelist[1]),
-                                  j, \
-                                  len(reposlist)))
-            exit_code, file_list = oai_harvest_get(prefix=repos[0][2],
-                                  baseurl=repos[0][1],
-                                  harvestpath=harvestpath,
-                                  fro=str(datelist[0]),
-                                  until=str(datelist[1]),
-                                  setspecs=setspecs)
-            if exit_code == 1 :
-                write_message("source %s was harvested from %s to %s" % \
-                              (reponame, str(datelist[0]), str(datelist[1])))
-                harvested_files_list = file_list
-            else:
-                write_message("an error occurred while harvesting from source %s for the dates chosen:\n%s\n" % \
-                              (reponame, file_list))
-                error_happened_p = True
-                continue
+            harvest_jobs.append({'repos': repos,
+                                 'number': j,
+                                 'harvestpath': harvestpath,
+                                 'fro': str(datelist[0]),
+                                 'until': str(datelist[1]),
+                                 'update_lastrun': False})
 
         elif dateflag != 1 and repos[0][7] is None and repos[0][8] != 0:
             write_message("source %s was never harvested before - harvesting whole repository" % \
                           (reponame,))
-            task_update_progress("Harvesting %s (%i/%i)" % \
-                                 (reponame,
-                                  j, \
-                                  len(reposlist)))
-            exit_code, file_list = oai_harvest_get(prefix=repos[0][2],
-                                  baseurl=repos[0][1],
-                                  harvestpath=harvestpath,
-                                  setspecs=setspecs)
-            if exit_code == 1 :
-                update_lastrun(repos[0][0])
-                harvested_files_list = file_list
-            else :
-                write_message("an error occurred while harvesting from source %s:\n%s\n" % (reponame, file_list))
-                error_happened_p = True
-                continue
+            harvest_jobs.append({'repos': repos,
+                                 'number': j,
+                                 'harvestpath': harvestpath,
+                                 'fro': None,
+                                 'until': None,
+                                 'update_lastrun': True})
 
         elif dateflag != 1 and repos[0][8] != 0:
             ### check that update is actually needed,
@@ -179,296 +160,459 @@ def task_run_core():
                 fromdate = str(repos[0][7])
                 fromdate = fromdate.split()[0] # get rid of time
                                                # of the day for the moment
-                task_update_progress("Harvesting %s (%i/%i)" % \
-                                     (reponame,
-                                     j, \
-                                     len(reposlist)))
-                exit_code, file_list = oai_harvest_get(prefix=repos[0][2],
-                                      baseurl=repos[0][1],
-                                      harvestpath=harvestpath,
-                                      fro=fromdate,
-                                      setspecs=setspecs)
-                if exit_code == 1 :
-                    update_lastrun(repos[0][0])
-                    harvested_files_list = file_list
-                else :
-                    write_message("an error occurred while harvesting from source %s:\n%s\n" % (reponame, file_list))
-                    error_happened_p = True
-                    continue
+                harvest_jobs.append({'repos': repos,
+                                     'number': j,
+                                     'harvestpath': harvestpath,
+                                     'fro': fromdate,
+                                     'until': None,
+                                     'update_lastrun': True})
             else:
                 write_message("source %s does not need updating" % (reponame,))
-                continue
 
         elif dateflag != 1 and repos[0][8] == 0:
             write_message("source %s has frequency set to 'Never' so it will not be updated" % (reponame,))
-            continue
 
-        # Harvesting done, now convert/extract/filter/upload as requested
+    ### go ahead: harvest, and post-process the harvested files
+    pipeline = HarvestPipeline()
+    pipeline.start()
+    harvest_queue = Queue.Queue()
+    for job in harvest_jobs:
+        harvest_queue.put(job)
+    harvest_threads = []
+    for dummy in range(min(CFG_OAI_HARVEST_CONCURRENT_SOURCES,
+                           len(harvest_jobs))):
+        harvest_queue.put(None)
+        harvest_thread = threading.Thread(target=run_harvest_jobs,
+                                          args=(harvest_queue, pipeline,
+                                                len(reposlist)))
+        harvest_thread.setDaemon(True)
+        harvest_thread.start()
+        harvest_threads.append(harvest_thread)
+    for harvest_thread in harvest_threads:
+        wait_for_thread(harvest_thread, pipeline.pause)
+    pipeline.close()
+    pipeline.join()
+
+    if pipeline.error_happened_p:
+        return False
+    else:
+        return True
+
+def wait_for_thread(thread, pause):
+    """Wait for THREAD to finish, letting BibSched put the task to sleep
+    in the meantime through PAUSE.  (The task can only be put to sleep
+    from the main thread.)"""
+    while True:
+        thread.join(5)
+        if not thread.isAlive():
+            return
+        pause.sleep_if_required()
+
+class HarvestPause:
+    """
+    Lets the main thread put the task to sleep in a safe state only,
+    i.e. while none of the harvesting and post-processing threads is in
+    the middle of a harvested file (downloading it, or running a step
+    on it).  The threads call L{enter} before working on a file and
+    L{leave} once done with it; L{enter} blocks them while the task is
+    asked to sleep.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.paused = False
+        self.nb_busy_threads = 0
+
+    def enter(self):
+        """Wait until the task is not paused, and mark the calling
+        thread as busy with a file."""
+        self.condition.acquire()
+        try:
+            while self.paused:
+                self.condition.wait()
+            self.nb_busy_threads += 1
+        finally:
+            self.condition.release()
+
+    def leave(self):
+        """Mark the calling thread as done with its file."""
+        self.condition.acquire()
+        try:
+            self.nb_busy_threads -= 1
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def sleep_if_required(self):
+        """If BibSched asked the task to sleep, wait until no thread is
+        busy with a file, and sleep.  To be called from the main
+        thread."""
+        if task_read_status() != 'ABOUT TO SLEEP':
+            return
+        self.condition.acquire()
+        try:
+            self.paused = True
+            while self.nb_busy_threads > 0:
+                # (Waiting with a timeout lets the signals of BibSched
+                # be handled meanwhile.)
+                self.condition.wait(1)
+        finally:
+            self.condition.release()
+        try:
+            task_sleep_now_if_required()
+        finally:
+            self.condition.acquire()
+            try:
+                self.paused = False
+                self.condition.notifyAll()
+            finally:
+                self.condition.release()
+
+def run_harvest_jobs(harvest_queue, pipeline, nb_repos):
+    """Harvest the repositories of the jobs of HARVEST_QUEUE (up to a None
+    job), feeding PIPELINE with the harvested files.  NB_REPOS is the
+    total number of repositories, for the progress messages."""
+    while True:
+        job = harvest_queue.get()
+        if job is None:
+            return
+        pipeline.pause.enter()
+        try:
+            try:
+                harvest_repository(job, pipeline, nb_repos)
+            except Exception, e:
+                register_exception()
+                write_message("an error occurred while harvesting from source %s:\n%s\n" % \
+                              (str(job['repos'][0][6]), e))
+                pipeline.error_happened_p = True
+        finally:
+            pipeline.pause.leave()
+
+def harvest_repository(job, pipeline, nb_repos):
+    """Harvest the repository of JOB, and put each harvested file into
+    PIPELINE as soon as it is downloaded.  Called between
+    PIPELINE.pause.enter() and PIPELINE.pause.leave(): the task can be
+    put to sleep between two harvested files."""
+    repos = job['repos']
+    reponame = str(repos[0][6])
+    postmode = repos[0][9]
+    write_message("running in postmode %s" % (postmode,))
+    if job['until']:
+        task_update_progress("Harvesting %s from %s to %s (%i/%i)" % \
+                             (reponame,
+                              job['fro'],
+                              job['until'],
+                              job['number'],
+                              nb_repos))
+    else:
+        task_update_progress("Harvesting %s (%i/%i)" % \
+                             (reponame,
+                              job['number'],
+                              nb_repos))
+
+    # Harvested files of this repository, and material downloaded for
+    # their records by the extraction steps
+    harvested_files_list = []
+    downloaded_material_dict = {}
+
+    def put_harvested_file(harvested_file):
+        """Put HARVESTED_FILE into the pipeline, with its OAI IDs."""
+        identifiers = collect_identifiers([harvested_file])
+        if len(identifiers) != 1:
+            # Harvested file and its identifiers are 'out of sync'
+            write_message("Harvested file %s misses identifiers for %s" % \
+                          (harvested_file, reponame))
+            pipeline.error_happened_p = True
+            return
+        harvested_files_list.append(harvested_file)
+        pipeline.pause.leave()
+        try:
+            pipeline.put({'repos': repos,
+                          'reponame': reponame,
+                          'postmode': postmode,
+                          'active_file': harvested_file,
+                          'identifiers': identifiers[0],
+                          'downloaded_material': downloaded_material_dict,
+                          'number': len(harvested_files_list)})
+        finally:
+            pipeline.pause.enter()
+
+    exit_code, file_list = oai_harvest_get(prefix=repos[0][2],
+                                           baseurl=repos[0][1],
+                                           harvestpath=job['harvestpath'],
+                                           fro=job['fro'],
+                                           until=job['until'],
+                                           setspecs=str(repos[0][10]),
+                                           harvested_file_callback=put_harvested_file)
+    if exit_code == 1:
+        if job['until']:
+            write_message("source %s was harvested from %s to %s" % \
+                          (reponame, job['fro'], job['until']))
+        if job['update_lastrun']:
+            update_lastrun(repos[0][0])
         if len(harvested_files_list) < 1:
             write_message("No records harvested for %s" % (reponame,))
-            continue
+    else:
+        if job['until']:
+            write_message("an error occurred while harvesting from source %s for the dates chosen:\n%s\n" % \
+                          (reponame, file_list))
+        else:
+            write_message("an error occurred while harvesting from source %s:\n%s\n" % (reponame, file_list))
+        pipeline.error_happened_p = True
 
-        # Retrieve all OAI IDs and set active list
-        harvested_identifier_list = collect_identifiers(harvested_files_list)
-        active_files_list = harvested_files_list
-        if len(active_files_list) != len(harvested_identifier_list):
-            # Harvested files and its identifiers are 'out of sync', abort harvest
-            write_message("Harvested files miss identifiers for %s" % (reponame,))
-            continue
+class HarvestPipeline:
+    """
+    Post-processing of harvested files, as a pipeline of threads: one
+    thread per post-processing step (see L{HARVEST_PIPELINE_STEPS}),
+    connected to the next one by a queue of at most
+    CFG_OAI_HARVEST_QUEUE_SIZE harvested files, so that every step works
+    on a different file at the same time as the harvesting.
+
+    The harvested files are dictionaries, whose 'active_file' is the
+    path of the file to give to the next step, and 'postmode' the
+    post-processing steps to apply to it.  As when the steps were run
+    one after the other, a file on which a step fails still goes
+    through the next steps, but the task ends in error.
+
+    The task is put to sleep only between two files (see
+    L{HarvestPause}), through the 'pause' of the pipeline.
+    """
 
-        # Convert phase
-        if 'c' in postmode:
-            updated_files_list = []
-            i = 0
-            for active_file in active_files_list:
-                i += 1
-                task_sleep_now_if_required()
-                task_update_progress("Converting material harvested from %s (%i/%i)" % \
-                                     (reponame, \
-                                      i, \
-                                      len(active_files_list)))
-                updated_file = "%s.converted" % (active_file.split('.')[0],)
-                updated_files_list.append(updated_file)
-                (exitcode, err_msg) = call_bibconvert(config=str(repos[0][5]),
-                                                      harvestpath=active_file,
-                                                      convertpath=updated_file)
-                if exitcode == 0:
-                    write_message("harvested file %s was successfully converted" % \
-                                  (active_file,))
-                else:
-                    write_message("an error occurred while converting %s:\n%s" % (active_file, err_msg))
-                    error_happened_p = True
-                    continue
-            # print stats:
-            for updated_file in updated_files_list:
-                write_message("File %s contains %i records." % \
-                              (updated_file,
-                               get_nb_records_in_file(updated_file)))
-            active_files_list = updated_files_list
-
-        # plotextract phase
-        if 'p' in postmode:
-            # Download tarball for each harvested/converted record, then run plotextrator.
-            # Update converted xml files with generated xml or add it for upload
-            updated_files_list = []
-            i = 0
-            for active_file in active_files_list:
-                identifiers = harvested_identifier_list[i]
-                i += 1
-                task_sleep_now_if_required()
-                task_update_progress("Extracting plots from harvested material from %s (%i/%i)" % \
-                                     (reponame, i, len(active_files_list)))
-                updated_file = "%s.plotextracted" % (active_file.split('.')[0],)
-                updated_files_list.append(updated_file)
-                (exitcode, err_msg) = call_plotextractor(active_file,
-                                                         updated_file,
-                                                         identifiers,
-                                                         downloaded_material_dict)
-                if exitcode == 0:
-                    if err_msg != "":
-                        write_message("plots from %s was extracted, but with some errors:\n%s" % \
-                                  (active_file, err_msg))
-                    else:
-                        write_message("plots from %s was successfully extracted" % \
-                                      (active_file,))
-                else:
-                    write_message("an error occurred while extracting plots from %s:\n%s" % (active_file, err_msg))
-                    error_happened_p = True
-                    continue
-            # print stats:
-            for updated_file in updated_files_list:
-                write_message("File %s contains %i records." % \
-                              (updated_file,
-                               get_nb_records_in_file(updated_file)))
-            active_files_list = updated_files_list
-
-        # refextract phase
-        if 'r' in postmode:
-            updated_files_list = []
-            i = 0
-            for active_file in active_files_list:
-                identifiers = harvested_identifier_list[i]
-                i += 1
-                task_sleep_now_if_required()
-                task_update_progress("Extracting references from material harvested from %s (%i/%i)" % \
-                                     (reponame, i, len(active_files_list)))
-                updated_file = "%s.refextracted" % (active_file.split('.')[0],)
-                updated_files_list.append(updated_file)
-                (exitcode, err_msg) = call_refextract(active_file,
-                                                      updated_file,
-                                                      identifiers,
-                                                      downloaded_material_dict)
-                if exitcode == 0:
-                    if err_msg != "":
-                        write_message("references from %s was extracted, but with some errors:\n%s" % \
-                                      (active_file, err_msg))
-                    else:
-                        write_message("references from %s was successfully extracted" % \
-                                      (active_file,))
-                else:
-                    write_message("an error occurred while extracting references from %s:\n%s" % \
-                                  (active_file, err_msg))
-                    error_happened_p = True
-                    continue
-            # print stats:
-            for updated_file in updated_files_list:
-                write_message("File %s contains %i records." % \
-                              (updated_file,
-                               get_nb_records_in_file(updated_file)))
-            active_files_list = updated_files_list
-
-        # fulltext phase
-        if 't' in postmode:
-            # Attaching fulltext
-            updated_files_list = []
-            i = 0
-            for active_file in active_files_list:
-                identifiers = harvested_identifier_list[i]
-                i += 1
-                task_sleep_now_if_required()
-                task_update_progress("Attaching fulltext to records harvested from %s (%i/%i)" % \
-                                     (reponame, i, len(active_files_list)))
-                updated_file = "%s.fulltext" % (active_file.split('.')[0],)
-                updated_files_list.append(updated_file)
-                (exitcode, err_msg) = call_fulltext(active_file,
-                                                    updated_file,
-                                                    identifiers,
-                                                    downloaded_material_dict)
-                if exitcode == 0:
-                    write_message("fulltext from %s was successfully attached" % \
-                                  (active_file,))
-                else:
-                    write_message("an error occurred while attaching fulltext to %s:\n%s" % \
-                                  (active_file, err_msg))
-                    error_happened_p = True
-                    continue
-            # print stats:
-            for updated_file in updated_files_list:
-                write_message("File %s contains %i records." % \
-                              (updated_file,
-                               get_nb_records_in_file(updated_file)))
-            active_files_list = updated_files_list
-
-        # Filter-phase
-        if 'f' in postmode:
-            # first call bibfilter:
-            res = 0
-            i = 0
-            for active_file in active_files_list:
-                i += 1
-                task_sleep_now_if_required()
-                task_update_progress("Filtering material harvested from %s (%i/%i)" % \
-                                     (reponame, \
-                                      i, \
-                                      len(active_files_list)))
-                (exitcode, err_msg) = call_bibfilter(str(repos[0][11]), active_file)
-
-                if exitcode == 0:
-                    write_message("%s was successfully bibfiltered" % \
-                                  (active_file,))
-                else:
-                    write_message("an error occurred while bibfiltering %s:\n%s" % \
-                                  (active_file, err_msg))
-                    error_happened_p = True
-                    continue
-            # print stats:
-            for active_file in active_files_list:
-                write_message("File %s contains %i records." % \
-                    (active_file + ".insert.xml",
-                    get_nb_records_in_file(active_file + ".insert.xml")))
-                write_message("File %s contains %i records." % \
-                    (active_file + ".correct.xml",
-                    get_nb_records_in_file(active_file + ".correct.xml")))
-                write_message("File %s contains %i records." % \
-                    (active_file + ".append.xml",
-                    get_nb_records_in_file(active_file + ".append.xml")))
-                write_message("File %s contains %i records." % \
-                    (active_file + ".holdingpen.xml",
-                    get_nb_records_in_file(active_file + ".holdingpen.xml")))
-
-        # Upload files
-        if "u" in postmode:
-            if 'f' in postmode:
-                # upload filtered files
-                uploaded = False
-                i = 0
-                for active_file in active_files_list:
-                    task_sleep_now_if_required()
-                    i += 1
-                    if get_nb_records_in_file(active_file + ".insert.xml") > 0:
-                        task_update_progress("Uploading new records harvested from %s (%i/%i)" % \
-                                             (reponame, \
-                                              i, \
-                                              len(active_files_list)))
-                        res += call_bibupload(active_file + ".insert.xml", \
-                                              ["-i"], oai_src_id=repos[0][0])
-                        uploaded = True
-                    task_sleep_now_if_required()
-                    if get_nb_records_in_file(active_file + ".correct.xml") > 0:
-                        task_update_progress("Uploading corrections for records harvested from %s (%i/%i)" % \
-                                             (reponame, \
-                                              i, \
-                                              len(active_files_list)))
-                        res += call_bibupload(active_file + ".correct.xml", \
-                                              ["-c"], oai_src_id=repos[0][0])
-                        uploaded = True
-                    if get_nb_records_in_file(active_file + ".append.xml") > 0:
-                        task_update_progress("Uploading additions for records harvested from %s (%i/%i)" % \
-                                             (reponame, \
-                                              i, \
-                                              len(active_files_list)))
-                        res += call_bibupload(active_file + ".append.xml", \
-                                              ["-a"], oai_src_id=repos[0][0])
-                        uploaded = True
-                    if get_nb_records_in_file(active_file + ".holdingpen.xml") > 0:
-                        task_update_progress("Uploading records harvested from %s to holding pen (%i/%i)" % \
-                                             (reponame, \
-                                              i, \
-                                              len(active_files_list)))
-                        res += call_bibupload(active_file + ".holdingpen.xml", \
-                                              ["-o"], oai_src_id=repos[0][0])
-                        uploaded = True
-                if len(active_files_list) > 0:
-                    if res == 0:
-                        if uploaded:
-                            write_message("material harvested from source %s was successfully uploaded" % \
-                                          (reponame,))
-                        else:
-                            write_message("nothing to upload")
-                    else:
-                        write_message("an error occurred while uploading harvest from %s" % (reponame,))
-                        error_happened_p = True
-                        continue
-            else:
-                # upload files normally
-                res = 0
-                i = 0
-                uploaded = False
-                for active_file in active_files_list:
-                    i += 1
-                    task_sleep_now_if_required()
-                    if get_nb_records_in_file(active_file) > 0:
-                        task_update_progress("Uploading records harvested from %s (%i/%i)" % \
-                                             (reponame, \
-                                              i, \
-                                              len(active_files_list)))
-                        res += call_bibupload(active_file, oai_src_id=repos[0][0])
-                        uploaded = True
-                    if res == 0:
-                        if uploaded:
-                            write_message("material harvested from source %s was successfully uploaded" % \
-                                          (reponame,))
-                        else:
-                            write_message("nothing to upload")
-                    else:
-                        write_message("an error occurred while uploading harvest from %s" % (reponame,))
-                        error_happened_p = True
-                        continue
-
-    if error_happened_p:
-        return False
+    def __init__(self, steps=None, queue_size=CFG_OAI_HARVEST_QUEUE_SIZE):
+        if steps is None:
+            steps = HARVEST_PIPELINE_STEPS
+        self.steps = steps
+        self.queues = [Queue.Queue(queue_size) for dummy in steps]
+        self.threads = [threading.Thread(target=self._run_step, args=(i,))
+                        for i in range(len(steps))]
+        self.error_happened_p = False
+        self.pause = HarvestPause()
+
+    def start(self):
+        """Start the threads of the steps."""
+        for thread in self.threads:
+            thread.setDaemon(True)
+            thread.start()
+
+    def put(self, harvested_file):
+        """Put HARVESTED_FILE into the pipeline.  Blocks while the queue
+        of the first step is full."""
+        self.queues[0].put(harvested_file)
+
+    def close(self):
+        """Signal the end of the harvested files."""
+        self.queues[0].put(None)
+
+    def join(self):
+        """Wait until all the harvested files went through the pipeline."""
+        for thread in self.threads:
+            wait_for_thread(thread, self.pause)
+
+    def _run_step(self, i):
+        """Apply the step I to the harvested files of its queue, and pass
+        them to the next step."""
+        mode, function = self.steps[i]
+        while True:
+            harvested_file = self.queues[i].get()
+            try:
+                try:
+                    if harvested_file is not None and \
+                           mode in harvested_file['postmode']:
+                        self.pause.enter()
+                        try:
+                            success = function(harvested_file)
+                        finally:
+                            self.pause.leave()
+                        if not success:
+                            self.error_happened_p = True
+                except Exception, e:
+                    register_exception()
+                    write_message("an error occurred in post-processing step %s:\n%s" % \
+                                  (mode, e))
+                    self.error_happened_p = True
+            finally:
+                # Always pass the file (or the end of the files) on
+                if i + 1 < len(self.steps):
+                    self.queues[i + 1].put(harvested_file)
+            if harvested_file is None:
+                return
+
+def convert_harvested_file(harvested_file):
+    """Convert phase.  Return True in case of success."""
+    active_file = harvested_file['active_file']
+    task_update_progress("Converting material harvested from %s (%i)" % \
+                         (harvested_file['reponame'],
+                          harvested_file['number']))
+    updated_file = "%s.converted" % (active_file.split('.')[0],)
+    harvested_file['active_file'] = updated_file
+    (exitcode, err_msg) = call_bibconvert(config=str(harvested_file['repos'][0][5]),
+                                          harvestpath=active_file,
+                                          convertpath=updated_file)
+    if exitcode == 0:
+        write_message("harvested file %s was successfully converted" % \
+                      (active_file,))
     else:
+        write_message("an error occurred while converting %s:\n%s" % (active_file, err_msg))
+    # print stats:
+    write_message("File %s contains %i records." % \
+                  (updated_file,
+                   get_nb_records_in_file(updated_file)))
+    return exitcode == 0
+
+def plotextract_harvested_file(harvested_file):
+    """plotextract phase: download tarball for each harvested/converted
+    record, then run plotextrator.  Update converted xml files with
+    generated xml or add it for upload.  Return True in case of success."""
+    active_file = harvested_file['active_file']
+    task_update_progress("Extracting plots from harvested material from %s (%i)" % \
+                         (harvested_file['reponame'],
+                          harvested_file['number']))
+    updated_file = "%s.plotextracted" % (active_file.split('.')[0],)
+    harvested_file['active_file'] = updated_file
+    (exitcode, err_msg) = call_plotextractor(active_file,
+                                             updated_file,
+                                             harvested_file['identifiers'],
+                                             harvested_file['downloaded_material'])
+    if exitcode == 0:
+        if err_msg != "":
+            write_message("plots from %s was extracted, but with some errors:\n%s" % \
+                      (active_file, err_msg))
+        else:
+            write_message("plots from %s was successfully extracted" % \
+                          (active_file,))
+    else:
+        write_message("an error occurred while extracting plots from %s:\n%s" % (active_file, err_msg))
+    # print stats:
+    write_message("File %s contains %i records." % \
+                  (updated_file,
+                   get_nb_records_in_file(updated_file)))
+    return exitcode == 0
+
+def refextract_harvested_file(harvested_file):
+    """refextract phase.  Return True in case of success."""
+    active_file = harvested_file['active_file']
+    task_update_progress("Extracting references from material harvested from %s (%i)" % \
+                         (harvested_file['reponame'],
+                          harvested_file['number']))
+    updated_file = "%s.refextracted" % (active_file.split('.')[0],)
+    harvested_file['active_file'] = updated_file
+    (exitcode, err_msg) = call_refextract(active_file,
+                                          updated_file,
+                                          harvested_file['identifiers'],
+                                          harvested_file['downloaded_material'])
+    if exitcode == 0:
+        if err_msg != "":
+            write_message("references from %s was extracted, but with some errors:\n%s" % \
+                          (active_file, err_msg))
+        else:
+            write_message("references from %s was successfully extracted" % \
+                          (active_file,))
+    else:
+        write_message("an error occurred while extracting references from %s:\n%s" % \
+                      (active_file, err_msg))
+    # print stats:
+    write_message("File %s contains %i records." % \
+                  (updated_file,
+                   get_nb_records_in_file(updated_file)))
+    return exitcode == 0
+
+def fulltext_harvested_file(harvested_file):
+    """fulltext phase: attaching fulltext.  Return True in case of
+    success."""
+    active_file = harvested_file['active_file']
+    task_update_progress("Attaching fulltext to records harvested from %s (%i)" % \
+                         (harvested_file['reponame'],
+                          harvested_file['number']))
+    updated_file = "%s.fulltext" % (active_file.split('.')[0],)
+    harvested_file['active_file'] = updated_file
+    (exitcode, err_msg) = call_fulltext(active_file,
+                                        updated_file,
+                                        harvested_file['identifiers'],
+                                        harvested_file['downloaded_material'])
+    if exitcode == 0:
+        write_message("fulltext from %s was successfully attached" % \
+                      (active_file,))
+    else:
+        write_message("an error occurred while attaching fulltext to %s:\n%s" % \
+                      (active_file, err_msg))
+    # print stats:
+    write_message("File %s contains %i records." % \
+                  (updated_file,
+                   get_nb_records_in_file(updated_file)))
+    return exitcode == 0
+
+def filter_harvested_file(harvested_file):
+    """Filter-phase: call bibfilter.  Return True in case of success."""
+    active_file = harvested_file['active_file']
+    task_update_progress("Filtering material harvested from %s (%i)" % \
+                         (harvested_file['reponame'],
+                          harvested_file['number']))
+    (exitcode, err_msg) = call_bibfilter(str(harvested_file['repos'][0][11]), active_file)
+
+    if exitcode == 0:
+        write_message("%s was successfully bibfiltered" % \
+                      (active_file,))
+    else:
+        write_message("an error occurred while bibfiltering %s:\n%s" % \
+                      (active_file, err_msg))
+    # print stats:
+    for suffix in (".insert.xml", ".correct.xml", ".append.xml",
+                   ".holdingpen.xml"):
+        write_message("File %s contains %i records." % \
+            (active_file + suffix,
+            get_nb_records_in_file(active_file + suffix)))
+    return exitcode == 0
+
+def upload_harvested_file(harvested_file):
+    """Upload files: submit the bibupload tasks of a harvested file.
+    Return True in case of success."""
+    active_file = harvested_file['active_file']
+    reponame = harvested_file['reponame']
+    oai_src_id = harvested_file['repos'][0][0]
+    res = 0
+    uploaded = False
+    if 'f' in harvested_file['postmode']:
+        # upload filtered files
+        for suffix, mode, progress in \
+                ((".insert.xml", "-i", "Uploading new records harvested from %s (%i)"),
+                 (".correct.xml", "-c", "Uploading corrections for records harvested from %s (%i)"),
+                 (".append.xml", "-a", "Uploading additions for records harvested from %s (%i)"),
+                 (".holdingpen.xml", "-o", "Uploading records harvested from %s to holding pen (%i)")):
+            if get_nb_records_in_file(active_file + suffix) > 0:
+                task_update_progress(progress % \
+                                     (reponame,
+                                      harvested_file['number']))
+                res += call_bibupload(active_file + suffix, \
+                                      [mode], oai_src_id=oai_src_id)
+                uploaded = True
+    else:
+        # upload files normally
+        if get_nb_records_in_file(active_file) > 0:
+            task_update_progress("Uploading records harvested from %s (%i)" % \
+                                 (reponame,
+                                  harvested_file['number']))
+            res += call_bibupload(active_file, oai_src_id=oai_src_id)
+            uploaded = True
+    if res == 0:
+        if uploaded:
+            write_message("material harvested from source %s was successfully uploaded (%s)" % \
+                          (reponame, active_file))
+        else:
+            write_message("nothing to upload from %s" % (active_file,))
         return True
+    else:
+        write_message("an error occurred while uploading harvest from %s (%s)" % \
+                      (reponame, active_file))
+        return False
+
+## The post-processing steps of the harvested files, in order:
+## (postmode, function)
+HARVEST_PIPELINE_STEPS = (('c', convert_harvested_file),
+                          ('p', plotextract_harvested_file),
+                          ('r', refextract_harvested_file),
+                          ('t', fulltext_harvested_file),
+                          ('f', filter_harvested_file),
+                          ('u', upload_harvested_file))
 
 def collect_identifiers(harvested_file_list):
     """Collects all OAI PMH identifiers from each file in the list
@@ -489,11 +633,16 @@ def collect_identifiers(harvested_file_list):
         result.append(REGEXP_OAI_ID.findall(data))
     return result
 
-def remove_duplicates(harvested_file_list):
+def remove_duplicates(harvested_file_list, harvested_identifiers=None):
     """
     Go through a list of harvested files and remove any duplicate records.
+
+    HARVESTED_IDENTIFIERS is the set of OAI IDs of the records already
+    harvested in other files, which is updated with the OAI IDs of the
+    records of the list.
     """
-    harvested_identifiers = []
+    if harvested_identifiers is None:
+        harvested_identifiers = set()
     for harvested_file in harvested_file_list:
         # Firstly, rename original file to temporary name
         try:
@@ -521,7 +670,7 @@ def remove_duplicates(harvested_file_list):
             oai_identifier = REGEXP_OAI_ID.search(record)
             if oai_identifier != None and oai_identifier.group(1) not in harvested_identifiers:
                 updated_harvested_file.write("<record>%s</record>\n" % (record,))
-                harvested_identifiers.append(oai_identifier.group(1))
+                harvested_identifiers.add(oai_identifier.group(1))
         updated_harvested_file.write("</ListRecords>\n</OAI-PMH>\n")
         updated_harvested_file.close()
 
@@ -553,9 +702,13 @@ def update_lastrun(index):
 def oai_harvest_get(prefix, baseurl, harvestpath,
                     fro=None, until=None, setspecs=None,
                     user=None, password=None, cert_file=None,
-                    key_file=None, method="POST"):
+                    key_file=None, method="POST", harvested_file_callback=None):
     """
-    Retrieve OAI records from given repository, with given arguments
+    Retrieve OAI records from given repository, with given arguments.
+
+    If HARVESTED_FILE_CALLBACK is given, it is called with the path of
+    each harvested file as soon as it is downloaded (and its duplicate
+    records removed), while the next files are being harvested.
     """
     try:
         (addressing_scheme, network_location, path, parameters, \
@@ -570,11 +723,22 @@ def oai_harvest_get(prefix, baseurl, harvestpath,
             http_param_dict['until'] = until
         sets = None
         if setspecs:
-            sets = [set.strip() for set in setspecs.split(' ')]
+            sets = [setspec.strip() for setspec in setspecs.split(' ')]
 
-        harvested_files = oai_harvest_getter.harvest(network_location, path, http_param_dict, method, harvestpath,
-                                   sets, secure, user, password, cert_file, key_file)
-        remove_duplicates(harvested_files)
+        if harvested_file_callback is None:
+            harvested_files = oai_harvest_getter.harvest(network_location, path, http_param_dict, method, harvestpath,
+                                       sets, secure, user, password, cert_file, key_file)
+            remove_duplicates(harvested_files)
+        else:
+            harvested_identifiers = set()
+            def process_harvested_file(harvested_file):
+                """Remove the duplicate records of HARVESTED_FILE, and
+                pass it to HARVESTED_FILE_CALLBACK."""
+                remove_duplicates([harvested_file], harvested_identifiers)
+                harvested_file_callback(harvested_file)
+            harvested_files = oai_harvest_getter.harvest(network_location, path, http_param_dict, method, harvestpath,
+                                       sets, secure, user, password, cert_file, key_file,
+                                       harvested_file_callback=process_harvested_file)
         return (1, harvested_files)
     except (StandardError, oai_harvest_getter.InvenioOAIRequestError), e:
         return (0, e)
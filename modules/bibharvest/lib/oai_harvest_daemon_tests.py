@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+## Invenio OAI harvest daemon unit tests.
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the oai harvest daemon."""
+
+__revision__ = "$Id$"
+
+import os
+import tempfile
+import threading
+import unittest
+
+from invenio import oai_harvest_daemon
+from invenio.testutils import make_test_suite, run_test_suite
+
+class TestHarvestPipeline(unittest.TestCase):
+    """Test the post-processing pipeline of harvested files."""
+
+    def test_pipeline_steps(self):
+        """oaiharvest - pipeline applies the steps of the postmode in order"""
+        def step(mode, success=True):
+            def function(harvested_file):
+                harvested_file['active_file'] += '.' + mode
+                return success
+            return (mode, function)
+        done = []
+        def last_step(harvested_file):
+            done.append(harvested_file['active_file'])
+            return True
+        pipeline = oai_harvest_daemon.HarvestPipeline(
+            (step('c'), step('f', False), step('x'), ('u', last_step)),
+            queue_size=1)
+        pipeline.start()
+        for i in range(5):
+            pipeline.put({'active_file': str(i), 'postmode': 'cxu'})
+        pipeline.put({'active_file': 'f', 'postmode': 'cfu'})
+        pipeline.close()
+        pipeline.join()
+        self.assertEqual(['0.c.x', '1.c.x', '2.c.x', '3.c.x', '4.c.x',
+                          'f.c.f'], done)
+        self.assertEqual(True, pipeline.error_happened_p)
+
+    def test_pipeline_errors(self):
+        """oaiharvest - pipeline passes files on whatever the errors"""
+        done = []
+        def failing_step(harvested_file):
+            raise ValueError(harvested_file['active_file'])
+        def last_step(harvested_file):
+            done.append(harvested_file['active_file'])
+            return True
+        pipeline = oai_harvest_daemon.HarvestPipeline(
+            (('c', failing_step), ('u', last_step)), queue_size=1)
+        pipeline.start()
+        pipeline.put({'active_file': '0', 'postmode': None})
+        pipeline.put({'active_file': '1', 'postmode': 'cu'})
+        pipeline.close()
+        pipeline.join()
+        self.assertEqual(['1'], done)
+        self.assertEqual(True, pipeline.error_happened_p)
+
+class TestHarvestPause(unittest.TestCase):
+    """Test the sleeping of the task between two harvested files."""
+
+    def setUp(self):
+        """Save the BibTask functions faked by the tests"""
+        self.task_read_status = oai_harvest_daemon.task_read_status
+        self.task_sleep_now_if_required = \
+            oai_harvest_daemon.task_sleep_now_if_required
+
+    def tearDown(self):
+        """Restore the BibTask functions"""
+        oai_harvest_daemon.task_read_status = self.task_read_status
+        oai_harvest_daemon.task_sleep_now_if_required = \
+            self.task_sleep_now_if_required
+
+    def test_sleep_between_files(self):
+        """oaiharvest - task sleeps only once no thread is busy with a file"""
+        pause = oai_harvest_daemon.HarvestPause()
+        events = []
+        busy = threading.Event()
+        release = threading.Event()
+        def run_thread():
+            pause.enter()
+            busy.set()
+            release.wait()
+            events.append('file 1')
+            pause.leave()
+            pause.enter()
+            events.append('file 2')
+            pause.leave()
+        def read_status():
+            # Let the thread finish its file once the sleep is requested
+            threading.Timer(0.2, release.set).start()
+            return 'ABOUT TO SLEEP'
+        def sleep():
+            events.append('sleep (%i busy)' % pause.nb_busy_threads)
+        oai_harvest_daemon.task_read_status = read_status
+        oai_harvest_daemon.task_sleep_now_if_required = sleep
+        thread = threading.Thread(target=run_thread)
+        thread.start()
+        busy.wait()
+        pause.sleep_if_required()
+        thread.join()
+        self.assertEqual(['file 1', 'sleep (0 busy)', 'file 2'], events)
+
+class TestRemoveDuplicates(unittest.TestCase):
+    """Test the removal of duplicate harvested records."""
+
+    def setUp(self):
+        """Write two harvested files"""
+        self.harvested_files = []
+        for identifiers in (('oai:1', 'oai:2', 'oai:1'), ('oai:2', 'oai:3')):
+            fd, harvested_file = tempfile.mkstemp()
+            os.write(fd, '<OAI-PMH><ListRecords>' +
+                     ''.join(['<record><header><identifier>%s</identifier>'
+                              '</header></record>' % identifier
+                              for identifier in identifiers]) +
+                     '</ListRecords></OAI-PMH>')
+            os.close(fd)
+            self.harvested_files.append(harvested_file)
+
+    def tearDown(self):
+        """Remove the harvested files"""
+        for harvested_file in self.harvested_files:
+            os.remove(harvested_file)
+            os.remove(harvested_file + '~')
+
+    def test_remove_duplicates_per_file(self):
+        """oaiharvest - removing duplicates file by file"""
+        harvested_identifiers = set()
+        for harvested_file in self.harvested_files:
+            oai_harvest_daemon.remove_duplicates([harvested_file],
+                                                 harvested_identifiers)
+        self.assertEqual([['oai:1', 'oai:2'], ['oai:3']],
+                         oai_harvest_daemon.collect_identifiers( \
+            self.harvested_files))
+
+TEST_SUITE = make_test_suite(TestHarvestPipeline,
+                             TestHarvestPause,
+                             TestRemoveDuplicates,)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
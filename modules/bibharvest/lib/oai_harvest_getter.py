@@ -78,13 +78,16 @@ def http_request_parameters(http_param_dict, method="POST"):
 
 def OAI_Session(server, script, http_param_dict , method="POST", output="",
                 resume_request_nbr=0, secure=False, user=None, password=None,
-                cert_file=None, key_file=None):
+                cert_file=None, key_file=None, harvested_file_callback=None):
     """Handle one OAI session (1 request, which might lead
     to multiple answers because of resumption tokens)
 
     If output filepath is given, each answer of the oai repository is saved
     in corresponding filepath, with a unique number appended at the end.
-    This number starts at 'resume_request_nbr'.
+    This number starts at 'resume_request_nbr'.  If
+    'harvested_file_callback' is given, it is called with the filepath of
+    each answer as soon as it is saved, before the next answer is
+    requested.
 
     Returns a tuple containing an int corresponding to the last created 'resume_request_nbr' and 
     a list of harvested files.
@@ -109,6 +112,8 @@ def OAI_Session(server, script, http_param_dict , method="POST", output="",
                 os.write(output_fd, harvested_data)
                 os.close(output_fd)
                 harvested_files.append(output_filename)
+                if harvested_file_callback is not None:
+                    harvested_file_callback(output_filename)
             else:
                 # No records in output? Do not create a file. Warn the user.
                 sys.stderr.write("\n<!--\n*** WARNING: NO RECORDS IN THE HARVESTED DATA: "
@@ -128,7 +133,7 @@ def OAI_Session(server, script, http_param_dict , method="POST", output="",
 
 def harvest(server, script, http_param_dict , method="POST", output="",
             sets=None, secure=False, user=None, password=None,
-            cert_file=None, key_file=None):
+            cert_file=None, key_file=None, harvested_file_callback=None):
     """
     Handle multiple OAI sessions (multiple requests, which might lead to
     multiple answers).
@@ -186,6 +191,11 @@ http_param_dict - *dict* the URL parameters to send to the OAI script
                   key in case the server to harvest requires
                   certificate-based authentication
                   (If provided, 'key_file' must also be provided)
+
+harvested_file_callback - *function* called with the filepath of each
+                  answer as soon as it is saved in 'output', so that
+                  it can be processed while the next answers are
+                  harvested.
     """
     if sets:
         resume_request_nbr = 0
@@ -194,7 +204,7 @@ http_param_dict - *dict* the URL parameters to send to the OAI script
             http_param_dict['set'] = set
             resume_request_nbr, harvested_files = OAI_Session(server, script, http_param_dict, method,
                             output, resume_request_nbr, secure, user, password,
-                            cert_file, key_file)
+                            cert_file, key_file, harvested_file_callback)
             resume_request_nbr += 1
             all_harvested_files.extend(harvested_files)
         return all_harvested_files
@@ -202,7 +212,8 @@ http_param_dict - *dict* the URL parameters to send to the OAI script
         dummy, harvested_files = OAI_Session(server, script, http_param_dict, method,
                     output, secure=secure, user=user,
                     password=password, cert_file=cert_file,
-                    key_file=key_file)
+                    key_file=key_file,
+                    harvested_file_callback=harvested_file_callback)
         return harvested_files
 
 def OAI_Request(server, script, params, method="POST", secure=False,
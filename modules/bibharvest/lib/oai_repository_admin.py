@@ -421,6 +421,7 @@ def modify_oai_set(oai_set_id, oai_set_name, oai_set_spec,
                        oai_set_f3,
                        oai_set_m3,
                        oai_set_id))
+        reset_oai_sets_last_update()
 
         return (1, "")
     except StandardError, e:
@@ -455,6 +456,7 @@ def add_oai_set(oai_set_name, oai_set_spec, oai_set_collection,
                        oai_set_description, set_definition, oai_set_p1,
                        oai_set_f1, oai_set_m1, oai_set_p2, oai_set_f2,
                        oai_set_m2, oai_set_p3, oai_set_f3, oai_set_m3))
+        reset_oai_sets_last_update()
         return (1, "")
     except StandardError, e:
         return (0, e)
@@ -464,10 +466,19 @@ def delete_oai_set(oai_set_id):
 
     try:
         res = run_sql("DELETE FROM oaiREPOSITORY WHERE id=%s" % oai_set_id)
+        reset_oai_sets_last_update()
         return (1, "")
     except StandardError, e:
         return (0, e)
 
+def reset_oai_sets_last_update():
+    """
+    Forget the state of the last oairepositoryupdater run, so that the
+    next run processes all the records even if it is incremental.
+    Must be called each time the set definitions are changed.
+    """
+    run_sql("UPDATE oaiREPOSITORY SET last_updated=NULL")
+
 def drop_down_menu(boxname, content):
     """
     Returns the code of a drop down menu.
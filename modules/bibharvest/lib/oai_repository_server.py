@@ -19,7 +19,6 @@
 
 __revision__ = "$Id$"
 
-import cPickle
 import os
 import re
 import cgi
@@ -34,20 +33,22 @@ else:
 from invenio.config import \
      CFG_OAI_DELETED_POLICY, \
      CFG_OAI_EXPIRE, \
+     CFG_OAI_FETCH_BATCH_SIZE, \
      CFG_OAI_IDENTIFY_DESCRIPTION, \
      CFG_OAI_ID_FIELD, \
      CFG_OAI_LOAD, \
      CFG_OAI_SET_FIELD, \
-     CFG_CACHEDIR, \
+     CFG_CERN_SITE, \
      CFG_SITE_NAME, \
      CFG_SITE_SUPPORT_EMAIL, \
      CFG_SITE_URL
 
 from invenio.dbquery import run_sql
 from invenio.search_engine import record_exists, perform_request_search
-from invenio.bibformat_dblayer import get_preformatted_record
+from invenio.bibformat_dblayer import get_preformatted_records
 from invenio.bibformat import format_record
 from invenio.textutils import encode_for_xml
+from invenio.intbitset import intbitset
 
 verbs = {
     'GetRecord'          : ['identifier', 'metadataPrefix'],
@@ -63,6 +64,7 @@ verbs = {
                             'resumptionToken'],
     'ListSets'           : ['resumptionToken']
     }
+
 params = {
     "verb" : ["Identify","ListIdentifiers","ListSets","ListMetadataFormats","ListRecords","GetRecord"],
     "metadataPrefix" : ["oai_dc","marcxml"],
@@ -162,6 +164,29 @@ def get_field(sysno, field):
 
     return out
 
+def get_fields(sysnos, field):
+    """
+    Gets lists of field 'field' for all the records in 'sysnos' with
+    one query.  Returns a dictionary {sysno: [value1, value2, ...]}.
+    """
+
+    out = {}
+    if not sysnos:
+        return out
+    digit = field[0:2]
+
+    bibbx = "bib%sx" % digit
+    bibx  = "bibrec_bib%sx" % digit
+    query = "SELECT bibx.id_bibrec, bx.value FROM %s AS bx, %s AS bibx WHERE bibx.id_bibrec IN (%s) AND bx.id=bibx.id_bibxxx AND bx.tag=%%s" % \
+            (bibbx, bibx, ("%s,"*len(sysnos))[:-1])
+
+    res = run_sql(query, tuple(sysnos) + (field,))
+
+    for sysno, value in res:
+        out.setdefault(sysno, []).append(value)
+
+    return out
+
 def utc_to_localtime(date):
     """
     Convert UTC to localtime
@@ -243,6 +268,47 @@ def get_modification_date(sysno):
         out = localtime_to_utc(res[0][0])
     return out
 
+def get_modification_dates(sysnos):
+    """
+    Returns the dates of last modification for all the records in
+    'sysnos' with one query, as a dictionary {sysno: date}.
+    """
+    out = {}
+    if not sysnos:
+        return out
+    # (the list of placeholders is concatenated, so that the %% of the
+    # query are only unescaped by run_sql)
+    res = run_sql("SELECT id, DATE_FORMAT(modification_date,'%%Y-%%m-%%d %%H:%%i:%%s') FROM bibrec WHERE id IN (" + \
+                  ",".join(["%s"] * len(sysnos)) + ")", tuple(sysnos))
+    for sysno, date in res:
+        if date:
+            out[sysno] = localtime_to_utc(date)
+    return out
+
+def records_exist(sysnos):
+    """
+    Batch version of record_exists(): returns a dictionary {sysno:
+    status} for all the records in 'sysnos', where 'status' is 1 if
+    the record exists, 0 if it doesn't exist and -1 if it exists but
+    is marked as deleted.
+    """
+    out = dict([(sysno, 0) for sysno in sysnos])
+    if not sysnos:
+        return out
+    res = run_sql("SELECT id FROM bibrec WHERE id IN (" + \
+                  ",".join(["%s"] * len(sysnos)) + ")", tuple(sysnos))
+    existing = [row[0] for row in res]
+    if not existing:
+        return out
+    for sysno in existing:
+        out[sysno] = 1
+    res = run_sql("SELECT bibx.id_bibrec, bx.value FROM bib98x AS bx, bibrec_bib98x AS bibx WHERE bibx.id_bibrec IN (" + \
+                  ",".join(["%s"] * len(existing)) + ") AND bx.id=bibx.id_bibxxx AND bx.tag LIKE '980__%%'", tuple(existing))
+    for sysno, value in res:
+        if value == "DELETED" or (CFG_CERN_SITE and value == "DUMMY"):
+            out[sysno] = -1 # exists, but marked as deleted
+    return out
+
 def get_earliest_datestamp():
     "Get earliest datestamp in the database"
     out = ""
@@ -284,7 +350,31 @@ def normalize_date(date, dtime="T00:00:00Z"):
 
     return date
 
-def print_record(sysno, format='marcxml', record_exists_result=None):
+def prefetch_records(sysnos, format='marcxml'):
+    """
+    Fetches with a fixed number of queries the data needed by
+    print_record() for all the records in 'sysnos'.  Returns a
+    dictionary {sysno: prefetched} where each 'prefetched' value can
+    be passed to print_record().
+    """
+
+    identifiers = get_fields(sysnos, CFG_OAI_ID_FIELD)
+    datestamps = get_modification_dates(sysnos)
+    sets = get_fields(sysnos, CFG_OAI_SET_FIELD)
+    if format == "marcxml":
+        preformatted = get_preformatted_records(sysnos, 'xm')
+    else:
+        preformatted = {}
+
+    out = {}
+    for sysno in sysnos:
+        out[sysno] = {'identifiers': identifiers.get(sysno, []),
+                      'datestamp': datestamps.get(sysno, ''),
+                      'sets': sets.get(sysno, []),
+                      'xm': preformatted.get(sysno)}
+    return out
+
+def print_record(sysno, format='marcxml', record_exists_result=None, prefetched=None):
     """Prints record 'sysno' formatted according to 'format'.
 
     - if record does not exist, return nothing.
@@ -299,6 +389,10 @@ def print_record(sysno, format='marcxml', record_exists_result=None):
     Optional parameter 'record_exists_result' has the value of the result
     of the record_exists(sysno) function (in order not to call that function
     again if already done.)
+
+    Optional parameter 'prefetched' has the value returned for 'sysno'
+    by prefetch_records(..) (in order to fetch the data of many records
+    at once.)
     """
 
     out = ""
@@ -328,10 +422,13 @@ def print_record(sysno, format='marcxml', record_exists_result=None):
     else:
         out = out + "   <header>\n"
 
-    for ident in get_field(sysno, CFG_OAI_ID_FIELD):
+    if prefetched is None:
+        prefetched = prefetch_records([sysno], format)[sysno]
+
+    for ident in prefetched['identifiers']:
         out = "%s    <identifier>%s</identifier>\n" % (out, escape_space(ident))
-    out = "%s    <datestamp>%s</datestamp>\n" % (out, get_modification_date(sysno))
-    for set in get_field(sysno, CFG_OAI_SET_FIELD):
+    out = "%s    <datestamp>%s</datestamp>\n" % (out, prefetched['datestamp'])
+    for set in prefetched['sets']:
         if set:
             # Print only if field not empty
             out = "%s    <setSpec>%s</setSpec>\n" % (out, set)
@@ -343,7 +440,7 @@ def print_record(sysno, format='marcxml', record_exists_result=None):
         out = out + "   <metadata>\n"
 
         if format == "marcxml":
-            formatted_record = get_preformatted_record(sysno, 'xm')
+            formatted_record = prefetched['xm']
             if formatted_record is not None:
                 ## MARCXML is already preformatted. Adapt it if needed
                 formatted_record = formatted_record.replace("<record>", "<marc:record xmlns:marc=\"http://www.loc.gov/MARC21/slim\" xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" xsi:schemaLocation=\"http://www.loc.gov/MARC21/slim http://www.loc.gov/standards/marcxml/schema/MARC21slim.xsd\" type=\"Bibliographic\">\n     <marc:leader>00000coc  2200000uu 4500</marc:leader>")
@@ -472,71 +569,55 @@ def oailistmetadataformats(args):
     return out
 
 
-def oailistrecords(args):
-    "Generates response to oailistrecords verb."
+def oailistrecords(args, req=None):
+    """
+    Generates response to oailistrecords verb.
+
+    If 'req' is given, the response is written incrementally to it
+    and an empty string is returned.
+    """
+
+    return oaistreamresponse(oailistrecords_iter(args), req)
+
+def oailistrecords_iter(args):
+    "Generates the chunks of the response to oailistrecords verb."
 
     arg = parse_args(args)
 
-    out = ""
-    resumptionToken_printed = False
+    page = oaigetpage(arg)
+    if page is None:
+        out = oai_error("badResumptionToken", "ResumptionToken expired")
+        yield oai_error_header(args, "ListRecords") + out + oai_error_footer("ListRecords")
+        return
 
-    sysnos = []
-    sysno  = []
-    # check if the resumptionToken did not expire
-    if arg['resumptionToken']:
-        filename = os.path.join(CFG_CACHEDIR, 'RTdata', arg['resumptionToken'])
-        if os.path.exists(filename) == 0:
-            out = oai_error("badResumptionToken", "ResumptionToken expired")
-            out = oai_error_header(args, "ListRecords") + out + oai_error_footer("ListRecords")
-            return out
+    records, resumptionToken = page
+
+    if not records and not arg['resumptionToken']: # noRecordsMatch error
+        out = oai_error("noRecordsMatch", "no records correspond to the request")
+        yield oai_error_header(args, "ListRecords") + out + oai_error_footer("ListRecords")
+        return
 
-    if arg['resumptionToken'] != "":
-        sysnos = oaicacheout(arg['resumptionToken'])
-        arg['set'] = sysnos.pop()
-        arg['metadataPrefix'] = sysnos.pop()
+    if arg['set'] == 'ec_fundedresources' and arg['metadataPrefix'] == 'oai_dc':
+        ## OpenAIRE compliancy
+        format = 'XOAIRE'
     else:
-        sysnos = oaigetsysnolist(arg['set'], arg['from'], arg['until'])
+        format = arg['metadataPrefix']
 
-    if len(sysnos) == 0: # noRecordsMatch error
+    yield oai_header(args, "ListRecords")
 
-        out = out + oai_error("noRecordsMatch", "no records correspond to the request")
-        out = oai_error_header(args, "ListRecords") + out + oai_error_footer("ListRecords")
-        return out
+    for batch in oaibatches(records):
+        prefetched = prefetch_records([sysno_ for sysno_, dummy in batch], format)
+        out = ""
+        for sysno_, _record_exists in batch:
+            res = print_record(sysno_, format, _record_exists, prefetched[sysno_])
+            if res:
+                out += res
+        yield out
 
-    i = 0
-    for sysno_ in sysnos:
-        if sysno_:
-            if i >= CFG_OAI_LOAD:          # cache or write?
-                if not resumptionToken_printed: # resumptionToken?
-                    arg['resumptionToken'] = oaigenresumptionToken()
-                    extdate = oaigetresponsedate(CFG_OAI_EXPIRE)
-                    if extdate:
-                        out = "%s <resumptionToken expirationDate=\"%s\">%s</resumptionToken>\n" % (out, extdate, arg['resumptionToken'])
-                    else:
-                        out = "%s <resumptionToken>%s</resumptionToken>\n" % (out, arg['resumptionToken'])
-                    resumptionToken_printed = True
-                sysno.append(sysno_)
-            else:
-                _record_exists = record_exists(sysno_)
-                if not (_record_exists == -1 and CFG_OAI_DELETED_POLICY == "no"):
-                    #Produce output only if record exists and had to be printed
-                    i = i + 1 # Increment limit only if record is returned
-                    if arg['set'] == 'ec_fundedresources' and arg['metadataPrefix'] == 'oai_dc':
-                        ## OpenAIRE compliancy
-                        res = print_record(sysno_, 'XOAIRE', _record_exists)
-                    else:
-                        res = print_record(sysno_, arg['metadataPrefix'], _record_exists)
-                    if res:
-                        out += res
-
-    if resumptionToken_printed:
-        oaicacheclean()
-        sysno.append(arg['metadataPrefix'])
-        sysno.append(arg['set'])
-        oaicachein(arg['resumptionToken'], sysno)
+    if resumptionToken:
+        yield " " + oaiprintresumptionToken(resumptionToken)
 
-    out = oai_header(args, "ListRecords") + out + oai_footer("ListRecords")
-    return out
+    yield oai_footer("ListRecords")
 
 def oailistsets(args):
     "Lists available sets for OAI metadata harvesting."
@@ -587,77 +668,80 @@ def oaigetrecord(args):
         out = oai_error_header(args, "GetRecord") + out + oai_error_footer("GetRecord")
     return out
 
-def oailistidentifiers(args):
-    "Prints OAI response to the ListIdentifiers verb."
+def oailistidentifiers(args, req=None):
+    """
+    Prints OAI response to the ListIdentifiers verb.
 
-    arg = parse_args(args)
+    If 'req' is given, the response is written incrementally to it
+    and an empty string is returned.
+    """
 
-    out = ""
-    resumptionToken_printed = False
+    return oaistreamresponse(oailistidentifiers_iter(args), req)
 
-    sysno  = []
-    sysnos = []
+def oailistidentifiers_iter(args):
+    "Generates the chunks of the OAI response to the ListIdentifiers verb."
 
-    if arg['resumptionToken']:
-        filename = os.path.join(CFG_CACHEDIR, 'RTdata', arg['resumptionToken'])
-        if os.path.exists(filename) == 0:
-            out = out + oai_error("badResumptionToken", "ResumptionToken expired")
-            out = oai_error_header(args, "ListIdentifiers") + out + oai_error_footer("ListIdentifiers")
-            return out
+    arg = parse_args(args)
 
-    if arg['resumptionToken']:
-        sysnos = oaicacheout(arg['resumptionToken'])
-    else:
-        sysnos = oaigetsysnolist(arg['set'], arg['from'], arg['until'])
+    page = oaigetpage(arg)
+    if page is None:
+        out = oai_error("badResumptionToken", "ResumptionToken expired")
+        yield oai_error_header(args, "ListIdentifiers") + out + oai_error_footer("ListIdentifiers")
+        return
 
-    if len(sysnos) == 0: # noRecordsMatch error
-        out = out + oai_error("noRecordsMatch", "no records correspond to the request")
-        out = oai_error_header(args, "ListIdentifiers") + out + oai_error_footer("ListIdentifiers")
-        return out
+    records, resumptionToken = page
+
+    if not records and not arg['resumptionToken']: # noRecordsMatch error
+        out = oai_error("noRecordsMatch", "no records correspond to the request")
+        yield oai_error_header(args, "ListIdentifiers") + out + oai_error_footer("ListIdentifiers")
+        return
 
-    i = 0
-    for sysno_ in sysnos:
-        if sysno_:
-            if i >= CFG_OAI_LOAD:           # cache or write?
-                if not resumptionToken_printed: # resumptionToken?
-                    arg['resumptionToken'] = oaigenresumptionToken()
-                    extdate = oaigetresponsedate(CFG_OAI_EXPIRE)
-                    if extdate:
-                        out = "%s  <resumptionToken expirationDate=\"%s\">%s</resumptionToken>\n" % (out, extdate, arg['resumptionToken'])
+    yield oai_header(args, "ListIdentifiers")
+
+    for batch in oaibatches(records):
+        sysnos = [sysno_ for sysno_, dummy in batch]
+        identifiers = get_fields(sysnos, CFG_OAI_ID_FIELD)
+        datestamps = get_modification_dates(sysnos)
+        sets = get_fields(sysnos, CFG_OAI_SET_FIELD)
+        out = ""
+        for sysno_, _record_exists in batch:
+            for ident in identifiers.get(sysno_, []):
+                if ident != '':
+                    if _record_exists == -1: #Deleted?
+                        out = out + "    <header status=\"deleted\">\n"
                     else:
-                        out = "%s  <resumptionToken>%s</resumptionToken>\n" % (out, arg['resumptionToken'])
-                    resumptionToken_printed = True
-                sysno.append(sysno_)
-            else:
-                _record_exists = record_exists(sysno_)
-                if (not _record_exists == -1 and CFG_OAI_DELETED_POLICY == "no"):
-                    i = i + 1 # Increment limit only if record is returned
-                for ident in get_field(sysno_, CFG_OAI_ID_FIELD):
-                    if ident != '':
-                        if _record_exists == -1: #Deleted?
-                            if CFG_OAI_DELETED_POLICY == "persistent" \
-                                   or CFG_OAI_DELETED_POLICY == "transient":
-                                out = out + "    <header status=\"deleted\">\n"
-                            else:
-                                # In that case, print nothing (do not go further)
-                                break
-                        else:
-                            out = out + "    <header>\n"
-                        out = "%s      <identifier>%s</identifier>\n" % (out, escape_space(ident))
-                        out = "%s      <datestamp>%s</datestamp>\n" % (out, get_modification_date(oaigetsysno(ident)))
-                        for set in get_field(sysno_, CFG_OAI_SET_FIELD):
-                            if set:
-                                # Print only if field not empty
-                                out = "%s      <setSpec>%s</setSpec>\n" % (out, set)
-                        out = out + "    </header>\n"
-
-    if resumptionToken_printed:
-        oaicacheclean() # clean cache from expired resumptionTokens
-        oaicachein(arg['resumptionToken'], sysno)
-
-    out = oai_header(args, "ListIdentifiers") + out + oai_footer("ListIdentifiers")
+                        out = out + "    <header>\n"
+                    out = "%s      <identifier>%s</identifier>\n" % (out, escape_space(ident))
+                    out = "%s      <datestamp>%s</datestamp>\n" % (out, datestamps.get(sysno_, ''))
+                    for set in sets.get(sysno_, []):
+                        if set:
+                            # Print only if field not empty
+                            out = "%s      <setSpec>%s</setSpec>\n" % (out, set)
+                    out = out + "    </header>\n"
+        yield out
+
+    if resumptionToken:
+        yield "  " + oaiprintresumptionToken(resumptionToken)
+
+    yield oai_footer("ListIdentifiers")
+
+def oaistreamresponse(chunks, req=None):
+    """
+    Writes the response 'chunks' to 'req' as soon as they are
+    generated, or returns them joined in one string if 'req' is None.
+    """
 
-    return out
+    if req is None:
+        return "".join(chunks)
+    for chunk in chunks:
+        req.write(chunk)
+    return ""
+
+def oaibatches(records):
+    "Splits 'records' into batches of CFG_OAI_FETCH_BATCH_SIZE elements."
+
+    for i in xrange(0, len(records), CFG_OAI_FETCH_BATCH_SIZE):
+        yield records[i:i + CFG_OAI_FETCH_BATCH_SIZE]
 
 
 def oaiidentify(args, script_url):
@@ -748,70 +832,151 @@ def oaigetsysnolist(set="", fromdate="", untildate=""):
                                     ap=0)
     return recids
 
-def oaigenresumptionToken():
-    "Generates unique ID for resumption token management."
+def oaigetpage(arg):
+    """
+    Return the records to be disseminated in the current page of a
+    ListRecords or ListIdentifiers request.
+
+    The full result set of the harvest is computed only once, when
+    the first page is requested, and it is then stored in the
+    resumption token cache together with the position (cursor) of the
+    next page.  Subsequent pages only restore the hitset and slice it
+    from the cursor.
+
+    Returns a tuple (records, resumptionToken) where 'records' is a
+    list of (recid, record_exists) tuples and 'resumptionToken' is
+    the token for the next page, or '' if this is the last page.
+    Returns None if the resumption token in 'arg' is not valid or
+    expired.  When resuming, 'arg' is updated with the
+    metadataPrefix and set of the original request.
+    """
 
-    return md5(str(time.time())).hexdigest()
+    if arg['resumptionToken']:
+        cached = oaicacheout(arg['resumptionToken'])
+        if cached is None:
+            return None
+        key, hitset, cursor, arg['metadataPrefix'], arg['set'] = cached
+    else:
+        key = None
+        cursor = 0
+        hitset = intbitset(oaigetsysnolist(arg['set'], arg['from'], arg['until']))
+
+    records = []
+    total = len(hitset)
+    while cursor < total and len(records) < CFG_OAI_LOAD:
+        ## fetch only as many candidates as can still fit into this page
+        candidates = list(hitset.to_sorted_list(cursor, cursor + CFG_OAI_LOAD - len(records)))
+        exist = records_exist(candidates)
+        for sysno_ in candidates:
+            cursor += 1
+            _record_exists = exist[sysno_]
+            if not _record_exists or \
+                   (_record_exists == -1 and CFG_OAI_DELETED_POLICY == "no"):
+                # Produce output only if record exists and had to be printed
+                continue
+            records.append((sysno_, _record_exists))
+
+    if cursor >= total:
+        return records, ''
+
+    oaicacheclean() # clean cache from expired resumptionTokens
+    if key is None:
+        key = oaicachein(hitset, arg['metadataPrefix'], arg['set'])
+    else:
+        oaicachetouch(key)
+    return records, oaigenresumptionToken(key, cursor)
 
+def oaiprintresumptionToken(resumptionToken):
+    "Prints the resumptionToken tag, with its expiration date."
 
-def oaicachein(resumptionToken, sysnos):
-    "Stores or adds sysnos in cache.  Input is a string of sysnos separated by commas."
+    extdate = oaigetresponsedate(CFG_OAI_EXPIRE)
+    if extdate:
+        return "<resumptionToken expirationDate=\"%s\">%s</resumptionToken>\n" % (extdate, resumptionToken)
+    else:
+        return "<resumptionToken>%s</resumptionToken>\n" % resumptionToken
 
-    filename = os.path.join(CFG_CACHEDIR, 'RTdata', resumptionToken)
+def oaigenresumptionToken(key=None, cursor=0):
+    """
+    Generates the resumptionToken pointing at position 'cursor' of the
+    result set stored in cache under 'key'.  If 'key' is not given,
+    generates a new unique key.
+    """
 
-    fil = open(filename, "w")
-    cPickle.dump(sysnos, fil)
-    fil.close()
-    return 1
+    if key is None:
+        return md5(str(time.time()) + str(os.getpid())).hexdigest()
+    return "%s-%d" % (key, cursor)
 
+def oaiparseresumptionToken(resumptionToken):
+    """
+    Splits the resumptionToken into (key, cursor).  Returns None if
+    the token is not well-formed.
+    """
 
-def oaicacheout(resumptionToken):
-    "Restores string of comma-separated system numbers from cache."
+    try:
+        key, cursor = resumptionToken.split('-')
+        cursor = int(cursor)
+    except ValueError:
+        return None
+    if cursor < 0 or len(key) != 32 or not key.isalnum():
+        return None
+    return key, cursor
 
-    sysnos = []
+def oaicachein(hitset, metadataPrefix, set_spec):
+    """
+    Stores in cache the result set 'hitset' of a harvest with the
+    given metadataPrefix and set.  Returns the key under which it has
+    been stored.  The hitset is stored only once for all the pages of
+    the harvest.
+    """
 
-    filename = os.path.join(CFG_CACHEDIR, 'RTdata', resumptionToken)
+    key = oaigenresumptionToken()
+    run_sql("""INSERT INTO oaiRESUMPTIONTOKEN
+                  (id, metadataPrefix, setSpec, hitset, expiration)
+               VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)""",
+            (key, metadataPrefix, set_spec, hitset.fastdump(), CFG_OAI_EXPIRE))
+    return key
 
-    if oaicachestatus(resumptionToken):
-        fil = open(filename, "r")
-        sysnos = cPickle.load(fil)
-        fil.close()
-    else:
-        return 0
-    return sysnos
+def oaicachetouch(key):
+    "Postpones the expiration of the result set cached under 'key'."
 
+    run_sql("""UPDATE oaiRESUMPTIONTOKEN
+                  SET expiration=NOW() + INTERVAL %s SECOND
+                WHERE id=%s""", (CFG_OAI_EXPIRE, key))
+    return 1
 
-def oaicacheclean():
-    "Removes cached resumptionTokens older than specified"
+def oaicacheout(resumptionToken):
+    """
+    Restores the result set pointed at by 'resumptionToken'.  Returns
+    a tuple (key, hitset, cursor, metadataPrefix, set), or None if
+    the token is not valid or expired.
+    """
 
-    directory = os.path.join(CFG_CACHEDIR, 'RTdata')
+    parsed = oaiparseresumptionToken(resumptionToken)
+    if parsed is None:
+        return None
+    key, cursor = parsed
+    res = run_sql("""SELECT hitset, metadataPrefix, setSpec
+                       FROM oaiRESUMPTIONTOKEN
+                      WHERE id=%s AND expiration>=NOW()""", (key,))
+    if not res:
+        return None
+    hitset = intbitset(res[0][0])
+    if cursor > len(hitset):
+        return None
+    return key, hitset, cursor, res[0][1], res[0][2]
 
-    files = os.listdir(directory)
+def oaicacheclean():
+    "Removes cached resumptionTokens that have expired."
 
-    for file_ in files:
-        filename = os.path.join(directory, file_)
-        # cache entry expires when not modified during a specified period of time
-        if ((time.time() - os.path.getmtime(filename)) > CFG_OAI_EXPIRE):
-            try:
-                os.remove(filename)
-            except OSError, e:
-                # Most probably the cache was already deleted
-                pass
+    run_sql("DELETE FROM oaiRESUMPTIONTOKEN WHERE expiration<NOW()")
     return 1
 
-
 def oaicachestatus(resumptionToken):
     "Checks cache status.  Returns 0 for empty, 1 for full."
 
-    filename = os.path.join(CFG_CACHEDIR, 'RTdata', resumptionToken)
-
-    if os.path.exists(filename):
-        if os.path.getsize(filename) > 0:
-            return 1
-        else:
-            return 0
-    else:
+    if oaicacheout(resumptionToken) is None:
         return 0
+    return 1
 
 
 def get_sets():
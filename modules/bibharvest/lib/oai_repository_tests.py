@@ -82,11 +82,63 @@ class TestEncodings(unittest.TestCase):
         self.assertEqual("%20", oai_repository_server.escape_space(" "))
         self.assertEqual("%25%20%3F%23%3D%26%2F%3A%3B%2B", oai_repository_server.encode_for_url("% ?#=&/:;+"))
 
-
+class TestResumptionTokens(unittest.TestCase):
+    """Test for OAI resumption token handling."""
+
+    def test_resumption_token_roundtrip(self):
+        """oairepository - testing resumption token generation and parsing"""
+        key = oai_repository_server.oaigenresumptionToken()
+        self.assertEqual(32, len(key))
+        token = oai_repository_server.oaigenresumptionToken(key, 1000)
+        self.assertEqual((key, 1000), oai_repository_server.oaiparseresumptionToken(token))
+
+    def test_invalid_resumption_token(self):
+        """oairepository - testing invalid resumption tokens"""
+        key = oai_repository_server.oaigenresumptionToken()
+        self.assertEqual(None, oai_repository_server.oaiparseresumptionToken(key))
+        self.assertEqual(None, oai_repository_server.oaiparseresumptionToken(key + "-foo"))
+        self.assertEqual(None, oai_repository_server.oaiparseresumptionToken(key + "--1"))
+        self.assertEqual(None, oai_repository_server.oaiparseresumptionToken("../etc-10"))
+
+class TestBatchQueries(unittest.TestCase):
+    """Test the queries fetching the data of several records at once."""
+
+    def setUp(self):
+        """Replace run_sql by the substitution of its parameters"""
+        self.run_sql = oai_repository_server.run_sql
+        self.queries = []
+        self.results = []
+        def run_sql(query, params=(), *args):
+            # Substitute the parameters into the query, as MySQLdb does
+            self.queries.append(query % tuple([repr(param) for param in params]))
+            if self.results:
+                return self.results.pop(0)
+            return ()
+        oai_repository_server.run_sql = run_sql
+
+    def tearDown(self):
+        """Restore run_sql"""
+        oai_repository_server.run_sql = self.run_sql
+
+    def test_modification_dates_query(self):
+        """oairepository - query of the modification dates of records"""
+        self.assertEqual({}, oai_repository_server.get_modification_dates([1, 2, 3]))
+        self.assertEqual(["SELECT id, DATE_FORMAT(modification_date,'%Y-%m-%d %H:%i:%s') FROM bibrec WHERE id IN (1,2,3)"],
+                         self.queries)
+
+    def test_records_exist_query(self):
+        """oairepository - query of the existence of records"""
+        self.results = [((1,), (2,)), ()]
+        self.assertEqual({1: 1, 2: 1, 3: 0}, oai_repository_server.records_exist([1, 2, 3]))
+        self.assertEqual(["SELECT id FROM bibrec WHERE id IN (1,2,3)",
+                          "SELECT bibx.id_bibrec, bx.value FROM bib98x AS bx, bibrec_bib98x AS bibx WHERE bibx.id_bibrec IN (1,2) AND bx.id=bibx.id_bibxxx AND bx.tag LIKE '980__%'"],
+                         self.queries)
 
 TEST_SUITE = make_test_suite(TestVerbs,
                              TestErrorCodes,
-                             TestEncodings,)
+                             TestEncodings,
+                             TestResumptionTokens,
+                             TestBatchQueries,)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -40,11 +40,11 @@ from invenio.config import \
      CFG_OAI_ID_FIELD, \
      CFG_OAI_ID_PREFIX, \
      CFG_OAI_SET_FIELD, \
-     CFG_BINDIR, \
      CFG_SITE_NAME, \
      CFG_TMPDIR
 from invenio.search_engine import \
      perform_request_search, \
+     search_unit_in_bibrec, \
      get_fieldvalues, \
      get_record
 from invenio.intbitset import intbitset as HitSet
@@ -55,7 +55,8 @@ from invenio.bibtask import \
      write_message, \
      task_update_progress, \
      task_init, \
-     task_sleep_now_if_required
+     task_sleep_now_if_required, \
+     task_low_level_submission
 from invenio.bibrecord import \
      record_delete_subfield, \
      field_xml_output
@@ -126,7 +127,7 @@ def all_set_specs():
 
     return [row[0] for row in res]
 
-def get_recids_for_set_spec(set_spec):
+def get_recids_for_set_spec(set_spec, modified_since=""):
     """
     Returns the list (as HitSet) of recids belonging to 'set'
 
@@ -134,6 +135,9 @@ def get_recids_for_set_spec(set_spec):
 
       set_spec - *str* the set_spec for which we would like to get the
                  recids
+
+      modified_since - *str* if given (as 'YYYY-MM-DD HH:MM:SS'), only
+                       consider records modified since that date
     """
     recids = HitSet()
 
@@ -151,12 +155,79 @@ def get_recids_for_set_spec(set_spec):
                                             p3=set_def['p3'],
                                             f3=set_def['f3'],
                                             m3=set_def['m3'],
+                                            d1=modified_since,
+                                            dt=(modified_since and 'm' or ''),
                                             ap=0)
 
         recids = recids.union(HitSet(new_recids))
 
     return recids
 
+def get_last_update():
+    """
+    Returns the date (as 'YYYY-MM-DD HH:MM:SS') at which the last
+    successful run of the updater started, or None if the OAI
+    repository has never been fully synchronized with the current
+    set definitions (in which case an incremental run is not
+    possible).
+
+    A run is successful once the corrections it submitted have been
+    uploaded: the set membership it stored is not used before its
+    bibupload task is DONE.
+    """
+    res = run_sql("""SELECT COUNT(*), MIN(DATE_FORMAT(last_updated,'%%Y-%%m-%%d %%H:%%i:%%s'))
+                       FROM oaiREPOSITORY""")
+    nb_definitions, last_update = res[0]
+    if not nb_definitions or not last_update:
+        return None
+    res = run_sql("""SELECT COUNT(*) FROM oaiREPOSITORY
+                      WHERE last_updated IS NULL OR setRecList IS NULL""")
+    if res[0][0]:
+        return None
+    res = run_sql("""SELECT COUNT(*) FROM schTASK
+                      WHERE proc='bibupload' AND user='oairepository'
+                        AND runtime>=%s AND status<>'DONE'""",
+                  (last_update, ))
+    if res[0][0]:
+        # The upload failed, or has not run yet
+        return None
+    return last_update
+
+def get_last_recids_for_set_spec(set_spec):
+    """
+    Returns the recids (as HitSet) that belonged to 'set_spec' at the
+    end of the last successful run of the updater.
+
+    Parameters:
+
+      set_spec - *str* the set_spec for which we would like to get the
+                 recids
+    """
+    res = run_sql("""SELECT setRecList FROM oaiREPOSITORY
+                      WHERE setSpec=%s AND setRecList IS NOT NULL
+                      LIMIT 1""", (set_spec, ))
+    if res:
+        return HitSet(res[0][0])
+    return HitSet()
+
+def store_last_update(recids_for_set, last_update):
+    """
+    Remembers the recids belonging to each set_spec, and the date of
+    the run that computed them, so that the next runs can be
+    incremental.
+
+    Parameters:
+
+      recids_for_set - *dict* the recids (as HitSet) for each set_spec
+
+         last_update - *str* the date (as 'YYYY-MM-DD HH:MM:SS') at
+                       which the run started
+    """
+    for set_spec, recids in recids_for_set.iteritems():
+        run_sql("""UPDATE oaiREPOSITORY SET setRecList=%s, last_updated=%s
+                    WHERE setSpec=%s""",
+                (recids.fastdump(), last_update, set_spec))
+
 def get_set_name_for_set_spec(set_spec):
     """
     Returns the OAI setName of a setSpec.
@@ -311,6 +382,7 @@ def oairepositoryupdater_task():
     """Main business logic code of oai_archive"""
     no_upload = task_get_option("no_upload")
     report = task_get_option("report")
+    incremental = task_get_option("incremental")
 
     if report > 1:
         print_repository_status(verbose=report)
@@ -318,14 +390,36 @@ def oairepositoryupdater_task():
 
     task_update_progress("Fetching records to process")
 
-    # Build the list of records to be processed, that is, search for
-    # the records that match one of the search queries defined in OAI
-    # Repository admin interface.
+    # Remember when we started: records modified from now on will be
+    # reconsidered by the next incremental run.
+    run_start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+
+    last_update = None
+    if incremental:
+        last_update = get_last_update()
+        if last_update is None:
+            write_message("OAI repository has never been fully updated " \
+                          "with the current set definitions: " \
+                          "processing all the records.")
+        else:
+            write_message("Processing records modified since %s" % last_update)
+
+    if last_update:
+        # Only the records modified since last run can have changed
+        # their membership: keep the last known membership of the
+        # other records.
+        modified_recids = search_unit_in_bibrec(last_update, run_start, 'm')
     recids_for_set = {} # Remember exactly which record belongs to which set
     recids = HitSet() # "Flat" set of the recids_for_set values
     for set_spec in all_set_specs():
         task_sleep_now_if_required(can_stop_too=True)
-        _recids = get_recids_for_set_spec(set_spec)
+        if last_update:
+            _recids = get_recids_for_set_spec(set_spec, last_update) & \
+                      modified_recids
+            _recids |= get_last_recids_for_set_spec(set_spec) - \
+                       modified_recids
+        else:
+            _recids = get_recids_for_set_spec(set_spec)
         recids_for_set[set_spec] = _recids
         recids = recids.union(_recids)
 
@@ -334,9 +428,16 @@ def oairepositoryupdater_task():
     oai_recids = perform_request_search(c=CFG_SITE_NAME,
                                         p1='oai:%s:*' % CFG_OAI_ID_PREFIX,
                                         f1=CFG_OAI_ID_FIELD,
-                                        m1="e", ap=0)
+                                        m1="e",
+                                        d1=(last_update or ""),
+                                        dt=(last_update and 'm' or ''),
+                                        ap=0)
     recids = recids.union(HitSet(oai_recids))
 
+    if last_update:
+        recids &= modified_recids
+        write_message("%i modified records to check" % len(recids))
+
     # Prepare to save results in a tmp file
     (fd, filename) = mkstemp(dir=CFG_TMPDIR,
                                   prefix='oairepository_' + \
@@ -435,10 +536,14 @@ def oairepositoryupdater_task():
     if not no_upload:
         task_sleep_now_if_required(can_stop_too=True)
         if has_updated_records:
-            command = "%s/bibupload -c %s -u oairepository" % (CFG_BINDIR, filename)
-            os.system(command)
+            task_id = task_low_level_submission('bibupload', 'oairepository',
+                                                '-c', filename)
+            write_message("Submitted bibupload task #%s" % task_id)
         else:
             os.remove(filename)
+        # Used by the next incremental run once the bibupload task is
+        # DONE (see get_last_update())
+        store_last_update(recids_for_set, run_start)
 
     return True
 
@@ -511,6 +616,8 @@ def main():
                 "   $ oairepositoryupdater \n"
                 " Expose records according to sets defined in OAI Repository admin interface and update them every day\n"
                 "   $ oairepositoryupdater -s24\n"
+                " Only check the records modified since the last run, every hour\n"
+                "   $ oairepositoryupdater -i -s1h\n"
                 " Print OAI repository status\n"
                 "   $ oairepositoryupdater -r\n"
                 " Print OAI repository detailed status\n"
@@ -518,12 +625,14 @@ def main():
             help_specific_usage="Options:\n"
                 " -r --report\t\tOAI repository status\n"
                 " -d --detailed-report\t\tOAI repository detailed status\n"
-                " -n --no-process\tDo no upload the modifications\n",
+                " -n --no-process\tDo no upload the modifications\n"
+                " -i --incremental\tOnly check the records modified since the last run\n",
             version=__revision__,
-            specific_params=("rdn", [
+            specific_params=("rdni", [
                 "report",
                 "detailed-report",
-                "no-process"]),
+                "no-process",
+                "incremental"]),
             task_submit_elaborate_specific_parameter_fnc=
                 task_submit_elaborate_specific_parameter,
             task_run_fnc=oairepositoryupdater_task)
@@ -536,6 +645,8 @@ def task_submit_elaborate_specific_parameter(key, value, opts, args):
         task_set_option("report", 2)
     elif key in ("-n", "--no-process"):
         task_set_option("no_upload", 1)
+    elif key in ("-i", "--incremental"):
+        task_set_option("incremental", 1)
     else:
         return False
     return True
@@ -114,13 +114,13 @@ class WebInterfaceOAIProviderPages(WebInterfaceDirectory):
             ## OAI ListIdentifiers
 
             elif argd['verb'] == "ListIdentifiers":
-                req.write(oai_repository_server.oailistidentifiers(args))
+                oai_repository_server.oailistidentifiers(args, req)
 
 
             ## OAI ListRecords
 
             elif argd['verb'] == "ListRecords":
-                req.write(oai_repository_server.oailistrecords(args))
+                oai_repository_server.oailistrecords(args, req)
 
 
             ## OAI GetRecord
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Aho-Corasick automaton, finding the occurrences of many strings in a text
+in a single pass over the text, whatever the number of strings.
+
+Used by BibClassify to find the anchors of the keywords in a fulltext, and
+by refextract to find the periodical titles in a reference line.  It does
+not depend on the rest of Invenio, so that these modules can still run
+standalone.
+"""
+
+__revision__ = "$Id$"
+
+class AhoCorasickAutomaton:
+    """An Aho-Corasick automaton finding the occurrences of a list of
+    strings in a text."""
+
+    def __init__(self, strings):
+        """Build the automaton of strings (any sequence of strings, or
+        of unicode strings)."""
+        # State -> {character: next state}
+        self.goto = [{}]
+        # State -> strings recognized when reaching the state
+        self.output = [[]]
+
+        for string in strings:
+            state = 0
+            for char in string:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.output.append([])
+                state = next_state
+            if string not in self.output[state]:
+                self.output[state].append(string)
+
+        # Compute the failure function breadth first.
+        self.fail = [0] * len(self.goto)
+        queue = self.goto[0].values()
+        while queue:
+            next_queue = []
+            for state in queue:
+                for char, next_state in self.goto[state].iteritems():
+                    fail_state = self.fail[state]
+                    while fail_state and char not in self.goto[fail_state]:
+                        fail_state = self.fail[fail_state]
+                    fail_state = self.goto[fail_state].get(char, 0)
+                    self.fail[next_state] = fail_state
+                    self.output[next_state] = (self.output[next_state] +
+                        self.output[fail_state])
+                    next_queue.append(next_state)
+            queue = next_queue
+
+    def find(self, text):
+        """Returns a dictionary of the strings of the automaton found in
+        text bound with the sorted list of their start positions."""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        occurrences = {}
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for string in output[state]:
+                occurrences.setdefault(string, []).append(index -
+                    len(string) + 1)
+
+        return occurrences
+
+    def find_strings(self, text):
+        """Returns the list of the strings of the automaton found in
+        text, each of them once, in no particular order."""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        reached = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                reached[state] = None
+
+        strings = {}
+        for state in reached:
+            for string in output[state]:
+                strings[string] = None
+
+        return strings.keys()
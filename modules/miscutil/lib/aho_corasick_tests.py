@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the Aho-Corasick automaton."""
+
+__revision__ = "$Id$"
+
+import unittest
+
+from invenio.aho_corasick import AhoCorasickAutomaton
+from invenio.testutils import make_test_suite, run_test_suite
+
+class AhoCorasickAutomatonTest(unittest.TestCase):
+    """Test the single pass search of several strings."""
+
+    def test_find(self):
+        """aho_corasick - finding the occurrences of several strings"""
+        automaton = AhoCorasickAutomaton(["he", "she", "his", "hers"])
+        self.assertEqual({"he": [1, 10], "she": [0, 9], "hers": [10],
+                          "his": [7]},
+                         automaton.find("shed a hishers"))
+        self.assertEqual({}, automaton.find("nothing"))
+
+    def test_find_strings(self):
+        """aho_corasick - finding the strings contained by a text"""
+        automaton = AhoCorasickAutomaton([u"PHYS REV LETT", u"PHYS REV",
+                                          u"REV", u"NUCL PHYS", u"REV"])
+        self.assertEqual([u"PHYS REV", u"PHYS REV LETT", u"REV"],
+            sorted(automaton.find_strings(u"[1] PHYS REV LETT 44, REV")))
+        self.assertEqual([], automaton.find_strings(u"[1] SOME TEXT"))
+
+TEST_SUITE = make_test_suite(AhoCorasickAutomatonTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
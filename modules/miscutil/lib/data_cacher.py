@@ -22,7 +22,7 @@ Tool for caching important infos, which are slow to rebuild, but that
 rarely change.
 """
 
-from invenio.dbquery import run_sql, get_table_update_time
+from invenio.dbquery import run_sql, get_cached_table_update_time
 import time
 
 class InvenioDataCacherError(Exception):
@@ -38,15 +38,19 @@ class DataCacher:
     The .timestamp and .cache objects are exposed to clients.  Most
     use cases use a dict internal structure for .cache, but some use
     lists.
+
+    The cache is only created when .cache or .timestamp are first
+    accessed, so that instantiating cachers at module load time (e.g.
+    when a web worker starts) is cheap.
     """
     def __init__(self, cache_filler, timestamp_verifier):
         """ @param cache_filler: a function that fills the cache dictionary.
             @param timestamp_verifier: a function that returns a timestamp for
                    checking if something has changed after cache creation.
         """
-        self.timestamp = 0 # WARNING: may be exposed to clients
-        self.cache = {} # WARNING: may be exposed to clients; lazy
-                        # clients may even alter this object on the fly
+        ## WARNING: .timestamp and .cache (created on first access) may
+        ## be exposed to clients; lazy clients may even alter .cache on
+        ## the fly
         if not callable(cache_filler):
             raise InvenioDataCacherError, "cache_filler is not callable"
         self.cache_filler = cache_filler
@@ -54,7 +58,13 @@ class DataCacher:
             raise InvenioDataCacherError, "timestamp_verifier is not callable"
         self.timestamp_verifier = timestamp_verifier
         self.is_ok_p = True
-        self.create_cache()
+
+    def __getattr__(self, name):
+        """Create the cache when it is first needed."""
+        if name in ('cache', 'timestamp'):
+            self.create_cache()
+            return self.__dict__[name]
+        raise AttributeError(name)
 
     def clear(self):
         """Clear the cache rebuilding it."""
@@ -97,7 +107,7 @@ class SQLDataCacher(DataCacher):
         def timestamp_verifier():
             """The standard timestamp verifier is looking at affected
             tables time stamp."""
-            return max([get_table_update_time(table)
+            return max([get_cached_table_update_time(table)
                 for table in self.affected_tables])
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
@@ -37,11 +37,19 @@ import string
 import time
 import marshal
 import re
+import fnmatch
+import random
+import threading
 from zlib import compress, decompress
-from thread import get_ident
+from thread import get_ident, allocate_lock
 from invenio.config import CFG_ACCESS_CONTROL_LEVEL_SITE, \
     CFG_MISCUTIL_SQL_USE_SQLALCHEMY, \
-    CFG_MISCUTIL_SQL_RUN_SQL_MANY_LIMIT
+    CFG_MISCUTIL_SQL_RUN_SQL_MANY_LIMIT, \
+    CFG_MISCUTIL_SQL_POOL_MAX_IDLE, \
+    CFG_MISCUTIL_SQL_POOL_IDLE_TIMEOUT, \
+    CFG_MISCUTIL_SQL_PROFILING_TOP, \
+    CFG_MISCUTIL_SQL_PROFILING_LOG_THRESHOLD, \
+    CFG_MISCUTIL_SQL_TABLE_UPDATE_TIME_CACHE
 
 if CFG_MISCUTIL_SQL_USE_SQLALCHEMY:
     try:
@@ -68,8 +76,35 @@ CFG_DATABASE_PORT = '3306'
 CFG_DATABASE_NAME = 'invenio'
 CFG_DATABASE_USER = 'invenio'
 CFG_DATABASE_PASS = 'my123p$ss'
-
+CFG_DATABASE_SLAVES = ''
+
+## For how many seconds a read replica that could not be reached is
+## not used anymore.
+CFG_DATABASE_SLAVE_RETRY_INTERVAL = 60
+
+def _parse_db_servers(servers):
+    """Return the list of (host, port) of the comma separated SERVERS."""
+    ret = []
+    for server in servers.split(','):
+        server = server.strip()
+        if server:
+            if ':' in server:
+                host, port = server.split(':', 1)
+            else:
+                host, port = server, CFG_DATABASE_PORT
+            ret.append((host, port))
+    return ret
+
+_DB_PRIMARY = (CFG_DATABASE_HOST, CFG_DATABASE_PORT)
+_DB_REPLICAS = _parse_db_servers(CFG_DATABASE_SLAVES)
 _DB_CONN = {}
+_DB_REPLICA_CONN = {}
+_DB_REPLICA_DOWN = {}
+_DB_READ_ROUTING = {}
+_DB_POOL = {}
+_DB_POOL_LOCK = allocate_lock()
+_DB_THREAD_LOCAL = threading.local()
+_QUERY_PROFILES = {}
 
 
 class InvenioDbQueryWildcardLimitError(Exception):
@@ -78,9 +113,9 @@ class InvenioDbQueryWildcardLimitError(Exception):
         """Initialization."""
         self.res = res
 
-def _db_login(relogin = 0):
-
-    """Login to the database."""
+def _db_connect(server=_DB_PRIMARY):
+    """Open a new connection to the database SERVER (a (host, port)
+    tuple, by default the primary one)."""
 
     ## Note: we are using "use_unicode=False", because we want to
     ## receive strings from MySQL as Python UTF-8 binary string
@@ -93,31 +128,139 @@ def _db_login(relogin = 0):
     ## older MySQLdb versions here, since we are recommending to
     ## upgrade to more recent versions anyway.
 
+    host, port = server
+    return connect(host=host, port=int(port),
+                   db=CFG_DATABASE_NAME, user=CFG_DATABASE_USER,
+                   passwd=CFG_DATABASE_PASS,
+                   use_unicode=False, charset='utf8')
+
+def _db_close(db):
+    """Close a connection, ignoring errors (e.g. if it is already broken)."""
+    try:
+        db.close()
+    except Error:
+        pass
+
+def _db_checkout(server=_DB_PRIMARY):
+    """Return a healthy connection to SERVER taken from the pool of idle
+    connections of this process, or a new one if none is available.
+    Connections idle for more than CFG_MISCUTIL_SQL_POOL_IDLE_TIMEOUT
+    seconds are closed, the others are pinged before being reused."""
+    pool_key = (os.getpid(), server)
+    while True:
+        _DB_POOL_LOCK.acquire()
+        try:
+            idle_connections = _DB_POOL.get(pool_key)
+            if not idle_connections:
+                break
+            db, last_used = idle_connections.pop()
+        finally:
+            _DB_POOL_LOCK.release()
+        if time.time() - last_used > CFG_MISCUTIL_SQL_POOL_IDLE_TIMEOUT:
+            _db_close(db)
+            continue
+        try:
+            db.ping()
+            return db
+        except Error:
+            _db_close(db)
+    return _db_connect(server)
+
+def _db_checkin(db, server=_DB_PRIMARY):
+    """Give back connection DB to SERVER to the pool of idle connections
+    of this process, closing it if the pool is full."""
+    pool_key = (os.getpid(), server)
+    _DB_POOL_LOCK.acquire()
+    try:
+        idle_connections = _DB_POOL.setdefault(pool_key, [])
+        if len(idle_connections) < CFG_MISCUTIL_SQL_POOL_MAX_IDLE:
+            idle_connections.append((db, time.time()))
+            db = None
+    finally:
+        _DB_POOL_LOCK.release()
+    if db is not None:
+        _db_close(db)
+
+class _ThreadExitWatcher:
+    """Gives back the connections of a thread to the pool when the
+    thread exits without calling release_connection().  It is stored in
+    the thread local storage of the thread, which is cleared when the
+    thread exits."""
+
+    def __init__(self, thread_ident):
+        self.thread_ident = thread_ident
+
+    def __del__(self):
+        # (in a forked child, the connections belong to the parent)
+        if _release_thread_connections is not None and \
+               self.thread_ident[0] == os.getpid():
+            _release_thread_connections(self.thread_ident)
+
+def _watch_thread_exit(thread_ident):
+    """Make sure the connections of the current thread, identified by
+    THREAD_IDENT, go back to the pool when the thread exits."""
+    watcher = getattr(_DB_THREAD_LOCAL, 'watcher', None)
+    if watcher is None or watcher.thread_ident != thread_ident:
+        _DB_THREAD_LOCAL.watcher = _ThreadExitWatcher(thread_ident)
+
+def _db_login_replica(relogin=0):
+    """Return the connection of the current thread to a read replica,
+    connecting to a random available one if needed, or None if no
+    replica can be reached."""
+    thread_ident = (os.getpid(), get_ident())
+    if _DB_REPLICA_CONN.has_key(thread_ident):
+        dummy, db = _DB_REPLICA_CONN[thread_ident]
+        if not relogin:
+            return db
+        del _DB_REPLICA_CONN[thread_ident]
+        _db_close(db)
+    now = time.time()
+    servers = [server for server in _DB_REPLICAS if _DB_REPLICA_DOWN.get(server, 0) < now]
+    random.shuffle(servers)
+    for server in servers:
+        try:
+            if relogin:
+                db = _db_connect(server)
+            else:
+                db = _db_checkout(server)
+        except Error:
+            _DB_REPLICA_DOWN[server] = now + CFG_DATABASE_SLAVE_RETRY_INTERVAL
+            continue
+        _DB_REPLICA_CONN[thread_ident] = (server, db)
+        _watch_thread_exit(thread_ident)
+        return db
+    return None
+
+def _db_login(relogin = 0, replica = False):
+    """Login to the database.
+
+    Every thread of a process keeps using the same connection until it
+    releases it with release_connection() (e.g. at the end of a web
+    request), after which the connection goes back to the pool of idle
+    connections of the process.
+
+    If REPLICA is True, return a connection to a read replica instead,
+    if any can be reached.
+    """
+    if replica:
+        db = _db_login_replica(relogin)
+        if db is not None:
+            return db
     if CFG_MISCUTIL_SQL_USE_SQLALCHEMY:
-        return connect(host=CFG_DATABASE_HOST, port=int(CFG_DATABASE_PORT),
-                       db=CFG_DATABASE_NAME, user=CFG_DATABASE_USER,
-                       passwd=CFG_DATABASE_PASS,
-                       use_unicode=False, charset='utf8')
-    else:
-        thread_ident = (os.getpid(), get_ident())
+        return _db_connect()
+    thread_ident = (os.getpid(), get_ident())
     if relogin:
-        _DB_CONN[thread_ident] = connect(host=CFG_DATABASE_HOST,
-                                         port=int(CFG_DATABASE_PORT),
-                                         db=CFG_DATABASE_NAME,
-                                         user=CFG_DATABASE_USER,
-                                         passwd=CFG_DATABASE_PASS,
-                                         use_unicode=False, charset='utf8')
+        if _DB_CONN.has_key(thread_ident):
+            _db_close(_DB_CONN[thread_ident])
+        _DB_CONN[thread_ident] = _db_connect()
+        _watch_thread_exit(thread_ident)
         return _DB_CONN[thread_ident]
     else:
         if _DB_CONN.has_key(thread_ident):
             return _DB_CONN[thread_ident]
         else:
-            _DB_CONN[thread_ident] = connect(host=CFG_DATABASE_HOST,
-                                             port=int(CFG_DATABASE_PORT),
-                                             db=CFG_DATABASE_NAME,
-                                             user=CFG_DATABASE_USER,
-                                             passwd=CFG_DATABASE_PASS,
-                                             use_unicode=False, charset='utf8')
+            _DB_CONN[thread_ident] = _db_checkout()
+            _watch_thread_exit(thread_ident)
             return _DB_CONN[thread_ident]
 
 def _db_logout():
@@ -132,13 +275,169 @@ def close_connection():
     Enforce the closing of a connection
     Highly relevant in multi-processing and multi-threaded modules
     """
+    thread_ident = (os.getpid(), get_ident())
     try:
-        _DB_CONN[(os.getpid(), get_ident())].close()
-        del(_DB_CONN[(os.getpid(), get_ident())])
+        _DB_CONN[thread_ident].close()
+        del(_DB_CONN[thread_ident])
     except KeyError:
         pass
+    try:
+        _DB_REPLICA_CONN.pop(thread_ident)[1].close()
+    except KeyError:
+        pass
+
+def release_connection():
+    """
+    Give back the connections of the current thread to the pool of
+    idle connections of the process, so that they can be reused by any
+    other thread.  At most CFG_MISCUTIL_SQL_POOL_MAX_IDLE idle
+    connections per database server are kept, exceeding ones are
+    closed.  This also stops routing the queries of the thread to the
+    read replicas (see enable_read_replicas()).
+
+    This is done anyway when the thread exits.
+    """
+    _release_thread_connections((os.getpid(), get_ident()))
+
+def _release_thread_connections(thread_ident):
+    """Do the job of release_connection() for the thread identified by
+    THREAD_IDENT."""
+    _DB_READ_ROUTING.pop(thread_ident, None)
+    if _DB_CONN.has_key(thread_ident):
+        _db_checkin(_DB_CONN.pop(thread_ident))
+    if _DB_REPLICA_CONN.has_key(thread_ident):
+        server, db = _DB_REPLICA_CONN.pop(thread_ident)
+        _db_checkin(db, server)
+
+def enable_read_replicas():
+    """
+    Route the read-only queries of the current thread (e.g. of a web
+    request) to the read replicas listed in CFG_DATABASE_SLAVES, if
+    any.  As soon as the thread runs a query that modifies the
+    database, all its following queries go to the primary database
+    again, so that it reads its own writes, until release_connection()
+    is called.
+    """
+    if _DB_REPLICAS:
+        _DB_READ_ROUTING[(os.getpid(), get_ident())] = True
+
+def _read_only_query_p(sql):
+    """Return True if SQL is a query that does not need to run on the
+    primary database."""
+    if string.upper(string.split(sql)[0]) not in ("SELECT", "SHOW", "DESC", "DESCRIBE"):
+        return False
+    sql = string.upper(sql)
+    for lock_clause in ("FOR UPDATE", "LOCK IN SHARE MODE", "GET_LOCK", "INTO OUTFILE"):
+        if lock_clause in sql:
+            return False
+    return True
+
+def start_query_profiling():
+    """
+    Start recording the SQL queries run by the current thread (e.g.
+    during a web request), see stop_query_profiling().
+    """
+    _QUERY_PROFILES[get_ident()] = {'count': 0, 'time': 0.0, 'queries': {}}
+
+def stop_query_profiling():
+    """
+    Stop recording the SQL queries run by the current thread.
 
-def run_sql(sql, param=None, n=0, with_desc=0):
+    @return: the profile, i.e. a dictionary with the number of queries
+        (C{count}), the cumulative time spent running them (C{time}) and
+        the per-statement statistics (C{queries}), or None if the
+        profiling was not started.
+    """
+    return _QUERY_PROFILES.pop(get_ident(), None)
+
+def get_query_profile():
+    """
+    Return the profile of the SQL queries run so far by the current
+    thread (see stop_query_profiling()), without stopping it.
+    """
+    return _QUERY_PROFILES.get(get_ident())
+
+def _record_query(sql, duration):
+    """Account SQL, run in DURATION seconds, in the profile of the
+    current thread, if any."""
+    profile = _QUERY_PROFILES.get(get_ident())
+    if profile is not None:
+        profile['count'] += 1
+        profile['time'] += duration
+        stats = profile['queries'].get(sql)
+        if stats is None:
+            profile['queries'][sql] = [1, duration, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+
+_RE_SQL_LITERALS = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|\b\d+\b""")
+_RE_SQL_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_RE_SQL_SPACES = re.compile(r"\s+")
+
+def normalize_sql_statement(sql):
+    """Return SQL with its literals and parameter placeholders replaced
+    by `?' and lists of them collapsed, so that statements differing
+    only by their values can be grouped together."""
+    sql = sql.replace('%s', '?')
+    sql = _RE_SQL_LITERALS.sub('?', sql)
+    sql = _RE_SQL_LISTS.sub('?', sql)
+    return _RE_SQL_SPACES.sub(' ', sql).strip()
+
+def get_query_profile_top_statements(profile, top=CFG_MISCUTIL_SQL_PROFILING_TOP):
+    """Return the TOP slowest normalized statements of PROFILE as a list
+    of tuples (cumulative time, count, max time, normalized statement),
+    sorted by decreasing cumulative time."""
+    statements = {}
+    for sql, (count, total_time, max_time) in profile['queries'].iteritems():
+        normalized_sql = normalize_sql_statement(sql)
+        stats = statements.get(normalized_sql)
+        if stats is None:
+            statements[normalized_sql] = [total_time, count, max_time]
+        else:
+            stats[0] += total_time
+            stats[1] += count
+            stats[2] = max(stats[2], max_time)
+    ret = [(total_time, count, max_time, normalized_sql) for \
+           normalized_sql, (total_time, count, max_time) in statements.iteritems()]
+    ret.sort()
+    ret.reverse()
+    return ret[:top]
+
+def format_query_profile(profile, top=CFG_MISCUTIL_SQL_PROFILING_TOP):
+    """Return a textual summary of PROFILE (see stop_query_profiling())."""
+    out = "%i SQL queries in %.3f s\n" % (profile['count'], profile['time'])
+    for total_time, count, max_time, normalized_sql in \
+            get_query_profile_top_statements(profile, top):
+        out += "%8.3f s %6ix (max %.3f s) %s\n" % (total_time, count, max_time, normalized_sql)
+    return out
+
+def log_query_profile(profile, context=''):
+    """Log PROFILE into prefix/var/log/dbquery_profile.log if the
+       cumulative time spent running SQL queries exceeded
+       CFG_MISCUTIL_SQL_PROFILING_LOG_THRESHOLD milliseconds.
+       CONTEXT (e.g. the URL of the request) is logged too.
+    """
+    if not CFG_MISCUTIL_SQL_PROFILING_LOG_THRESHOLD or \
+           profile['time'] * 1000 < CFG_MISCUTIL_SQL_PROFILING_LOG_THRESHOLD:
+        return
+    from invenio.config import CFG_LOGDIR
+    from invenio.dateutils import convert_datestruct_to_datetext
+    from invenio.textutils import indent_text
+    log_path = CFG_LOGDIR + '/dbquery_profile.log'
+    message = convert_datestruct_to_datetext(time.localtime()) + ' ' + context + '-->\n'
+    message += indent_text(format_query_profile(profile), 2)
+    message += '-----------------------------\n\n'
+    try:
+        log_file = open(log_path, 'a+')
+        log_file.writelines(message)
+        log_file.close()
+    except:
+        pass
+
+def run_sql(sql, param=None, n=0, with_desc=0, primary=False):
     """Run SQL on the server with PARAM and return result.
 
     @param param: tuple of string params to insert in the query (see
@@ -149,6 +448,9 @@ def run_sql(sql, param=None, n=0, with_desc=0):
     @param with_desc: if True, will return a DB API 7-tuple describing
         columns in query.
 
+    @param primary: if True, run the query on the primary database even
+        when it could go to a read replica (see enable_read_replicas()).
+
     @return: If SELECT, SHOW, DESCRIBE statements, return tuples of
         data, followed by description if parameter with_desc is
         provided.  If INSERT, return last row id.  Otherwise return
@@ -173,14 +475,24 @@ def run_sql(sql, param=None, n=0, with_desc=0):
     if param:
         param = tuple(param)
 
+    replica = False
+    thread_ident = (os.getpid(), get_ident())
+    if _DB_READ_ROUTING.has_key(thread_ident):
+        if not _read_only_query_p(sql):
+            # from now on, read our own writes:
+            del _DB_READ_ROUTING[thread_ident]
+        elif not primary:
+            replica = True
+
+    start = time.time()
     try:
-        db = _db_login()
+        db = _db_login(replica=replica)
         cur = db.cursor()
         rc = cur.execute(sql, param)
     except OperationalError: # unexpected disconnect, bad malloc error, etc
-        # FIXME: now reconnect is always forced, we may perhaps want to ping() first?
+        # e.g. a pooled connection closed by the server: reconnect once
         try:
-            db = _db_login(relogin=1)
+            db = _db_login(relogin=1, replica=replica)
             cur = db.cursor()
             rc = cur.execute(sql, param)
         except OperationalError: # again an unexpected disconnect, bad malloc error, etc
@@ -191,6 +503,7 @@ def run_sql(sql, param=None, n=0, with_desc=0):
             recset = cur.fetchmany(n)
         else:
             recset = cur.fetchall()
+        _record_query(sql, time.time() - start)
         if with_desc:
             return recset, cur.description
         else:
@@ -198,6 +511,7 @@ def run_sql(sql, param=None, n=0, with_desc=0):
     else:
         if string.upper(string.split(sql)[0]) == "INSERT":
             rc = cur.lastrowid
+        _record_query(sql, time.time() - start)
         return rc
 
 def run_sql_many(query, params, limit=CFG_MISCUTIL_SQL_RUN_SQL_MANY_LIMIT):
@@ -216,8 +530,10 @@ def run_sql_many(query, params, limit=CFG_MISCUTIL_SQL_RUN_SQL_MANY_LIMIT):
     """
     i = 0
     r = None
+    _DB_READ_ROUTING.pop((os.getpid(), get_ident()), None)
     while i < len(params):
         ## make partial query safely (mimicking procedure from run_sql())
+        start = time.time()
         try:
             db = _db_login()
             cur = db.cursor()
@@ -229,6 +545,7 @@ def run_sql_many(query, params, limit=CFG_MISCUTIL_SQL_RUN_SQL_MANY_LIMIT):
                 rc = cur.executemany(query, params[i:i + limit])
             except OperationalError:
                 raise
+        _record_query(query, time.time() - start)
         ## collect its result:
         if r is None:
             r = rc
@@ -320,6 +637,54 @@ def get_table_update_time(tablename):
             update_times.append(str(row[11]))
     return max(update_times)
 
+## Process-wide memo of the update times of the tables (or table
+## patterns) watched via get_cached_table_update_time().
+_TABLE_UPDATE_TIMES = {'timestamp': 0, 'update_times': {}}
+
+def _refresh_table_update_times(tablenames):
+    """Fetch with one query the update times of all the given TABLENAMES
+    (which can contain the `%' wildcard) and memoize them."""
+    update_times = {}
+    try:
+        res = run_sql("""SELECT table_name, update_time FROM information_schema.tables
+                          WHERE table_schema=DATABASE() AND (%s)""" % \
+                      ' OR '.join(['table_name LIKE %s'] * len(tablenames)),
+                      tuple(tablenames))
+        for tablename in tablenames:
+            pattern = tablename.replace('%', '*').replace('_', '?')
+            matching_update_times = [str(row[1]) for row in res if fnmatch.fnmatchcase(row[0], pattern)]
+            if matching_update_times:
+                update_times[tablename] = max(matching_update_times)
+            else:
+                update_times[tablename] = get_table_update_time(tablename)
+    except (ProgrammingError, OperationalError):
+        ## No information_schema (MySQL < 5.0), let's query one table
+        ## at a time.
+        for tablename in tablenames:
+            update_times[tablename] = get_table_update_time(tablename)
+    _TABLE_UPDATE_TIMES['update_times'] = update_times
+    _TABLE_UPDATE_TIMES['timestamp'] = time.time()
+
+def get_cached_table_update_time(tablename):
+    """Return update time of TABLENAME, like get_table_update_time(),
+       but shared by all the callers of the process: the update times of
+       all the tables ever asked for are fetched together with a single
+       query and then memoized for CFG_MISCUTIL_SQL_TABLE_UPDATE_TIME_CACHE
+       seconds.  This is what cache freshness checkers (see DataCacher)
+       should use.
+    """
+    if CFG_MISCUTIL_SQL_TABLE_UPDATE_TIME_CACHE <= 0:
+        return get_table_update_time(tablename)
+    update_times = _TABLE_UPDATE_TIMES['update_times']
+    if tablename not in update_times or \
+           time.time() - _TABLE_UPDATE_TIMES['timestamp'] > CFG_MISCUTIL_SQL_TABLE_UPDATE_TIME_CACHE:
+        tablenames = update_times.keys()
+        if tablename not in update_times:
+            tablenames.append(tablename)
+        _refresh_table_update_times(tablenames)
+        update_times = _TABLE_UPDATE_TIMES['update_times']
+    return update_times[tablename]
+
 def get_table_status_info(tablename):
     """Return table status information on TABLENAME.  Returned is a
        dict with keys like Name, Rows, Data_length, Max_data_length,
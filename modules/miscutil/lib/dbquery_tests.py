@@ -73,6 +73,12 @@ class TableUpdateTimesTest(unittest.TestCase):
         # drop empty test table
         dbquery.run_sql("DROP TABLE %s" % test_table)
 
+    def test_cached_table_update_time(self):
+        """dbquery - cached table update time detection"""
+        for tablename in ("collection", "fieldname", "idxWORD%"):
+            self.assertEqual(dbquery.get_table_update_time(tablename),
+                             dbquery.get_cached_table_update_time(tablename))
+
     def test_utf8_python_mysqldb_mysql_storage_chain(self):
         """dbquery - UTF-8 in Python<->MySQLdb<->MySQL storage chain"""
         # NOTE: This test test creates, uses and destroys a temporary
@@ -102,8 +108,52 @@ class WashTableColumnNameTest(unittest.TestCase):
         self.assertEqual(dbquery.real_escape_string(testcase_ok), testcase_ok)
         self.assertNotEqual(dbquery.real_escape_string(testcase_injection), testcase_injection)
 
+class QueryProfilingTest(unittest.TestCase):
+    """Test the SQL query profiling."""
+
+    def test_normalize_sql_statement(self):
+        """dbquery - normalize SQL statement"""
+        self.assertEqual(dbquery.normalize_sql_statement(
+            "SELECT id FROM bibrec WHERE id IN (%s, %s,%s) AND x='a''b'\n  LIMIT 10"),
+            "SELECT id FROM bibrec WHERE id IN (?) AND x=? LIMIT ?")
+        self.assertEqual(dbquery.normalize_sql_statement(
+            "SELECT id FROM bibrec WHERE id IN (1,2,3)"),
+            dbquery.normalize_sql_statement("SELECT id FROM bibrec WHERE id IN (4)"))
+
+    def test_query_profile(self):
+        """dbquery - query profile of the current thread"""
+        dbquery.start_query_profiling()
+        dbquery.run_sql("SELECT id FROM bibrec WHERE id=%s", (1, ))
+        dbquery.run_sql("SELECT id FROM bibrec WHERE id=%s", (2, ))
+        dbquery.run_sql("SELECT name FROM collection WHERE id=1")
+        profile = dbquery.stop_query_profiling()
+        self.assertEqual(profile['count'], 3)
+        top_statements = dbquery.get_query_profile_top_statements(profile)
+        self.assertEqual(len(top_statements), 2)
+        self.failUnless((2, "SELECT id FROM bibrec WHERE id=?") in \
+            [(count, sql) for dummy, count, dummy, sql in top_statements])
+        self.assertEqual(dbquery.stop_query_profiling(), None)
+
+class ReadReplicasTest(unittest.TestCase):
+    """Test the routing of queries to the read replicas."""
+
+    def test_read_only_query_p(self):
+        """dbquery - detection of read-only queries"""
+        self.failUnless(dbquery._read_only_query_p("SELECT id FROM bibrec"))
+        self.failUnless(dbquery._read_only_query_p("  show tables"))
+        self.failIf(dbquery._read_only_query_p("UPDATE bibrec SET id=1"))
+        self.failIf(dbquery._read_only_query_p("SELECT id FROM bibrec FOR UPDATE"))
+        self.failIf(dbquery._read_only_query_p("SELECT GET_LOCK('foo', 1)"))
+
+    def test_parse_db_servers(self):
+        """dbquery - parsing of read replicas configuration"""
+        self.assertEqual(dbquery._parse_db_servers(""), [])
+        self.assertEqual(dbquery._parse_db_servers("db2, db3:3307"),
+                         [("db2", dbquery.CFG_DATABASE_PORT), ("db3", "3307")])
+
 
-TEST_SUITE = make_test_suite(TableUpdateTimesTest, WashTableColumnNameTest)
+TEST_SUITE = make_test_suite(TableUpdateTimesTest, WashTableColumnNameTest,
+                             QueryProfilingTest, ReadReplicasTest)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
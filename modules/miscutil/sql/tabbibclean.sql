@@ -310,6 +310,7 @@ TRUNCATE bibHOLDINGPEN;
 TRUNCATE hstEXCEPTION;
 TRUNCATE aidAUTHORNAMES;
 TRUNCATE aidAUTHORNAMESBIBREFS;
+TRUNCATE aidPERSONIDNAMEINDEX;
 TRUNCATE aidDOCLIST;
 TRUNCATE aidREALAUTHORS;
 TRUNCATE aidREALAUTHORDATA;
@@ -2636,9 +2636,20 @@ CREATE TABLE IF NOT EXISTS oaiREPOSITORY (
   p3 text NOT NULL default '',
   f3 text NOT NULL default '',
   m3 text NOT NULL default '',
+  last_updated datetime default NULL, -- start of the last oairepositoryupdater run that synchronized setRecList
   PRIMARY KEY (id)
 ) ENGINE=MyISAM;
 
+CREATE TABLE IF NOT EXISTS oaiRESUMPTIONTOKEN (
+  id char(32) NOT NULL, -- key shared by all the pages of a harvest
+  metadataPrefix varchar(255) NOT NULL default '',
+  setSpec varchar(255) NOT NULL default '',
+  hitset longblob, -- fastdump'd intbitset of the harvest result set
+  expiration datetime NOT NULL default '0000-00-00 00:00:00',
+  PRIMARY KEY (id),
+  KEY expiration (expiration)
+) ENGINE=MyISAM;
+
 CREATE TABLE IF NOT EXISTS oaiHARVEST (
   id mediumint(9) unsigned NOT NULL auto_increment,
   baseurl varchar(255) NOT NULL default '',
@@ -2830,6 +2841,17 @@ CREATE TABLE IF NOT EXISTS bibdoc_bibdoc (
   KEY  (id_bibdoc2)
 ) ENGINE=MyISAM;
 
+CREATE TABLE IF NOT EXISTS bibdocfsinfo (
+  id_bibdoc mediumint(9) unsigned NOT NULL,
+  version smallint(5) unsigned NOT NULL,
+  format varchar(50) NOT NULL,
+  cd datetime NOT NULL,
+  md datetime NOT NULL,
+  checksum char(32) NOT NULL,
+  filesize bigint(15) unsigned NOT NULL,
+  PRIMARY KEY (id_bibdoc, version, format)
+) ENGINE=MyISAM;
+
 -- tables for publication requests:
 
 CREATE TABLE IF NOT EXISTS publreq (
@@ -3877,6 +3899,13 @@ CREATE TABLE IF NOT EXISTS `aidAUTHORNAMESBIBREFS` (
   INDEX `bibref-b` (`bibref`)
 ) ENGINE=MyISAM;
 
+CREATE TABLE IF NOT EXISTS `aidPERSONIDNAMEINDEX` (
+  `term` varchar(100) NOT NULL,
+  `personid` bigint(15) NOT NULL,
+  PRIMARY KEY  (`term`, `personid`),
+  INDEX `personid-b` (`personid`)
+) ENGINE=MyISAM;
+
 CREATE TABLE IF NOT EXISTS `aidDOCLIST` (
   `id` bigint(15) NOT NULL auto_increment,
   `bibrecID` bigint(15) NOT NULL,
@@ -332,6 +332,7 @@ DROP TABLE IF EXISTS collection_rnkMETHOD;
 DROP TABLE IF EXISTS collection;
 DROP TABLE IF EXISTS collectionname;
 DROP TABLE IF EXISTS oaiREPOSITORY;
+DROP TABLE IF EXISTS oaiRESUMPTIONTOKEN;
 DROP TABLE IF EXISTS oaiHARVEST;
 DROP TABLE IF EXISTS oaiHARVESTLOG;
 DROP TABLE IF EXISTS bibHOLDINGPEN;
@@ -396,6 +397,7 @@ DROP TABLE IF EXISTS sbmSUBMISSIONS;
 DROP TABLE IF EXISTS schTASK;
 DROP TABLE IF EXISTS bibdoc;
 DROP TABLE IF EXISTS bibdoc_bibdoc;
+DROP TABLE IF EXISTS bibdocfsinfo;
 DROP TABLE IF EXISTS bibrec_bibdoc;
 DROP TABLE IF EXISTS usergroup;
 DROP TABLE IF EXISTS user_usergroup;
@@ -443,6 +445,7 @@ DROP TABLE IF EXISTS swrCLIENTDATA;
 DROP TABLE IF EXISTS hstEXCEPTION;
 DROP TABLE IF EXISTS aidAUTHORNAMES;
 DROP TABLE IF EXISTS aidAUTHORNAMESBIBREFS;
+DROP TABLE IF EXISTS aidPERSONIDNAMEINDEX;
 DROP TABLE IF EXISTS aidDOCLIST;
 DROP TABLE IF EXISTS aidREALAUTHORS;
 DROP TABLE IF EXISTS aidREALAUTHORDATA;
@@ -24,6 +24,8 @@ __revision__ = "$Id$"
 ## import interesting modules:
 
 import sys
+import time
+from datetime import datetime
 
 if sys.hexversion < 0x2040000:
     # pylint: disable=W0622
@@ -35,9 +37,11 @@ from invenio.config import CFG_SITE_ADMIN_EMAIL, CFG_SITE_LANG
 from invenio.access_control_config import CFG_ACC_EMPTY_ROLE_DEFINITION_SER, \
     CFG_ACC_EMPTY_ROLE_DEFINITION_SRC, DELEGATEADDUSERROLE, SUPERADMINROLE, \
     DEF_USERS, DEF_ROLES, DEF_AUTHS, DEF_ACTIONS, CFG_ACC_ACTIVITIES_URLS
-from invenio.dbquery import run_sql, ProgrammingError
+from invenio.dbquery import run_sql, ProgrammingError, \
+    get_cached_table_update_time
 from invenio.access_control_firerole import compile_role_definition, \
     acc_firerole_check_user, serialize, deserialize, load_role_definition
+from invenio.data_cacher import DataCacher
 from invenio.intbitset import intbitset
 
 CFG_SUPERADMINROLE_ID = 0
@@ -1208,33 +1212,162 @@ def acc_get_user_id(email=''):
     except IndexError:
         return 0
 
+class AccAuthorizationDataCacher(DataCacher):
+    """
+    Cache the compiled authorizations, that is, for every action id:
+    the roles authorized whatever the arguments (C{any_argument_roles})
+    and the list of (role id, arguments) authorized for specific
+    arguments (C{argument_roles}); together with the deserialized
+    FireRole definitions of the roles (C{firerole_defs}), the user_info
+    fields they depend on (C{firerole_fields}) and the roles whose
+    definition depends on the time (C{time_dependent_roles}).
+    """
+    def __init__(self):
+        def cache_filler():
+            ret = {'actions': {}, 'any_argument_roles': {},
+                   'argument_roles': {}, 'firerole_defs': {},
+                   'firerole_fields': [], 'time_dependent_roles': intbitset()}
+            try:
+                ret['actions'] = dict(run_sql("SELECT name, id FROM accACTION"))
+                for id_action, id_role in run_sql("""SELECT id_accACTION, id_accROLE
+                        FROM accROLE_accACTION_accARGUMENT WHERE argumentlistid <= 0"""):
+                    ret['any_argument_roles'].setdefault(id_action, intbitset()).add(id_role)
+                arguments = {}
+                for id_action, id_role, keyword, value, argumentlistid in run_sql("""SELECT id_accACTION, id_accROLE, keyword, value, argumentlistid
+                        FROM accROLE_accACTION_accARGUMENT JOIN accARGUMENT ON id_accARGUMENT=id
+                        WHERE argumentlistid > 0"""):
+                    arguments.setdefault((id_action, id_role, argumentlistid), {})[keyword] = value
+                for (id_action, id_role, dummy), stored_arguments in arguments.iteritems():
+                    if id_role not in ret['any_argument_roles'].get(id_action, ()):
+                        ret['argument_roles'].setdefault(id_action, []).append((id_role, stored_arguments))
+                firerole_fields = {}
+                for id_role, firerole_def_ser in run_sql("""SELECT id, firerole_def_ser
+                        FROM accROLE WHERE firerole_def_ser IS NOT NULL"""):
+                    try:
+                        firerole_def = deserialize(firerole_def_ser)
+                    except Exception:
+                        firerole_def = load_role_definition(id_role)
+                    ret['firerole_defs'][id_role] = firerole_def
+                    for dummy, dummy, field, dummy in firerole_def[1]:
+                        if field in ('from', 'until'):
+                            ret['time_dependent_roles'].add(id_role)
+                        else:
+                            firerole_fields[field] = True
+                ret['firerole_fields'] = firerole_fields.keys()
+                ret['firerole_fields'].sort()
+            except Exception:
+                # database problems, return empty cache
+                pass
+            return ret
+
+        def timestamp_verifier():
+            return max(get_cached_table_update_time('accROLE_accACTION_accARGUMENT'),
+                       get_cached_table_update_time('accARGUMENT'),
+                       get_cached_table_update_time('accACTION'),
+                       get_cached_table_update_time('accROLE'))
+
+        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+
+    def recreate_cache_if_needed(self):
+        """
+        Recreate cache if needed.  Unlike other caches, also recreate it
+        when the tables were modified during the same second it was
+        created, since stale authorizations are not acceptable.
+        """
+        if self.timestamp_verifier() >= self.timestamp:
+            self.create_cache()
+
+_ACC_AUTHORIZATION_CACHE = []
+
+def acc_get_authorization_cache():
+    """Return the up-to-date content of the AccAuthorizationDataCacher."""
+    if not _ACC_AUTHORIZATION_CACHE:
+        _ACC_AUTHORIZATION_CACHE.append(AccAuthorizationDataCacher())
+    else:
+        _ACC_AUTHORIZATION_CACHE[0].recreate_cache_if_needed()
+    return _ACC_AUTHORIZATION_CACHE[0]
+
+#: maximum number of role sets memoized by acc_get_user_roles_from_user_info.
+CFG_ACC_USER_ROLES_CACHE_SIZE = 10000
+
+## (uid, values of the user_info fields referenced by FireRole
+## definitions) -> (version, explicit roles with their expiration,
+## implicit roles)
+_ACC_USER_ROLES_CACHE = {}
+
+def _acc_get_user_roles_key(user_info, cache):
+    """Return the uid together with the values of the user_info fields
+    referenced by the FireRole definitions in the authorization cache."""
+    key = [user_info['uid']]
+    for field in cache['firerole_fields']:
+        value = user_info.get(field)
+        if type(value) is list:
+            value = tuple(value)
+        key.append((field, user_info.has_key(field), value))
+    return tuple(key)
+
+def acc_get_user_roles_stamp(user_info):
+    """Return a stamp of the roles of the user described by user_info.
+
+    The stamp changes whenever the roles of the user might have changed
+    (because of modified roles, authorizations or memberships, or of
+    different values of the user_info fields referenced by FireRole
+    definitions) and is comparable across processes.  Its first element
+    is the last modification time of the tables involved.
+    """
+    authorization_cache = acc_get_authorization_cache()
+    stamp = [max(authorization_cache.timestamp_verifier(),
+                 get_cached_table_update_time('user_accROLE')),
+             _acc_get_user_roles_key(user_info, authorization_cache.cache)]
+    if authorization_cache.cache['time_dependent_roles']:
+        stamp.append(time.strftime("%Y-%m-%d"))
+    return tuple(stamp)
+
 def acc_is_user_in_role(user_info, id_role):
     """Return True if the user belong implicitly or explicitly to the role."""
 
-    if run_sql("""SELECT ur.id_accROLE
-            FROM user_accROLE ur
-            WHERE ur.id_user = %s AND ur.expiration >= NOW() AND
-            ur.id_accROLE = %s LIMIT 1""", (user_info['uid'], id_role), 1):
-        return True
-
-    return acc_firerole_check_user(user_info, load_role_definition(id_role))
+    return id_role in acc_get_user_roles_from_user_info(user_info)
 
 def acc_get_user_roles_from_user_info(user_info):
-    """get all roles a user is connected to."""
-
-    roles = intbitset(run_sql("""SELECT ur.id_accROLE
-        FROM user_accROLE ur
-        WHERE ur.id_user = %s AND ur.expiration >= NOW()
-        ORDER BY ur.id_accROLE""", (user_info['uid'], )))
-
-    potential_implicit_roles = run_sql("""SELECT id, firerole_def_ser FROM accROLE
-        WHERE firerole_def_ser IS NOT NULL""")
-
-    for role_id, firerole_def_ser in potential_implicit_roles:
-        if role_id not in roles:
-            if acc_firerole_check_user(user_info, deserialize(firerole_def_ser)):
-                roles.add(role_id)
+    """get all roles a user is connected to.
 
+    The set of roles of a user is memoized for all the users whose
+    user_info share the same values for the fields referenced by the
+    FireRole definitions (e.g. for all the requests of a session), until
+    roles or memberships change.
+    """
+    authorization_cache = acc_get_authorization_cache()
+    cache = authorization_cache.cache
+    version = (authorization_cache.timestamp,
+               get_cached_table_update_time('user_accROLE'))
+    key = _acc_get_user_roles_key(user_info, cache)
+
+    memo = _ACC_USER_ROLES_CACHE.get(key)
+    if memo is None or memo[0] != version:
+        explicit_roles = run_sql("""SELECT ur.id_accROLE, ur.expiration
+            FROM user_accROLE ur
+            WHERE ur.id_user = %s AND ur.expiration >= NOW()""", (user_info['uid'], ))
+        implicit_roles = intbitset()
+        for role_id, firerole_def in cache['firerole_defs'].iteritems():
+            if role_id not in cache['time_dependent_roles'] and \
+                    acc_firerole_check_user(user_info, firerole_def):
+                implicit_roles.add(role_id)
+        memo = (version, explicit_roles, implicit_roles)
+        if version[1] != time.strftime("%Y-%m-%d %H:%M:%S"):
+            ## (memberships modified during this second might not be
+            ## visible yet)
+            if len(_ACC_USER_ROLES_CACHE) >= CFG_ACC_USER_ROLES_CACHE_SIZE:
+                _ACC_USER_ROLES_CACHE.clear()
+            _ACC_USER_ROLES_CACHE[key] = memo
+
+    dummy, explicit_roles, implicit_roles = memo
+    now = datetime.now()
+    roles = intbitset([role_id for role_id, expiration in explicit_roles if expiration >= now])
+    roles |= implicit_roles
+    for role_id in cache['time_dependent_roles']:
+        if role_id not in roles and \
+                acc_firerole_check_user(user_info, cache['firerole_defs'][role_id]):
+            roles.add(role_id)
     return roles
 
 def acc_get_user_roles(id_user):
@@ -1294,7 +1427,7 @@ def acc_find_user_role_actions(user_info):
         res2.append(res)
     res2.sort()
 
-    if type(user_info) == type({}):
+    if isinstance(user_info, dict):
         query = """SELECT DISTINCT r.name, a.name, r.firerole_def_ser
             FROM accROLE_accACTION_accARGUMENT raa, accACTION a, accROLE r
             WHERE raa.id_accACTION = a.id and
@@ -1360,19 +1493,14 @@ def acc_find_possible_roles(name_action, always_add_superadmin=True, **arguments
     """Find all the possible roles that are enabled to action_name with
     given arguments. roles is a list of role_id
     """
-    id_action = acc_get_action_id(name_action)
-    roles = intbitset(run_sql("SELECT id_accROLE FROM accROLE_accACTION_accARGUMENT WHERE id_accACTION=%s AND argumentlistid <= 0", (id_action, )))
+    cache = acc_get_authorization_cache().cache
+    id_action = cache['actions'].get(name_action, 0)
+    roles = intbitset(cache['any_argument_roles'].get(id_action, ()))
     if always_add_superadmin:
         roles.add(CFG_SUPERADMINROLE_ID)
-    other_roles_to_check = run_sql("SELECT id_accROLE, keyword, value, argumentlistid FROM  accROLE_accACTION_accARGUMENT JOIN accARGUMENT ON id_accARGUMENT=id WHERE id_accACTION=%s AND argumentlistid > 0", (id_action, ))
-    other_roles_to_check_dict = {}
-    for id_accROLE, keyword, value, argumentlistid in other_roles_to_check:
-        if id_accROLE not in roles:
-            try:
-                other_roles_to_check_dict[(id_accROLE, argumentlistid)][keyword] = value
-            except KeyError:
-                other_roles_to_check_dict[(id_accROLE, argumentlistid)] = {keyword : value}
-    for ((id_accROLE, argumentlistid), stored_arguments) in other_roles_to_check_dict.iteritems():
+    for id_accROLE, stored_arguments in cache['argument_roles'].get(id_action, ()):
+        if id_accROLE in roles:
+            continue
         for key, value in stored_arguments.iteritems():
             if (value != arguments.get(key, '*') != '*') and value != '*':
                 break
@@ -1380,6 +1508,28 @@ def acc_find_possible_roles(name_action, always_add_superadmin=True, **arguments
             roles.add(id_accROLE)
     return roles
 
+def acc_find_possible_roles_by_argument(name_action, argument_name, values):
+    """Find, for each of the given VALUES of the argument ARGUMENT_NAME,
+    the roles that are enabled to action_name with argument_name=value
+    (as acc_find_possible_roles(name_action, always_add_superadmin=False,
+    argument_name=value) would do, but all at once).
+    @return: the dictionary value -> intbitset of role ids.
+    """
+    cache = acc_get_authorization_cache().cache
+    id_action = cache['actions'].get(name_action, 0)
+    any_value_roles = intbitset(cache['any_argument_roles'].get(id_action, ()))
+    value_roles = {}
+    for id_accROLE, stored_arguments in cache['argument_roles'].get(id_action, ()):
+        value = stored_arguments.get(argument_name, '*')
+        if value == '*':
+            any_value_roles.add(id_accROLE)
+        else:
+            value_roles.setdefault(value, intbitset()).add(id_accROLE)
+    ret = {}
+    for value in values:
+        ret[value] = any_value_roles | value_roles.get(value, intbitset())
+    return ret
+
 def acc_find_possible_actions_user_from_user_info(user_info, id_action):
     """user based function to find all action combination for a given
     user and action. find all the roles and utilize findPossibleActions
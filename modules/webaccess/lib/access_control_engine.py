@@ -30,7 +30,8 @@ if sys.hexversion < 0x2040000:
 
 from invenio.config import CFG_SITE_SECURE_URL
 from invenio.dbquery import run_sql
-from invenio.access_control_admin import acc_find_possible_roles, acc_is_user_in_role, CFG_SUPERADMINROLE_ID, acc_get_role_users
+from invenio.access_control_admin import acc_find_possible_roles, CFG_SUPERADMINROLE_ID, acc_get_role_users, \
+     acc_get_user_roles_from_user_info, acc_find_possible_roles_by_argument
 from invenio.access_control_config import CFG_WEBACCESS_WARNING_MSGS, CFG_WEBACCESS_MSGS
 from invenio.webuser import collect_user_info
 from invenio.access_control_firerole import deserialize, load_role_definition, acc_firerole_extract_emails
@@ -47,11 +48,11 @@ def acc_authorize_action(req, name_action, authorized_if_no_roles=False, **argum
     """
     user_info = collect_user_info(req)
     roles = acc_find_possible_roles(name_action, always_add_superadmin=False, **arguments)
-    for id_role in roles:
-        if acc_is_user_in_role(user_info, id_role):
-            ## User belong to at least one authorized role.
-            return (0, CFG_WEBACCESS_WARNING_MSGS[0])
-    if acc_is_user_in_role(user_info, CFG_SUPERADMINROLE_ID):
+    user_roles = acc_get_user_roles_from_user_info(user_info)
+    if roles & user_roles:
+        ## User belong to at least one authorized role.
+        return (0, CFG_WEBACCESS_WARNING_MSGS[0])
+    if CFG_SUPERADMINROLE_ID in user_roles:
         ## User is SUPERADMIN
         return (0, CFG_WEBACCESS_WARNING_MSGS[0])
     if not roles:
@@ -67,6 +68,28 @@ def acc_authorize_action(req, name_action, authorized_if_no_roles=False, **argum
     in_a_web_request_p = bool(user_info['uri'])
     return (1, "%s %s" % (CFG_WEBACCESS_WARNING_MSGS[1], (in_a_web_request_p and "%s %s" % (CFG_WEBACCESS_MSGS[0] % quote(user_info['uri']), CFG_WEBACCESS_MSGS[1]) or "")))
 
+def acc_authorize_action_on_values(req, name_action, argument_name, values, authorized_if_no_roles=False):
+    """
+    Given the request object (or the user_info dictionary, or the uid),
+    return the sublist of VALUES for which the user is allowed to run
+    name_action with argument_name=value, i.e. for which
+    acc_authorize_action(req, name_action, authorized_if_no_roles,
+    argument_name=value) would grant the authorization, e.g. which of
+    the restricted collections the user can view.
+    """
+    user_info = collect_user_info(req)
+    user_roles = acc_get_user_roles_from_user_info(user_info)
+    if CFG_SUPERADMINROLE_ID in user_roles:
+        ## User is SUPERADMIN
+        return list(values)
+    ret = []
+    roles_by_value = acc_find_possible_roles_by_argument(name_action, argument_name, values)
+    for value in values:
+        roles = roles_by_value[value]
+        if roles & user_roles or (not roles and authorized_if_no_roles):
+            ret.append(value)
+    return ret
+
 def acc_get_authorized_emails(name_action, **arguments):
     """
     Given the action and its arguments, try to retireve all the matching
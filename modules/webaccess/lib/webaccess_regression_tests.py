@@ -108,6 +108,31 @@ class WebAccessUseBasketsTest(unittest.TestCase):
         if error_messages:
             self.fail(merge_error_messages(error_messages))
 
+class WebAccessAuthorizationCacheTest(unittest.TestCase):
+    """Check the cached authorizations."""
+
+    def test_batch_authorization(self):
+        """webaccess - batch authorization consistent with single ones"""
+        from invenio.access_control_engine import acc_authorize_action, \
+            acc_authorize_action_on_values
+        from invenio.search_engine import restricted_collection_cache
+        restricted_collection_cache.recreate_cache_if_needed()
+        collections = restricted_collection_cache.cache
+        self.failUnless(collections)
+        for uid in (1, 2, 5, 6):
+            self.assertEqual(acc_authorize_action_on_values(uid, 'viewrestrcoll', 'collection', collections),
+                [collection for collection in collections if acc_authorize_action(uid, 'viewrestrcoll', collection=collection)[0] == 0])
+
+    def test_role_set_of_admin(self):
+        """webaccess - admin belongs to the superadmin role"""
+        from invenio.access_control_admin import CFG_SUPERADMINROLE_ID, \
+            acc_get_user_roles_from_user_info, acc_is_user_in_role
+        from invenio.webuser import collect_user_info
+        user_info = collect_user_info(1)
+        self.failUnless(CFG_SUPERADMINROLE_ID in acc_get_user_roles_from_user_info(user_info))
+        self.failUnless(acc_is_user_in_role(user_info, CFG_SUPERADMINROLE_ID))
+        self.failIf(acc_is_user_in_role(collect_user_info(2), CFG_SUPERADMINROLE_ID))
+
 if CFG_DEVEL_SITE:
     class WebAccessRobotLoginTest(unittest.TestCase):
         """
@@ -231,11 +256,13 @@ if CFG_DEVEL_SITE:
     TEST_SUITE = make_test_suite(WebAccessWebPagesAvailabilityTest,
                                 WebAccessFireRoleTest,
                                 WebAccessUseBasketsTest,
+                                WebAccessAuthorizationCacheTest,
                                 WebAccessRobotLoginTest)
 else:
     TEST_SUITE = make_test_suite(WebAccessWebPagesAvailabilityTest,
                                 WebAccessFireRoleTest,
-                                WebAccessUseBasketsTest)
+                                WebAccessUseBasketsTest,
+                                WebAccessAuthorizationCacheTest)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE, warn_user=True)
@@ -71,6 +71,8 @@ from invenio.config import \
      CFG_BIBRANK_SHOW_CITATION_LINKS, \
      CFG_SOLR_URL
 from invenio.search_engine_config import InvenioWebSearchUnknownCollectionError, InvenioWebSearchWildcardLimitError
+from invenio.search_engine_instrumentation import start_search_instrumentation, \
+     record_search_stage, record_search_cache
 from invenio.bibrecord import create_record, record_get_field_instances
 from invenio.bibrank_record_sorter import get_bibrank_methods, rank_records, is_method_valid
 from invenio.bibrank_downloads_similarity import register_page_view_event, calculate_reading_similarity_list
@@ -87,7 +89,7 @@ from invenio.access_control_config import VIEWRESTRCOLL, \
 from invenio.websearchadminlib import get_detailed_page_tabs
 from invenio.intbitset import intbitset as HitSet
 from invenio.dbquery import DatabaseError, deserialize_via_marshal, InvenioDbQueryWildcardLimitError
-from invenio.access_control_engine import acc_authorize_action
+from invenio.access_control_engine import acc_authorize_action, acc_authorize_action_on_values
 from invenio.errorlib import register_exception
 from invenio.textutils import encode_for_xml, wash_for_utf8
 
@@ -101,7 +103,7 @@ from invenio.bibrank_citation_searcher import get_cited_by_count, calculate_cite
 from invenio.bibrank_citation_grapher import create_citation_history_graph_and_box
 
 from invenio.dbquery import run_sql, run_sql_with_limit, \
-                            get_table_update_time, Error
+                            get_table_update_time, get_cached_table_update_time, Error
 from invenio.webuser import getUid, collect_user_info
 from invenio.webpage import pageheaderonly, pagefooteronly, create_error_box
 from invenio.messages import gettext_set_language
@@ -200,7 +202,7 @@ class RestrictedCollectionDataCacher(DataCacher):
             return ret
 
         def timestamp_verifier():
-            return max(get_table_update_time('accROLE_accACTION_accARGUMENT'), get_table_update_time('accARGUMENT'))
+            return max(get_cached_table_update_time('accROLE_accACTION_accARGUMENT'), get_cached_table_update_time('accARGUMENT'))
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
@@ -237,11 +239,7 @@ def get_permitted_restricted_collections(user_info, recreate_cache_if_needed=Tru
     is authorized."""
     if recreate_cache_if_needed:
         restricted_collection_cache.recreate_cache_if_needed()
-    ret = []
-    for collection in restricted_collection_cache.cache:
-        if acc_authorize_action(user_info, 'viewrestrcoll', collection=collection)[0] == 0:
-            ret.append(collection)
-    return ret
+    return acc_authorize_action_on_values(user_info, 'viewrestrcoll', 'collection', restricted_collection_cache.cache)
 
 def get_restricted_collections_for_recid(recid, recreate_cache_if_needed=True):
     """
@@ -252,6 +250,50 @@ def get_restricted_collections_for_recid(recid, recreate_cache_if_needed=True):
         collection_reclist_cache.recreate_cache_if_needed()
     return [collection for collection in restricted_collection_cache.cache if recid in get_collection_reclist(collection, recreate_cache_if_needed=False)]
 
+#: maximum number of sets of visible records kept in memory (one per
+#: combination of permitted restricted collections).
+CFG_WEBSEARCH_VISIBLE_RECORDS_CACHE_SIZE = 100
+
+## tuple of permitted restricted collections -> (version, visible records)
+_VISIBLE_RECORDS_CACHE = {}
+
+def get_records_user_can_view(user_info, recreate_cache_if_needed=True):
+    """
+    Return the hitset of the records the user is authorized to view
+    thanks to the collections they belong to, i.e. the public records
+    plus the records whose restricted collections are all permitted to
+    the user.  Filtering a hitset for a user is then a mere
+    intersection.  The result is shared by all the users with the same
+    permitted restricted collections, until collections or
+    authorizations change.
+
+    Note that records not yet belonging to any collection (i.e. not yet
+    processed by webcoll) and records the user can view only as their
+    owner are not included: see check_user_can_view_record().
+    """
+    if recreate_cache_if_needed:
+        restricted_collection_cache.recreate_cache_if_needed()
+        collection_reclist_cache.recreate_cache_if_needed()
+    permitted_collections = get_permitted_restricted_collections(user_info, recreate_cache_if_needed=False)
+    permitted_collections.sort()
+    key = tuple(permitted_collections)
+    version = (collection_reclist_cache.timestamp, restricted_collection_cache.timestamp)
+    memo = _VISIBLE_RECORDS_CACHE.get(key)
+    if memo is None or memo[0] != version:
+        visible_records = HitSet()
+        for collection in collection_reclist_cache.cache.keys():
+            visible_records |= get_collection_reclist(collection, recreate_cache_if_needed=False)
+        for collection in restricted_collection_cache.cache:
+            if collection not in permitted_collections and \
+                   collection_reclist_cache.cache.has_key(collection):
+                visible_records -= get_collection_reclist(collection, recreate_cache_if_needed=False)
+        visible_records |= get_collection_reclist(CFG_SITE_NAME, recreate_cache_if_needed=False)
+        memo = (version, visible_records)
+        if len(_VISIBLE_RECORDS_CACHE) >= CFG_WEBSEARCH_VISIBLE_RECORDS_CACHE_SIZE:
+            _VISIBLE_RECORDS_CACHE.clear()
+        _VISIBLE_RECORDS_CACHE[key] = memo
+    return memo[1]
+
 def is_user_owner_of_record(user_info, recid):
     """
     Check if the user is owner of the record, i.e. he is the submitter
@@ -293,6 +335,10 @@ def check_user_can_view_record(user_info, recid):
     if record_public_p(recid):
         ## The record is already known to be public.
         return (0, '')
+    if recid in get_records_user_can_view(user_info):
+        ## The user is authorized to all the restricted collections
+        ## of the record.
+        return (0, '')
     ## At this point, either webcoll has not yet run or there are some
     ## restricted collections. Let's see first if the user own the record.
     if is_user_owner_of_record(user_info, recid):
@@ -345,7 +391,7 @@ class IndexStemmingDataCacher(DataCacher):
             return dict(res)
 
         def timestamp_verifier():
-            return get_table_update_time('idxINDEX')
+            return get_cached_table_update_time('idxINDEX')
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
@@ -378,7 +424,7 @@ class CollectionRecListDataCacher(DataCacher):
             return ret
 
         def timestamp_verifier():
-            return get_table_update_time('collection')
+            return get_cached_table_update_time('collection')
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
@@ -447,7 +493,7 @@ class CollectionI18nNameDataCacher(DataCacher):
             return ret
 
         def timestamp_verifier():
-            return get_table_update_time('collectionname')
+            return get_cached_table_update_time('collectionname')
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
@@ -504,7 +550,7 @@ class FieldI18nNameDataCacher(DataCacher):
             return ret
 
         def timestamp_verifier():
-            return get_table_update_time('fieldname')
+            return get_cached_table_update_time('fieldname')
 
         DataCacher.__init__(self, cache_filler, timestamp_verifier)
 
@@ -1803,7 +1849,9 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
     # search stage 1: break up arguments into basic search units:
     if verbose and of.startswith("h"):
         t1 = os.times()[4]
+    stage_start = time.time()
     basic_search_units = create_basic_search_units(req, p, f, m, of)
+    record_search_stage('parsing', stage_start)
     if verbose and of.startswith("h"):
         t2 = os.times()[4]
         print_warning(req, "Search stage 1: basic search units are: %s" % cgi.escape(repr(basic_search_units)))
@@ -1831,12 +1879,14 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
 
     for idx_unit in xrange(len(basic_search_units)):
         bsu_o, bsu_p, bsu_f, bsu_m = basic_search_units[idx_unit]
+        stage_start = time.time()
         try:
             basic_search_unit_hitset = search_unit(bsu_p, bsu_f, bsu_m, wl)
         except InvenioWebSearchWildcardLimitError, excp:
             basic_search_unit_hitset = excp.res
             if of.startswith("h"):
                 print_warning(req, "Search term too generic, displaying only partial results...")
+        record_search_stage('unit lookup', stage_start)
         # FIXME: print warning if we use native full-text indexing
         if bsu_f == 'fulltext' and bsu_m != 'w' and of.startswith('h') and not CFG_SOLR_URL:
             print_warning(req, _("No phrase index available for fulltext yet, looking for word combination..."))
@@ -1911,6 +1961,7 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
     # search stage 3: apply boolean query for each search unit:
     if verbose and of.startswith("h"):
         t1 = os.times()[4]
+    stage_start = time.time()
     # let the initial set be the complete universe:
     hitset_in_any_collection = HitSet(trailing_bits=1)
     hitset_in_any_collection.discard(0)
@@ -1926,6 +1977,7 @@ def search_pattern(req=None, p=None, f=None, m=None, ap=0, of="id", verbose=0, l
         else:
             if of.startswith("h"):
                 print_warning(req, "Invalid set operation %s." % cgi.escape(this_unit_operation), "Error")
+    record_search_stage('set algebra', stage_start)
     if len(hitset_in_any_collection) == 0:
         # no hits found, propose alternative boolean query:
         if of.startswith('h') and display_nearest_terms_box:
@@ -4487,6 +4539,8 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
 
     selected_external_collections_infos = None
 
+    start_search_instrumentation(req)
+
     # wash output format:
     of = wash_output_format(of)
 
@@ -4842,6 +4896,7 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
                 return page_end(req, of, ln)
         else:
             ## 3B - simple search
+            record_search_cache(search_results_cache.cache.has_key(query_representation_in_cache))
             if search_results_cache.cache.has_key(query_representation_in_cache):
                 # query is not in the cache already, so reuse it:
                 query_in_cache = True
@@ -4885,7 +4940,9 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
             # recommendations when there results only in the hosted collections. Also added the if clause to avoid
             # searching in case we know since the last stage that we have no results in any collection
             if len(results_in_any_collection) != 0:
+                stage_start = time.time()
                 results_final = intersect_results_with_collrecs(req, results_in_any_collection, colls_to_search, ap, of, verbose, ln, display_nearest_terms_box=not hosted_colls_actual_or_potential_results_p)
+                record_search_stage('collection intersection', stage_start)
             else:
                 results_final = {}
         except:
@@ -5018,6 +5075,7 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
             if of == "id":
                 # we have been asked to return list of recIDs
                 recIDs = list(results_final_for_all_selected_colls)
+                stage_start = time.time()
                 if sf: # do we have to sort?
                     recIDs = sort_records(req, recIDs, sf, so, sp, verbose, of)
                 elif rm: # do we have to rank?
@@ -5026,6 +5084,7 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
                                                                                    string.split(p2) + string.split(p3), verbose)
                     if results_final_for_all_colls_rank_records_output[0]:
                         recIDs = results_final_for_all_colls_rank_records_output[0]
+                record_search_stage('ranking/sorting', stage_start)
                 return recIDs
             elif of.startswith("h"):
                 if of not in ['hcs']:
@@ -5072,6 +5131,7 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
                         results_final_relevances = []
                         results_final_relevances_prologue = ""
                         results_final_relevances_epilogue = ""
+                        stage_start = time.time()
                         if sf: # do we have to sort?
                             results_final_recIDs = sort_records(req, results_final_recIDs, sf, so, sp, verbose, of)
                         elif rm: # do we have to rank?
@@ -5087,6 +5147,8 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
                                 # rank_records failed and returned some error message to display:
                                 print_warning(req, results_final_relevances_prologue)
                                 print_warning(req, results_final_relevances_epilogue)
+                        record_search_stage('ranking/sorting', stage_start)
+                        stage_start = time.time()
                         print_records(req, results_final_recIDs, jrec, rg, of, ot, ln,
                                       results_final_relevances,
                                       results_final_relevances_prologue,
@@ -5099,6 +5161,7 @@ def perform_request_search(req=None, cc=CFG_SITE_NAME, c=None, p="", f="", rg=CF
                                       so=so,
                                       sp=sp,
                                       rm=rm)
+                        record_search_stage('formatting', stage_start)
                         if of.startswith("h"):
                             req.write(print_search_info(p, f, sf, so, sp, rm, of, ot, coll, results_final_nb[coll],
                                                         jrec, rg, aas, ln, p1, p2, p3, f1, f2, f3, m1, m2, m3, op1, op2,
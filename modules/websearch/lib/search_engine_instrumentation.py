@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Instrumentation of the search pipeline.
+
+The time spent by every web search in each stage of the pipeline (see
+L{CFG_WEBSEARCH_INSTRUMENTED_STAGES}), its number of SQL queries and
+its search results cache hits are recorded and aggregated into
+histograms, which are periodically dumped into
+prefix/var/log/search_instrumentation.log, so that one can see where
+the slowest searches spend their time.
+
+Usage within the search engine::
+
+    start_search_instrumentation(req)
+    ...
+    start = time.time()
+    ...do some parsing...
+    record_search_stage('parsing', start)
+"""
+
+__revision__ = "$Id$"
+
+import time
+from thread import get_ident
+
+from invenio.config import CFG_LOGDIR, \
+    CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL
+from invenio.dbquery import get_query_profile
+
+#: the instrumented stages of the search pipeline, in order.
+CFG_WEBSEARCH_INSTRUMENTED_STAGES = ('parsing', 'unit lookup', 'set algebra',
+    'collection intersection', 'ranking/sorting', 'formatting', 'total')
+
+#: upper bounds, in milliseconds, of the buckets of the histograms.
+CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200,
+    500, 1000, 2000, 5000, 10000, 30000)
+
+## thread identifier -> record of the search being served by the thread
+_SEARCH_RECORDS = {}
+
+def _new_histograms():
+    """Return empty aggregated instrumentation data."""
+    return {'since': time.time(), 'searches': 0, 'cache_hits': 0,
+        'cache_misses': 0, 'db_queries': 0,
+        'stages': dict([(stage, [0] * (len(CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS) + 1))
+            for stage in CFG_WEBSEARCH_INSTRUMENTED_STAGES])}
+
+_SEARCH_HISTOGRAMS = _new_histograms()
+
+def start_search_instrumentation(req):
+    """
+    Start recording the search served by the current thread for the
+    web request REQ, unless instrumentation is disabled or a search is
+    already being recorded.  The record is closed at the end of the
+    request handling.
+    """
+    if not CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL or \
+            not hasattr(req, 'register_cleanup'):
+        return
+    ident = get_ident()
+    if ident in _SEARCH_RECORDS:
+        return
+    query_profile = get_query_profile()
+    _SEARCH_RECORDS[ident] = {'start': time.time(), 'stages': {},
+        'cache_hits': 0, 'cache_misses': 0,
+        'db_queries': query_profile and query_profile['count'] or 0}
+    req.register_cleanup(stop_search_instrumentation)
+
+def record_search_stage(stage, start):
+    """
+    Account the time elapsed since START (as returned by time.time())
+    to the STAGE of the search served by the current thread, if it is
+    being recorded.
+    """
+    record = _SEARCH_RECORDS.get(get_ident())
+    if record is not None:
+        record['stages'][stage] = record['stages'].get(stage, 0) + \
+            time.time() - start
+
+def record_search_cache(hit):
+    """
+    Account a search results cache hit (if HIT) or miss to the search
+    served by the current thread, if it is being recorded.
+    """
+    record = _SEARCH_RECORDS.get(get_ident())
+    if record is not None:
+        if hit:
+            record['cache_hits'] += 1
+        else:
+            record['cache_misses'] += 1
+
+def _get_bucket(seconds):
+    """Return the index of the histogram bucket of SECONDS."""
+    milliseconds = seconds * 1000
+    for bucket, upper_bound in enumerate(CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS):
+        if milliseconds <= upper_bound:
+            return bucket
+    return len(CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS)
+
+def stop_search_instrumentation(dummy_data=None):
+    """
+    Stop recording the search served by the current thread, aggregate
+    it into the histograms and dump them if
+    L{CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL} seconds passed since
+    the last dump.
+
+    @return: the record of the search, or None.
+    @rtype: dict
+    """
+    record = _SEARCH_RECORDS.pop(get_ident(), None)
+    if record is None:
+        return None
+    record['stages']['total'] = time.time() - record['start']
+    query_profile = get_query_profile()
+    if query_profile:
+        record['db_queries'] = query_profile['count'] - record['db_queries']
+    else:
+        record['db_queries'] = 0
+    histograms = _SEARCH_HISTOGRAMS
+    histograms['searches'] += 1
+    histograms['cache_hits'] += record['cache_hits']
+    histograms['cache_misses'] += record['cache_misses']
+    histograms['db_queries'] += record['db_queries']
+    for stage, seconds in record['stages'].iteritems():
+        histograms['stages'][stage][_get_bucket(seconds)] += 1
+    if time.time() - histograms['since'] >= \
+            CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL:
+        dump_search_instrumentation()
+    return record
+
+def get_histogram_percentile(histogram, percentile):
+    """
+    @return: the upper bound, in milliseconds, of the bucket of
+        HISTOGRAM containing its PERCENTILE (e.g. 99), None for the last
+        (unbounded) bucket, or 0 if the histogram is empty.
+    """
+    total = sum(histogram)
+    if not total:
+        return 0
+    threshold = total * percentile / 100.0
+    count = 0
+    for bucket, bucket_count in enumerate(histogram):
+        count += bucket_count
+        if count >= threshold:
+            break
+    if bucket < len(CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS):
+        return CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS[bucket]
+    return None
+
+def format_search_instrumentation(histograms=None):
+    """
+    @return: a textual report of HISTOGRAMS (by default, the ones
+        aggregated since the last dump).
+    @rtype: string
+    """
+    if histograms is None:
+        histograms = _SEARCH_HISTOGRAMS
+    searches = histograms['searches']
+    out = "%s searches since %s, %s results cache hits, %s misses, %.1f SQL queries per search\n" % \
+        (searches, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(histograms['since'])),
+         histograms['cache_hits'], histograms['cache_misses'],
+         searches and float(histograms['db_queries']) / searches or 0)
+    out += "%-24s %8s %8s %8s %8s  %s\n" % ('stage', 'count', 'p50', 'p90',
+        'p99', ' '.join(['<=%s' % bound for bound in CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS] + ['more']))
+    for stage in CFG_WEBSEARCH_INSTRUMENTED_STAGES:
+        histogram = histograms['stages'][stage]
+        percentiles = []
+        for percentile in (50, 90, 99):
+            value = get_histogram_percentile(histogram, percentile)
+            if value is None:
+                percentiles.append('more')
+            else:
+                percentiles.append('%sms' % value)
+        out += "%-24s %8s %8s %8s %8s  %s\n" % tuple([stage, sum(histogram)] +
+            percentiles + [' '.join([str(count) for count in histogram])])
+    return out
+
+def dump_search_instrumentation():
+    """
+    Append the report of the histograms aggregated since the last dump
+    to prefix/var/log/search_instrumentation.log and reset them.
+    """
+    global _SEARCH_HISTOGRAMS
+    histograms = _SEARCH_HISTOGRAMS
+    _SEARCH_HISTOGRAMS = _new_histograms()
+    if not histograms['searches']:
+        return
+    try:
+        log_file = open(CFG_LOGDIR + '/search_instrumentation.log', 'a')
+        log_file.write(format_search_instrumentation(histograms) + '\n')
+        log_file.close()
+    except IOError:
+        pass
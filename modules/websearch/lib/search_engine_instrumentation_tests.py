@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the search pipeline instrumentation."""
+
+__revision__ = "$Id$"
+
+import unittest
+
+from invenio import search_engine_instrumentation
+from invenio.search_engine_instrumentation import get_histogram_percentile, \
+     format_search_instrumentation, record_search_stage, \
+     stop_search_instrumentation, CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS, \
+     CFG_WEBSEARCH_INSTRUMENTED_STAGES
+from invenio.testutils import make_test_suite, run_test_suite
+
+class _FakeReq:
+    """Request object only registering its cleanups."""
+    def __init__(self):
+        self.cleanups = []
+    def register_cleanup(self, callback, data=None):
+        self.cleanups.append((callback, data))
+
+class SearchInstrumentationTest(unittest.TestCase):
+    """Test the search pipeline instrumentation."""
+
+    def test_histogram_percentile(self):
+        """search engine instrumentation - histogram percentiles"""
+        histogram = [0] * (len(CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS) + 1)
+        self.assertEqual(get_histogram_percentile(histogram, 99), 0)
+        histogram[0] = 98
+        histogram[3] = 1
+        histogram[-1] = 1
+        self.assertEqual(get_histogram_percentile(histogram, 50), CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS[0])
+        self.assertEqual(get_histogram_percentile(histogram, 99), CFG_WEBSEARCH_INSTRUMENTATION_BUCKETS[3])
+        self.assertEqual(get_histogram_percentile(histogram, 100), None)
+
+    def test_record_search(self):
+        """search engine instrumentation - recording of a search"""
+        old_interval = search_engine_instrumentation.CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL
+        search_engine_instrumentation.CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL = 3600
+        try:
+            req = _FakeReq()
+            search_engine_instrumentation.start_search_instrumentation(req)
+            self.assertEqual(len(req.cleanups), 1)
+            record_search_stage('parsing', 0)
+            search_engine_instrumentation.record_search_cache(True)
+            record = stop_search_instrumentation()
+            self.failUnless(record['stages']['parsing'] > 0)
+            self.assertEqual(record['cache_hits'], 1)
+            self.assertEqual(stop_search_instrumentation(), None)
+            report = format_search_instrumentation()
+            for stage in CFG_WEBSEARCH_INSTRUMENTED_STAGES:
+                self.failUnless(stage in report)
+        finally:
+            search_engine_instrumentation.CFG_WEBSEARCH_INSTRUMENTATION_DUMP_INTERVAL = old_interval
+
+TEST_SUITE = make_test_suite(SearchInstrumentationTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -45,7 +45,9 @@ from invenio.urlutils import same_urls_p
 from invenio.search_engine import perform_request_search, \
     guess_primary_collection_of_a_record, guess_collection_of_a_record, \
     collection_restricted_p, get_permitted_restricted_collections, \
-    get_fieldvalues, search_pattern
+    get_fieldvalues, search_pattern, get_collection_reclist, \
+    get_records_user_can_view, check_user_can_view_record
+from invenio.intbitset import intbitset as HitSet
 
 def parse_url(url):
     parts = urlparse.urlparse(url)
@@ -1047,6 +1049,20 @@ class WebSearchRestrictedCollectionTest(unittest.TestCase):
         self.assertEqual(get_permitted_restricted_collections(collect_user_info(get_uid_from_email('jekyll@cds.cern.ch'))), ['Theses'])
         self.assertEqual(get_permitted_restricted_collections(collect_user_info(get_uid_from_email('hyde@cds.cern.ch'))), [])
 
+    def test_get_records_user_can_view(self):
+        """websearch - get_records_user_can_view"""
+        from invenio.webuser import get_uid_from_email, collect_user_info
+        theses = get_collection_reclist('Theses')
+        self.failUnless(theses)
+        jekyll = collect_user_info(get_uid_from_email('jekyll@cds.cern.ch'))
+        hyde = collect_user_info(get_uid_from_email('hyde@cds.cern.ch'))
+        self.assertEqual(theses - get_records_user_can_view(jekyll), HitSet())
+        self.assertEqual(theses & get_records_user_can_view(hyde), HitSet())
+        self.failUnless(get_collection_reclist(CFG_SITE_NAME) - get_records_user_can_view(hyde) == HitSet())
+        for recid in theses:
+            self.assertEqual(check_user_can_view_record(jekyll, recid)[0], 0)
+            self.failUnless(check_user_can_view_record(hyde, recid)[0] > 0)
+
 class WebSearchRestrictedPicturesTest(unittest.TestCase):
     """
     Check whether restricted pictures on the demo site can be accessed
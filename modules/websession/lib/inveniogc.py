@@ -37,6 +37,7 @@ try:
     from invenio.access_control_mailcookie import mail_cookie_gc
     from invenio.bibdocfile import BibDoc
     from invenio.bibsched import gc_tasks
+    from invenio.session import get_session_storage, SQLSessionStorage
 except ImportError, e:
     print "Error: %s" % (e, )
     sys.exit(1)
@@ -289,16 +290,25 @@ def guest_user_garbage_collector():
 
 
     # 1b - DELETE GUEST USERS WITHOUT SESSION
-    write_message("- deleting guest users without session")
-
-    # get uids
-    write_message("""  SELECT u.id\n  FROM user AS u LEFT JOIN session AS s\n  ON u.id = s.uid\n  WHERE s.uid IS NULL AND u.email = ''""", verbose=9)
-
-    result = run_sql("""SELECT u.id
-    FROM user AS u LEFT JOIN session AS s
-    ON u.id = s.uid
-    WHERE s.uid IS NULL AND u.email = ''""")
-    write_message(result, verbose=9)
+    if isinstance(get_session_storage(), SQLSessionStorage):
+        write_message("- deleting guest users without session")
+
+        # get uids
+        write_message("""  SELECT u.id\n  FROM user AS u LEFT JOIN session AS s\n  ON u.id = s.uid\n  WHERE s.uid IS NULL AND u.email = ''""", verbose=9)
+
+        result = run_sql("""SELECT u.id
+        FROM user AS u LEFT JOIN session AS s
+        ON u.id = s.uid
+        WHERE s.uid IS NULL AND u.email = ''""")
+        write_message(result, verbose=9)
+    else:
+        # The session table is not used, hence it can not tell which
+        # guest users still have a session.
+        write_message("- expiring the sessions of the session storage")
+        get_session_storage().cleanup()
+        write_message("- not deleting guest users: the sessions are not "
+                      "stored in the database")
+        result = ()
 
     if result:
         # work on slices of result list in case of big result
@@ -27,22 +27,33 @@ interface, which will let you store permanent information).
 from invenio.webinterface_handler_wsgi_utils import add_cookie, Cookie, get_cookie
 
 import cPickle
+import marshal
 import time
 import random
 import re
 import sys
 import os
+import tempfile
 if sys.hexversion < 0x2060000:
     from md5 import md5
 else:
     from hashlib import md5
 
+try:
+    import memcache
+    CFG_HAS_MEMCACHE = True
+except ImportError:
+    CFG_HAS_MEMCACHE = False
+
 from invenio.dbquery import run_sql, blob_to_string
 from invenio.config import CFG_WEBSESSION_EXPIRY_LIMIT_REMEMBER, \
-    CFG_WEBSESSION_EXPIRY_LIMIT_DEFAULT
+    CFG_WEBSESSION_EXPIRY_LIMIT_DEFAULT, \
+    CFG_WEBSESSION_STORAGE, \
+    CFG_WEBSESSION_STORAGE_MEMCACHED_SERVERS, \
+    CFG_TMPSHAREDDIR
 from invenio.websession_config import CFG_WEBSESSION_COOKIE_NAME, \
     CFG_WEBSESSION_ONE_DAY, CFG_WEBSESSION_CLEANUP_CHANCE, \
-    CFG_WEBSESSION_ENABLE_LOCKING
+    CFG_WEBSESSION_ENABLE_LOCKING, CFG_WEBSESSION_ACCESS_REFRESH_INTERVAL
 
 def get_session(req, sid=None):
     """
@@ -67,9 +78,283 @@ def get_session(req, sid=None):
         req._session = InvenioSession(req, sid)
     return req._session
 
+def get_session_uid(sid):
+    """
+    Retrieve the user identifier stored in the session C{sid}, without
+    performing any of the checks done when loading the session of the
+    current request (e.g. IP verification).
+
+    @param sid: the session identifier.
+    @type sid: 32 hexadecimal string
+    @return: the user identifier or None if the session does not exist.
+    @rtype: int
+    """
+    if not _check_sid(sid):
+        return None
+    return get_session_storage().get_uid(sid)
+
+def serialize_session(session_dict):
+    """
+    Serialize a session dictionary.
+
+    The C{marshal} format is used whenever the session only contains
+    builtin types, as it is much faster to produce and to parse than
+    C{cPickle}. Sessions holding other objects fall back to C{cPickle}.
+
+    @param session_dict: the session dictionary.
+    @type session_dict: dict
+    @return: the serialized session.
+    @rtype: string
+    """
+    try:
+        return marshal.dumps(session_dict)
+    except ValueError:
+        return cPickle.dumps(session_dict, -1)
+
+def deserialize_session(session_object):
+    """
+    Deserialize a session produced by L{serialize_session} (or by the
+    previous C{cPickle} only implementation).
+
+    @param session_object: the serialized session.
+    @type session_object: string
+    @return: the session dictionary.
+    @rtype: dict
+    """
+    if session_object[:1] == '{':
+        ## A marshalled dictionary, whereas pickles of protocol 2
+        ## start with '\x80' and older ones with '('.
+        return marshal.loads(session_object)
+    return cPickle.loads(session_object)
+
+class SQLSessionStorage:
+    """
+    Store sessions in the C{session} table of the database.
+    """
+
+    def load(self, sid):
+        """
+        @return: the serialized session C{sid} or None.
+        @rtype: string
+        """
+        res = run_sql("SELECT session_object FROM session "
+                        "WHERE session_key=%s", (sid, ), primary=True)
+        if res:
+            return blob_to_string(res[0][0])
+        return None
+
+    def store(self, sid, session_object, session_expiry, uid):
+        """
+        Store the serialized session C{sid}.
+        """
+        run_sql("""
+            INSERT session(
+                session_key,
+                session_expiry,
+                session_object,
+                uid
+            ) VALUE(%s,
+                %s,
+                %s,
+                %s
+            ) ON DUPLICATE KEY UPDATE
+                session_expiry=%s,
+                session_object=%s,
+                uid=%s
+        """, (sid, session_expiry, session_object, uid,
+            session_expiry, session_object, uid))
+
+    def delete(self, sid):
+        """
+        Delete the session C{sid}.
+        """
+        run_sql("DELETE FROM session WHERE session_key=%s", (sid, ))
+
+    def get_uid(self, sid):
+        """
+        @return: the user identifier of the session C{sid} or None.
+        @rtype: int
+        """
+        res = run_sql("SELECT uid FROM session WHERE session_key=%s", (sid, ))
+        if res:
+            return res[0][0]
+        return None
+
+    def cleanup(self):
+        """
+        Delete the expired sessions.
+        """
+        run_sql("""
+            DELETE FROM session
+            WHERE session_expiry<=UNIX_TIMESTAMP()
+        """)
+
+class FileSessionStorage:
+    """
+    Store sessions as files in a local (or shared) directory.
+
+    Every session is written in its own file, whose modification time
+    is set to the session expiry.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(CFG_TMPSHAREDDIR, 'sessions')
+        self.path = path
+
+    def _get_filename(self, sid):
+        """
+        @return: the file storing the session C{sid}.
+        @rtype: string
+        """
+        return os.path.join(self.path, sid[:2], sid)
+
+    def load(self, sid):
+        """
+        @return: the serialized session C{sid} or None.
+        @rtype: string
+        """
+        filename = self._get_filename(sid)
+        try:
+            if os.stat(filename).st_mtime <= time.time():
+                return None
+            session_file = open(filename, 'rb')
+            try:
+                return session_file.read()
+            finally:
+                session_file.close()
+        except (IOError, OSError):
+            return None
+
+    def store(self, sid, session_object, session_expiry, dummy_uid):
+        """
+        Store the serialized session C{sid}.
+        """
+        filename = self._get_filename(sid)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                ## Concurrently created by another process.
+                pass
+        fd, tmpname = tempfile.mkstemp(prefix=sid, dir=dirname)
+        try:
+            os.write(fd, session_object)
+        finally:
+            os.close(fd)
+        os.utime(tmpname, (session_expiry, session_expiry))
+        os.rename(tmpname, filename)
+
+    def delete(self, sid):
+        """
+        Delete the session C{sid}.
+        """
+        try:
+            os.remove(self._get_filename(sid))
+        except OSError:
+            pass
+
+    def get_uid(self, sid):
+        """
+        @return: the user identifier of the session C{sid} or None.
+        @rtype: int
+        """
+        session_object = self.load(sid)
+        if session_object:
+            return deserialize_session(session_object)['_data'].get('uid')
+        return None
+
+    def cleanup(self):
+        """
+        Delete the expired sessions.
+        """
+        now = time.time()
+        for dirpath, dummy_dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                filename = os.path.join(dirpath, filename)
+                try:
+                    if os.stat(filename).st_mtime <= now:
+                        os.remove(filename)
+                except OSError:
+                    pass
+
+class MemcachedSessionStorage:
+    """
+    Store sessions in memcached, which takes care of their expiry.
+
+    @param client: an object implementing the C{get}, C{set} and
+        C{delete} methods of C{memcache.Client}, to be used instead of
+        connecting to L{CFG_WEBSESSION_STORAGE_MEMCACHED_SERVERS}.
+    """
+
+    key_prefix = 'invenio_session_'
+
+    def __init__(self, client=None):
+        if client is None:
+            client = memcache.Client([server.strip() for server in
+                CFG_WEBSESSION_STORAGE_MEMCACHED_SERVERS.split(',')
+                if server.strip()])
+        self.client = client
+
+    def load(self, sid):
+        """
+        @return: the serialized session C{sid} or None.
+        @rtype: string
+        """
+        return self.client.get(self.key_prefix + sid)
+
+    def store(self, sid, session_object, session_expiry, dummy_uid):
+        """
+        Store the serialized session C{sid}.
+        """
+        ## memcached interprets expiry times longer than 30 days as
+        ## absolute UNIX timestamps.
+        self.client.set(self.key_prefix + sid, session_object,
+            int(session_expiry))
+
+    def delete(self, sid):
+        """
+        Delete the session C{sid}.
+        """
+        self.client.delete(self.key_prefix + sid)
+
+    def get_uid(self, sid):
+        """
+        @return: the user identifier of the session C{sid} or None.
+        @rtype: int
+        """
+        session_object = self.load(sid)
+        if session_object:
+            return deserialize_session(session_object)['_data'].get('uid')
+        return None
+
+    def cleanup(self):
+        """
+        Nothing to do: memcached evicts expired sessions by itself.
+        """
+        pass
+
+_SESSION_STORAGE = []
+def get_session_storage():
+    """
+    @return: the session storage configured in L{CFG_WEBSESSION_STORAGE}.
+    @rtype: L{SQLSessionStorage}, L{FileSessionStorage} or
+        L{MemcachedSessionStorage}
+    """
+    if not _SESSION_STORAGE:
+        if CFG_WEBSESSION_STORAGE == 'file':
+            _SESSION_STORAGE.append(FileSessionStorage())
+        elif CFG_WEBSESSION_STORAGE == 'memcached' and CFG_HAS_MEMCACHE:
+            _SESSION_STORAGE.append(MemcachedSessionStorage())
+        else:
+            _SESSION_STORAGE.append(SQLSessionStorage())
+    return _SESSION_STORAGE[0]
+
 class InvenioSession(dict):
     """
-    This class implements a Session handling based on MySQL.
+    This class implements a Session handling based on MySQL, or on any
+    other storage returned by L{get_session_storage}.
 
     @param req: the mod_python request object.
     @type req: mod_python request object
@@ -83,6 +368,10 @@ class InvenioSession(dict):
         implementation.
     @note: This class implements IP verification to prevent basic cookie
         stealing.
+    @note: The session is written to the storage only when its content
+        changed since it was loaded (or when its last access time needs to
+        be refreshed), and new guest sessions not holding any data are not
+        stored at all.
     @raise ValueError: if C{sid} is provided and correspond to a broken
         session.
     """
@@ -99,6 +388,10 @@ class InvenioSession(dict):
         self._invalid = 0
         self._http_ip = None
         self._https_ip = None
+        self._storage = get_session_storage()
+        self._stored = False
+        self._stored_accessed = 0
+        self._stored_object = None
 
         dict.__init__(self)
 
@@ -174,10 +467,9 @@ class InvenioSession(dict):
         """
         session_dict = None
         invalid = False
-        res = run_sql("SELECT session_object FROM session "
-                        "WHERE session_key=%s", (self._sid, ))
-        if res:
-            session_dict = cPickle.loads(blob_to_string(res[0][0]))
+        session_object = self._storage.load(self._sid)
+        if session_object:
+            session_dict = deserialize_session(session_object)
             remote_ip = self._req.remote_ip
             if self._req.is_https():
                 if session_dict['_https_ip'] is not None and \
@@ -207,48 +499,66 @@ class InvenioSession(dict):
         self._timeout  = session_dict["_timeout"]
         self._remember_me = session_dict["_remember_me"]
         self.update(session_dict["_data"])
+        self._stored = True
+        self._stored_accessed = self._accessed
+        self._stored_object = self._serialize(self._stored_accessed)
         return 1
 
+    def _serialize(self, accessed):
+        """
+        @param accessed: the last access time to be recorded.
+        @type accessed: double
+        @return: the serialized session.
+        @rtype: string
+        """
+        return serialize_session({"_data" : self.copy(),
+                "_created" : self._created,
+                "_accessed": accessed,
+                "_timeout" : self._timeout,
+                "_http_ip" : self._http_ip,
+                "_https_ip" : self._https_ip,
+                "_remember_me" : self._remember_me
+        })
+
+    def _empty_guest_p(self):
+        """
+        @return: True if this is a guest session not holding any data
+            worth storing.
+        @rtype: bool
+        """
+        return not self._remember_me and self.get('uid', -1) <= 0 and \
+            not [key for key in self if key != 'uid']
+
     def save(self):
         """
-        Save the session to the database.
-        """
-        if not self._invalid:
-            session_dict = {"_data" : self.copy(),
-                    "_created" : self._created,
-                    "_accessed": self._accessed,
-                    "_timeout" : self._timeout,
-                    "_http_ip" : self._http_ip,
-                    "_https_ip" : self._https_ip,
-                    "_remember_me" : self._remember_me
-            }
-            session_key = self._sid
-            session_object = cPickle.dumps(session_dict, -1)
-            session_expiry = time.time() + self._timeout + \
-                CFG_WEBSESSION_ONE_DAY
-            uid = self.get('uid', -1)
-            run_sql("""
-                INSERT session(
-                    session_key,
-                    session_expiry,
-                    session_object,
-                    uid
-                ) VALUE(%s,
-                    %s,
-                    %s,
-                    %s
-                ) ON DUPLICATE KEY UPDATE
-                    session_expiry=%s,
-                    session_object=%s,
-                    uid=%s
-            """, (session_key, session_expiry, session_object, uid,
-                session_expiry, session_object, uid))
+        Save the session to the storage, if needed.
+        """
+        if self._invalid:
+            return
+        if not self._stored and self._empty_guest_p():
+            ## Lazily store guest sessions only once they hold data.
+            return
+        if self._stored and \
+                time.time() - self._stored_accessed < \
+                CFG_WEBSESSION_ACCESS_REFRESH_INTERVAL and \
+                self._serialize(self._stored_accessed) == self._stored_object:
+            ## Nothing changed.
+            return
+        session_object = self._serialize(self._accessed)
+        session_expiry = time.time() + self._timeout + \
+            CFG_WEBSESSION_ONE_DAY
+        self._storage.store(self._sid, session_object, session_expiry,
+            self.get('uid', -1))
+        self._stored = True
+        self._stored_accessed = self._accessed
+        self._stored_object = session_object
 
     def delete(self):
         """
         Delete the session.
         """
-        run_sql("DELETE FROM session WHERE session_key=%s", (self._sid, ))
+        self._storage.delete(self._sid)
+        self._stored = False
         self.clear()
 
     def invalidate(self):
@@ -361,19 +671,16 @@ class InvenioSession(dict):
 
     def cleanup(self):
         """
-        Perform the database session cleanup.
+        Perform the session storage cleanup.
         """
-        def session_cleanup():
+        def session_cleanup(dummy_data=None):
             """
             Session cleanup procedure which to be executed at the end
             of the request handling.
             """
-            run_sql("""
-                DELETE FROM session
-                WHERE session_expiry<=UNIX_TIMESTAMP()
-            """)
+            self._storage.cleanup()
         self._req.register_cleanup(session_cleanup)
-        self._req.log_error("InvenioSession: registered database cleanup.")
+        self._req.log_error("InvenioSession: registered storage cleanup.")
 
     def __del__(self):
         self.unlock()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+##
+## This file is part of Invenio.
+## Copyright (C) 2011 CERN.
+##
+## Invenio is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 2 of the
+## License, or (at your option) any later version.
+##
+## Invenio is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with Invenio; if not, write to the Free Software Foundation, Inc.,
+## 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the session handling library."""
+
+__revision__ = "$Id$"
+
+import unittest
+import shutil
+import tempfile
+import time
+
+from invenio import session
+from invenio.session import serialize_session, deserialize_session, \
+    FileSessionStorage, MemcachedSessionStorage, InvenioSession
+from invenio.websession_config import CFG_WEBSESSION_COOKIE_NAME
+from invenio.testutils import make_test_suite, run_test_suite
+
+class _MemcachedStandIn:
+    """Local stand-in for a memcache.Client."""
+    def __init__(self):
+        self.values = {}
+    def get(self, key):
+        return self.values.get(key)
+    def set(self, key, value, expiry=0):
+        self.values[key] = value
+    def delete(self, key):
+        self.values.pop(key, None)
+
+class _RequestStandIn:
+    """Local stand-in for the request of a session."""
+    def __init__(self, sid=None):
+        self.remote_ip = '127.0.0.1'
+        self.headers_in = {}
+        if sid:
+            self.headers_in['cookie'] = '%s=%s' % \
+                (CFG_WEBSESSION_COOKIE_NAME, sid)
+        self.headers_out = _HeadersStandIn()
+    def is_https(self):
+        return False
+    def register_cleanup(self, callback, data=None):
+        pass
+    def log_error(self, message):
+        pass
+
+class _HeadersStandIn(dict):
+    """Local stand-in for the outgoing headers of a request."""
+    def add(self, key, value):
+        self.setdefault(key, []).append(value)
+
+class _RecordingStorage(FileSessionStorage):
+    """File session storage counting the sessions it stores."""
+    def __init__(self, path):
+        FileSessionStorage.__init__(self, path)
+        self.stored = 0
+    def store(self, sid, session_object, session_expiry, uid):
+        self.stored += 1
+        FileSessionStorage.store(self, sid, session_object, session_expiry,
+            uid)
+
+class SessionSerializationTest(unittest.TestCase):
+    """Test the session serialization."""
+
+    def test_serialize_builtin_types(self):
+        """session - serialization of builtin types"""
+        session_dict = {'_data': {'uid': 5, 'foo': [1, 'bar', None]},
+            '_remember_me': False}
+        session_object = serialize_session(session_dict)
+        self.assertEqual(session_object[:1], '{')
+        self.assertEqual(deserialize_session(session_object), session_dict)
+
+    def test_serialize_other_objects(self):
+        """session - serialization falling back to cPickle"""
+        session_dict = {'_data': {'uid': 5, 'foo': SessionSerializationTest}}
+        session_object = serialize_session(session_dict)
+        self.assertNotEqual(session_object[:1], '{')
+        self.assertEqual(deserialize_session(session_object), session_dict)
+
+class SessionStorageTest(unittest.TestCase):
+    """Test the session storages."""
+
+    sid = '0123456789abcdef0123456789abcdef'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _check_storage(self, storage):
+        """Store, load and delete a session in storage."""
+        session_object = serialize_session({'_data': {'uid': 7}})
+        self.assertEqual(storage.load(self.sid), None)
+        storage.store(self.sid, session_object, time.time() + 60, 7)
+        self.assertEqual(storage.load(self.sid), session_object)
+        self.assertEqual(storage.get_uid(self.sid), 7)
+        storage.delete(self.sid)
+        self.assertEqual(storage.load(self.sid), None)
+
+    def test_file_storage(self):
+        """session - file storage"""
+        self._check_storage(FileSessionStorage(self.path))
+
+    def test_file_storage_expiry(self):
+        """session - file storage of expired sessions"""
+        storage = FileSessionStorage(self.path)
+        storage.store(self.sid, serialize_session({'_data': {}}),
+            time.time() - 1, -1)
+        self.assertEqual(storage.load(self.sid), None)
+        storage.cleanup()
+        self.assertEqual(storage.get_uid(self.sid), None)
+
+    def test_memcached_storage(self):
+        """session - memcached storage"""
+        self._check_storage(MemcachedSessionStorage(_MemcachedStandIn()))
+
+class SessionSaveTest(unittest.TestCase):
+    """Test when sessions are written to the storage."""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.storage = _RecordingStorage(self.path)
+        self.original_storage = session._SESSION_STORAGE[:]
+        session._SESSION_STORAGE[:] = [self.storage]
+
+    def tearDown(self):
+        session._SESSION_STORAGE[:] = self.original_storage
+        shutil.rmtree(self.path)
+
+    def test_lazy_guest_session(self):
+        """session - guest sessions stored only once holding data"""
+        guest_session = InvenioSession(_RequestStandIn())
+        guest_session['uid'] = -1
+        guest_session.save()
+        self.assertEqual(self.storage.stored, 0)
+        self.assertEqual(self.storage.load(guest_session.sid()), None)
+        guest_session['basket'] = [1, 2]
+        guest_session.save()
+        self.assertEqual(self.storage.stored, 1)
+        self.assertNotEqual(self.storage.load(guest_session.sid()), None)
+
+    def test_unchanged_session_not_stored(self):
+        """session - unchanged sessions not written back"""
+        user_session = InvenioSession(_RequestStandIn())
+        user_session['uid'] = 5
+        user_session.save()
+        self.assertEqual(self.storage.stored, 1)
+        loaded_session = InvenioSession(_RequestStandIn(user_session.sid()))
+        self.failIf(loaded_session.is_new())
+        self.assertEqual(loaded_session['uid'], 5)
+        loaded_session.save()
+        self.assertEqual(self.storage.stored, 1)
+        loaded_session['uid'] = 6
+        loaded_session.save()
+        self.assertEqual(self.storage.stored, 2)
+        loaded_session.save()
+        self.assertEqual(self.storage.stored, 2)
+
+TEST_SUITE = make_test_suite(SessionSerializationTest, SessionStorageTest,
+                             SessionSaveTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
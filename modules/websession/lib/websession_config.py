@@ -71,6 +71,7 @@ CFG_WEBSESSION_INFO_MESSAGES = {"GROUP_CREATED": 'You have successfully created
 CFG_WEBSESSION_COOKIE_NAME = "INVENIOSESSION"
 CFG_WEBSESSION_ONE_DAY = 86400 #: how many seconds are there in one day
 CFG_WEBSESSION_CLEANUP_CHANCE = 10000 #: cleanups have 1 in CLEANUP_CHANCE chance
+CFG_WEBSESSION_ACCESS_REFRESH_INTERVAL = 3600 #: how many seconds an unchanged session is not rewritten for
 
 ## FIXME: Session locking is currently disabled because, since it's
 ## implementing the mod_python technique of using Apache mutexes, these
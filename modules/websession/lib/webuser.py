@@ -44,6 +44,7 @@ import smtplib
 import re
 import random
 import datetime
+import time
 import base64
 
 from invenio.config import \
@@ -74,7 +75,8 @@ except ImportError:
     pass
 from invenio.dbquery import run_sql, OperationalError, \
     serialize_via_marshal, deserialize_via_marshal
-from invenio.access_control_admin import acc_get_role_id, acc_get_action_roles, acc_get_action_id, acc_is_user_in_role, acc_find_possible_activities
+from invenio.access_control_admin import acc_get_role_id, acc_get_action_roles, acc_get_action_id, acc_is_user_in_role, acc_find_possible_activities, \
+    acc_get_user_roles_stamp
 from invenio.access_control_mailcookie import mail_cookie_create_mail_activation
 from invenio.access_control_firerole import acc_firerole_check_user, load_role_definition
 from invenio.access_control_config import SUPERADMINROLE, CFG_EXTERNAL_AUTH_USING_SSO
@@ -232,12 +234,14 @@ def setUid(req, uid, remember_me=False):
         del req._user_info
     session = get_session(req)
     session['uid'] = uid
+    if 'precached_user_info' in session:
+        del session['precached_user_info']
     if remember_me:
         session.set_timeout(86400)
         session.set_remember_me()
     if uid > 0:
         user_info = collect_user_info(req, login_time=True)
-        session['user_info'] = user_info
+        session['user_info'] = user_info.get_persistent_info()
         req._user_info = user_info
     else:
         del session['user_info']
@@ -1052,18 +1056,162 @@ def get_preferred_user_language(req):
 
     return new_lang
 
+#: precached_* user_info keys granted by the authorization of an action.
+_PRECACHED_ACTIONS = {
+    'precached_usebaskets' : 'usebaskets',
+    'precached_useloans' : 'useloans',
+    'precached_usegroups' : 'usegroups',
+    'precached_usealerts' : 'usealerts',
+    'precached_usemessages' : 'usemessages',
+    'precached_usestats' : 'runwebstatadmin',
+}
+
+#: all the precached_* user_info keys, with their value for users who are
+#: not entitled to them.
+PRECACHED_USER_INFO_DEFAULTS = {
+    'precached_permitted_restricted_collections' : [],
+    'precached_usebaskets' : False,
+    'precached_useloans' : False,
+    'precached_usegroups' : False,
+    'precached_usealerts' : False,
+    'precached_usemessages' : False,
+    'precached_viewsubmissions' : False,
+    'precached_useapprove' : False,
+    'precached_useadmin' : False,
+    'precached_usestats' : False,
+    'precached_viewclaimlink' : False,
+    'precached_usepaperclaim' : False,
+    'precached_usepaperattribution' : False,
+}
+
+## precached_* keys depending on the session content rather than on the
+## roles of the user, hence not persisted in the session.
+_PRECACHED_VOLATILE_KEYS = ('precached_viewclaimlink', )
+
+def _compute_precached_user_info(user_info, key):
+    """Compute the value of the precached_* KEY of USER_INFO."""
+    from invenio.access_control_engine import acc_authorize_action
+    from invenio.search_engine import get_permitted_restricted_collections
+    guest = user_info.get('guest', '1') == '1'
+    if key in ('precached_usepaperattribution', 'precached_viewclaimlink'):
+        if guest and not CFG_INSPIRE_SITE or not CFG_BIBAUTHORID_ENABLED:
+            return False
+        if not acc_is_user_in_role(user_info, acc_get_role_id("paperattributionviewers")):
+            return False
+        if key == 'precached_usepaperattribution':
+            return True
+        return user_info.claim_in_process_p()
+    if guest:
+        return PRECACHED_USER_INFO_DEFAULTS[key]
+    if key == 'precached_permitted_restricted_collections':
+        if CFG_WEBSEARCH_PERMITTED_RESTRICTED_COLLECTIONS_LEVEL > 0:
+            return get_permitted_restricted_collections(user_info)
+        return []
+    if key in _PRECACHED_ACTIONS:
+        return acc_authorize_action(user_info, _PRECACHED_ACTIONS[key])[0] == 0
+    if key == 'precached_viewsubmissions':
+        return isUserSubmitter(user_info)
+    if key == 'precached_useapprove':
+        return isUserReferee(user_info)
+    if key == 'precached_useadmin':
+        return isUserAdmin(user_info)
+    if key == 'precached_usepaperclaim':
+        return bool(CFG_BIBAUTHORID_ENABLED and
+            acc_is_user_in_role(user_info, acc_get_role_id("paperclaimviewers")))
+    raise KeyError(key)
+
+class UserInfo(dict):
+    """
+    The user_info dictionary built by L{collect_user_info}.
+
+    The precached_* permissions are computed only when first accessed.
+    For logged-in users of a web request they are also persisted in the
+    session together with a stamp of the roles of the user (see
+    L{acc_get_user_roles_stamp}), so that the following requests reuse
+    them for as long as the stamp does not change.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.req = None
+        self._save_registered = False
+
+    def __getitem__(self, key):
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            if key in PRECACHED_USER_INFO_DEFAULTS:
+                return self._precache(key)
+            raise
+
+    def get(self, key, default=None):
+        if key in PRECACHED_USER_INFO_DEFAULTS:
+            return self[key]
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key in PRECACHED_USER_INFO_DEFAULTS or \
+            dict.__contains__(self, key)
+
+    has_key = __contains__
+
+    def get_persistent_info(self):
+        """Return a plain dictionary with the user information which is
+        not precached."""
+        return dict([(key, value) for (key, value) in self.iteritems()
+            if key not in PRECACHED_USER_INFO_DEFAULTS])
+
+    def claim_in_process_p(self):
+        """Return True if the user is in the middle of claiming papers."""
+        if self.req is None:
+            return False
+        try:
+            return get_session(self.req)['personinfo']['claim_in_process']
+        except (KeyError, TypeError):
+            return False
+
+    def _precache(self, key):
+        """Compute (or retrieve from the session) the precached_* KEY."""
+        session = None
+        if self.req is not None and dict.get(self, 'guest') == '0' and \
+                key not in _PRECACHED_VOLATILE_KEYS:
+            session = get_session(self.req)
+            stamp = acc_get_user_roles_stamp(self)
+            stored_stamp, stored_values = session.get('precached_user_info', (None, {}))
+            if stored_stamp == stamp and key in stored_values:
+                dict.update(self, stored_values)
+                return dict.__getitem__(self, key)
+        value = _compute_precached_user_info(self, key)
+        dict.__setitem__(self, key, value)
+        if session is not None and \
+                stamp[0] != time.strftime("%Y-%m-%d %H:%M:%S"):
+            ## (roles modified during this second might not be
+            ## visible yet)
+            if stored_stamp != stamp:
+                stored_values = {}
+            stored_values[key] = value
+            session['precached_user_info'] = (stamp, stored_values)
+            if not self._save_registered:
+                self.req.register_cleanup(_save_session, session)
+                self._save_registered = True
+        return value
+
+def _save_session(session):
+    """Save SESSION at the end of the request handling."""
+    session.save()
+
 def collect_user_info(req, login_time=False, refresh=False):
     """Given the mod_python request object rec or a uid it returns a dictionary
     containing at least the keys uid, nickname, email, groups, plus any external keys in
     the user preferences (collected at login time and built by the different
     external authentication plugins) and if the mod_python request object is
     provided, also the remote_ip, remote_host, referer, agent fields.
+    The precached_* keys are computed lazily (see L{UserInfo}).
     NOTE: if req is a mod_python request object, the user_info dictionary
     is saved into req._user_info (for caching purpouses)
     setApacheUser & setUid will properly reset it.
     """
-    from invenio.search_engine import get_permitted_restricted_collections
-    user_info = {
+    user_info = UserInfo({
         'remote_ip' : '',
         'remote_host' : '',
         'referer' : '',
@@ -1075,20 +1223,7 @@ def collect_user_info(req, login_time=False, refresh=False):
         'group' : [],
         'guest' : '1',
         'session' : None,
-        'precached_permitted_restricted_collections' : [],
-        'precached_usebaskets' : False,
-        'precached_useloans' : False,
-        'precached_usegroups' : False,
-        'precached_usealerts' : False,
-        'precached_usemessages' : False,
-        'precached_viewsubmissions' : False,
-        'precached_useapprove' : False,
-        'precached_useadmin' : False,
-        'precached_usestats' : False,
-        'precached_viewclaimlink' : False,
-        'precached_usepaperclaim' : False,
-        'precached_usepaperattribution' : False,
-    }
+    })
 
     try:
         is_req = False
@@ -1097,7 +1232,10 @@ def collect_user_info(req, login_time=False, refresh=False):
         elif type(req) in (type(1), type(1L)):
             ## req is infact a user identification
             uid = req
-        elif type(req) is dict:
+        elif isinstance(req, UserInfo):
+            ## req is already a complete user_info
+            return req
+        elif isinstance(req, dict):
             ## req is by mistake already a user_info
             try:
                 assert(req.has_key('uid'))
@@ -1112,9 +1250,14 @@ def collect_user_info(req, login_time=False, refresh=False):
             is_req = True
             uid = getUid(req)
             if hasattr(req, '_user_info') and not login_time:
-                user_info = req._user_info
                 if not refresh:
                     return req._user_info
+                ## (precached_* values are recomputed or retrieved from
+                ## the session with an up-to-date stamp)
+                user_info = UserInfo([(key, value) for (key, value)
+                    in req._user_info.items()
+                    if key not in PRECACHED_USER_INFO_DEFAULTS])
+            user_info.req = req
             req._user_info = user_info
             try:
                 user_info['remote_ip'] = req.remote_ip
@@ -1132,36 +1275,6 @@ def collect_user_info(req, login_time=False, refresh=False):
         user_info['group'] = []
         user_info['guest'] = str(isGuestUser(uid))
 
-        if user_info['guest'] == '1' and CFG_INSPIRE_SITE:
-            usepaperattribution = False
-            viewclaimlink = False
-
-            if (CFG_BIBAUTHORID_ENABLED
-                and acc_is_user_in_role(user_info, acc_get_role_id("paperattributionviewers"))):
-                usepaperattribution = True
-
-#            if (CFG_BIBAUTHORID_ENABLED
-#                and usepaperattribution
-#                and acc_is_user_in_role(user_info, acc_get_role_id("paperattributionlinkviewers"))):
-#                viewclaimlink = True
-            if is_req:
-                session = get_session(req)
-                viewlink = False
-                try:
-                    viewlink = session['personinfo']['claim_in_process']
-                except (KeyError, TypeError):
-                    viewlink = False
-            else:
-                viewlink = False
-                
-            if (CFG_BIBAUTHORID_ENABLED
-                and usepaperattribution
-                and viewlink): 
-                    viewclaimlink = True
-
-            user_info['precached_viewclaimlink'] = viewclaimlink
-            user_info['precached_usepaperattribution'] = usepaperattribution
-
         if user_info['guest'] == '0':
             user_info['group'] = [group[1] for group in get_groups(uid)]
             prefs = get_user_preferences(uid)
@@ -1204,55 +1317,6 @@ def collect_user_info(req, login_time=False, refresh=False):
             if prefs:
                 for key, value in prefs.iteritems():
                     user_info[key.lower()] = value
-            if login_time:
-                ## Heavy computational information
-                from invenio.access_control_engine import acc_authorize_action
-                if CFG_WEBSEARCH_PERMITTED_RESTRICTED_COLLECTIONS_LEVEL > 0:
-                    user_info['precached_permitted_restricted_collections'] = get_permitted_restricted_collections(user_info)
-                user_info['precached_usebaskets'] = acc_authorize_action(user_info, 'usebaskets')[0] == 0
-                user_info['precached_useloans'] = acc_authorize_action(user_info, 'useloans')[0] == 0
-                user_info['precached_usegroups'] = acc_authorize_action(user_info, 'usegroups')[0] == 0
-                user_info['precached_usealerts'] = acc_authorize_action(user_info, 'usealerts')[0] == 0
-                user_info['precached_usemessages'] = acc_authorize_action(user_info, 'usemessages')[0] == 0
-                user_info['precached_usestats'] = acc_authorize_action(user_info, 'runwebstatadmin')[0] == 0
-                user_info['precached_viewsubmissions'] = isUserSubmitter(user_info)
-                user_info['precached_useapprove'] = isUserReferee(user_info)
-                user_info['precached_useadmin'] = isUserAdmin(user_info)
-                usepaperclaim = False
-                usepaperattribution = False
-                viewclaimlink = False
-
-                if (CFG_BIBAUTHORID_ENABLED
-                    and acc_is_user_in_role(user_info, acc_get_role_id("paperclaimviewers"))):
-                    usepaperclaim = True
-
-                if (CFG_BIBAUTHORID_ENABLED
-                    and acc_is_user_in_role(user_info, acc_get_role_id("paperattributionviewers"))):
-                    usepaperattribution = True
-                
-                if is_req:
-                    session = get_session(req)
-                    viewlink = False
-                    try:
-                        viewlink = session['personinfo']['claim_in_process']
-                    except (KeyError, TypeError):
-                        viewlink = False
-                else:
-                    viewlink = False
-                    
-                if (CFG_BIBAUTHORID_ENABLED
-                    and usepaperattribution
-                    and viewlink): 
-                        viewclaimlink = True
-
-#                if (CFG_BIBAUTHORID_ENABLED
-#                    and ((usepaperclaim or usepaperattribution)
-#                         and acc_is_user_in_role(user_info, acc_get_role_id("paperattributionlinkviewers")))):
-#                    viewclaimlink = True
-
-                user_info['precached_viewclaimlink'] = viewclaimlink
-                user_info['precached_usepaperclaim'] = usepaperclaim
-                user_info['precached_usepaperattribution'] = usepaperattribution
 
     except Exception, e:
         register_exception()
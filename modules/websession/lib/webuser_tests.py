@@ -41,7 +41,28 @@ class IsUserSuperAdminTests(unittest.TestCase):
         """webuser - isUserSuperAdmin with hyde"""
         self.failIf(webuser.isUserSuperAdmin(webuser.collect_user_info(self.id_hyde)))
 
-TEST_SUITE = make_test_suite(IsUserSuperAdminTests)
+class LazyUserInfoTests(unittest.TestCase):
+    """Test the lazily computed precached_* user_info keys."""
+
+    def test_precached_computed_on_access(self):
+        """webuser - precached permissions computed on first access"""
+        from invenio.access_control_engine import acc_authorize_action
+        id_jekyll = run_sql('SELECT id FROM user WHERE nickname="jekyll"')[0][0]
+        user_info = webuser.collect_user_info(id_jekyll)
+        self.failIf('precached_usebaskets' in user_info.keys())
+        self.failUnless('precached_usebaskets' in user_info)
+        self.assertEqual(user_info['precached_usebaskets'],
+            acc_authorize_action(id_jekyll, 'usebaskets')[0] == 0)
+        self.failUnless('precached_usebaskets' in user_info.keys())
+
+    def test_precached_guest(self):
+        """webuser - precached permissions of guests"""
+        user_info = webuser.collect_user_info(0)
+        self.assertEqual(user_info['precached_useadmin'], False)
+        self.assertEqual(user_info.get('precached_permitted_restricted_collections'), [])
+        self.failIf('precached_useadmin' in user_info.get_persistent_info())
+
+TEST_SUITE = make_test_suite(IsUserSuperAdminTests, LazyUserInfoTests)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -41,6 +41,9 @@ from invenio.webinterface_handler_config import \
 from invenio.config import CFG_WEBDIR, CFG_SITE_LANG, \
     CFG_WEBSTYLE_HTTP_STATUS_ALERT_LIST, CFG_DEVEL_SITE
 from invenio.errorlib import register_exception, get_pretty_traceback
+from invenio.dbquery import start_query_profiling, stop_query_profiling, \
+    get_query_profile, format_query_profile, log_query_profile, \
+    release_connection, enable_read_replicas
 
 ## Static files are usually handled directly by the webserver (e.g. Apache)
 ## However in case WSGI is required to handle static files too (such
@@ -48,6 +51,15 @@ from invenio.errorlib import register_exception, get_pretty_traceback
 ## turned on (it is done automatically by wsgi_handler_test).
 CFG_WSGI_SERVE_STATIC_FILES = False
 
+## Output written with flush=0 is nevertheless sent to the client as soon
+## as this many bytes are buffered, so that the memory used by a request
+## stays bounded.
+CFG_WSGI_OUTPUT_BUFFER_SIZE = 256 * 1024
+
+## Size of the chunks in which files are streamed when they can not be
+## handed to the wsgi.file_wrapper of the WSGI server.
+CFG_WSGI_FILE_CHUNK_SIZE = 64 * 1024
+
 class InputProcessed(object):
     """
     Auxiliary class used when reading input.
@@ -68,7 +80,9 @@ class SimulatedModPythonRequest(object):
         self.__environ = environ
         self.__start_response = start_response
         self.__response_sent_p = False
-        self.__buffer = ''
+        self.__buffer = []
+        self.__buffer_size = 0
+        self.__pending_file = None
         self.__low_level_headers = []
         self.__headers = table(self.__low_level_headers)
         self.__headers.add = self.__headers.add_header
@@ -122,32 +136,98 @@ class SimulatedModPythonRequest(object):
         return self.__low_level_headers
 
     def get_buffer(self):
-        return self.__buffer
+        return ''.join(self.__buffer)
 
     def write(self, string, flush=1):
         if isinstance(string, unicode):
-            self.__buffer += string.encode('utf8')
-        else:
-            self.__buffer += string
-        if flush:
+            string = string.encode('utf8')
+        self.__buffer.append(string)
+        self.__buffer_size += len(string)
+        if flush or self.__buffer_size >= CFG_WSGI_OUTPUT_BUFFER_SIZE:
             self.flush()
 
     def flush(self):
         self.send_http_header()
-        if self.__buffer:
-            self.__bytes_sent += len(self.__buffer)
+        self.__send_pending_file()
+        if self.__buffer_size:
+            self.__send(''.join(self.__buffer))
+        self.__buffer = []
+        self.__buffer_size = 0
+
+    def __send(self, data):
+        """
+        Send DATA through the WSGI write callable.
+        """
+        self.__bytes_sent += len(data)
+        try:
+            if not self.__write_error:
+                self.__write(data)
+        except IOError, err:
+            if "failed to write data" in str(err) or "client connection closed" in str(err):
+                ## Let's just log this exception without alerting the admin:
+                register_exception(req=self)
+                self.__write_error = True ## This flag is there just
+                    ## to not report later other errors to the admin.
+            else:
+                raise
+
+    def __send_pending_file(self):
+        """
+        Stream through the WSGI write callable the file that was meant
+        to be handed to the wsgi.file_wrapper, since more output follows
+        it.
+        """
+        if self.__pending_file is not None:
+            file_to_send, size = self.__pending_file
+            self.__pending_file = None
             try:
-                if not self.__write_error:
-                    self.__write(self.__buffer)
-            except IOError, err:
-                if "failed to write data" in str(err) or "client connection closed" in str(err):
-                    ## Let's just log this exception without alerting the admin:
-                    register_exception(req=self)
-                    self.__write_error = True ## This flag is there just
-                        ## to not report later other errors to the admin.
+                ## (its size was already accounted in bytes_sent)
+                self.__bytes_sent -= size
+                self.__stream_file(file_to_send, -1)
+            finally:
+                file_to_send.close()
+
+    def close_pending_file(self):
+        """
+        Close the file sent with L{sendfile} that is still waiting to be
+        sent, if any (e.g. when the request ended with an exception).
+        """
+        if self.__pending_file is not None:
+            file_to_send = self.__pending_file[0]
+            self.__pending_file = None
+            file_to_send.close()
+
+    def __stream_file(self, file_to_send, the_len):
+        """
+        Send THE_LEN bytes (or everything, if negative) of FILE_TO_SEND,
+        from its current position, in chunks.
+        """
+        try:
+            while the_len != 0:
+                if the_len < 0:
+                    chunk = file_to_send.read(CFG_WSGI_FILE_CHUNK_SIZE)
                 else:
-                    raise
-            self.__buffer = ''
+                    chunk = file_to_send.read(min(the_len, CFG_WSGI_FILE_CHUNK_SIZE))
+                    the_len -= len(chunk)
+                if not chunk:
+                    break
+                self.__send(chunk)
+                if self.__write_error:
+                    break
+        finally:
+            file_to_send.close()
+
+    def get_file_wrapper(self):
+        """
+        @return: the wsgi.file_wrapper of the file sent with L{sendfile},
+            when it can be returned as the response iterable to the
+            WSGI server (that is when it ends the response), or None.
+        """
+        if self.__pending_file is not None and not self.__buffer_size:
+            file_to_send = self.__pending_file[0]
+            self.__pending_file = None
+            return self.__environ['wsgi.file_wrapper'](file_to_send, CFG_WSGI_FILE_CHUNK_SIZE)
+        return None
 
     def set_content_type(self, content_type):
         self.__headers['content-type'] = content_type
@@ -203,29 +283,25 @@ class SimulatedModPythonRequest(object):
         return self.__status
 
     def sendfile(self, path, offset=0, the_len=-1):
+        """
+        Send THE_LEN bytes (or everything, if negative) of the file PATH,
+        starting from OFFSET.
+
+        When the requested part extends to the end of the file, the file
+        is handed to the wsgi.file_wrapper of the WSGI server (which may
+        use the sendfile system call), unless further output follows.
+        """
         try:
-            self.send_http_header()
-            file_to_send = open(path)
+            self.flush()
+            file_to_send = open(path, 'rb')
             file_to_send.seek(offset)
-            file_wrapper = FileWrapper(file_to_send)
-            count = 0
-            if the_len < 0:
-                for chunk in file_wrapper:
-                    count += len(chunk)
-                    self.__bytes_sent += len(chunk)
-                    self.__write(chunk)
-            else:
-                for chunk in file_wrapper:
-                    if the_len >= len(chunk):
-                        the_len -= len(chunk)
-                        count += len(chunk)
-                        self.__bytes_sent += len(chunk)
-                        self.__write(chunk)
-                    else:
-                        count += the_len
-                        self.__bytes_sent += the_len
-                        self.__write(chunk[:the_len])
-                        break
+            if 'wsgi.file_wrapper' in self.__environ:
+                remaining = os.fstat(file_to_send.fileno()).st_size - offset
+                if the_len < 0 or the_len >= remaining:
+                    self.__pending_file = (file_to_send, max(remaining, 0))
+                    self.__bytes_sent += max(remaining, 0)
+                    return self.__bytes_sent
+            self.__stream_file(file_to_send, the_len)
         except IOError, err:
             if "failed to write data" in str(err) or "client connection closed" in str(err):
                 ## Let's just log this exception without alerting the admin:
@@ -356,6 +432,8 @@ def application(environ, start_response):
     ## Needed for mod_wsgi, see: <http://code.google.com/p/modwsgi/wiki/ApplicationIssues>
     req = SimulatedModPythonRequest(environ, start_response)
     #print 'Starting mod_python simulation'
+    start_query_profiling()
+    enable_read_replicas()
     try:
         try:
             possible_module, possible_handler = is_mp_legacy_publisher_path(environ['PATH_INFO'])
@@ -370,7 +448,9 @@ def application(environ, start_response):
                     ret = invenio_handler(req)
             else:
                 ret = invenio_handler(req)
+            print_query_profile(req)
             req.flush()
+            return req.get_file_wrapper() or []
         except SERVER_RETURN, status:
             status = int(str(status))
             if status not in (OK, DONE):
@@ -385,6 +465,7 @@ def application(environ, start_response):
                 return generate_error_page(req, admin_to_be_alerted)
             else:
                 req.flush()
+                return req.get_file_wrapper() or []
         except:
             register_exception(req=req, alert_admin=True)
             if not req.response_sent_p:
@@ -399,10 +480,37 @@ def application(environ, start_response):
             else:
                 return generate_error_page(req, page_already_started=True)
     finally:
+        req.close_pending_file()
         for (callback, data) in req.get_cleanups():
             callback(data)
+        profile = stop_query_profiling()
+        if profile is not None:
+            log_query_profile(profile, environ.get('REQUEST_URI', environ.get('PATH_INFO', '')))
+        release_connection()
     return []
 
+def print_query_profile(req):
+    """
+    Print the profile of the SQL queries run so far at the bottom of
+    HTML pages requested with verbose=9, for superadmins only (or for
+    everybody on development sites), since it exposes the queries.
+    """
+    try:
+        verbose = int(str(req.form.get('verbose', 0)))
+    except ValueError:
+        return
+    if verbose >= 9 and (req.content_type or '').startswith('text/html'):
+        profile = get_query_profile()
+        if profile is None:
+            return
+        ## (formatted before checking the user, not to profile the check)
+        formatted_profile = format_query_profile(profile)
+        if not CFG_DEVEL_SITE:
+            from invenio.webuser import collect_user_info, isUserSuperAdmin
+            if not isUserSuperAdmin(collect_user_info(req)):
+                return
+        req.write('<pre class="sqlprofile">%s</pre>' % cgi.escape(formatted_profile))
+
 def generate_error_page(req, admin_was_alerted=True, page_already_started=False):
     """
     Returns an iterable with the error page to be sent to the user browser.
@@ -539,6 +647,57 @@ def wsgi_handler_test(port=80):
     print "Serving on port %s..." % port
     httpd.serve_forever()
 
+def wsgi_handler_benchmark(writes=100000, file_size=64*1024*1024):
+    """
+    Benchmark the output of SimulatedModPythonRequest: a large search
+    result page written in many small unflushed pieces, and a file
+    download, with and without a wsgi.file_wrapper.
+    """
+    import time
+    import tempfile
+    from StringIO import StringIO
+    from wsgiref.util import setup_testing_defaults
+
+    def new_request(file_wrapper=True):
+        environ = {'wsgi.input': StringIO(''), 'wsgi.errors': sys.stderr}
+        setup_testing_defaults(environ)
+        if file_wrapper:
+            environ['wsgi.file_wrapper'] = FileWrapper
+        sent = []
+        def start_response(status, headers, exc_info=None):
+            return lambda data: sent.append(len(data))
+        return SimulatedModPythonRequest(environ, start_response), sent
+
+    req, sent = new_request()
+    record = '<div class="record"><a href="/record/1">%s</a></div>\n' % ('x' * 200)
+    start = time.time()
+    for dummy in xrange(writes):
+        req.write(record, 0)
+    req.flush()
+    print "search page: %d writes, %d bytes in %d chunks: %.3fs" % (
+        writes, sum(sent), len(sent), time.time() - start)
+
+    fd, path = tempfile.mkstemp(prefix='wsgi_benchmark_')
+    try:
+        chunk = 'x' * (1024 * 1024)
+        for dummy in xrange(file_size / len(chunk)):
+            os.write(fd, chunk)
+        os.close(fd)
+        for file_wrapper in (False, True):
+            req, sent = new_request(file_wrapper)
+            start = time.time()
+            req.sendfile(path)
+            req.flush()
+            response = req.get_file_wrapper() or []
+            size = sum(sent) + sum([len(data) for data in response])
+            if hasattr(response, 'close'):
+                response.close()
+            print "file download (%s): %d bytes: %.3fs" % (
+                file_wrapper and "wsgi.file_wrapper" or "write callable",
+                size, time.time() - start)
+    finally:
+        os.remove(path)
+
 def main():
     from optparse import OptionParser
     parser = OptionParser()
@@ -547,9 +706,14 @@ def main():
                       help="Run a WSGI test server via wsgiref (not using Apache).")
     parser.add_option('-p', '--port', type='int', dest='port', default='80',
                       help="The port where the WSGI test server will listen. [80]")
+    parser.add_option('-b', '--benchmark', action='store_true',
+                      dest='benchmark', default=False,
+                      help="Benchmark the output of large pages and files.")
     (options, args) = parser.parse_args()
     if options.test:
         wsgi_handler_test(options.port)
+    elif options.benchmark:
+        wsgi_handler_benchmark()
     else:
         parser.print_help()
 
@@ -22,16 +22,22 @@ Global organisation of the application's URLs.
 
 This module binds together Invenio's modules and maps them to
 their corresponding URLs (ie, /search to the websearch modules,...)
+
+Apart from the search pages, the modules are imported only when their
+URLs are first traversed, or when the worker is warmed up (see
+L{warmup}).
 """
 
 __revision__ = \
     "$Id$"
 
+import time
+
 from invenio.webinterface_handler import create_handler
 from invenio.errorlib import register_exception
 from invenio.webinterface_handler import WebInterfaceDirectory
 from invenio import webinterface_handler_config as apache
-from invenio.config import CFG_DEVEL_SITE
+from invenio.config import CFG_DEVEL_SITE, CFG_WEBSTYLE_WARMUP_PAGES
 
 class WebInterfaceDumbPages(WebInterfaceDirectory):
     """This class implements a dumb interface to use as a fallback in case of
@@ -87,134 +93,46 @@ except:
     register_exception(alert_admin=True, subject='EMERGENCY')
     WebInterfaceUnAPIPages = WebInterfaceDumbPages
 
-try:
-    from invenio.websubmit_webinterface import websubmit_legacy_getfile
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    websubmit_legacy_getfile = WebInterfaceDumbPages
-
-try:
-    from invenio.websubmit_webinterface import WebInterfaceSubmitPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceSubmitPages = WebInterfaceDumbPages
-
-try:
-    from invenio.websession_webinterface import WebInterfaceYourAccountPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourAccountPages = WebInterfaceDumbPages
-
-try:
-    from invenio.websession_webinterface import WebInterfaceYourTicketsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourTicketsPages = WebInterfaceDumbPages
-
-try:
-    from invenio.websession_webinterface import WebInterfaceYourGroupsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourGroupsPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webalert_webinterface import WebInterfaceYourAlertsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourAlertsPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webbasket_webinterface import WebInterfaceYourBasketsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourBasketsPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webcomment_webinterface import WebInterfaceCommentsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceCommentsPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webmessage_webinterface import WebInterfaceYourMessagesPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourMessagesPages = WebInterfaceDumbPages
-
-try:
-    from invenio.errorlib_webinterface import WebInterfaceErrorPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceErrorPages = WebInterfaceDumbPages
-
-try:
-    from invenio.oai_repository_webinterface import WebInterfaceOAIProviderPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceOAIProviderPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webstat_webinterface import WebInterfaceStatsPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceStatsPages = WebInterfaceDumbPages
-try:
-    from invenio.bibcirculation_webinterface import WebInterfaceYourLoansPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceYourLoansPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webjournal_webinterface import WebInterfaceJournalPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceJournalPages = WebInterfaceDumbPages
-
-try:
-    from invenio.webdoc_webinterface import WebInterfaceDocumentationPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceDocumentationPages = WebInterfaceDumbPages
-
-try:
-    from invenio.bibexport_method_fieldexporter_webinterface import \
-         WebInterfaceFieldExporterPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceFieldExporterPages = WebInterfaceDumbPages
-
-try:
-    from invenio.bibknowledge_webinterface import WebInterfaceBibKnowledgePages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceBibKnowledgePages = WebInterfaceDumbPages
-
-try:
-    from invenio.batchuploader_webinterface import \
-         WebInterfaceBatchUploaderPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceBatchUploaderPages = WebInterfaceDumbPages
-
-try:
-    from invenio.bibsword_webinterface import \
-         WebInterfaceSword
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceSword = WebInterfaceDumbPages
-
-try:
-    from invenio.bibauthorid_webinterface import WebInterfaceBibAuthorIDPages
-except:
-    register_exception(alert_admin=True, subject='EMERGENCY')
-    WebInterfaceBibAuthorIDPages = WebInterfaceDumbPages
+class LazyWebInterfacePages(object):
+    """
+    Descriptor resolving to the pages NAME of the module MODULE, which
+    is imported only the first time its URL is traversed (or when
+    warming up).  If the import fails, the admin is alerted and the
+    L{WebInterfaceDumbPages} are served instead.
+
+    @param instantiate: whether NAME is a class to be instantiated or
+        already a handler.
+    """
+    def __init__(self, module, name, instantiate=True):
+        self.module = module
+        self.name = name
+        self.instantiate = instantiate
+        self.import_time = None
+        self._pages = None
+
+    def load(self):
+        """Import (once) and return the pages."""
+        if self._pages is None:
+            start = time.time()
+            try:
+                module = __import__('invenio.%s' % self.module, globals(),
+                    locals(), [self.name])
+                pages = getattr(module, self.name)
+                if self.instantiate:
+                    pages = pages()
+            except:
+                register_exception(alert_admin=True, subject='EMERGENCY')
+                pages = WebInterfaceDumbPages()
+            self.import_time = time.time() - start
+            self._pages = pages
+        return self._pages
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return self.load()
 
 if CFG_DEVEL_SITE:
-    try:
-        from invenio.httptest_webinterface import WebInterfaceHTTPTestPages
-    except:
-        register_exception(alert_admin=True, subject='EMERGENCY')
-        WebInterfaceHTTPTestPages = WebInterfaceDumbPages
     test_exports = ['httptest']
 else:
     test_exports = []
@@ -247,36 +165,128 @@ class WebInterfaceInvenio(WebInterfaceSearchInterfacePages):
         'kb',
         'batchuploader',
         'bibsword',
-        'person'
+        'person',
+        ('_warmup', 'warmup'),
         ] + test_exports
 
-    def __init__(self):
-        self.getfile = websubmit_legacy_getfile
-        if CFG_DEVEL_SITE:
-            self.httptest = WebInterfaceHTTPTestPages()
-
     author = WebInterfaceAuthorPages()
-    submit = WebInterfaceSubmitPages()
-    youraccount = WebInterfaceYourAccountPages()
-    youralerts = WebInterfaceYourAlertsPages()
-    yourbaskets = WebInterfaceYourBasketsPages()
-    yourmessages = WebInterfaceYourMessagesPages()
-    yourloans = WebInterfaceYourLoansPages()
-    yourgroups = WebInterfaceYourGroupsPages()
-    yourtickets = WebInterfaceYourTicketsPages()
-    comments = WebInterfaceCommentsPages()
-    error = WebInterfaceErrorPages()
-    oai2d = WebInterfaceOAIProviderPages()
     rss = WebInterfaceRSSFeedServicePages()
-    stats = WebInterfaceStatsPages()
-    journal = WebInterfaceJournalPages()
-    help = WebInterfaceDocumentationPages()
     unapi = WebInterfaceUnAPIPages()
-    exporter = WebInterfaceFieldExporterPages()
-    kb = WebInterfaceBibKnowledgePages()
-    batchuploader = WebInterfaceBatchUploaderPages()
-    bibsword = WebInterfaceSword()
-    person = WebInterfaceBibAuthorIDPages()
+    getfile = LazyWebInterfacePages('websubmit_webinterface', 'websubmit_legacy_getfile', instantiate=False)
+    submit = LazyWebInterfacePages('websubmit_webinterface', 'WebInterfaceSubmitPages')
+    youraccount = LazyWebInterfacePages('websession_webinterface', 'WebInterfaceYourAccountPages')
+    youralerts = LazyWebInterfacePages('webalert_webinterface', 'WebInterfaceYourAlertsPages')
+    yourbaskets = LazyWebInterfacePages('webbasket_webinterface', 'WebInterfaceYourBasketsPages')
+    yourmessages = LazyWebInterfacePages('webmessage_webinterface', 'WebInterfaceYourMessagesPages')
+    yourloans = LazyWebInterfacePages('bibcirculation_webinterface', 'WebInterfaceYourLoansPages')
+    yourgroups = LazyWebInterfacePages('websession_webinterface', 'WebInterfaceYourGroupsPages')
+    yourtickets = LazyWebInterfacePages('websession_webinterface', 'WebInterfaceYourTicketsPages')
+    comments = LazyWebInterfacePages('webcomment_webinterface', 'WebInterfaceCommentsPages')
+    error = LazyWebInterfacePages('errorlib_webinterface', 'WebInterfaceErrorPages')
+    oai2d = LazyWebInterfacePages('oai_repository_webinterface', 'WebInterfaceOAIProviderPages')
+    stats = LazyWebInterfacePages('webstat_webinterface', 'WebInterfaceStatsPages')
+    journal = LazyWebInterfacePages('webjournal_webinterface', 'WebInterfaceJournalPages')
+    help = LazyWebInterfacePages('webdoc_webinterface', 'WebInterfaceDocumentationPages')
+    exporter = LazyWebInterfacePages('bibexport_method_fieldexporter_webinterface', 'WebInterfaceFieldExporterPages')
+    kb = LazyWebInterfacePages('bibknowledge_webinterface', 'WebInterfaceBibKnowledgePages')
+    batchuploader = LazyWebInterfacePages('batchuploader_webinterface', 'WebInterfaceBatchUploaderPages')
+    bibsword = LazyWebInterfacePages('bibsword_webinterface', 'WebInterfaceSword')
+    person = LazyWebInterfacePages('bibauthorid_webinterface', 'WebInterfaceBibAuthorIDPages')
+    if CFG_DEVEL_SITE:
+        httptest = LazyWebInterfacePages('httptest_webinterface', 'WebInterfaceHTTPTestPages')
+
+    def warmup(self, req, form):
+        """
+        Warm up this worker (see L{warmup}) and report how long every
+        step took.  Only available to requests coming from the local
+        host.
+        """
+        if req.remote_ip not in ('127.0.0.1', '::1'):
+            raise apache.SERVER_RETURN, apache.HTTP_FORBIDDEN
+        req.content_type = 'text/plain'
+        return format_warmup_profile(warmup())
+
+def get_lazy_pages():
+    """
+    @return: the lazily imported pages of the global URL layout, keyed
+        by their URL component.
+    @rtype: dict
+    """
+    ret = {}
+    for name, value in WebInterfaceInvenio.__dict__.iteritems():
+        if isinstance(value, LazyWebInterfacePages):
+            ret[name] = value
+    return ret
+
+def _warmup_search_caches():
+    """Fill the search engine caches needed by every search."""
+    from invenio import search_engine
+    for cache in (search_engine.collection_reclist_cache,
+                  search_engine.restricted_collection_cache,
+                  search_engine.collection_i18nname_cache,
+                  search_engine.field_i18nname_cache):
+        cache.recreate_cache_if_needed()
+
+def _warmup_authorization_cache():
+    """Fill the compiled authorizations cache."""
+    from invenio.access_control_admin import acc_get_authorization_cache
+    acc_get_authorization_cache()
+
+#: (description, function) of the hot caches filled at warm up.
+CFG_WEBSTYLE_WARMUP_CACHES = (
+    ('search engine caches', _warmup_search_caches),
+    ('authorization cache', _warmup_authorization_cache),
+)
+
+def warmup(pages=None):
+    """
+    Import the pages listed in L{CFG_WEBSTYLE_WARMUP_PAGES} (or in
+    PAGES; '*' meaning all of them) and fill the hot caches, so that
+    the first requests served by a new worker are not slowed down.
+
+    @return: the list of (step, seconds) it took.
+    @rtype: list
+    """
+    if pages is None:
+        pages = CFG_WEBSTYLE_WARMUP_PAGES
+    lazy_pages = get_lazy_pages()
+    if '*' in pages:
+        pages = lazy_pages.keys()
+        pages.sort()
+    profile = []
+    for page in pages:
+        if page in lazy_pages:
+            lazy_pages[page].load()
+            profile.append(('/%s pages import' % page, lazy_pages[page].import_time))
+    for description, function in CFG_WEBSTYLE_WARMUP_CACHES:
+        start = time.time()
+        try:
+            function()
+        except:
+            register_exception(alert_admin=True)
+        profile.append((description, time.time() - start))
+    return profile
+
+def format_warmup_profile(profile):
+    """
+    @param profile: as returned by L{warmup}.
+    @return: a textual report of the warm-up, together with the import
+        time of the pages imported so far.
+    @rtype: string
+    """
+    out = "Warm-up:\n"
+    total = 0
+    for step, seconds in profile:
+        out += "%8.3fs  %s\n" % (seconds, step)
+        total += seconds
+    out += "%8.3fs  total\n" % total
+    out += "Imported pages:\n"
+    lazy_pages = get_lazy_pages().items()
+    lazy_pages.sort()
+    for name, lazy_page in lazy_pages:
+        if lazy_page.import_time is not None:
+            out += "%8.3fs  /%s\n" % (lazy_page.import_time, name)
+    return out
 
 # This creates the 'handler' function, which will be invoked directly
 # by mod_python.
@@ -21,6 +21,11 @@ __revision__ = "$Id$"
 
 import unittest
 import cgi
+import os
+import sys
+import tempfile
+from StringIO import StringIO
+from wsgiref.util import setup_testing_defaults, FileWrapper
 
 from invenio.testutils import make_test_suite, run_test_suite
 
@@ -120,8 +125,53 @@ class TestWashArgs(unittest.TestCase):
         self._check('jrec=foo&jrec=1', default, {'jrec': -1})
         self._check('jrec=12&jrec=foo', default, {'jrec': 12})
 
-
-TEST_SUITE = make_test_suite(TestWashArgs,)
+class TestSimulatedModPythonRequestOutput(unittest.TestCase):
+    """webinterface - Test the output of the WSGI request object"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, '0123456789')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _new_request(self, file_wrapper):
+        from invenio.webinterface_handler_wsgi import SimulatedModPythonRequest
+        environ = {'wsgi.input': StringIO(''), 'wsgi.errors': sys.stderr}
+        setup_testing_defaults(environ)
+        if file_wrapper:
+            environ['wsgi.file_wrapper'] = FileWrapper
+        sent = []
+        def start_response(dummy_status, dummy_headers, dummy_exc_info=None):
+            return sent.append
+        return SimulatedModPythonRequest(environ, start_response), sent
+
+    def test_unflushed_writes(self):
+        """ webinterface - buffering of unflushed writes """
+        req, sent = self._new_request(False)
+        for dummy in range(1000):
+            req.write('x', 0)
+        self.assertEqual(sent, [])
+        self.assertEqual(req.get_buffer(), 'x' * 1000)
+        req.flush()
+        self.assertEqual(sent, ['x' * 1000])
+
+    def test_sendfile(self):
+        """ webinterface - sendfile ranges interleaved with writes """
+        for file_wrapper in (False, True):
+            req, sent = self._new_request(file_wrapper)
+            req.write('a', 0)
+            req.sendfile(self.path, 2, 3)
+            req.write('b', 0)
+            req.sendfile(self.path, 7)
+            req.flush()
+            response = req.get_file_wrapper() or []
+            self.assertEqual(''.join(sent) + ''.join(response), 'a234b789')
+            self.assertEqual(req.bytes_sent, 8)
+            self.assertEqual(bool(response), file_wrapper)
+
+TEST_SUITE = make_test_suite(TestWashArgs, TestSimulatedModPythonRequestOutput)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -61,8 +61,27 @@ class WebStyleWSGIUtilsTest(unittest.TestCase):
             body2 = response.read()
             self.assertEqual(body, body2, "Body sent differs from body received")
 
+class WebStyleWarmupTest(unittest.TestCase):
+    """Test the lazily imported pages and the warm-up."""
 
-TEST_SUITE = make_test_suite(WebStyleWSGIUtilsTest)
+    def test_warmup(self):
+        """webstyle - warm-up importing all the pages"""
+        from invenio.webinterface_layout import warmup, get_lazy_pages, \
+            format_warmup_profile
+        profile = warmup(['*'])
+        for name, lazy_page in get_lazy_pages().iteritems():
+            self.failIf(lazy_page.import_time is None, name)
+        self.failUnless('/youraccount' in format_warmup_profile(profile))
+
+    def test_lazy_page_traversal(self):
+        """webstyle - traversal to a lazily imported page"""
+        from invenio.webinterface_layout import WebInterfaceInvenio, \
+            WebInterfaceDumbPages
+        youraccount = WebInterfaceInvenio().youraccount
+        self.failIf(isinstance(youraccount, WebInterfaceDumbPages))
+        self.failUnless(youraccount is WebInterfaceInvenio().youraccount)
+
+TEST_SUITE = make_test_suite(WebStyleWSGIUtilsTest, WebStyleWarmupTest)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE, warn_user=True)
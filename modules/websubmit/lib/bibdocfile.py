@@ -71,6 +71,12 @@ try:
 except ImportError:
     CFG_HAS_MAGIC = False
 
+try:
+    import multiprocessing
+    CFG_HAS_MULTIPROCESSING = True
+except ImportError:
+    CFG_HAS_MULTIPROCESSING = False
+
 ## The above flag controls whether HTTP range requests are supported or not
 ## when serving static files via Python. This is disabled by default as
 ## it currently breaks support for opening PDF files on Windows platforms
@@ -128,6 +134,12 @@ CFG_BIBDOCFILE_MD5_THRESHOLD = 256 * 1024
 #: chunks loaded by the Python MD5 algorithm.
 CFG_BIBDOCFILE_MD5_BUFFER = 1024 * 1024
 
+#: chunks loaded when verifying the integrity of the whole file storage.
+CFG_BIBDOCFILE_INTEGRITY_BUFFER = 16 * 1024 * 1024
+
+#: number of document folders verified between two checkpoints.
+CFG_BIBDOCFILE_INTEGRITY_CHECKPOINT = 100
+
 #: whether to normalize e.g. ".JPEG" and ".jpg" into .jpeg.
 CFG_BIBDOCFILE_STRONG_FORMAT_NORMALIZATION = False
 
@@ -527,12 +539,16 @@ class BibRecDocs:
     @ivar bibdocs: the list of documents attached to the record.
     @type bibdocs: list of BibDoc
     """
-    def __init__(self, recid, deleted_too=False, human_readable=False):
+    def __init__(self, recid, deleted_too=False, human_readable=False, bibdocs=None):
         self.id = recid
         self.human_readable = human_readable
         self.deleted_too = deleted_too
-        self.bibdocs = []
-        self.build_bibdoc_list()
+        if bibdocs is None:
+            self.bibdocs = []
+            self.build_bibdoc_list()
+        else:
+            ## Already loaded via bulk_load_bibrecdocs()
+            self.bibdocs = bibdocs
 
     def __repr__(self):
         """
@@ -639,18 +655,7 @@ class BibRecDocs:
         This method must be called everytime a I{bibdoc} is added, removed or
         modified.
         """
-        self.bibdocs = []
-        if self.deleted_too:
-            res = run_sql("""SELECT id_bibdoc, type FROM bibrec_bibdoc JOIN
-                         bibdoc ON id=id_bibdoc WHERE id_bibrec=%s
-                         ORDER BY docname ASC""", (self.id,))
-        else:
-            res = run_sql("""SELECT id_bibdoc, type FROM bibrec_bibdoc JOIN
-                         bibdoc ON id=id_bibdoc WHERE id_bibrec=%s AND
-                         status<>'DELETED' ORDER BY docname ASC""", (self.id,))
-        for row in res:
-            cur_doc = BibDoc(docid=row[0], recid=self.id, doctype=row[1], human_readable=self.human_readable)
-            self.bibdocs.append(cur_doc)
+        self.bibdocs = _load_bibdocs([int(self.id)], self.deleted_too, self.human_readable)[int(self.id)]
 
     def list_bibdocs(self, doctype=''):
         """
@@ -1370,10 +1375,13 @@ class BibDoc:
     @param human_readable: whether sizes should be represented in a human
         readable format.
     @type human_readable: bool
+    @param initial_data: the already fetched database information about the
+        document (used by L{bulk_load_bibrecdocs}).
+    @type initial_data: dict
     @raise InvenioWebSubmitFileError: in case of error.
     """
 
-    def __init__ (self, docid=None, recid=None, docname=None, doctype='Main', human_readable=False):
+    def __init__ (self, docid=None, recid=None, docname=None, doctype='Main', human_readable=False, initial_data=None):
         """Constructor of a bibdoc. At least the docid or the recid/docname
         pair is needed."""
         # docid is known, the document already exists
@@ -1383,6 +1391,24 @@ class BibDoc:
         self.md5s = None
         self.related_files = []
         self.human_readable = human_readable
+        if initial_data is not None:
+            # everything has already been fetched from the database
+            self.recid = recid
+            self.doctype = doctype
+            self.id = docid
+            self.status = initial_data['status']
+            self.docname = initial_data['docname']
+            self.cd = initial_data['cd']
+            self.md = initial_data['md']
+            self.td = initial_data['td']
+            self.more_info = BibDocMoreInfo(docid, blob_to_string(initial_data['more_info']))
+            self.basedir = _make_base_dir(self.id)
+            if initial_data['files']:
+                self._build_file_list_from_cache(initial_data['files'])
+            else:
+                self._build_file_list('init')
+            self._build_related_file_list(initial_data['related'])
+            return
         if docid:
             if not recid:
                 res = run_sql("SELECT id_bibrec,type FROM bibrec_bibdoc WHERE id_bibdoc=%s LIMIT 1", (docid,), 1)
@@ -1782,6 +1808,7 @@ class BibDoc:
         run_sql('DELETE FROM bibrec_bibdoc WHERE id_bibdoc=%s', (self.id, ))
         run_sql('DELETE FROM bibdoc_bibdoc WHERE id_bibdoc1=%s OR id_bibdoc2=%s', (self.id, self.id))
         run_sql('DELETE FROM bibdoc WHERE id=%s', (self.id, ))
+        run_sql('DELETE FROM bibdocfsinfo WHERE id_bibdoc=%s', (self.id, ))
         run_sql('INSERT DELAYED INTO hstDOCUMENT(action, id_bibdoc, docname, doctimestamp) VALUES("EXPUNGE", %s, %s, NOW())', (self.id, self.docname))
 
         del self.docfiles
@@ -2393,10 +2420,13 @@ class BibDoc:
         in the log facility, according to the context:
         "init": means that the function has been called;
         for the first time by a constructor, hence no logging is performed
+        and the list is taken from the bibdocfsinfo table when available;
         "": by default means to log every deleted file as deleted and every
         added file as added;
         "rename": means that every appearently deleted file is logged as
         renamef and every new file as renamet.
+        In any context but "init" the list is rebuilt from the filesystem and
+        the bibdocfsinfo table is updated accordingly.
         """
 
         def log_action(action, docid, docname, format, version, size, checksum, timestamp=''):
@@ -2444,6 +2474,13 @@ class BibDoc:
         self.status = res[0][0]
         self.more_info = BibDocMoreInfo(self.id, blob_to_string(res[0][4]))
         self.docfiles = []
+        if context == 'init':
+            res = run_sql("SELECT version, format, cd, md, checksum, filesize "
+                "FROM bibdocfsinfo WHERE id_bibdoc=%s ORDER BY format, version",
+                (self.id,))
+            if res:
+                self._build_file_list_from_cache(res)
+                return
         if os.path.exists(self.basedir):
             self.md5s = Md5Folder(self.basedir)
             files = os.listdir(self.basedir)
@@ -2463,6 +2500,7 @@ class BibDoc:
                             self.more_info, human_readable=self.human_readable))
                     except Exception, e:
                         register_exception()
+        self._store_file_list_cache()
         if context == 'init':
             return
         else:
@@ -2481,16 +2519,60 @@ class BibDoc:
                     md = '' # No modification time
                 log_action(deletedstr, self.id, docname, format, version, size, checksum, md)
 
-    def _build_related_file_list(self):
+    def _build_file_list_from_cache(self, rows):
+        """
+        Lists all files attached to the bibdoc, out of the rows of the
+        bibdocfsinfo table, i.e. without accessing the filesystem.
+
+        @param rows: the (version, format, cd, md, checksum, filesize)
+            rows corresponding to this bibdoc.
+        @type rows: list of tuples
+        """
+        self.docfiles = []
+        for version, format, cd, md, checksum, filesize in rows:
+            filepath = os.path.join(self.basedir, "%s%s;%i" % (self.docname, format, version))
+            self.docfiles.append(BibDocFile(filepath, self.doctype,
+                version, self.docname, format,
+                self.recid, self.id, self.status, checksum,
+                self.more_info, human_readable=self.human_readable,
+                size=filesize, cd=cd, md=md))
+
+    def _store_file_list_cache(self):
+        """
+        Stores the current list of files into the bibdocfsinfo table, so
+        that the next instantiations do not need to access the filesystem.
+        """
+        try:
+            run_sql("DELETE FROM bibdocfsinfo WHERE id_bibdoc=%s", (self.id,))
+            for afile in self.docfiles:
+                filename = os.path.basename(afile.get_full_path())
+                if afile.name != self.docname or not filename.startswith(self.docname):
+                    ## Strange file that can not be located from the
+                    ## docname: let's always look at the filesystem.
+                    run_sql("DELETE FROM bibdocfsinfo WHERE id_bibdoc=%s", (self.id,))
+                    return
+                ## The format as it appears in the filename, i.e. before
+                ## any normalization
+                format = filename[len(self.docname):filename.rfind(';')]
+                run_sql("INSERT INTO bibdocfsinfo(id_bibdoc, version, format, cd, md, checksum, filesize) "
+                    "VALUES(%s, %s, %s, %s, %s, %s, %s)",
+                    (self.id, afile.version, format, afile.cd, afile.md, afile.checksum, afile.size))
+        except DatabaseError:
+            register_exception()
+
+    def _build_related_file_list(self, rows=None):
         """Lists all files attached to the bibdoc. This function should be
         called everytime the bibdoc is modified within e.g. its icon.
+        @param rows: the already fetched (id_bibdoc2, type, status) rows
+            of the related documents, if any.
         @deprecated: use subformats instead.
         """
         self.related_files = {}
-        res = run_sql("SELECT ln.id_bibdoc2,ln.type,bibdoc.status FROM "
-            "bibdoc_bibdoc AS ln,bibdoc WHERE id=ln.id_bibdoc2 AND "
-            "ln.id_bibdoc1=%s", (self.id,))
-        for row in res:
+        if rows is None:
+            rows = run_sql("SELECT ln.id_bibdoc2,ln.type,bibdoc.status FROM "
+                "bibdoc_bibdoc AS ln,bibdoc WHERE id=ln.id_bibdoc2 AND "
+                "ln.id_bibdoc1=%s", (self.id,))
+        for row in rows:
             docid = row[0]
             doctype = row[1]
             if row[2] != 'DELETED':
@@ -2562,7 +2644,7 @@ class BibDocFile:
     """This class represents a physical file in the Invenio filesystem.
     It should never be instantiated directly"""
 
-    def __init__(self, fullpath, doctype, version, name, format, recid, docid, status, checksum, more_info, human_readable=False):
+    def __init__(self, fullpath, doctype, version, name, format, recid, docid, status, checksum, more_info, human_readable=False, size=None, cd=None, md=None):
         self.fullpath = os.path.abspath(fullpath)
         self.doctype = doctype
         self.docid = docid
@@ -2588,12 +2670,21 @@ class BibDocFile:
         self.comment = more_info.get_comment(format, version)
         self.flags = more_info.get_flags(format, version)
         self.hidden = 'HIDDEN' in self.flags
-        self.size = os.path.getsize(fullpath)
-        self.md = datetime.fromtimestamp(os.path.getmtime(fullpath))
-        try:
-            self.cd = datetime.fromtimestamp(os.path.getctime(fullpath))
-        except OSError:
-            self.cd = self.md
+        if size is None:
+            self.size = os.path.getsize(fullpath)
+        else:
+            self.size = size
+        if md is None:
+            self.md = datetime.fromtimestamp(os.path.getmtime(fullpath))
+        else:
+            self.md = md
+        if cd is None:
+            try:
+                self.cd = datetime.fromtimestamp(os.path.getctime(fullpath))
+            except OSError:
+                self.cd = self.md
+        else:
+            self.cd = cd
         self.name = name
         self.dir = os.path.dirname(fullpath)
         if self.subformat:
@@ -3091,6 +3182,68 @@ def list_versions_from_array(docfiles):
     versions.reverse()
     return versions
 
+def bulk_load_bibrecdocs(recids, deleted_too=False, human_readable=False):
+    """
+    Instantiate the C{BibRecDocs} of many records at once, fetching all
+    their documents with a fixed number of queries.
+
+    @param recids: the record identifiers.
+    @type recids: list of integer
+    @param deleted_too: see L{BibRecDocs}.
+    @type deleted_too: bool
+    @param human_readable: see L{BibRecDocs}.
+    @type human_readable: bool
+    @return: the C{BibRecDocs} of each record.
+    @rtype: dict of recid -> BibRecDocs
+    """
+    bibdocs = _load_bibdocs(recids, deleted_too, human_readable)
+    return dict([(recid, BibRecDocs(recid, deleted_too, human_readable, bibdocs[recid])) for recid in bibdocs])
+
+def _load_bibdocs(recids, deleted_too=False, human_readable=False):
+    """
+    Instantiate all the C{BibDoc} attached to the given records.
+
+    @return: the list of documents of each record, ordered by docname.
+    @rtype: dict of recid -> list of BibDoc
+    """
+    recids = [int(recid) for recid in recids]
+    ret = dict([(recid, []) for recid in recids])
+    if not recids:
+        return ret
+    query = """SELECT bb.id_bibrec, b.id, bb.type, b.status, b.docname,
+        b.creation_date, b.modification_date, b.text_extraction_date,
+        b.more_info FROM bibrec_bibdoc AS bb JOIN bibdoc AS b ON
+        b.id=bb.id_bibdoc WHERE bb.id_bibrec IN (%s)""" % ("%s," * len(recids))[:-1]
+    if not deleted_too:
+        query += " AND b.status<>'DELETED'"
+    query += " ORDER BY b.docname ASC"
+    docs = run_sql(query, tuple(recids))
+    if not docs:
+        return ret
+    docids = tuple([row[1] for row in docs])
+    files = {}
+    for row in run_sql("""SELECT id_bibdoc, version, format, cd, md, checksum,
+            filesize FROM bibdocfsinfo WHERE id_bibdoc IN (%s)
+            ORDER BY format, version""" % ("%s," * len(docids))[:-1], docids):
+        files.setdefault(row[0], []).append(row[1:])
+    related = {}
+    for row in run_sql("""SELECT ln.id_bibdoc1, ln.id_bibdoc2, ln.type,
+            b.status FROM bibdoc_bibdoc AS ln JOIN bibdoc AS b ON
+            b.id=ln.id_bibdoc2 WHERE ln.id_bibdoc1 IN (%s)""" % ("%s," * len(docids))[:-1], docids):
+        related.setdefault(row[0], []).append(row[1:])
+    for recid, docid, doctype, status, docname, cd, md, td, more_info in docs:
+        ret[recid].append(BibDoc(docid=docid, recid=recid, doctype=doctype,
+            human_readable=human_readable, initial_data={
+                'status': status,
+                'docname': docname,
+                'cd': cd,
+                'md': md,
+                'td': td,
+                'more_info': more_info,
+                'files': files.get(docid, []),
+                'related': related.get(docid, [])}))
+    return ret
+
 def _make_base_dir(docid):
     """Given a docid it returns the complete path that should host its files."""
     group = "g" + str(int(int(docid) / CFG_WEBSUBMIT_FILESYSTEM_BIBDOC_GROUP_LIMIT))
@@ -3135,12 +3288,7 @@ class Md5Folder:
         """Load .md5 into the md5 dictionary"""
         self.md5s = {}
         try:
-            md5file = open(os.path.join(self.folder, ".md5"), "r")
-            for row in md5file:
-                md5hash = row[:32]
-                filename = row[34:].strip()
-                self.md5s[filename] = md5hash
-            md5file.close()
+            self.md5s = read_md5_file(self.folder)
         except IOError:
             self.update()
         except Exception, e:
@@ -3175,6 +3323,22 @@ class Md5Folder:
         md5hash = self.md5s[filename]
         return md5hash
 
+def read_md5_file(folder):
+    """Return the dictionary filename -> md5 stored in the .md5 file of the
+    given folder, without computing any checksum.
+    @raise IOError: if the .md5 file can't be read.
+    """
+    md5s = {}
+    md5file = open(os.path.join(folder, ".md5"), "r")
+    try:
+        for row in md5file:
+            md5hash = row[:32]
+            filename = row[34:].strip()
+            md5s[filename] = md5hash
+    finally:
+        md5file.close()
+    return md5s
+
 def calculate_md5_external(filename):
     """Calculate the md5 of a physical file through md5sum Command Line Tool.
     This is suitable for file larger than 256Kb."""
@@ -3212,6 +3376,240 @@ def calculate_md5(filename, force_internal=False):
     else:
         return calculate_md5_external(filename)
 
+def iterate_filedir_folders(start_after=None):
+    """Yield the pairs (docid, folder) of every document folder found in
+    CFG_WEBSUBMIT_FILEDIR, sorted by docid.
+    @param start_after: if specified, folders of documents with a docid
+        lower or equal to this one are skipped (used to resume a walk).
+    """
+    if not os.path.isdir(CFG_WEBSUBMIT_FILEDIR):
+        return
+    groups = [int(group[1:]) for group in os.listdir(CFG_WEBSUBMIT_FILEDIR) if group.startswith('g') and group[1:].isdigit()]
+    groups.sort()
+    for group in groups:
+        if start_after is not None and (group + 1) * CFG_WEBSUBMIT_FILESYSTEM_BIBDOC_GROUP_LIMIT <= start_after:
+            ## All the documents of this group have already been visited.
+            continue
+        group_dir = os.path.join(CFG_WEBSUBMIT_FILEDIR, 'g%i' % group)
+        docids = [int(docid) for docid in os.listdir(group_dir) if docid.isdigit()]
+        docids.sort()
+        for docid in docids:
+            if start_after is None or docid > start_after:
+                yield docid, os.path.join(group_dir, str(docid))
+
+def _verify_file_integrity(task):
+    """Compute the md5 of a file for check_filedir_integrity(), reading it
+    sequentially in large chunks. This is run in the worker processes.
+    @param task: the tuple (docid, fullpath, expected md5).
+    @return: the tuple (docid, fullpath, size, mtime, expected md5,
+        computed md5, error message).
+    """
+    docid, fullpath, expected = task
+    try:
+        stat = os.stat(fullpath)
+        computed_md5 = md5()
+        to_be_read = open(fullpath, "rb")
+        try:
+            while True:
+                buf = to_be_read.read(CFG_BIBDOCFILE_INTEGRITY_BUFFER)
+                if buf:
+                    computed_md5.update(buf)
+                else:
+                    break
+        finally:
+            to_be_read.close()
+        return docid, fullpath, stat.st_size, stat.st_mtime, expected, computed_md5.hexdigest(), None
+    except (IOError, OSError), e:
+        return docid, fullpath, None, None, expected, None, str(e)
+
+def _load_integrity_state(state_file):
+    """Load the state of the previous check_filedir_integrity() runs, by
+    replaying the journal stored in C{state_file}.
+
+    The journal is made of tab separated lines, one per event:
+    C{FILE, size, mtime, fullpath} (the file was verified),
+    C{FORGET, fullpath} (the file has to be verified again) and
+    C{CHECKPOINT, docid} (the folders up to this docid were verified).
+    Full paths are escaped with the string_escape codec.
+    """
+    state = {'last_docid': None, 'files': {}}
+    if state_file and os.path.exists(state_file):
+        try:
+            for line in open(state_file):
+                if not line.endswith('\n'):
+                    ## The run was interrupted while writing this line.
+                    break
+                fields = line[:-1].split('\t')
+                if fields[0] == 'FILE':
+                    state['files'][fields[3].decode('string_escape')] = (int(fields[1]), float(fields[2]))
+                elif fields[0] == 'FORGET':
+                    state['files'].pop(fields[1].decode('string_escape'), None)
+                elif fields[0] == 'CHECKPOINT':
+                    state['last_docid'] = int(fields[1])
+        except Exception, e:
+            register_exception()
+            raise InvenioWebSubmitFileError, "Encountered an exception while loading integrity state file '%s': '%s'" % (state_file, e)
+    return state
+
+def _format_integrity_event(event, *args):
+    """Format a line of the journal of check_filedir_integrity() (see
+    _load_integrity_state()), the last argument being a full path."""
+    args = list(args)
+    args[-1] = args[-1].encode('string_escape')
+    return '\t'.join([event] + [str(arg) for arg in args]) + '\n'
+
+def _store_integrity_state(state_file, state):
+    """Atomically store the state of a check_filedir_integrity() run as a
+    compacted journal (see _load_integrity_state())."""
+    if state_file:
+        tmp_state_file = state_file + '.tmp'
+        state_fd = open(tmp_state_file, 'w')
+        try:
+            for fullpath, (size, mtime) in state['files'].iteritems():
+                state_fd.write(_format_integrity_event('FILE', size, repr(mtime), fullpath))
+            if state['last_docid'] is not None:
+                state_fd.write('CHECKPOINT\t%s\n' % state['last_docid'])
+        finally:
+            state_fd.close()
+        os.rename(tmp_state_file, state_file)
+
+def check_filedir_integrity(processes=1, state_file=None, report=None, force=False):
+    """Verify the md5 checksum of every file stored in CFG_WEBSUBMIT_FILEDIR
+    against the checksums recorded in the .md5 file of its folder.
+
+    Files are hashed by a pool of C{processes} worker processes (when the
+    multiprocessing module is available), while the next folders are
+    listed. When C{state_file} is specified, every verified file is
+    appended to it with its size and modification time, so that following
+    runs skip the files that have not changed since (unless C{force} is
+    True), and the walk is checkpointed into it every
+    CFG_BIBDOCFILE_INTEGRITY_CHECKPOINT document folders, so that an
+    interrupted run can be resumed.
+
+    Every problem is written to C{report} as a tab separated line:
+    C{status, docid, fullpath, expected md5, computed md5}, where status is
+    one of C{MISMATCH} (checksum differs), C{UNREADABLE} (the file can't be
+    read), C{MISSING} (the file is listed in .md5 but does not exist) or
+    C{NOCHECKSUM} (no checksum was ever recorded for the file).
+
+    @param processes: number of worker processes.
+    @param state_file: path of the file where to store the state of the
+        check.
+    @param report: file-like object where to write the report.
+    @param force: whether to verify also files that did not change
+        since the last check.
+    @return: a dictionary with the number of C{checked}, C{skipped} and
+        C{failures} files.
+    """
+    if report is None:
+        report = sys.stdout
+    state = _load_integrity_state(state_file)
+    stats = {'checked': 0, 'skipped': 0, 'failures': 0}
+
+    def report_problem(status, docid, fullpath, expected='', computed=''):
+        stats['failures'] += 1
+        if fullpath in state['files']:
+            del state['files'][fullpath]
+            if journal is not None:
+                journal.write(_format_integrity_event('FORGET', fullpath))
+        report.write('%s\t%s\t%s\t%s\t%s\n' % (status, docid, fullpath, expected or '', computed or ''))
+
+    def prepare_tasks(docid, folder):
+        try:
+            md5s = read_md5_file(folder)
+        except IOError:
+            md5s = {}
+        tasks = []
+        filenames = [filename for filename in os.listdir(folder) if not filename.startswith('.')]
+        for filename in filenames:
+            fullpath = os.path.join(folder, filename)
+            if filename not in md5s:
+                report_problem('NOCHECKSUM', docid, fullpath)
+                continue
+            if not force and fullpath in state['files']:
+                try:
+                    stat = os.stat(fullpath)
+                except OSError:
+                    stat = None
+                if stat and state['files'][fullpath] == (stat.st_size, stat.st_mtime):
+                    stats['skipped'] += 1
+                    continue
+            tasks.append((docid, fullpath, md5s[filename]))
+        for filename in md5s:
+            if filename not in filenames:
+                report_problem('MISSING', docid, os.path.join(folder, filename), md5s[filename])
+        return tasks
+
+    def handle_result(result):
+        docid, fullpath, size, mtime, expected, computed, error = result
+        stats['checked'] += 1
+        if error:
+            report_problem('UNREADABLE', docid, fullpath, expected, error)
+        elif computed != expected:
+            report_problem('MISMATCH', docid, fullpath, expected, computed)
+        else:
+            state['files'][fullpath] = (size, mtime)
+            if journal is not None:
+                journal.write(_format_integrity_event('FILE', size, repr(mtime), fullpath))
+
+    ## Listed folders, in docid order, with the results (pending ones
+    ## when computed by the pool) of the verification of their files.
+    pending = []
+    counters = {'folders': 0, 'tasks': 0}
+    ## Number of tasks after which the walk waits for the pool.
+    max_pending_tasks = 64 * processes
+
+    def handle_folders(wait):
+        """Handle the results of the listed folders, in order: all of them
+        if wait is True, otherwise as long as they are available or too
+        many tasks are pending."""
+        while pending:
+            docid, results = pending[0]
+            if pool is not None and not wait and counters['tasks'] <= max_pending_tasks:
+                for result in results:
+                    if not result.ready():
+                        return
+            del pending[0]
+            counters['tasks'] -= len(results)
+            for result in results:
+                if pool is not None:
+                    result = result.get()
+                handle_result(result)
+            counters['folders'] += 1
+            if journal is not None and counters['folders'] % CFG_BIBDOCFILE_INTEGRITY_CHECKPOINT == 0:
+                journal.write('CHECKPOINT\t%s\n' % docid)
+                journal.flush()
+
+    journal = None
+    pool = None
+    try:
+        if state_file:
+            ## Start from a compacted journal, without the line an
+            ## interrupted run may have left incomplete.
+            _store_integrity_state(state_file, state)
+            journal = open(state_file, 'a')
+        if processes > 1 and CFG_HAS_MULTIPROCESSING:
+            pool = multiprocessing.Pool(processes)
+        for docid, folder in iterate_filedir_folders(state['last_docid']):
+            tasks = prepare_tasks(docid, folder)
+            if pool is not None:
+                results = [pool.apply_async(_verify_file_integrity, (task, )) for task in tasks]
+            else:
+                results = [_verify_file_integrity(task) for task in tasks]
+            pending.append((docid, results))
+            counters['tasks'] += len(results)
+            handle_folders(False)
+        handle_folders(True)
+    finally:
+        if journal is not None:
+            journal.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    ## The walk is complete: next run will start from the beginning.
+    state['last_docid'] = None
+    _store_integrity_state(state_file, state)
+    return stats
 
 def bibdocfile_url_to_bibrecdocs(url):
     """Given an URL in the form CFG_SITE_[SECURE_]URL/record/xxx/files/... it returns
@@ -22,12 +22,16 @@
 __revision__ = "$Id$"
 
 import unittest
+import os
+from cStringIO import StringIO
 from invenio.testutils import make_test_suite, run_test_suite
-from invenio.bibdocfile import BibRecDocs, check_bibdoc_authorization
+from invenio.bibdocfile import BibRecDocs, check_bibdoc_authorization, \
+     bulk_load_bibrecdocs, check_filedir_integrity
 from invenio.access_control_config import CFG_WEBACCESS_WARNING_MSGS
 from invenio.config import \
         CFG_SITE_URL, \
         CFG_PREFIX, \
+        CFG_TMPDIR, \
         CFG_WEBSUBMIT_FILEDIR
 
 
@@ -236,6 +240,47 @@ class BibDocFilesTest(unittest.TestCase):
         my_new_bibdoc.delete()
         self.assertEqual(my_new_bibdoc.deleted_p(), True)
 
+class BibDocFileListCacheTest(unittest.TestCase):
+    """regression tests about the cached list of files of BibDocs"""
+
+    def test_cached_file_list(self):
+        """bibdocfile - cached file list is coherent with the filesystem"""
+        for bibdoc in BibRecDocs(2).list_bibdocs():
+            ## Rescanning the filesystem must not change anything
+            cached_files = [(afile.get_full_path(), afile.get_size(), afile.get_checksum()) for afile in bibdoc.list_all_files()]
+            bibdoc._build_file_list()
+            scanned_files = [(afile.get_full_path(), afile.get_size(), afile.get_checksum()) for afile in bibdoc.list_all_files()]
+            cached_files.sort()
+            scanned_files.sort()
+            self.assertEqual(cached_files, scanned_files)
+
+    def test_bulk_load_bibrecdocs(self):
+        """bibdocfile - bulk loading of BibRecDocs"""
+        bibrecdocs = bulk_load_bibrecdocs([2, 8, 9])
+        for recid in (2, 8, 9):
+            self.assertEqual(str(bibrecdocs[recid]), str(BibRecDocs(recid)))
+
+class BibDocFileIntegrityTest(unittest.TestCase):
+    """regression tests about the integrity check of the file storage"""
+
+    def setUp(self):
+        self.state_file = os.path.join(CFG_TMPDIR, 'bibdocfile_integrity_test.state')
+
+    def tearDown(self):
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    def test_check_filedir_integrity(self):
+        """bibdocfile - check_filedir_integrity skips unchanged files"""
+        report = StringIO()
+        stats = check_filedir_integrity(state_file=self.state_file, report=report)
+        self.failUnless(stats['checked'] > 0)
+        self.assertEqual(stats['failures'], len(report.getvalue().splitlines()))
+        stats = check_filedir_integrity(state_file=self.state_file, report=StringIO())
+        self.failUnless(stats['skipped'] > 0)
+        stats = check_filedir_integrity(processes=2, state_file=self.state_file, report=StringIO(), force=True)
+        self.failUnless(stats['checked'] > 0)
+
 class CheckBibDocAuthorization(unittest.TestCase):
     """Regression tests for check_bibdoc_authorization function."""
     def test_check_bibdoc_authorization(self):
@@ -260,6 +305,8 @@ class CheckBibDocAuthorization(unittest.TestCase):
 TEST_SUITE = make_test_suite(BibRecDocsTest, \
                              BibDocsTest, \
                              BibDocFilesTest, \
+                             BibDocFileListCacheTest, \
+                             BibDocFileIntegrityTest, \
                              CheckBibDocAuthorization)
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE, warn_user=True)
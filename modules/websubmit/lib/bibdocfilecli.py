@@ -39,7 +39,8 @@ from invenio.config import CFG_TMPDIR, CFG_SITE_URL, CFG_WEBSUBMIT_FILEDIR
 from invenio.bibdocfile import BibRecDocs, BibDoc, InvenioWebSubmitFileError, \
     nice_size, check_valid_url, clean_url, get_docname_from_url, \
     guess_format_from_url, KEEP_OLD_VALUE, decompose_bibdocfile_fullpath, \
-    bibdocfile_url_to_bibdoc, decompose_bibdocfile_url
+    bibdocfile_url_to_bibdoc, decompose_bibdocfile_url, Md5Folder, \
+    check_filedir_integrity
 
 from invenio.intbitset import intbitset
 from invenio.search_engine import perform_request_search
@@ -490,6 +491,10 @@ Examples:
 
     housekeeping_options = OptionGroup(parser, 'Actions for housekeeping')
     housekeeping_options.add_option("--check-md5", action='store_const', const='check-md5', dest='action', help='check md5 checksum validity of files')
+    housekeeping_options.add_option("--check-integrity", action='store_const', const='check-integrity', dest='action', help='check md5 checksum validity of all the files in %s (query options are ignored)' % CFG_WEBSUBMIT_FILEDIR)
+    housekeeping_options.add_option("--with-processes", dest='processes', type='int', default=1, help='number of parallel processes used by --check-integrity', metavar='N')
+    housekeeping_options.add_option("--with-state-file", dest='state_file', help='file where --check-integrity checkpoints its progress, in order to resume an interrupted check and to skip files unchanged since the last check (use --force to check them anyway)', metavar='PATH')
+    housekeeping_options.add_option("--with-report", dest='report', help='file where --check-integrity writes a tab separated report of failing files (default: standard output)', metavar='PATH')
     housekeeping_options.add_option("--check-format", action='store_const', const='check-format', dest='action', help='check if any format-related inconsistences exists')
     housekeeping_options.add_option("--check-duplicate-docnames", action='store_const', const='check-duplicate-docnames', dest='action', help='check for duplicate docnames associated with the same record')
     housekeeping_options.add_option("--update-md5", action='store_const', const='update-md5', dest='action', help='update md5 checksum of files')
@@ -934,7 +939,7 @@ def cli_check_md5(options):
     failures = 0
     for docid in cli_docids_iterator(options):
         bibdoc = BibDoc(docid)
-        if bibdoc.md5s.check():
+        if Md5Folder(bibdoc.get_base_dir()).check():
             print_info(bibdoc.get_recid(), docid, 'checksum OK')
         else:
             for afile in bibdoc.list_all_files():
@@ -946,18 +951,37 @@ def cli_check_md5(options):
     else:
         print wrap_text_in_a_box('All files are correct', style='conclusion')
 
+def cli_check_integrity(options):
+    """Check the md5 sums of all the files in the storage."""
+    report_path = getattr(options, 'report', None)
+    if report_path:
+        report = open(report_path, 'a')
+    else:
+        report = sys.stdout
+    try:
+        stats = check_filedir_integrity(processes=getattr(options, 'processes', 1),
+            state_file=getattr(options, 'state_file', None),
+            report=report, force=getattr(options, 'force', False))
+    finally:
+        if report_path:
+            report.close()
+    print wrap_text_in_a_box('%(checked)i files checked\n%(skipped)i files skipped (unchanged since last check)\n%(failures)i files failing' % stats, style='conclusion')
+
 def cli_update_md5(options):
     """Update the md5 sums of a docid_set."""
     for docid in cli_docids_iterator(options):
         bibdoc = BibDoc(docid)
-        if bibdoc.md5s.check():
+        md5s = Md5Folder(bibdoc.get_base_dir())
+        if md5s.check():
             print_info(bibdoc.get_recid(), docid, 'checksum OK')
         else:
             for afile in bibdoc.list_all_files():
                 if not afile.check():
                     print_info(bibdoc.get_recid(), docid, '%s failing checksum!' % afile.get_full_path())
             wait_for_user('Updating the md5s of this document can hide real problems.')
-            bibdoc.md5s.update(only_new=False)
+            md5s.update(only_new=False)
+            ## Let's refresh the cached checksums too.
+            bibdoc._build_file_list()
 
 def cli_hide(options):
     """Hide the matched versions of documents."""
@@ -1060,6 +1084,8 @@ def main():
             cli_get_disk_usage(options)
         elif getattr(options, 'action', None) == 'check-md5':
             cli_check_md5(options)
+        elif getattr(options, 'action', None) == 'check-integrity':
+            cli_check_integrity(options)
         elif getattr(options, 'action', None) == 'update-md5':
             cli_update_md5(options)
         elif getattr(options, 'action', None) == 'fix-all':